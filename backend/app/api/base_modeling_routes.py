@@ -1,13 +1,14 @@
 """
 基础建模模块API路由
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from typing import Callable, List, Optional
 from pydantic import BaseModel
 import pandas as pd
 import io
 from app.core.logger import app_logger
 from app.core.exceptions import DataValidationError, BusinessException
+from app.core.upload_stream import ImportJob, import_jobs, run_streaming_import
 from app.services.base_modeling import BaseModelingService
 
 router = APIRouter(prefix="/modeling", tags=["基础建模"])
@@ -55,53 +56,96 @@ class UserProfileItem(BaseModel):
 
 # ========== 行为数据接口 ==========
 
+# 流式导入时每块的行数
+IMPORT_CHUNK_SIZE = 10000
+
+
+async def _stream_csv_import(
+    request: Request,
+    job: ImportJob,
+    required_columns: List[str],
+    import_records: Callable[[pd.DataFrame], dict],
+    suffix: Optional[str] = None
+) -> dict:
+    """请求体边接收边按块解析CSV并写库（工作线程中执行，不落临时文件）
+
+    每块单独提交：中途失败时已写入的分块保留，失败行数见 job.committed_rows。
+
+    Returns:
+        {"total_count", "columns", "job_id"}
+    """
+    def consume(stream) -> dict:
+        saved_count = chunks = 0
+        columns: List[str] = []
+        with pd.read_csv(stream, chunksize=IMPORT_CHUNK_SIZE) as reader:
+            for df in reader:
+                if not columns:
+                    columns = list(df.columns)
+                    missing_columns = [col for col in required_columns if col not in df.columns]
+                    if missing_columns:
+                        raise DataValidationError(
+                            f"CSV文件缺少必需列: {', '.join(missing_columns)}。当前列: {', '.join(columns)}"
+                        )
+                result = import_records(df)
+                if not result["success"]:
+                    raise BusinessException(result["error"], 500)
+                saved_count += result["saved_count"]
+                chunks += 1
+                job.update({"total": saved_count, "success": saved_count, "error": 0, "chunks": chunks})
+        return {"total_count": saved_count, "columns": columns}
+
+    result = await run_streaming_import(
+        request.stream(), request.headers.get("content-type", ""), consume, job, suffix=suffix
+    )
+    app_logger.info(f"导入任务 {job.job_id} 完成: 共 {result['total_count']} 条, 列: {result['columns']}")
+    return {**result, "job_id": job.job_id}
+
+
 @router.post("/behavior/import")
-async def import_behavior_data(file: UploadFile = File(...)):
-    """导入行为数据CSV"""
-    try:
-        app_logger.info(f"开始导入行为数据: {file.filename}")
+async def import_behavior_data(request: Request, job_id: Optional[str] = None):
+    """导入行为数据CSV（multipart/form-data，文件字段名 file；进度见 /modeling/import-jobs/{job_id}）
 
-        if not file.filename.endswith('.csv'):
-            raise HTTPException(status_code=400, detail="文件格式错误，请上传CSV文件")
+    按块提交，中途失败时已写入的行不会回滚，失败响应中给出已写入的行数。
+    """
+    job = import_jobs.create("behavior_data", job_id)
+    try:
+        app_logger.info("开始流式导入行为数据")
 
         try:
-            content = await file.read()
-            df = pd.read_csv(io.BytesIO(content))
-        except Exception as e:
-            app_logger.error(f"CSV文件解析失败: {e}", exc_info=True)
-            raise HTTPException(status_code=400, detail=f"CSV文件解析失败: {str(e)}")
-
-        app_logger.info(f"成功读取CSV,共 {len(df)} 条记录, 列: {list(df.columns)}")
-
-        required_columns = ['user_id', 'action', 'timestamp']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"CSV文件缺少必需列: {', '.join(missing_columns)}。当前列: {', '.join(df.columns)}"
+            data = await _stream_csv_import(
+                request, job,
+                ['user_id', 'action', 'timestamp'],
+                modeling_service.import_behavior_data,
+                suffix=".csv"
             )
+        except (BusinessException, ValueError) as e:
+            code = e.code if isinstance(e, BusinessException) else 400
+            app_logger.error(f"CSV文件导入失败: {e}", exc_info=True)
+            raise HTTPException(status_code=code, detail=f"CSV文件导入失败: {job.failure_message()}")
 
-        behaviors = df.to_dict('records')
-
-        result = modeling_service.import_behavior_data(behaviors)
-
-        if result["success"]:
-            return {
-                "code": 0,
-                "message": f"成功导入 {result['saved_count']} 条行为数据",
-                "data": {
-                    "total_count": result['saved_count'],
-                    "columns": list(df.columns)
-                }
-            }
-        else:
-            raise HTTPException(status_code=500, detail=result["error"])
+        return {
+            "code": 0,
+            "message": f"成功导入 {data['total_count']} 条行为数据",
+            "data": data
+        }
 
     except HTTPException:
         raise
     except Exception as e:
         app_logger.error(f"导入行为数据失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"导入失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"导入失败: {job.failure_message()}")
+
+
+@router.get("/import-jobs/{job_id}")
+async def get_import_job(job_id: str):
+    """查询流式导入任务进度"""
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"导入任务不存在: {job_id}")
+    return {
+        "code": 0,
+        "data": job.to_dict()
+    }
 
 
 @router.get("/behavior/list")
@@ -177,6 +221,15 @@ async def list_app_tags(
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
 
+@router.get("/app-tags/status")
+async def get_app_tagging_status():
+    """查询APP标签后台生成进度"""
+    return {
+        "code": 0,
+        "data": modeling_service.get_tagging_status("app")
+    }
+
+
 # ========== 媒体标签接口 ==========
 
 @router.post("/media-tags/import")
@@ -232,41 +285,40 @@ async def list_media_tags(
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
 
-# ========== 用户画像接口 ==========
+@router.get("/media-tags/status")
+async def get_media_tagging_status():
+    """查询媒体标签后台生成进度"""
+    return {
+        "code": 0,
+        "data": modeling_service.get_tagging_status("media")
+    }
 
-@router.post("/profiles/import")
-async def import_user_profiles(file: UploadFile = File(...)):
-    """导入用户画像数据"""
-    try:
-        app_logger.info(f"开始导入用户画像: {file.filename}")
 
-        # 读取CSV
-        content = await file.read()
-        df = pd.read_csv(io.BytesIO(content))
+# ========== 用户画像接口 ==========
 
-        app_logger.info(f"成功读取CSV,共 {len(df)} 个用户")
+@router.post("/profiles/import")
+async def import_user_profiles(request: Request, job_id: Optional[str] = None):
+    """导入用户画像数据（multipart/form-data，文件字段名 file）
 
-        # 转换为字典列表
-        profiles = df.to_dict('records')
+    按块提交，中途失败时已写入的行不会回滚，失败响应中给出已写入的行数。
+    """
+    job = import_jobs.create("user_profiles", job_id)
+    try:
+        app_logger.info("开始流式导入用户画像")
 
-        # 调用服务层导入
-        result = modeling_service.import_user_profiles(profiles)
+        data = await _stream_csv_import(
+            request, job, [], modeling_service.import_user_profiles
+        )
 
-        if result["success"]:
-            return {
-                "code": 0,
-                "message": f"成功导入 {result['saved_count']} 个用户画像",
-                "data": {
-                    "total_count": result['saved_count'],
-                    "columns": list(df.columns)
-                }
-            }
-        else:
-            raise HTTPException(status_code=500, detail=result["error"])
+        return {
+            "code": 0,
+            "message": f"成功导入 {data['total_count']} 个用户画像",
+            "data": data
+        }
 
     except Exception as e:
         app_logger.error(f"导入用户画像失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"导入失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"导入失败: {job.failure_message()}")
 
 
 @router.get("/profiles/list")
@@ -2,40 +2,53 @@
 灵活CSV导入API路由
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from typing import Dict
+from typing import Dict, Optional
 import io
 import csv
 
 from app.services.flexible_csv_importer import FlexibleCSVImporter
 from app.core.logger import app_logger
+from app.core.upload_stream import ImportJob, import_jobs, run_streaming_import
 
 router = APIRouter(prefix="/api/v1/flexible-import", tags=["灵活导入"])
 
 
+async def _stream_import(request: Request, job: ImportJob, method: str) -> Dict:
+    """请求体边接收边解析写库，不落临时文件；进度可通过 /jobs/{job_id} 查询
+
+    每块单独提交：中途失败时已写入的分块保留，已写入行数见 job.committed_rows。
+    """
+    importer = FlexibleCSVImporter()
+    import_method = getattr(importer, method)
+    result = await run_streaming_import(
+        request.stream(),
+        request.headers.get("content-type", ""),
+        lambda stream: import_method(stream, progress=job.update),
+        job
+    )
+    app_logger.info(f"导入任务 {job.job_id} 完成: {result}")
+    return {**result, "job_id": job.job_id}
+
+
 @router.post("/behavior-data")
-async def import_behavior_data(file: UploadFile = File(...)) -> Dict:
-    """导入行为数据CSV
+async def import_behavior_data(request: Request, job_id: Optional[str] = None) -> Dict:
+    """导入行为数据CSV（multipart/form-data，文件字段名 file）
 
     必需列:
     - user_id: 用户ID
     - event_time 或 timestamp: 事件时间
 
     其他列（包括action/event_type）会自动打包到event_data中
-    """
-    try:
-        # 保存上传的文件
-        temp_file = f"/tmp/{file.filename}"
-        with open(temp_file, "wb") as f:
-            content = await file.read()
-            f.write(content)
 
-        # 导入数据
-        importer = FlexibleCSVImporter()
-        result = importer.import_behavior_data(temp_file)
+    job_id 可由客户端指定，上传过程中通过 GET /jobs/{job_id} 查询进度
 
-        app_logger.info(f"行为数据导入完成: {result}")
+    按块提交，中途失败时已写入的行不会回滚，失败响应中给出已写入的行数
+    """
+    job = import_jobs.create("behavior_data", job_id)
+    try:
+        result = await _stream_import(request, job, "import_behavior_data")
 
         return {
             "success": True,
@@ -45,30 +58,23 @@ async def import_behavior_data(file: UploadFile = File(...)) -> Dict:
 
     except Exception as e:
         app_logger.error(f"导入行为数据失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=job.failure_message())
 
 
 @router.post("/user-profiles")
-async def import_user_profiles(file: UploadFile = File(...)) -> Dict:
-    """导入用户画像CSV
+async def import_user_profiles(request: Request, job_id: Optional[str] = None) -> Dict:
+    """导入用户画像CSV（multipart/form-data，文件字段名 file）
 
     必需列:
     - user_id: 用户ID
 
     其他列会自动打包到profile_data中
+
+    按块提交，中途失败时已写入的行不会回滚，失败响应中给出已写入的行数
     """
+    job = import_jobs.create("user_profiles", job_id)
     try:
-        # 保存上传的文件
-        temp_file = f"/tmp/{file.filename}"
-        with open(temp_file, "wb") as f:
-            content = await file.read()
-            f.write(content)
-
-        # 导入数据
-        importer = FlexibleCSVImporter()
-        result = importer.import_user_profiles(temp_file)
-
-        app_logger.info(f"用户画像导入完成: {result}")
+        result = await _stream_import(request, job, "import_user_profiles")
 
         return {
             "success": True,
@@ -78,7 +84,19 @@ async def import_user_profiles(file: UploadFile = File(...)) -> Dict:
 
     except Exception as e:
         app_logger.error(f"导入用户画像失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=job.failure_message())
+
+
+@router.get("/jobs/{job_id}")
+async def get_import_job(job_id: str) -> Dict:
+    """查询上传导入任务进度（已接收字节数、已写入行数、状态）"""
+    job = import_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"导入任务不存在: {job_id}")
+    return {
+        "success": True,
+        "data": job.to_dict()
+    }
 
 
 @router.get("/template/behavior-data")
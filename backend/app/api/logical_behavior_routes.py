@@ -1,25 +1,53 @@
 """
 逻辑行为生成API路由
 """
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
 from app.services.logical_behavior import LogicalBehaviorGenerator
+from app.services.generation_jobs import generation_job_manager
 from app.core.dependencies import get_logical_behavior_generator
 from app.core.logger import app_logger
+from app.core.db_pool import get_pool
 from app.core.exceptions import BusinessException, DatabaseError, LLMServiceError
 
 
 router = APIRouter(prefix="/logical-behaviors", tags=["逻辑行为生成"])
 
 
+def _pending_user_ids() -> List[str]:
+    """所有尚未成功生成逻辑行为的用户"""
+    with get_pool("data/graph.db").read() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT DISTINCT user_id
+               FROM user_profiles
+               WHERE user_id NOT IN (
+                   SELECT user_id FROM logical_behavior_sequences
+                   WHERE status = 'success'
+               )
+               ORDER BY user_id ASC"""
+        )
+        user_ids = [row[0] for row in cursor.fetchall()]
+    app_logger.info(f"未指定用户列表，自动获取 {len(user_ids)} 个未生成的用户")
+    return user_ids
+
+
 class GenerateBatchRequest(BaseModel):
     """批量生成请求"""
     user_ids: Optional[List[str]] = Field(None, description="用户ID列表，为空时处理所有未生成的用户")
     max_workers: int = Field(4, ge=1, le=10, description="并发数")
 
 
+class CreateJobRequest(BaseModel):
+    """后台生成任务请求"""
+    user_ids: Optional[List[str]] = Field(None, description="用户ID列表，为空时处理所有未生成的用户")
+    max_workers: Optional[int] = Field(None, ge=1, le=10, description="并发数，默认使用 GENERATION_WORKERS")
+
+
 @router.post("/generate/batch")
 async def generate_batch(
     request: GenerateBatchRequest,
@@ -27,27 +55,7 @@ async def generate_batch(
 ):
     """批量生成逻辑行为序列"""
     try:
-        import sqlite3
-        from pathlib import Path
-
-        user_ids = request.user_ids
-
-        # 如果未指定user_ids，则获取所有未生成的用户
-        if not user_ids:
-            db_path = Path("data/graph.db")
-            with sqlite3.connect(db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """SELECT DISTINCT user_id
-                       FROM user_profiles
-                       WHERE user_id NOT IN (
-                           SELECT user_id FROM logical_behavior_sequences
-                           WHERE status = 'success'
-                       )
-                       ORDER BY user_id ASC"""
-                )
-                user_ids = [row[0] for row in cursor.fetchall()]
-                app_logger.info(f"未指定用户列表，自动获取 {len(user_ids)} 个未生成的用户")
+        user_ids = request.user_ids or _pending_user_ids()
 
         if not user_ids:
             return {
@@ -113,6 +121,48 @@ async def get_progress(
         raise HTTPException(status_code=500, detail=f"获取进度失败: {str(e)}")
 
 
+@router.post("/jobs")
+async def create_generation_job(request: CreateJobRequest):
+    """创建后台生成任务（持久化，进程重启后继续，已成功的用户不会重做）"""
+    try:
+        user_ids = request.user_ids or await asyncio.to_thread(_pending_user_ids)
+        if not user_ids:
+            return {"code": 200, "message": "没有需要生成的用户", "data": None}
+
+        job_id = await generation_job_manager.submit(user_ids, request.max_workers)
+        status = await asyncio.to_thread(generation_job_manager.queue.job_status, job_id)
+        return {"code": 200, "message": "任务已创建", "data": status}
+    except Exception as e:
+        app_logger.error(f"创建生成任务失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"创建生成任务失败: {str(e)}")
+
+
+@router.get("/jobs")
+async def list_generation_jobs(limit: int = 20, offset: int = 0):
+    """生成任务列表（含进度与吞吐）"""
+    jobs = await asyncio.to_thread(generation_job_manager.queue.list_jobs, limit, offset)
+    return {"code": 200, "message": "获取任务列表成功", "data": jobs}
+
+
+@router.get("/jobs/{job_id}")
+async def get_generation_job(job_id: str):
+    """任务状态：各状态用户数、吞吐（用户/分钟）、预计剩余时间与失败用户"""
+    status = await asyncio.to_thread(generation_job_manager.queue.job_status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    status["active"] = generation_job_manager.is_running(job_id)
+    status["failed_users"] = await asyncio.to_thread(generation_job_manager.queue.failed_tasks, job_id)
+    return {"code": 200, "message": "获取任务状态成功", "data": status}
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_generation_job(job_id: str):
+    """取消任务（正在处理的用户归还到队列）"""
+    if not await generation_job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return {"code": 200, "message": "任务已取消", "data": {"job_id": job_id}}
+
+
 @router.get("/query/{user_id}")
 async def query_logical_behaviors(
     user_id: str,
@@ -146,11 +196,10 @@ async def list_logical_behavior_sequences(
 ):
     """列出所有用户的逻辑行为序列状态（包括未生成的用户）"""
     try:
-        import sqlite3
         from pathlib import Path
 
         db_path = Path("data/graph.db")
-        with sqlite3.connect(db_path) as conn:
+        with get_pool(db_path).read() as conn:
             cursor = conn.cursor()
 
             # 查询所有用户，LEFT JOIN逻辑行为序列状态，并统计原始行为数量
@@ -220,12 +269,11 @@ async def get_user_detail(
 ):
     """获取用户详细信息（画像+原始行为+逻辑行为）"""
     try:
-        import sqlite3
         import json
         from pathlib import Path
 
         db_path = Path("data/graph.db")
-        with sqlite3.connect(db_path) as conn:
+        with get_pool(db_path).read() as conn:
             cursor = conn.cursor()
 
             # 1. 获取用户画像
@@ -17,7 +17,7 @@ mining_service = SequenceMiningService()
 # ========== 请求/响应模型 ==========
 
 class MiningRequest(BaseModel):
-    algorithm: str = Field("prefixspan", description="算法类型: prefixspan 或 attention")
+    algorithm: str = Field("prefixspan", description="算法类型: prefixspan、attention 或 ngram")
     min_support: int = Field(2, ge=1, le=100, description="最小支持度")
     min_length: int = Field(2, ge=1, le=10, description="最小序列长度")
     max_length: int = Field(3, ge=2, le=5, description="最大序列长度 (限制为5以控制内存使用)")
@@ -38,9 +38,10 @@ class SavePatternsRequest(BaseModel):
 async def mine_frequent_patterns(request: MiningRequest):
     """挖掘高频事件子序列
 
-    支持两种算法:
+    支持三种算法:
     - prefixspan: 经典的序列模式挖掘算法
     - attention: 基于共现频率的Attention权重方法
+    - ngram: 连续子序列支持度，n-gram索引已构建时直接查索引返回
 
     注意: 为控制内存使用,max_length限制为3,处理序列数量限制为50,000
     """
@@ -76,6 +77,46 @@ async def mine_frequent_patterns(request: MiningRequest):
         raise HTTPException(status_code=500, detail=f"挖掘失败: {str(e)}")
 
 
+@router.post("/ngram-index/rebuild")
+async def rebuild_ngram_index():
+    """全量重建n-gram支持度索引
+
+    构建后逻辑行为生成会增量维护该索引，ngram 挖掘请求直接查索引返回
+    """
+    try:
+        result = mining_service.rebuild_ngram_index()
+
+        return {
+            "code": 0,
+            "message": "索引重建完成",
+            "data": result
+        }
+
+    except Exception as e:
+        app_logger.error(f"重建n-gram索引失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"重建失败: {str(e)}")
+
+
+@router.post("/posting-index/rebuild")
+async def rebuild_posting_index():
+    """全量重建事件倒排索引
+
+    构建后模式示例查询通过倒排列表求交完成，逻辑行为写入时同步更新
+    """
+    try:
+        result = mining_service.rebuild_posting_index()
+
+        return {
+            "code": 0,
+            "message": "索引重建完成",
+            "data": result
+        }
+
+    except Exception as e:
+        app_logger.error(f"重建事件倒排索引失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"重建失败: {str(e)}")
+
+
 @router.post("/patterns/{pattern_id}/examples")
 async def get_pattern_examples(pattern_id: str, limit: int = 5):
     """获取某个模式的用户示例
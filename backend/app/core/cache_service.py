@@ -92,6 +92,23 @@ class CacheService:
                 del self.cache[key]
                 app_logger.debug(f"缓存删除: {key}")
 
+    def delete_prefix(self, prefix: str) -> int:
+        """删除指定前缀的所有缓存
+
+        Args:
+            prefix: 缓存键前缀
+
+        Returns:
+            删除的条目数
+        """
+        with self._lock:
+            keys = [key for key in self.cache if key.startswith(prefix)]
+            for key in keys:
+                del self.cache[key]
+            if keys:
+                app_logger.info(f"缓存删除: 前缀{prefix} {len(keys)}个条目")
+            return len(keys)
+
     def clear(self) -> None:
         """清空所有缓存"""
         with self._lock:
@@ -246,7 +263,8 @@ class SequenceCacheService:
         max_length: int,
         target_label: Optional[str] = None,
         target_event: Optional[str] = None,
-        target_category: Optional[str] = None
+        target_category: Optional[str] = None,
+        **options
     ) -> Optional[Any]:
         """获取缓存的模式数据
 
@@ -256,11 +274,12 @@ class SequenceCacheService:
             target_label: 目标标签
             target_event: 目标事件
             target_category: 目标分类
+            **options: 其他影响结果的参数（如 algorithm、min_length、top_k）
 
         Returns:
             模式列表或None
         """
-        key = f"patterns:support_{min_support}_length_{max_length}_label_{target_label}_event_{target_event}_category_{target_category}"
+        key = self._patterns_key(min_support, max_length, target_label, target_event, target_category, options)
         return self.cache.get(key)
 
     def set_patterns(
@@ -271,7 +290,8 @@ class SequenceCacheService:
         target_label: Optional[str] = None,
         target_event: Optional[str] = None,
         target_category: Optional[str] = None,
-        ttl: int = 600
+        ttl: int = 600,
+        **options
     ) -> None:
         """缓存模式数据
 
@@ -283,17 +303,22 @@ class SequenceCacheService:
             target_event: 目标事件
             target_category: 目标分类
             ttl: 过期时间（秒）
+            **options: 其他影响结果的参数（如 algorithm、min_length、top_k）
         """
-        key = f"patterns:support_{min_support}_length_{max_length}_label_{target_label}_event_{target_event}_category_{target_category}"
+        key = self._patterns_key(min_support, max_length, target_label, target_event, target_category, options)
         self.cache.set(key, patterns, ttl)
 
+    @staticmethod
+    def _patterns_key(min_support, max_length, target_label, target_event, target_category, options: Dict) -> str:
+        key = f"patterns:support_{min_support}_length_{max_length}_label_{target_label}_event_{target_event}_category_{target_category}"
+        for name in sorted(options):
+            key += f"_{name}_{options[name]}"
+        return key
+
     def invalidate_sequences(self) -> None:
-        """使序列缓存失效"""
-        # 简单实现：清空所有缓存
-        # 更好的实现：只清空sequences相关的缓存
-        self.cache.clear()
+        """使序列缓存失效（只删除sequences相关的缓存）"""
+        self.cache.delete_prefix("sequences:")
 
     def invalidate_patterns(self) -> None:
-        """使模式缓存失效"""
-        # 简单实现：清空所有缓存
-        self.cache.clear()
+        """使模式缓存失效（只删除patterns相关的缓存）"""
+        self.cache.delete_prefix("patterns:")
@@ -16,10 +16,42 @@ class Settings(BaseSettings):
 
     primary_model: str = os.getenv("PRIMARY_MODEL", "glm-4.6-flash")
     reasoning_model: str = os.getenv("REASONING_MODEL", "qwen3-32b")
-    max_tokens_per_request: int = int(os.getenv("MAX_TOKENS_PER_REQUEST", "30000"))
+    max_tokens_per_request: int = int(os.getenv("MAX_TOKENS_PER_REQUEST", "30000"))  # 单次请求的输入token预算
+    llm_max_output_tokens: int = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "8000"))  # 单次请求的输出token上限
 
     # LLM并行处理配置
     max_llm_workers: int = int(os.getenv("MAX_LLM_WORKERS", "4"))  # 最大并发LLM调用数
+    llm_pack_users: bool = os.getenv("LLM_PACK_USERS", "false").lower() == "true"  # 逻辑行为生成时多用户打包到一个请求
+
+    # 逻辑行为后台生成任务配置
+    generation_workers: int = int(os.getenv("GENERATION_WORKERS", "4"))  # 每个任务默认并发数
+    generation_max_attempts: int = int(os.getenv("GENERATION_MAX_ATTEMPTS", "3"))  # 每个用户最大尝试次数
+    generation_lease_seconds: float = float(os.getenv("GENERATION_LEASE_SECONDS", "120"))  # 子任务租约时长
+    generation_retry_backoff_seconds: float = float(os.getenv("GENERATION_RETRY_BACKOFF_SECONDS", "30"))  # 首次重试等待，之后翻倍
+
+    # APP/媒体标签并发打标配置
+    tagging_concurrency: int = int(os.getenv("TAGGING_CONCURRENCY", "4"))  # 同时进行的LLM打标批次数
+    tagging_batch_size: int = int(os.getenv("TAGGING_BATCH_SIZE", "100"))  # 初始批大小，之后按延迟和截断自适应
+
+    # 知识图谱内存存储：networkx（MultiDiGraph）或 csr（整数编码 + CSR邻接数组，大图内存更低）
+    graph_backend: str = os.getenv("GRAPH_BACKEND", "networkx").lower()
+
+    # 序列挖掘并行配置
+    mining_workers: int = int(os.getenv("MINING_WORKERS", "1"))  # >1 时按进程分片挖掘
+    mining_two_pass: bool = os.getenv("MINING_TWO_PASS", "false").lower() == "true"  # 分片挖掘两遍精确模式
+
+    # LLM原始响应日志抽样比例（0-1，DEBUG级别；0关闭）
+    llm_payload_log_sample_rate: float = float(os.getenv("LLM_PAYLOAD_LOG_SAMPLE_RATE", "0"))
+
+    # LLM HTTP连接池配置
+    llm_http_max_connections: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))  # 连接池上限
+    llm_http_keepalive_expiry: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保活秒数
+
+    # LLM响应缓存配置
+    llm_cache_enabled: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    llm_cache_path: str = os.getenv("LLM_CACHE_PATH", "data/llm_cache.db")
+    llm_cache_ttl_seconds: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))  # 默认7天，<=0永不过期
+    llm_cache_max_mb: int = int(os.getenv("LLM_CACHE_MAX_MB", "512"))  # 缓存响应总大小上限
 
     class Config:
         env_file = ".env"
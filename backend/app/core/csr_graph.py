@@ -0,0 +1,322 @@
+"""
+紧凑图存储 - 整数编码节点 + CSR邻接数组的有向多重图（NetworkX MultiDiGraph 的低内存替代）
+
+- 节点ID字符串只存一份，节点下标为 int32；节点类型编码为整数，其他属性按列存放（每个属性一个列表）
+- 边为 src/dst/关系类型/权重 四个定长数组，额外的边属性稀疏存放
+- 出边、入边各一套 CSR（indptr + 边下标），按需从边数组排序构建；构建之后新增的边先记在增量表中，
+  增量超过阈值时重新压缩
+- 每种关系类型的边下标数组按需缓存
+
+实现了 GraphDatabase 用到的 NetworkX 接口子集（has_node / nodes / add_node / add_edge / edges 等），
+并提供可随时停止的逐条邻接读取 iter_adjacent（多跳遍历和最短路径使用）。
+"""
+import sys
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# 增量边数超过 max(COMPACT_MIN_PENDING, 已压缩边数 × COMPACT_RATIO) 时重新构建CSR
+COMPACT_MIN_PENDING = 4096
+COMPACT_RATIO = 0.25
+
+# 不超过该长度的字符串属性值做驻留，重复值（性别、城市等级等）只存一份
+INTERN_MAX_LENGTH = 64
+
+_MISSING = object()
+
+
+class _NodeView:
+    """与 networkx NodeView 兼容的只读视图：nodes[id]、nodes.get(id)、nodes(data=True)"""
+
+    def __init__(self, graph: "CSRGraph"):
+        self._graph = graph
+
+    def __getitem__(self, node_id: str) -> Dict:
+        return self._graph.node_data(self._graph._index[node_id])
+
+    def get(self, node_id: str, default=None):
+        index = self._graph._index.get(node_id)
+        return default if index is None else self._graph.node_data(index)
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._graph._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._graph._ids)
+
+    def __len__(self) -> int:
+        return len(self._graph._ids)
+
+    def __call__(self, data: bool = False):
+        if not data:
+            return iter(self._graph._ids)
+        return ((node_id, self._graph.node_data(i)) for i, node_id in enumerate(self._graph._ids))
+
+
+class CSRGraph:
+    """CSR邻接的有向多重图
+
+    节点属性字典在读取时按列组装（返回新字典，修改它不会写回图中，更新属性请调用 add_node）。
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._type_names: List[Optional[str]] = []
+        self._type_codes: Dict[Optional[str], int] = {}
+        self._node_types = array("i")
+        self._columns: Dict[str, List[Any]] = {}
+
+        self._rel_names: List[Optional[str]] = []
+        self._rel_codes: Dict[Optional[str], int] = {}
+        self._src = array("i")
+        self._dst = array("i")
+        self._rel = array("i")
+        self._weight = array("d")  # NaN 表示没有权重属性
+        self._edge_extra: Dict[int, Dict] = {}
+
+        self._csr_edges = 0  # 已编入CSR的边数（边下标 < _csr_edges）
+        self._out_indptr = np.zeros(1, dtype=np.int64)
+        self._out_edges = np.empty(0, dtype=np.int64)
+        self._in_indptr = np.zeros(1, dtype=np.int64)
+        self._in_edges = np.empty(0, dtype=np.int64)
+        self._pending_out: Dict[int, List[int]] = defaultdict(list)
+        self._pending_in: Dict[int, List[int]] = defaultdict(list)
+        self._rel_edges: Dict[int, np.ndarray] = {}
+
+    @property
+    def nodes(self) -> _NodeView:
+        return _NodeView(self)
+
+    # ---- 节点 ----
+
+    @staticmethod
+    def _code(names: List, codes: Dict, name) -> int:
+        code = codes.get(name)
+        if code is None:
+            code = len(names)
+            names.append(name)
+            codes[name] = code
+        return code
+
+    def _intern_node(self, node_id: str) -> int:
+        index = self._index.get(node_id)
+        if index is None:
+            index = len(self._ids)
+            self._ids.append(node_id)
+            self._index[node_id] = index
+            self._node_types.append(self._code(self._type_names, self._type_codes, None))
+        return index
+
+    def add_node(self, node_id: str, **attrs) -> None:
+        """添加节点；节点已存在时合并属性（与 networkx 一致）"""
+        index = self._intern_node(node_id)
+        for key, value in attrs.items():
+            if key == "type":
+                self._node_types[index] = self._code(self._type_names, self._type_codes, value)
+                continue
+            column = self._columns.get(key)
+            if column is None:
+                column = self._columns[key] = []
+            if len(column) <= index:
+                column.extend([_MISSING] * (index + 1 - len(column)))
+            if isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH:
+                value = sys.intern(value)
+            column[index] = value
+
+    def add_nodes_from(self, nodes: Iterable) -> None:
+        for node in nodes:
+            if isinstance(node, tuple):
+                self.add_node(node[0], **node[1])
+            else:
+                self.add_node(node)
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self._index
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def number_of_nodes(self) -> int:
+        return len(self._ids)
+
+    def node_data(self, index: int) -> Dict:
+        data = {}
+        for key, column in self._columns.items():
+            if index < len(column) and column[index] is not _MISSING:
+                data[key] = column[index]
+        node_type = self._type_names[self._node_types[index]]
+        if node_type is not None:
+            data["type"] = node_type
+        return data
+
+    def node_type(self, index: int) -> Optional[str]:
+        return self._type_names[self._node_types[index]]
+
+    def type_of(self, node_id: str) -> Optional[str]:
+        index = self._index.get(node_id)
+        return None if index is None else self._type_names[self._node_types[index]]
+
+    # ---- 边 ----
+
+    def add_edge(self, from_id: str, to_id: str, **attrs) -> None:
+        """添加一条边（端点不存在时自动创建，与 networkx 一致）"""
+        src = self._intern_node(from_id)
+        dst = self._intern_node(to_id)
+        edge = len(self._src)
+        self._src.append(src)
+        self._dst.append(dst)
+        self._rel.append(self._code(self._rel_names, self._rel_codes, attrs.pop("type", None)))
+        weight = attrs.pop("weight", _MISSING)
+        if weight is _MISSING or not isinstance(weight, (int, float)) or isinstance(weight, bool):
+            if weight is not _MISSING:
+                attrs["weight"] = weight
+            weight = float("nan")
+        self._weight.append(float(weight))
+        if attrs:
+            self._edge_extra[edge] = attrs
+        self._pending_out[src].append(edge)
+        self._pending_in[dst].append(edge)
+        self._rel_edges.clear()
+
+    def add_edges_from(self, edges: Iterable) -> None:
+        for edge in edges:
+            attrs = dict(edge[2]) if len(edge) > 2 else {}
+            self.add_edge(edge[0], edge[1], **attrs)
+
+    def number_of_edges(self) -> int:
+        return len(self._src)
+
+    def edge_data(self, edge: int) -> Dict:
+        data = dict(self._edge_extra.get(edge, ()))
+        rel_type = self._rel_names[self._rel[edge]]
+        if rel_type is not None:
+            data["type"] = rel_type
+        weight = self._weight[edge]
+        if weight == weight:  # 非NaN
+            data["weight"] = weight
+        return data
+
+    def edges(self, data: bool = False) -> Iterator[Tuple]:
+        """按添加顺序遍历边：(u, v) 或 (u, v, 属性)"""
+        ids = self._ids
+        for edge in range(len(self._src)):
+            u, v = ids[self._src[edge]], ids[self._dst[edge]]
+            yield (u, v, self.edge_data(edge)) if data else (u, v)
+
+    def edges_of_type(self, rel_type: Optional[str]) -> np.ndarray:
+        """某种关系类型的全部边下标（升序，即添加顺序）"""
+        code = self._rel_codes.get(rel_type)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        edges = self._rel_edges.get(code)
+        if edges is None:
+            rel = np.frombuffer(self._rel, dtype=np.int32) if len(self._rel) else np.empty(0, dtype=np.int32)
+            edges = self._rel_edges[code] = np.flatnonzero(rel == code)
+        return edges
+
+    def typed_edges(self, rel_type: Optional[str]) -> Iterator[Tuple[str, str, Dict]]:
+        """按添加顺序遍历某种关系类型的边：(u, v, 属性)"""
+        for edge in self.edges_of_type(rel_type).tolist():
+            yield self._ids[self._src[edge]], self._ids[self._dst[edge]], self.edge_data(edge)
+
+    # ---- CSR ----
+
+    def _maybe_compact(self) -> None:
+        pending = len(self._src) - self._csr_edges
+        if pending and pending > max(COMPACT_MIN_PENDING, self._csr_edges * COMPACT_RATIO):
+            self.compact()
+
+    def compact(self) -> None:
+        """把全部边重新编入出边/入边CSR，清空增量表"""
+        n, m = len(self._ids), len(self._src)
+        src = np.frombuffer(self._src, dtype=np.int32) if m else np.empty(0, dtype=np.int32)
+        dst = np.frombuffer(self._dst, dtype=np.int32) if m else np.empty(0, dtype=np.int32)
+        self._out_indptr, self._out_edges = self._build_csr(src, n)
+        self._in_indptr, self._in_edges = self._build_csr(dst, n)
+        self._csr_edges = m
+        self._pending_out = defaultdict(list)
+        self._pending_in = defaultdict(list)
+
+    @staticmethod
+    def _build_csr(keys: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=n), out=indptr[1:])
+        return indptr, np.argsort(keys, kind="stable").astype(np.int64)
+
+    def _incident(self, index: int, outgoing: bool) -> List[int]:
+        """节点的出边（或入边）下标，按添加顺序"""
+        self._maybe_compact()
+        indptr, edges, pending = (
+            (self._out_indptr, self._out_edges, self._pending_out) if outgoing
+            else (self._in_indptr, self._in_edges, self._pending_in)
+        )
+        result = edges[indptr[index]:indptr[index + 1]].tolist() if index + 1 < len(indptr) else []
+        extra = pending.get(index)
+        return result + extra if extra else result
+
+    def __getstate__(self) -> Dict:
+        self.compact()
+        state = self.__dict__.copy()
+        state["_rel_edges"] = {}
+        return state
+
+    # ---- 邻居与遍历 ----
+
+    def has_edge(self, from_id: str, to_id: str) -> bool:
+        src, dst = self._index.get(from_id), self._index.get(to_id)
+        if src is None or dst is None:
+            return False
+        return any(self._dst[edge] == dst for edge in self._incident(src, True))
+
+    def out_edges(self, node_id: str, rel_type: Optional[str] = None) -> List[Tuple[str, Dict]]:
+        """节点的出边：[(目标节点, 边属性)]，可按关系类型过滤"""
+        index = self._index.get(node_id)
+        if index is None:
+            return []
+        code = None
+        if rel_type is not None:
+            code = self._rel_codes.get(rel_type)
+            if code is None:
+                return []
+        return [
+            (self._ids[self._dst[edge]], self.edge_data(edge))
+            for edge in self._incident(index, True)
+            if code is None or self._rel[edge] == code
+        ]
+
+    def iter_adjacent(self, node_id: str, outgoing: bool = True, chunk_size: int = 256) -> Iterator[Tuple[str, Optional[str]]]:
+        """按添加顺序逐条产出出边（或入边）的 (邻居, 关系类型)，分块读取CSR，调用方可随时停止"""
+        index = self._index.get(node_id)
+        if index is None:
+            return
+        self._maybe_compact()
+        indptr, edges, pending, ends = (
+            (self._out_indptr, self._out_edges, self._pending_out, self._dst) if outgoing
+            else (self._in_indptr, self._in_edges, self._pending_in, self._src)
+        )
+        ids, rel, rel_names = self._ids, self._rel, self._rel_names
+        if index + 1 < len(indptr):
+            for start in range(int(indptr[index]), int(indptr[index + 1]), chunk_size):
+                for edge in edges[start:min(start + chunk_size, int(indptr[index + 1]))].tolist():
+                    yield ids[ends[edge]], rel_names[rel[edge]]
+        for edge in pending.get(index, ()):
+            yield ids[ends[edge]], rel_names[rel[edge]]
+
+    def memory_bytes(self) -> int:
+        """数组部分占用的字节数（不含节点ID字符串和属性值对象）"""
+        arrays = (self._node_types, self._src, self._dst, self._rel, self._weight)
+        numpy_arrays = (self._out_indptr, self._out_edges, self._in_indptr, self._in_edges)
+        return (
+            sum(a.itemsize * len(a) for a in arrays)
+            + sum(a.nbytes for a in numpy_arrays)
+            + sum(8 * len(column) for column in self._columns.values())
+        )
@@ -0,0 +1,230 @@
+"""
+SQLite连接池 - 为graph.db提供复用的连接
+
+设计:
+- 每个线程持有一个只读连接，WAL模式下读不阻塞写
+- 写操作共享一个串行化的写连接（进程内加锁，跨进程用 BEGIN IMMEDIATE + 重试）
+- PRAGMA（WAL、synchronous=NORMAL、mmap_size、cache_size）在建连时统一配置一次
+- 记录连接等待、忙重试和持有时间等指标
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Union
+from urllib.request import pathname2url
+
+from app.core.logger import app_logger
+
+# 连接级PRAGMA配置
+MMAP_SIZE = 256 * 1024 * 1024  # 256MB
+CACHE_SIZE_KB = 64 * 1024  # 64MB（cache_size取负数表示KB）
+BUSY_TIMEOUT_MS = 5000
+
+# 获取写事务时遇到跨进程锁的重试策略
+MAX_BUSY_RETRIES = 5
+BUSY_RETRY_BASE_DELAY = 0.05  # 秒，指数退避
+
+
+class SQLiteConnectionPool:
+    """单个数据库文件的连接池"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = str(db_path)
+        self.in_memory = self.db_path == ":memory:"
+
+        self._local = threading.local()
+        self._read_connections = []
+        self._registry_lock = threading.Lock()
+
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer = self._connect(read_only=False)
+        if not self.in_memory:
+            self._writer.execute("PRAGMA journal_mode=WAL")
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "read_checkouts": 0,
+            "read_hold_ms_total": 0.0,
+            "write_checkouts": 0,
+            "write_waits": 0,
+            "write_wait_ms_total": 0.0,
+            "write_wait_ms_max": 0.0,
+            "write_hold_ms_total": 0.0,
+            "write_hold_ms_max": 0.0,
+            "busy_retries": 0,
+            "busy_failures": 0
+        }
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        """创建连接并配置PRAGMA"""
+        if read_only:
+            uri = f"file:{pathname2url(str(Path(self.db_path).resolve()))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if not self.in_memory:
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        return conn
+
+    def _record(self, **deltas) -> None:
+        with self._metrics_lock:
+            for key, value in deltas.items():
+                if key.endswith("_max"):
+                    self._metrics[key] = max(self._metrics[key], value)
+                else:
+                    self._metrics[key] += value
+
+    def _get_read_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(read_only=True)
+            self._local.conn = conn
+            with self._registry_lock:
+                self._read_connections.append(conn)
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """获取当前线程的只读连接"""
+        if self.in_memory:
+            # 内存数据库无法跨连接共享，读写共用同一连接
+            with self.write() as conn:
+                yield conn
+            return
+
+        conn = self._get_read_connection()
+        start = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            self._record(
+                read_checkouts=1,
+                read_hold_ms_total=(time.perf_counter() - start) * 1000
+            )
+
+    def _begin_immediate(self) -> None:
+        """开启写事务，遇到其他进程持有写锁时指数退避重试"""
+        for attempt in range(MAX_BUSY_RETRIES + 1):
+            try:
+                self._writer.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                if attempt == MAX_BUSY_RETRIES:
+                    self._record(busy_failures=1)
+                    raise
+                self._record(busy_retries=1)
+                time.sleep(BUSY_RETRY_BASE_DELAY * (2 ** attempt))
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """获取串行化的写连接
+
+        正常退出时提交事务，异常时回滚。同一线程内可重入，由最外层负责提交。
+        """
+        wait_start = time.perf_counter()
+        acquired = self._write_lock.acquire(blocking=False)
+        if not acquired:
+            self._write_lock.acquire()
+            wait_ms = (time.perf_counter() - wait_start) * 1000
+            self._record(write_waits=1, write_wait_ms_total=wait_ms, write_wait_ms_max=wait_ms)
+
+        hold_start = time.perf_counter()
+        outermost = self._write_depth == 0
+        self._write_depth += 1
+        try:
+            if outermost and not self._writer.in_transaction:
+                self._begin_immediate()
+            yield self._writer
+            if outermost and self._writer.in_transaction:
+                self._writer.commit()
+        except BaseException:
+            if outermost and self._writer.in_transaction:
+                self._writer.rollback()
+            raise
+        finally:
+            self._write_depth -= 1
+            if outermost:
+                hold_ms = (time.perf_counter() - hold_start) * 1000
+                self._record(write_checkouts=1, write_hold_ms_total=hold_ms, write_hold_ms_max=hold_ms)
+            self._write_lock.release()
+
+    def get_metrics(self) -> Dict:
+        """获取连接池指标"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        with self._registry_lock:
+            metrics["read_connections"] = len(self._read_connections)
+
+        metrics["db_path"] = self.db_path
+        metrics["write_hold_ms_avg"] = round(
+            metrics["write_hold_ms_total"] / metrics["write_checkouts"], 3
+        ) if metrics["write_checkouts"] else 0.0
+        metrics["read_hold_ms_avg"] = round(
+            metrics["read_hold_ms_total"] / metrics["read_checkouts"], 3
+        ) if metrics["read_checkouts"] else 0.0
+        for key in ("read_hold_ms_total", "write_wait_ms_total", "write_wait_ms_max",
+                    "write_hold_ms_total", "write_hold_ms_max"):
+            metrics[key] = round(metrics[key], 3)
+        return metrics
+
+    def close(self) -> None:
+        """关闭池内所有连接"""
+        with self._registry_lock:
+            for conn in self._read_connections:
+                conn.close()
+            self._read_connections.clear()
+        self._local = threading.local()
+        with self._write_lock:
+            self._writer.close()
+
+
+_pools: Dict[str, SQLiteConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(db_path: Union[str, Path]) -> str:
+    if str(db_path) == ":memory:":
+        return ":memory:"
+    return str(Path(db_path).resolve())
+
+
+def get_pool(db_path: Union[str, Path] = "data/graph.db") -> SQLiteConnectionPool:
+    """获取数据库文件对应的连接池（进程内单例）"""
+    key = _pool_key(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                if key != ":memory:":
+                    Path(key).parent.mkdir(parents=True, exist_ok=True)
+                pool = SQLiteConnectionPool(key)
+                _pools[key] = pool
+                app_logger.info(f"创建SQLite连接池: {key}")
+    return pool
+
+
+def get_pool_metrics() -> Dict[str, Dict]:
+    """获取所有连接池的指标"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {key: pool.get_metrics() for key, pool in pools}
+
+
+def close_all_pools() -> None:
+    """关闭所有连接池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
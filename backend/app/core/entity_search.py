@@ -0,0 +1,208 @@
+"""
+实体搜索索引 - 基于SQLite FTS5的知识图谱实体全文检索，与实体持久化存放在同一数据库
+
+- entity_search_docs: 实体ID -> 文档ID（FTS5 rowid）和实体类型，用于类型过滤和按实体更新
+- entity_search: FTS5表，entity_key 为实体ID，content 为字符串/数值属性值
+- entity_search_meta: 索引元信息（构建时间）
+
+unicode61 分词器不切分中文，写入和查询前把每个中日韩字符拆成单独的token，
+查询按短语匹配（相邻token），因此中文关键词为子串匹配，英文/数字按词（末词前缀）匹配。
+结果按 bm25 排序，实体ID命中的权重高于属性值。
+"""
+import json
+import re
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.core.db_pool import get_pool
+from app.core.logger import app_logger
+
+# 中日韩字符（含全角符号），写入和查询时逐字切分
+_CJK_PATTERN = re.compile(r"([　-〿㐀-䶿一-鿿＀-￯])")
+
+# 与 unicode61 分词一致的token（字母数字，下划线等为分隔符）
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# bm25 列权重：entity_key, content
+ENTITY_KEY_WEIGHT = 5.0
+CONTENT_WEIGHT = 1.0
+
+# 全量重建时每批写入的实体数
+REBUILD_CHUNK_SIZE = 10000
+
+
+def _split_cjk(text: str) -> str:
+    return _CJK_PATTERN.sub(r" \1 ", text)
+
+
+def build_match_query(keyword: str) -> Optional[str]:
+    """把关键词转换为FTS5短语查询，末个token按前缀匹配；没有可检索的token时返回None"""
+    tokens = _TOKEN_PATTERN.findall(_split_cjk(keyword))
+    if not tokens:
+        return None
+    return '"' + " ".join(tokens) + '"*'
+
+
+def entity_document(entity_id: str, properties: Dict) -> Tuple[str, str]:
+    """实体的可检索文本：(实体ID, 字符串/数值属性值)"""
+    values = [
+        str(value) for value in properties.values()
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool)
+    ]
+    return _split_cjk(entity_id), _split_cjk(" ".join(values))
+
+
+class EntitySearchIndex:
+    """持久化的实体全文检索索引"""
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: 数据库路径（与 entities 同库）
+        """
+        self.db_path = db_path
+        self._tables_ready = False
+
+    def _init_tables(self) -> None:
+        if self._tables_ready:
+            return
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entity_search_docs (
+                    doc_id INTEGER PRIMARY KEY,
+                    entity_id TEXT UNIQUE NOT NULL,
+                    entity_type TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entity_search_docs_type ON entity_search_docs(entity_type)")
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS entity_search
+                USING fts5(entity_key, content, tokenize = 'unicode61')
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entity_search_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+        self._tables_ready = True
+
+    def is_built(self) -> bool:
+        """索引是否已全量构建"""
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            row = conn.execute("SELECT 1 FROM entity_search_meta WHERE key = 'built_at'").fetchone()
+        return row is not None
+
+    # ---- 写入 ----
+
+    def upsert(self, entities: Iterable[Dict]) -> int:
+        """写入或更新实体（{"id", "type", "properties"}），同一批中重复的实体以最后一个为准"""
+        latest = {entity["id"]: entity for entity in entities}
+        if not latest:
+            return 0
+        self._init_tables()
+        with get_pool(self.db_path).write() as conn:
+            self._write(conn, latest.values())
+        return len(latest)
+
+    def _write(self, conn, entities: Iterable[Dict]) -> None:
+        rows = [
+            (entity["id"], entity["type"], *entity_document(entity["id"], entity.get("properties") or {}))
+            for entity in entities
+        ]
+        conn.executemany(
+            "DELETE FROM entity_search WHERE rowid = (SELECT doc_id FROM entity_search_docs WHERE entity_id = ?)",
+            [(entity_id,) for entity_id, *_ in rows]
+        )
+        conn.executemany(
+            """
+            INSERT INTO entity_search_docs (entity_id, entity_type) VALUES (?, ?)
+            ON CONFLICT(entity_id) DO UPDATE SET entity_type = excluded.entity_type
+            """,
+            [(entity_id, entity_type) for entity_id, entity_type, _, _ in rows]
+        )
+        conn.executemany(
+            """
+            INSERT INTO entity_search (rowid, entity_key, content)
+            SELECT doc_id, ?, ? FROM entity_search_docs WHERE entity_id = ?
+            """,
+            [(key, content, entity_id) for entity_id, _, key, content in rows]
+        )
+
+    def clear(self) -> None:
+        """清空索引（保留构建标记，空图谱也视为已构建）"""
+        self._init_tables()
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("DELETE FROM entity_search")
+            conn.execute("DELETE FROM entity_search_docs")
+
+    def rebuild(self) -> int:
+        """从 entities 表全量重建索引，返回索引的实体数"""
+        self._init_tables()
+        start = time.time()
+        total = 0
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("DELETE FROM entity_search")
+            conn.execute("DELETE FROM entity_search_docs")
+            cursor = conn.execute("SELECT id, type, properties FROM entities")
+            while True:
+                rows = cursor.fetchmany(REBUILD_CHUNK_SIZE)
+                if not rows:
+                    break
+                entities = []
+                for entity_id, entity_type, properties in rows:
+                    try:
+                        props = json.loads(properties) if properties else {}
+                    except (TypeError, ValueError):
+                        props = {}
+                    entities.append({"id": entity_id, "type": entity_type,
+                                     "properties": props if isinstance(props, dict) else {}})
+                self._write(conn, entities)
+                total += len(entities)
+            conn.execute(
+                "INSERT OR REPLACE INTO entity_search_meta (key, value) VALUES ('built_at', ?)",
+                (str(time.time()),)
+            )
+        app_logger.info(f"✓ 实体搜索索引重建完成: {total} 个实体, 耗时 {time.time() - start:.1f}s")
+        return total
+
+    # ---- 查询 ----
+
+    def search(self, keyword: str, entity_type: Optional[str] = None, limit: int = 20) -> Dict:
+        """
+        按关键词检索实体
+
+        Returns:
+            {"hits": [{"id", "type", "score"}], "total": 命中总数}，score 越大越相关
+        """
+        query = build_match_query(keyword)
+        if query is None:
+            return {"hits": [], "total": 0}
+        self._init_tables()
+
+        type_filter = "AND d.entity_type = ?" if entity_type else ""
+        params = [query] + ([entity_type] if entity_type else [])
+        with get_pool(self.db_path).read() as conn:
+            rows = conn.execute(f"""
+                SELECT d.entity_id, d.entity_type, bm25(entity_search, ?, ?) AS rank
+                FROM entity_search
+                JOIN entity_search_docs d ON d.doc_id = entity_search.rowid
+                WHERE entity_search MATCH ? {type_filter}
+                ORDER BY rank
+                LIMIT ?
+            """, [ENTITY_KEY_WEIGHT, CONTENT_WEIGHT] + params + [limit]).fetchall()
+            if len(rows) < limit:
+                total = len(rows)
+            else:
+                total = conn.execute(f"""
+                    SELECT COUNT(*) FROM entity_search
+                    JOIN entity_search_docs d ON d.doc_id = entity_search.rowid
+                    WHERE entity_search MATCH ? {type_filter}
+                """, params).fetchone()[0]
+
+        return {
+            "hits": [{"id": entity_id, "type": entity_type_, "score": round(-rank, 4)}
+                     for entity_id, entity_type_, rank in rows],
+            "total": total
+        }
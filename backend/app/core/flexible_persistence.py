@@ -7,7 +7,6 @@
 - 延迟解析，只在需要时解析文本内容
 """
 
-import sqlite3
 import json
 from datetime import datetime
 from typing import List, Dict, Any, Optional
@@ -15,6 +14,7 @@ from pathlib import Path
 
 from app.core.data_parser import DataParser, BehaviorEventParser, UserProfileParser
 from app.core.logger import app_logger
+from app.core.db_pool import get_pool
 
 
 class FlexiblePersistence:
@@ -26,7 +26,7 @@ class FlexiblePersistence:
 
     def _ensure_tables(self):
         """确保灵活数据表存在"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).write() as conn:
             cursor = conn.cursor()
 
             # 创建灵活的行为事件表
@@ -87,8 +87,6 @@ class FlexiblePersistence:
                 ON event_sequences_v2(start_time, end_time)
             """)
 
-            conn.commit()
-
     # ==================== 行为事件操作 ====================
 
     def insert_behavior_event(
@@ -107,13 +105,12 @@ class FlexiblePersistence:
         Returns:
             插入的记录ID
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).write() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO behavior_events (user_id, event_time, event_data)
                 VALUES (?, ?, ?)
             """, (user_id, event_time, event_data))
-            conn.commit()
             return cursor.lastrowid
 
     def batch_insert_behavior_events(self, events: List[Dict[str, Any]]) -> int:
@@ -128,7 +125,7 @@ class FlexiblePersistence:
         Returns:
             插入的记录数
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).write() as conn:
             cursor = conn.cursor()
 
             data = [
@@ -145,7 +142,6 @@ class FlexiblePersistence:
                 VALUES (?, ?, ?)
             """, data)
 
-            conn.commit()
             return len(data)
 
     def query_behavior_events(
@@ -170,7 +166,7 @@ class FlexiblePersistence:
         Returns:
             事件列表
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).read() as conn:
             cursor = conn.cursor()
 
             # 构建查询条件
@@ -234,7 +230,7 @@ class FlexiblePersistence:
             profile_data: 画像数据（文本格式）
             profile_version: 画像版本号
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).write() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO user_profiles_v2 (user_id, profile_data, profile_version, updated_at)
@@ -244,7 +240,6 @@ class FlexiblePersistence:
                     profile_version = excluded.profile_version,
                     updated_at = CURRENT_TIMESTAMP
             """, (user_id, profile_data, profile_version))
-            conn.commit()
 
     def batch_upsert_user_profiles(self, profiles: List[Dict[str, Any]]) -> int:
         """批量插入或更新用户画像
@@ -255,24 +250,21 @@ class FlexiblePersistence:
         Returns:
             处理的记录数
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).write() as conn:
             cursor = conn.cursor()
 
-            for profile in profiles:
-                cursor.execute("""
-                    INSERT INTO user_profiles_v2 (user_id, profile_data, profile_version, updated_at)
-                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        profile_data = excluded.profile_data,
-                        profile_version = excluded.profile_version,
-                        updated_at = CURRENT_TIMESTAMP
-                """, (
-                    profile["user_id"],
-                    profile["profile_data"],
-                    profile.get("profile_version", 1)
-                ))
-
-            conn.commit()
+            cursor.executemany("""
+                INSERT INTO user_profiles_v2 (user_id, profile_data, profile_version, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    profile_data = excluded.profile_data,
+                    profile_version = excluded.profile_version,
+                    updated_at = CURRENT_TIMESTAMP
+            """, [
+                (profile["user_id"], profile["profile_data"], profile.get("profile_version", 1))
+                for profile in profiles
+            ])
+
             return len(profiles)
 
     def query_user_profile(
@@ -289,7 +281,7 @@ class FlexiblePersistence:
         Returns:
             用户画像或None
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).read() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT user_id, profile_data, profile_version, updated_at, created_at
@@ -339,13 +331,12 @@ class FlexiblePersistence:
         Returns:
             插入的记录ID
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).write() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO event_sequences_v2 (user_id, sequence_data, start_time, end_time, event_count)
                 VALUES (?, ?, ?, ?, ?)
             """, (user_id, sequence_data, start_time, end_time, event_count))
-            conn.commit()
             return cursor.lastrowid
 
     def query_event_sequences(
@@ -366,7 +357,7 @@ class FlexiblePersistence:
         Returns:
             序列列表
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).read() as conn:
             cursor = conn.cursor()
 
             if user_id:
@@ -418,7 +409,7 @@ class FlexiblePersistence:
         Returns:
             统计信息字典
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).read() as conn:
             cursor = conn.cursor()
 
             stats = {}
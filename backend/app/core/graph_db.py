@@ -1,75 +1,275 @@
 """
-图数据库服务 - 基于NetworkX的内存图数据库 + SQLite持久化
+图数据库服务 - 内存图数据库（NetworkX 或 CSR紧凑存储，GRAPH_BACKEND 选择）+ SQLite持久化
 后续可替换为Neo4j
+
+知识图谱在后台线程中加载（分块读取，没有条数上限），访问图或索引时等待加载完成；
+加载结果保存为快照文件，数据库中的知识图谱版本未变化时下次启动直接反序列化快照。
 """
+import gc
+import json
+import os
+import pickle
+import threading
+import time
 import networkx as nx
-from typing import Dict, List, Any, Optional
+from pathlib import Path
+from itertools import islice
+from typing import Dict, Iterator, List, Any, Optional, Set, Tuple, Union
 from collections import defaultdict
+from contextlib import contextmanager
+from app.core.config import settings
+from app.core.csr_graph import CSRGraph
+from app.core.entity_search import EntitySearchIndex
+from app.core.graph_traversal import GraphTraverser
 from app.core.persistence import persistence
 from app.core.logger import app_logger
 
+# 建立二级属性索引的实体属性（分群查询按倒排集合求交）
+INDEXED_PROPERTIES = {
+    "User": ("gender", "city_tier", "income_level", "age_bucket", "purchase_intent", "lifecycle_stage"),
+}
+
+# 从数据库加载时每块读取的行数
+LOAD_CHUNK_SIZE = 10000
+
+# 快照格式版本（内存结构变化时递增，旧快照自动失效）
+SNAPSHOT_FORMAT = 2
+
+# 可选的内存图存储
+GRAPH_BACKENDS = ("networkx", "csr")
+
+
+@contextmanager
+def _gc_paused():
+    """批量创建大量容器对象时暂停循环垃圾回收（分代GC会反复扫描新建的对象）"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _value_postings():
+    return defaultdict(set)
+
+
+def _is_indexable(value: Any) -> bool:
+    return value is not None and isinstance(value, (str, int, float, bool))
+
+
+def _index_node(property_index, entity_id: str, data: Dict) -> None:
+    """把节点的属性值加入二级属性索引"""
+    entity_type = data.get("type")
+    for prop in INDEXED_PROPERTIES.get(entity_type, ()):
+        value = data.get(prop)
+        if _is_indexable(value):
+            property_index[(entity_type, prop)][value].add(entity_id)
+
+
 class GraphDatabase:
-    """基于NetworkX的图数据库（带持久化）"""
+    """内存图数据库（带持久化）
 
-    def __init__(self, enable_persistence: bool = True):
-        self.knowledge_graph = nx.MultiDiGraph()
+    networkx 后端为 MultiDiGraph；csr 后端为 CSRGraph（整数编码节点 + CSR邻接数组），
+    大图内存占用显著更低。多跳遍历和最短路径由 GraphTraverser 经 iter_adjacent 逐条读取邻接，两种后端共用。
+    """
+
+    def __init__(
+        self,
+        enable_persistence: bool = True,
+        search_index: Optional[EntitySearchIndex] = None,
+        snapshot_path: Optional[str] = None,
+        background_load: bool = True,
+        backend: Optional[str] = None
+    ):
+        """
+        Args:
+            enable_persistence: 是否持久化（并在启动时加载已持久化的知识图谱）
+            search_index: 实体全文检索索引（默认与持久化同库；未持久化且未指定时不建索引）
+            snapshot_path: 内存图快照文件（默认与数据库同目录的 graph.snapshot.pkl）
+            background_load: 是否在后台线程中加载；访问图或索引时等待加载完成
+            backend: 内存图存储 networkx / csr（默认 GRAPH_BACKEND 配置）
+        """
+        self.backend = backend or settings.graph_backend
+        if self.backend not in GRAPH_BACKENDS:
+            raise ValueError(f"不支持的图存储后端: {self.backend}（可选: {', '.join(GRAPH_BACKENDS)}）")
+        self._knowledge_graph = self._new_graph()
         self.event_graph = nx.DiGraph()
-        self.entity_index = defaultdict(list)  # 实体索引
-        self.relation_index = defaultdict(list)  # 关系索引
+        self._entity_index = defaultdict(list)  # 实体索引
+        self._relation_index = defaultdict(list)  # 关系索引
+        self._property_index = defaultdict(_value_postings)  # (实体类型, 属性) -> 属性值 -> 实体ID集合
         self.enable_persistence = enable_persistence
+        if search_index is None and enable_persistence:
+            search_index = EntitySearchIndex(persistence.db_path)
+        self.search_index = search_index
+        if snapshot_path is None and enable_persistence:
+            snapshot_path = persistence.db_path.with_suffix(".snapshot.pkl")
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.traverser = GraphTraverser(self.iter_adjacent, self._node_type, lambda node: self.knowledge_graph.has_node(node))
 
         # 启动时自动加载持久化数据
-        if self.enable_persistence:
+        self._loaded = threading.Event()
+        if not self.enable_persistence:
+            self._loaded.set()
+        elif background_load:
+            threading.Thread(target=self._load_from_persistence, name="graph-loader", daemon=True).start()
+        else:
             self._load_from_persistence()
+
+    # ---- 加载完成前访问图或索引时等待 ----
+
+    def _new_graph(self) -> Union[nx.MultiDiGraph, CSRGraph]:
+        return CSRGraph() if self.backend == "csr" else nx.MultiDiGraph()
+
+    @property
+    def knowledge_graph(self) -> Union[nx.MultiDiGraph, CSRGraph]:
+        self._loaded.wait()
+        return self._knowledge_graph
+
+    @property
+    def entity_index(self) -> Dict[str, List[str]]:
+        self._loaded.wait()
+        return self._entity_index
+
+    @property
+    def relation_index(self) -> Dict[str, List[tuple]]:
+        self._loaded.wait()
+        return self._relation_index
+
+    @property
+    def property_index(self) -> Dict[tuple, Dict[Any, Set[str]]]:
+        self._loaded.wait()
+        return self._property_index
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """等待知识图谱加载完成，返回是否已完成"""
+        return self._loaded.wait(timeout)
+
     def _load_from_persistence(self):
-        """从持久化层加载数据"""
+        """从持久化层加载数据：版本一致时读取快照，否则分块读取数据库并写入新快照"""
+        start = time.perf_counter()
         try:
             app_logger.info("正在从持久化层加载知识图谱...")
-            entities = persistence.load_entities(limit=100000)
-            relations = persistence.load_relations(limit=100000)
-
-            for entity in entities:
-                self.knowledge_graph.add_node(
-                    entity["id"],
-                    type=entity["type"],
-                    **entity["properties"]
-                )
-                self.entity_index[entity["type"]].append(entity["id"])
-
-            for rel in relations:
-                if self.knowledge_graph.has_node(rel["from"]) and self.knowledge_graph.has_node(rel["to"]):
-                    self.knowledge_graph.add_edge(
-                        rel["from"],
-                        rel["to"],
-                        type=rel["type"],
-                        weight=rel.get("weight", 0.5)
-                    )
-                    self.relation_index[rel["type"]].append((rel["from"], rel["to"]))
-
-            app_logger.info(f"加载完成: {len(entities)} 个实体, {len(relations)} 个关系")
+            with _gc_paused():
+                state = self._read_snapshot(persistence.get_graph_version())
+                source = "快照"
+                if state is None:
+                    state = self._read_database()
+                    source = "数据库"
+            if source == "数据库":
+                self._write_snapshot(state)
+
+            self._knowledge_graph = state["knowledge_graph"]
+            self._entity_index = state["entity_index"]
+            self._relation_index = state["relation_index"]
+            self._property_index = state["property_index"]
+            app_logger.info(
+                f"加载完成({source}): {self._knowledge_graph.number_of_nodes()} 个实体, "
+                f"{self._knowledge_graph.number_of_edges()} 个关系, 耗时 {time.perf_counter() - start:.2f}s"
+            )
         except Exception as e:
             app_logger.warning(f"加载持久化数据失败: {e}")
+        finally:
+            self._loaded.set()
+
+        try:
+            # 旧数据库没有搜索索引时从 entities 表全量构建一次
+            if self.search_index is not None and not self.search_index.is_built():
+                self.search_index.rebuild()
+        except Exception as e:
+            app_logger.warning(f"构建实体搜索索引失败: {e}")
+
+    def _read_database(self) -> Dict:
+        """在一个读事务中分块读取实体和关系，构建内存图和索引"""
+        graph = self._new_graph()
+        entity_index = defaultdict(list)
+        relation_index = defaultdict(list)
+        property_index = defaultdict(_value_postings)
+        version = None
+
+        for kind, payload in persistence.iter_knowledge_graph(LOAD_CHUNK_SIZE):
+            if kind == "version":
+                version = payload
+            elif kind == "entities":
+                nodes = []
+                for entity_id, entity_type, properties in payload:
+                    data = {**json.loads(properties), "type": entity_type}
+                    nodes.append((entity_id, data))
+                    entity_index[entity_type].append(entity_id)
+                    _index_node(property_index, entity_id, data)
+                graph.add_nodes_from(nodes)
+            else:
+                edges = []
+                for from_id, to_id, rel_type, properties in payload:
+                    if from_id in graph and to_id in graph:
+                        weight = json.loads(properties).get("weight", 0.5)
+                        edges.append((from_id, to_id, {"type": rel_type, "weight": weight}))
+                        relation_index[rel_type].append((from_id, to_id))
+                graph.add_edges_from(edges)
+
+        return {
+            "version": version,
+            "knowledge_graph": graph,
+            "entity_index": entity_index,
+            "relation_index": relation_index,
+            "property_index": property_index
+        }
+
+    def _read_snapshot(self, version: Optional[str]) -> Optional[Dict]:
+        """读取与当前知识图谱版本一致的快照，不可用时返回None"""
+        if self.snapshot_path is None or version is None or not self.snapshot_path.exists():
+            return None
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            app_logger.warning(f"读取图快照失败，改为从数据库加载: {e}")
+            return None
+        if (state.get("format") != SNAPSHOT_FORMAT or state.get("backend") != self.backend
+                or state.get("version") != version):
+            return None
+        return state
+
+    def _write_snapshot(self, state: Dict) -> None:
+        """原子写入快照（先写临时文件再替换）"""
+        if self.snapshot_path is None or state["version"] is None:
+            return
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"format": SNAPSHOT_FORMAT, "backend": self.backend, **state}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            app_logger.warning(f"写入图快照失败: {e}")
 
     def clear_knowledge_graph(self):
         """清空知识图谱"""
         self.knowledge_graph.clear()
         self.entity_index.clear()
         self.relation_index.clear()
+        self.property_index.clear()
 
         # 同步清空持久化数据
         if self.enable_persistence:
             persistence.clear_knowledge_graph()
+        if self.search_index is not None:
+            self.search_index.clear()
     
     def create_entity(self, entity_id: str, entity_type: str, properties: Dict = None):
         """创建实体"""
         props = properties or {}
+        self._track_entity_type(entity_id, entity_type)
+        self._unindex_properties(entity_id)
         self.knowledge_graph.add_node(entity_id, type=entity_type, **props)
-        self.entity_index[entity_type].append(entity_id)
-        self.entity_index[f"type:{entity_type}"].append(entity_id)
+        self._index_properties(entity_id)
 
         # 持久化到数据库
         if self.enable_persistence:
             persistence.save_entity(entity_id, entity_type, props)
+        if self.search_index is not None:
+            self.search_index.upsert([{"id": entity_id, "type": entity_type, "properties": props}])
 
         return {"id": entity_id, "type": entity_type, "properties": props}
     
@@ -104,55 +304,204 @@ class GraphDatabase:
             })
         return entities
     
-    def query_relations(self, rel_type: str = None, limit: int = 100) -> List[Dict]:
-        """查询关系"""
-        relations = []
-        edges = list(self.knowledge_graph.edges(data=True))[:limit]
-        for u, v, data in edges:
-            if not rel_type or data.get("type") == rel_type:
-                relations.append({
-                    "from": u,
-                    "to": v,
-                    "type": data.get("type", "RELATED"),
-                    "weight": data.get("weight", 0.5)
-                })
-        return relations
-    
-    def find_path(self, source: str, target: str) -> List[str]:
-        """查找路径"""
-        try:
-            path = nx.shortest_path(self.knowledge_graph, source, target)
-            return path
-        except nx.NetworkXNoPath:
-            return []
-    
-    def find_related(self, entity_id: str, depth: int = 2) -> List[Dict]:
-        """查找关联实体"""
-        related = []
-        visited = set()
-        queue = [(entity_id, 0)]
-        
-        while queue and len(related) < 50:
-            node, d = queue.pop(0)
-            if node in visited:
+    def _track_entity_type(self, entity_id: str, entity_type: str) -> None:
+        """维护类型索引（在 add_node 之前调用）：新实体追加一次，类型变化时从旧类型中移除"""
+        if not self.knowledge_graph.has_node(entity_id):
+            self.entity_index[entity_type].append(entity_id)
+            return
+        old_type = self.knowledge_graph.nodes[entity_id].get("type")
+        if old_type != entity_type:
+            if entity_id in self.entity_index.get(old_type, ()):
+                self.entity_index[old_type].remove(entity_id)
+            self.entity_index[entity_type].append(entity_id)
+
+    def _index_properties(self, entity_id: str) -> None:
+        """把节点当前的属性值加入二级属性索引"""
+        _index_node(self.property_index, entity_id, self.knowledge_graph.nodes[entity_id])
+
+    def _unindex_properties(self, entity_id: str) -> None:
+        """节点属性更新前从二级属性索引中移除旧值（add_node 会合并属性）"""
+        if not self.knowledge_graph.has_node(entity_id):
+            return
+        data = self.knowledge_graph.nodes[entity_id]
+        entity_type = data.get("type")
+        for prop in INDEXED_PROPERTIES.get(entity_type, ()):
+            postings = self.property_index.get((entity_type, prop))
+            value = data.get(prop)
+            if postings is not None and _is_indexable(value) and value in postings:
+                postings[value].discard(entity_id)
+                if not postings[value]:
+                    del postings[value]
+
+    def find_entities(self, entity_type: str, criteria: Dict = None, limit: int = None) -> List[Dict]:
+        """
+        按属性等值条件查询实体
+
+        有二级索引的条件按倒排集合求交（从最小的集合开始），其余条件逐个校验候选实体；
+        没有可用索引时扫描该类型的全部实体。
+        """
+        criteria = criteria or {}
+        indexed = [prop for prop in criteria if prop in INDEXED_PROPERTIES.get(entity_type, ())]
+        if indexed:
+            postings: List[Set[str]] = sorted(
+                (self.property_index[(entity_type, prop)].get(criteria[prop], set()) for prop in indexed),
+                key=len
+            )
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+                if not candidates:
+                    break
+            candidates = sorted(candidates)
+        else:
+            candidates = dict.fromkeys(self.entity_index.get(entity_type, []))
+
+        remaining = [prop for prop in criteria if prop not in indexed]
+        entities = []
+        for eid in candidates:
+            data = self.knowledge_graph.nodes.get(eid)
+            if data is None or data.get("type") != entity_type:
+                continue
+            if any(data.get(prop) != criteria[prop] for prop in remaining):
                 continue
-            visited.add(node)
-            
-            if d > 0:
-                data = self.knowledge_graph.nodes.get(node, {})
-                related.append({
-                    "id": node,
-                    "type": data.get("type", "Unknown"),
-                    "distance": d
+            entities.append({
+                "id": eid,
+                "type": entity_type,
+                "properties": {k: v for k, v in data.items() if k != "type"}
+            })
+            if limit is not None and len(entities) >= limit:
+                break
+        return entities
+
+    def neighbors(self, node_id: str, rel_type: str = None) -> List[Dict]:
+        """
+        类型化出边查询：一次读取节点的邻接表
+
+        Returns:
+            [{"id": 目标节点, "type": 关系类型, "weight": 权重, "properties": 关系属性}]
+        """
+        graph = self.knowledge_graph
+        if not graph.has_node(node_id):
+            return []
+        if isinstance(graph, CSRGraph):
+            edges = graph.out_edges(node_id)
+        else:
+            edges = [(target, data) for target, keyed in graph.adj[node_id].items() for data in keyed.values()]
+        result = []
+        for target, data in edges:
+            edge_type = data.get("type", "RELATED")
+            if rel_type is None or edge_type == rel_type:
+                result.append({
+                    "id": target,
+                    "type": edge_type,
+                    "weight": data.get("weight", 0.5),
+                    "properties": {k: v for k, v in data.items() if k != "type"}
                 })
-            
-            if d < depth:
-                for neighbor in self.knowledge_graph.successors(node):
-                    queue.append((neighbor, d + 1))
-                for predecessor in self.knowledge_graph.predecessors(node):
-                    queue.append((predecessor, d + 1))
-        
-        return related
+        return result
+
+    def search_entities(self, keyword: str, entity_type: str = None, limit: int = 20) -> Dict:
+        """
+        全文检索实体（按相关度排序）
+
+        Returns:
+            {"entities": [{"id", "type", "properties", "score"}], "total": 命中总数}
+        """
+        if self.search_index is None:
+            return self._scan_entities(keyword, entity_type, limit)
+
+        result = self.search_index.search(keyword, entity_type, limit)
+        hits = result["hits"]
+        # 优先取内存图中的属性，未加载到内存的实体从持久化层读取
+        missing = [hit["id"] for hit in hits if not self.knowledge_graph.has_node(hit["id"])]
+        stored = {}
+        if missing and self.enable_persistence:
+            stored = {e["id"]: e["properties"] for e in persistence.load_entities_by_ids(missing)}
+
+        entities = []
+        for hit in hits:
+            if self.knowledge_graph.has_node(hit["id"]):
+                data = self.knowledge_graph.nodes[hit["id"]]
+                properties = {k: v for k, v in data.items() if k != "type"}
+            else:
+                properties = stored.get(hit["id"], {})
+            entities.append({**hit, "properties": properties})
+        return {"entities": entities, "total": result["total"]}
+
+    def _scan_entities(self, keyword: str, entity_type: str = None, limit: int = 20) -> Dict:
+        """没有搜索索引时逐个扫描内存图中的实体（ID和属性值子串匹配）"""
+        keyword_lower = keyword.lower()
+        ids = self.entity_index.get(entity_type, []) if entity_type else self.knowledge_graph.nodes()
+        matching = []
+        seen = set()
+        for eid in ids:
+            if eid in seen:
+                continue
+            seen.add(eid)
+            data = self.knowledge_graph.nodes.get(eid, {})
+            properties = {k: v for k, v in data.items() if k != "type"}
+            values = [eid] + [str(v) for v in properties.values() if isinstance(v, (str, int, float))]
+            if any(keyword_lower in value.lower() for value in values):
+                matching.append({"id": eid, "type": data.get("type", "Unknown"), "properties": properties})
+        return {"entities": matching[:limit], "total": len(matching)}
+
+    def query_relations(self, rel_type: str = None, limit: int = 100) -> List[Dict]:
+        """查询关系（按添加顺序，先按类型过滤再取前 limit 条）"""
+        graph = self.knowledge_graph
+        if rel_type and isinstance(graph, CSRGraph):
+            edges = graph.typed_edges(rel_type)
+        else:
+            edges = (
+                edge for edge in graph.edges(data=True)
+                if not rel_type or edge[2].get("type") == rel_type
+            )
+        return [
+            {
+                "from": u,
+                "to": v,
+                "type": data.get("type", "RELATED"),
+                "weight": data.get("weight", 0.5)
+            }
+            for u, v, data in islice(edges, limit)
+        ]
+    
+    def iter_adjacent(self, node_id: str, outgoing: bool = True) -> Iterator[Tuple[str, Optional[str]]]:
+        """逐条产出节点出边（或入边）的 (邻居, 关系类型)，多重边各产出一次；按需读取，调用方可随时停止"""
+        graph = self.knowledge_graph
+        if isinstance(graph, CSRGraph):
+            yield from graph.iter_adjacent(node_id, outgoing)
+            return
+        if not graph.has_node(node_id):
+            return
+        adjacency = graph.succ[node_id] if outgoing else graph.pred[node_id]
+        for neighbor, keyed in adjacency.items():
+            for data in keyed.values():
+                yield neighbor, data.get("type")
+
+    def _node_type(self, node_id: str) -> Optional[str]:
+        graph = self.knowledge_graph
+        if isinstance(graph, CSRGraph):
+            return graph.type_of(node_id)
+        return graph.nodes.get(node_id, {}).get("type")
+
+    def expand(self, sources: List[str], **options) -> Dict:
+        """
+        多起点有界广度优先扩展（深度、方向、关系类型、按关系类型的扇出上限、提前结束、分页）
+
+        参数与返回值见 GraphTraverser.expand
+        """
+        return self.traverser.expand(sources, **options)
+
+    def find_path(self, source: str, target: str, max_depth: Optional[int] = None) -> List[str]:
+        """查找路径（沿出边的最短路径，双向BFS）"""
+        return self.traverser.shortest_path(source, target, max_depth)
+
+    def find_related(self, entity_id: str, depth: int = 2, limit: int = 50) -> List[Dict]:
+        """查找关联实体（出边和入边，按距离由近到远，最多 limit 个）"""
+        result = self.traverser.expand([entity_id], depth=depth, max_nodes=limit, limit=limit)
+        return [
+            {"id": node["id"], "type": node["type"], "distance": node["distance"]}
+            for node in result["nodes"]
+        ]
     
     def get_stats(self) -> Dict:
         """获取统计信息"""
@@ -171,17 +520,21 @@ class GraphDatabase:
         """批量创建实体（性能优化）"""
         created_count = 0
         for entity in entities:
+            self._track_entity_type(entity["id"], entity["type"])
+            self._unindex_properties(entity["id"])
             self.knowledge_graph.add_node(
                 entity["id"],
                 type=entity["type"],
                 **entity.get("properties", {})
             )
-            self.entity_index[entity["type"]].append(entity["id"])
+            self._index_properties(entity["id"])
             created_count += 1
 
         # 批量持久化
         if self.enable_persistence:
             persistence.batch_save_entities(entities)
+        if self.search_index is not None:
+            self.search_index.upsert(entities)
 
         return created_count
 
@@ -0,0 +1,195 @@
+"""
+多跳遍历引擎 - 知识图谱上有界的广度优先扩展与双向最短路径
+
+- expand: 多个起点一起做广度优先扩展（共享已访问集合），可限制深度、方向、关系类型，
+  每个节点按关系类型限制扩展数（fan-out），并在发现节点数或扫描边数达到上限时提前结束；
+  结果按发现顺序（距离递增）分页返回，附每一跳的节点数
+- shortest_path: 沿出边的双向BFS，每次扩展较小的一侧
+
+热门APP、品牌等枢纽节点有数万条边：邻接按需逐条读取，每个节点最多扫描 node_scan_limit 条边，
+达到扇出上限后不再继续读取，因此单次查询的代价与枢纽节点的度数无关。
+"""
+from collections import Counter, deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 默认遍历参数
+DEFAULT_DEPTH = 2
+DEFAULT_FANOUT = 100  # 每个节点每种关系类型最多扩展的邻居数
+DEFAULT_NODE_SCAN_LIMIT = 5000  # 每个节点最多扫描的边数
+DEFAULT_MAX_NODES = 10000  # 最多发现的节点数
+DEFAULT_MAX_EDGES = 200000  # 整次遍历最多扫描的边数
+DEFAULT_PAGE_SIZE = 50
+
+DIRECTIONS = ("out", "in", "both")
+
+# 邻接读取函数：(节点, 是否出边) -> 逐条产出 (邻居, 关系类型)
+Adjacency = Callable[[str, bool], Iterator[Tuple[str, Optional[str]]]]
+
+
+class GraphTraverser:
+    """基于邻接读取函数的遍历引擎（与具体图存储无关）"""
+
+    def __init__(self, adjacency: Adjacency, node_type: Callable[[str], Optional[str]], has_node: Callable[[str], bool]):
+        """
+        Args:
+            adjacency: 邻接读取函数，多重边各产出一次
+            node_type: 节点类型查询
+            has_node: 节点是否存在
+        """
+        self.adjacency = adjacency
+        self.node_type = node_type
+        self.has_node = has_node
+
+    def _neighbors(self, node: str, direction: str) -> Iterator[Tuple[str, Optional[str]]]:
+        if direction in ("out", "both"):
+            yield from self.adjacency(node, True)
+        if direction in ("in", "both"):
+            yield from self.adjacency(node, False)
+
+    def expand(
+        self,
+        sources: Iterable[str],
+        depth: int = DEFAULT_DEPTH,
+        direction: str = "both",
+        rel_types: Optional[Iterable[str]] = None,
+        fanout: Optional[int] = DEFAULT_FANOUT,
+        fanout_per_type: Optional[Dict[str, int]] = None,
+        node_scan_limit: Optional[int] = DEFAULT_NODE_SCAN_LIMIT,
+        max_nodes: Optional[int] = DEFAULT_MAX_NODES,
+        max_edges: Optional[int] = DEFAULT_MAX_EDGES,
+        offset: int = 0,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE
+    ) -> Dict:
+        """
+        从多个起点做有界的广度优先扩展
+
+        Args:
+            sources: 起点（不存在的起点忽略）
+            depth: 最大跳数
+            direction: out / in / both
+            rel_types: 只沿这些关系类型扩展（None 为全部）
+            fanout: 每个节点每种关系类型最多扩展的新邻居数（None 不限制）
+            fanout_per_type: 按关系类型覆盖 fanout
+            node_scan_limit: 每个节点最多扫描的边数
+            max_nodes: 发现的节点数达到该值时结束
+            max_edges: 扫描的边数达到该值时结束
+            offset / limit: 结果分页（按发现顺序）
+
+        Returns:
+            {"nodes": [{"id", "type", "distance", "source", "via"}], "total", "hop_counts",
+             "offset", "limit", "truncated", "edges_scanned"}
+            truncated 表示因扫描或节点上限提前结束（或有节点的边未扫描完），结果可能不完整
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction 必须为 {', '.join(DIRECTIONS)} 之一")
+        allowed = set(rel_types) if rel_types is not None else None
+        fanout_per_type = fanout_per_type or {}
+
+        visited = set()
+        frontier = deque()
+        for source in sources:
+            if source not in visited and self.has_node(source):
+                visited.add(source)
+                frontier.append((source, 0, source))
+
+        found: List[Dict] = []
+        hop_counts = Counter()
+        edges_scanned = 0
+        truncated = stop = False
+
+        while frontier and not stop:
+            node, distance, origin = frontier.popleft()
+            if distance >= depth:
+                continue
+            taken = Counter()
+            for scanned, (neighbor, rel_type) in enumerate(self._neighbors(node, direction)):
+                if node_scan_limit is not None and scanned >= node_scan_limit:
+                    truncated = True
+                    break
+                if max_edges is not None and edges_scanned >= max_edges:
+                    truncated = stop = True
+                    break
+                edges_scanned += 1
+                if allowed is not None and rel_type not in allowed:
+                    continue
+                cap = fanout_per_type.get(rel_type, fanout)
+                if cap is not None and taken[rel_type] >= cap:
+                    continue
+                if neighbor in visited:
+                    continue
+                visited.add(neighbor)
+                taken[rel_type] += 1
+                hop_counts[distance + 1] += 1
+                found.append({
+                    "id": neighbor,
+                    "type": self.node_type(neighbor) or "Unknown",
+                    "distance": distance + 1,
+                    "source": origin,
+                    "via": rel_type
+                })
+                frontier.append((neighbor, distance + 1, origin))
+                if max_nodes is not None and len(found) >= max_nodes:
+                    truncated = stop = True
+                    break
+
+        page = found[offset:offset + limit] if limit is not None else found[offset:]
+        return {
+            "nodes": page,
+            "total": len(found),
+            "hop_counts": dict(sorted(hop_counts.items())),
+            "offset": offset,
+            "limit": limit,
+            "truncated": truncated,
+            "edges_scanned": edges_scanned
+        }
+
+    def shortest_path(self, source: str, target: str, max_depth: Optional[int] = None) -> List[str]:
+        """沿出边的无权最短路径（双向BFS），不可达或超过 max_depth 时返回空列表"""
+        if not (self.has_node(source) and self.has_node(target)):
+            return []
+        if source == target:
+            return [source]
+
+        forward = {source: None}  # 节点 -> 前驱（从 source 出发）
+        backward = {target: None}  # 节点 -> 后继（到达 target）
+        forward_frontier, backward_frontier = [source], [target]
+        length = 0
+
+        while forward_frontier and backward_frontier:
+            if max_depth is not None and length >= max_depth:
+                return []
+            length += 1
+            # 扩展较小的一侧；同一层内任何相遇点给出的路径长度相同
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meet = self._advance(forward_frontier, forward, backward, outgoing=True)
+            else:
+                backward_frontier, meet = self._advance(backward_frontier, backward, forward, outgoing=False)
+            if meet is not None:
+                return self._join(meet, forward, backward)
+        return []
+
+    def _advance(self, frontier: List[str], parents: Dict, other: Dict, outgoing: bool):
+        next_frontier = []
+        for node in frontier:
+            for neighbor, _ in self.adjacency(node, outgoing):
+                if neighbor in parents:
+                    continue
+                parents[neighbor] = node
+                if neighbor in other:
+                    return next_frontier, neighbor
+                next_frontier.append(neighbor)
+        return next_frontier, None
+
+    @staticmethod
+    def _join(meet: str, forward: Dict, backward: Dict) -> List[str]:
+        path = []
+        node = meet
+        while node is not None:
+            path.append(node)
+            node = forward[node]
+        path.reverse()
+        node = backward[meet]
+        while node is not None:
+            path.append(node)
+            node = backward[node]
+        return path
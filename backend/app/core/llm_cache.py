@@ -0,0 +1,221 @@
+"""
+LLM响应缓存 - 按 (model, temperature, max_tokens, prompt哈希) 内容寻址的持久化缓存
+
+任务重试或重跑时会发送完全相同的prompt，命中缓存可直接回放结果而不再调用LLM。
+缓存存储在独立的SQLite文件中，支持TTL过期和按总大小的LRU驱逐。
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.db_pool import get_pool
+from app.core.logger import app_logger
+
+
+class LLMResponseCache:
+    """持久化的LLM响应缓存（支持TTL和按容量的LRU驱逐）"""
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_bytes: int):
+        """
+        Args:
+            db_path: 缓存数据库路径
+            ttl_seconds: 缓存过期时间（秒），<=0表示永不过期
+            max_bytes: 响应内容总大小上限（字节），超出时驱逐最久未使用的条目
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()  # get/set 在多个线程中执行（asyncio.to_thread）
+        self._init_table()
+
+    def _init_table(self) -> None:
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    hit_count INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed "
+                "ON llm_response_cache(last_accessed)"
+            )
+
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: int, prompt: str) -> str:
+        """生成缓存键
+
+        Returns:
+            SHA-256十六进制字符串
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        key_str = json.dumps(
+            {
+                "model": model, "temperature": temperature, "max_tokens": max_tokens,
+                "prompt": prompt_hash
+            },
+            sort_keys=True
+        )
+        return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """获取缓存的响应
+
+        查询走读连接，只有命中后更新访问时间、或删除过期条目时才获取写锁。
+
+        Returns:
+            响应文本或None（不存在或已过期）
+        """
+        now = time.time()
+        with get_pool(self.db_path).read() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_response_cache WHERE cache_key = ?",
+                (key,)
+            ).fetchone()
+
+        if row is None:
+            self._count("misses")
+            return None
+
+        response, created_at = row
+        with get_pool(self.db_path).write() as conn:
+            if self._is_expired(created_at, now):
+                # 只删除读到的这一版本，不误删并发写入的新响应
+                conn.execute(
+                    "DELETE FROM llm_response_cache WHERE cache_key = ? AND created_at = ?",
+                    (key, created_at)
+                )
+                response = None
+            else:
+                conn.execute(
+                    "UPDATE llm_response_cache SET last_accessed = ?, hit_count = hit_count + 1 "
+                    "WHERE cache_key = ?",
+                    (now, key)
+                )
+
+        if response is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        app_logger.debug(f"LLM缓存命中: {key[:12]}")
+        return response
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def set(self, key: str, model: str, response: str) -> None:
+        """写入缓存，超出容量时按LRU驱逐"""
+        size_bytes = len(response.encode("utf-8"))
+        if size_bytes > self.max_bytes:
+            return
+
+        now = time.time()
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO llm_response_cache
+                (cache_key, model, response, size_bytes, created_at, last_accessed, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            """, (key, model, response, size_bytes, now, now))
+            self._evict(conn)
+
+    def _evict(self, conn) -> None:
+        """删除最久未使用的条目直到总大小不超过上限"""
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM llm_response_cache"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute(
+            "SELECT cache_key, size_bytes FROM llm_response_cache ORDER BY last_accessed"
+        ).fetchall()
+        evict_keys = []
+        for cache_key, size_bytes in rows:
+            if total <= self.max_bytes:
+                break
+            evict_keys.append((cache_key,))
+            total -= size_bytes
+
+        conn.executemany("DELETE FROM llm_response_cache WHERE cache_key = ?", evict_keys)
+        self._count("evictions", len(evict_keys))
+        app_logger.debug(f"LLM缓存已满，驱逐 {len(evict_keys)} 个条目")
+
+    def delete(self, key: str) -> None:
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (key,))
+
+    def clear(self) -> None:
+        """清空所有缓存"""
+        with get_pool(self.db_path).write() as conn:
+            count = conn.execute("DELETE FROM llm_response_cache").rowcount
+        app_logger.info(f"LLM缓存已清空: {count}个条目")
+
+    def cleanup_expired(self) -> int:
+        """清理过期缓存
+
+        Returns:
+            清理的条目数
+        """
+        if self.ttl_seconds <= 0:
+            return 0
+        with get_pool(self.db_path).write() as conn:
+            count = conn.execute(
+                "DELETE FROM llm_response_cache WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            ).rowcount
+        if count:
+            app_logger.info(f"清理过期LLM缓存: {count}个条目")
+        return count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with get_pool(self.db_path).read() as conn:
+            entries, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_response_cache"
+            ).fetchone()
+
+        with self._stats_lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        lookups = hits + misses
+        return {
+            "total_entries": entries,
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "evictions": evictions
+        }
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """获取全局LLM响应缓存实例（未启用时返回None）"""
+    global _llm_cache
+    if not settings.llm_cache_enabled:
+        return None
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache(
+            db_path=settings.llm_cache_path,
+            ttl_seconds=settings.llm_cache_ttl_seconds,
+            max_bytes=settings.llm_cache_max_mb * 1024 * 1024
+        )
+    return _llm_cache
@@ -2,9 +2,16 @@
 LLM客户端 - 用于关系识别和商品ID映射
 """
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from app.core.openai_client import OpenAIClient
 from app.core.logger import app_logger
+from app.core.token_budget import BatchPlanner, estimate_tokens
+
+# 关系识别：每条行为预估的输出token数（一条关系JSON）
+RELATION_OUTPUT_TOKENS_PER_BEHAVIOR = 120
+
+# 关系识别调用的输出token上限
+RELATION_MAX_TOKENS = 4000
 
 
 class LLMRelationIdentifier:
@@ -13,11 +20,11 @@ class LLMRelationIdentifier:
     def __init__(self):
         self.llm_client = OpenAIClient()
 
-    def identify_relations_batch(
+    async def identify_relations_batch(
         self,
         behavior_data: List[Dict],
         item_index: Dict[str, str],
-        batch_size: int = 10
+        batch_size: Optional[int] = None
     ) -> List[Dict]:
         """
         批量识别关系并映射商品ID
@@ -25,45 +32,84 @@ class LLMRelationIdentifier:
         Args:
             behavior_data: 行为数据列表
             item_index: 商品名称→item_id的映射表
-            batch_size: 每批处理的行为数量
+            batch_size: 每批处理的行为数量（默认按token预算切分）
 
         Returns:
             识别出的关系列表
         """
         all_relations = []
 
-        # 分批处理
-        for i in range(0, len(behavior_data), batch_size):
-            batch = behavior_data[i:i + batch_size]
-            try:
-                relations = self._process_batch(batch, item_index)
-                all_relations.extend(relations)
-            except Exception as e:
-                app_logger.error(f"LLM识别批次失败: {e}", exc_info=True)
-                continue
+        # 分批处理：未指定批大小时按prompt和预期输出的token预算切分；输出被截断的批次拆小后重试
+        planner = BatchPlanner(
+            output_tokens_per_item=RELATION_OUTPUT_TOKENS_PER_BEHAVIOR,
+            base_tokens=estimate_tokens(self._build_prompt([], item_index)),
+            max_output_tokens=RELATION_MAX_TOKENS
+        )
+        if batch_size:
+            batches = [
+                behavior_data[i:i + batch_size] for i in range(0, len(behavior_data), batch_size)
+            ]
+        else:
+            batches = planner.plan(behavior_data, self._render_behavior)
+
+        for batch in batches:
+            all_relations.extend(await self._identify_batch(batch, item_index, planner))
 
         return all_relations
 
-    def _process_batch(self, batch: List[Dict], item_index: Dict[str, str]) -> List[Dict]:
-        """处理单个批次"""
+    async def _identify_batch(
+        self, batch: List[Dict], item_index: Dict[str, str], planner: BatchPlanner
+    ) -> List[Dict]:
+        """处理一批；输出被截断时按缩小后的预算重新切分，逐个子批次重试"""
+        relations, truncated = await self._process_batch(batch, item_index)
+        planner.record(truncated)
+        if not truncated or len(batch) == 1:
+            return relations
+
+        parts = planner.plan(batch, self._render_behavior)
+        if len(parts) < 2:
+            middle = len(batch) // 2
+            parts = [batch[:middle], batch[middle:]]
+        app_logger.warning(f"关系识别 {len(batch)} 条行为的输出被截断，拆为 {len(parts)} 批重试")
+        relations = []
+        for part in parts:
+            relations.extend(await self._identify_batch(part, item_index, planner))
+        return relations
+
+    @staticmethod
+    def _render_behavior(behavior: Dict) -> str:
+        return json.dumps(behavior, ensure_ascii=False, indent=2)
+
+    async def _process_batch(
+        self, batch: List[Dict], item_index: Dict[str, str]
+    ) -> Tuple[List[Dict], bool]:
+        """处理单个批次，返回 (关系列表, 输出是否被截断)"""
         prompt = self._build_prompt(batch, item_index)
+        status = {}
 
         try:
-            response = self.llm_client.chat(
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=4000
+            response = await self.llm_client._collect_stream_response(
+                self.llm_client.chat_completion(
+                    prompt, max_tokens=RELATION_MAX_TOKENS, status=status
+                )
             )
+        except Exception as e:
+            app_logger.error(f"LLM调用失败: {e}", exc_info=True)
+            return [], False
 
+        truncated = status.get("truncated", False)
+        try:
             # 解析LLM返回的JSON
             result = json.loads(response)
-            return result.get("relations", [])
-
+            return result.get("relations", []), truncated
         except json.JSONDecodeError as e:
-            app_logger.error(f"LLM返回JSON解析失败: {e}")
-            return []
-        except Exception as e:
-            app_logger.error(f"LLM调用失败: {e}", exc_info=True)
-            return []
+            if truncated:
+                app_logger.warning(f"LLM输出被截断，JSON不完整（{len(batch)} 条行为）")
+            else:
+                app_logger.error(f"LLM返回JSON解析失败: {e}")
+                # 无法解析的完整响应不保留在缓存中
+                await self.llm_client.invalidate_cache(prompt, max_tokens=RELATION_MAX_TOKENS)
+            return [], truncated
 
     def _build_prompt(self, batch: List[Dict], item_index: Dict[str, str]) -> str:
         """构建LLM提示词"""
@@ -0,0 +1,232 @@
+"""
+LLM HTTP传输层 - 进程级共享的keep-alive连接池、全局并发限制和调用指标
+
+- 每个事件循环共享一个 httpx.AsyncClient，复用TCP/TLS连接（安装h2时启用HTTP/2）
+- 全局信号量限制同时进行的LLM调用数，上限取 settings.max_llm_workers
+- 记录每次调用的首token时延(TTFT)和输出速度(tokens/s)
+"""
+import asyncio
+import importlib.util
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.logger import app_logger
+from app.core.token_budget import estimate_tokens
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 最近调用样本数（用于计算分位数）
+METRICS_WINDOW = 500
+
+
+class _LoopResources:
+    """绑定到单个事件循环的HTTP客户端和并发信号量"""
+
+    def __init__(self):
+        max_connections = max(settings.llm_http_max_connections, settings.max_llm_workers)
+        self.max_connections = max_connections
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=settings.llm_http_keepalive_expiry
+            )
+        )
+        self.semaphore = asyncio.Semaphore(max(1, settings.max_llm_workers))
+
+
+# httpx连接与asyncio原语都绑定事件循环，按循环分别维护
+_resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopResources]" = weakref.WeakKeyDictionary()
+
+
+def _get_resources() -> _LoopResources:
+    loop = asyncio.get_running_loop()
+    resources = _resources.get(loop)
+    if resources is None or resources.client.is_closed:
+        resources = _LoopResources()
+        _resources[loop] = resources
+        app_logger.info(
+            f"创建LLM HTTP客户端: http2={HTTP2_AVAILABLE}, "
+            f"max_connections={resources.max_connections}, "
+            f"max_concurrency={settings.max_llm_workers}"
+        )
+    return resources
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取当前事件循环共享的HTTP客户端"""
+    return _get_resources().client
+
+
+async def close_http_clients() -> None:
+    """关闭当前事件循环的HTTP客户端（应用关闭时调用）"""
+    loop = asyncio.get_running_loop()
+    resources = _resources.pop(loop, None)
+    if resources is not None:
+        await resources.client.aclose()
+
+
+class LLMCallTracker:
+    """单次LLM调用的计时器"""
+
+    def __init__(self, metrics: "LLMMetrics", model: str):
+        self._metrics = metrics
+        self.model = model
+        self.created_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.output_chars = 0
+        self.output_tokens = 0
+
+    def on_start(self) -> None:
+        """获得并发槽位，开始发送请求"""
+        self.started_at = time.perf_counter()
+        self._metrics._mark_started()
+
+    def on_chunk(self, content: str) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.output_chars += len(content)
+        self.output_tokens += estimate_tokens(content)
+
+    def on_usage(self, usage: Dict) -> None:
+        """服务端返回usage时以其completion_tokens为准"""
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens:
+            self.output_tokens = int(completion_tokens)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self._metrics._record(self, error)
+
+
+class LLMMetrics:
+    """LLM调用指标汇总"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self.total_calls = 0
+        self.failed_calls = 0
+        self.queued = 0  # 等待并发槽位的调用数
+        self.in_flight = 0  # 已获得槽位、正在请求的调用数
+        self.total_output_tokens = 0
+
+    def start_call(self, model: str) -> LLMCallTracker:
+        with self._lock:
+            self.queued += 1
+        return LLMCallTracker(self, model)
+
+    def _mark_started(self) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+
+    def _record(self, call: LLMCallTracker, error: Optional[BaseException]) -> None:
+        now = time.perf_counter()
+        started = call.started_at or call.created_at
+        duration = now - started
+        ttft = (call.first_token_at - started) if call.first_token_at else None
+        generation = (now - call.first_token_at) if call.first_token_at else 0.0
+        tokens_per_second = call.output_tokens / generation if generation > 0 else None
+
+        with self._lock:
+            if call.started_at is None:
+                self.queued -= 1  # 等待槽位时被取消
+            else:
+                self.in_flight -= 1
+            self.total_calls += 1
+            self.total_output_tokens += call.output_tokens
+            if error is not None:
+                self.failed_calls += 1
+            self._samples.append({
+                "model": call.model,
+                "queue_wait": started - call.created_at,
+                "ttft": ttft,
+                "duration": duration,
+                "output_tokens": call.output_tokens,
+                "tokens_per_second": tokens_per_second,
+                "error": error is not None
+            })
+
+        if ttft is not None:
+            app_logger.info(
+                f"LLM调用完成: model={call.model}, ttft={ttft:.2f}s, 总耗时={duration:.2f}s, "
+                f"输出≈{call.output_tokens} tokens"
+                + (f", {tokens_per_second:.1f} tokens/s" if tokens_per_second else "")
+            )
+
+    @staticmethod
+    def _percentile(values, pct: float) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return round(values[idx], 3)
+
+    def snapshot(self) -> Dict:
+        """获取指标快照"""
+        with self._lock:
+            samples = list(self._samples)
+            summary = {
+                "total_calls": self.total_calls,
+                "failed_calls": self.failed_calls,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "total_output_tokens": self.total_output_tokens
+            }
+
+        ttfts = [s["ttft"] for s in samples if s["ttft"] is not None]
+        speeds = [s["tokens_per_second"] for s in samples if s["tokens_per_second"]]
+        waits = [s["queue_wait"] for s in samples]
+        summary.update({
+            "window_size": len(samples),
+            "ttft_p50": self._percentile(ttfts, 50),
+            "ttft_p95": self._percentile(ttfts, 95),
+            "tokens_per_second_avg": round(sum(speeds) / len(speeds), 2) if speeds else None,
+            "queue_wait_p95": self._percentile(waits, 95),
+            "http2": HTTP2_AVAILABLE,
+            "max_concurrency": settings.max_llm_workers
+        })
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self.total_calls = 0
+            self.failed_calls = 0
+            self.total_output_tokens = 0
+
+
+llm_metrics = LLMMetrics()
+
+
+@asynccontextmanager
+async def llm_call(model: str):
+    """占用一个全局并发槽位并跟踪调用指标
+
+    Example:
+        async with llm_call(model) as call:
+            async with client.stream(...) as response:
+                ...
+                call.on_chunk(content)
+    """
+    resources = _get_resources()
+    call = llm_metrics.start_call(model)
+    error = None
+    try:
+        async with resources.semaphore:
+            call.on_start()
+            yield call
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        call.finish(error)
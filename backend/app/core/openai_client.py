@@ -1,9 +1,35 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 import json
+import random
 import httpx
 import asyncio
 from app.core.config import settings
 from app.core.logger import app_logger as logger
+from app.core.llm_transport import get_http_client, llm_call
+from app.core.llm_cache import LLMResponseCache, get_llm_cache
+from app.core.token_budget import BatchPlanner, estimate_tokens, is_truncated
+
+# 事件抽象：每条行为预估的输出token数（每个事件一行约30-40 token，事件数不超过行为数）
+EVENT_OUTPUT_TOKENS_PER_BEHAVIOR = 40
+
+# 事件抽象：用户画像段落预留的token数
+PROFILE_TOKENS = 50
+
+# 批量打标调用的输出token上限
+TAG_BATCH_MAX_TOKENS = 4000
+
+
+def _log_payload_sample(label: str, payload: str) -> None:
+    """按 LLM_PAYLOAD_LOG_SAMPLE_RATE 抽样在DEBUG级别记录LLM原始响应（默认关闭）"""
+    rate = settings.llm_payload_log_sample_rate
+    if rate > 0 and random.random() < rate:
+        logger.debug(f"{label}前2000字符: [{payload[:2000]}...]")
+        logger.debug(f"{label}后500字符: [...{payload[-500:]}]")
+
+
+# 缓存命中时回放的分块大小（字符）
+CACHE_REPLAY_CHUNK_SIZE = 256
+
 
 class OpenAIClient:
     def __init__(self):
@@ -163,7 +189,9 @@ class OpenAIClient:
         prompt: str,
         model: str = None,
         max_tokens: int = 4000,
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        use_cache: bool = True,
+        status: Optional[Dict] = None
     ):
         """调用LLM进行对话补全（流式调用）
 
@@ -172,11 +200,14 @@ class OpenAIClient:
             model: 模型名称（可选，默认使用配置的模型）
             max_tokens: 最大token数
             temperature: 温度参数
+            use_cache: 是否使用响应缓存（False时跳过读取和写入缓存）
+            status: 可选的字典，流结束后写入 finish_reason 和 truncated（输出是否因达到max_tokens被截断）
 
         Returns:
             返回异步生成器，逐块yield响应内容
         """
         model = model or self.primary_model
+        status = {} if status is None else status
 
         # 计算超时时间
         is_batch_operation = "批量" in prompt or "用户 user_" in prompt or len(prompt) > 5000
@@ -189,13 +220,56 @@ class OpenAIClient:
         else:
             timeout_seconds = 60.0   # 小量输出：1分钟
 
+        cache = get_llm_cache() if use_cache else None
+        cache_key = None
+        if cache is not None:
+            cache_key = LLMResponseCache.make_key(model, temperature, max_tokens, prompt)
+            # 缓存读写是同步的SQLite操作，放到线程池中执行，避免阻塞事件循环
+            cached_response = await asyncio.to_thread(cache.get, cache_key)
+            if cached_response is not None:
+                status.update(finish_reason=None, truncated=False)  # 只缓存未截断的响应
+                logger.info(f"LLM缓存命中: model={model}, 响应长度={len(cached_response)}")
+                # 以流的形式回放，调用方无需区分是否命中缓存
+                for i in range(0, len(cached_response), CACHE_REPLAY_CHUNK_SIZE):
+                    yield cached_response[i:i + CACHE_REPLAY_CHUNK_SIZE]
+                return
+
         logger.info(f"调用LLM: model={model}, max_tokens={max_tokens}, stream=True, base_url={self.base_url}")
         logger.debug(f"LLM请求prompt: {prompt[:200]}...")
 
         # 直接yield，使chat_completion成为async generator
-        async for chunk in self._stream_chat(prompt, model, max_tokens, temperature, timeout_seconds):
+        chunks = []
+        async for chunk in self._stream_chat(prompt, model, max_tokens, temperature, timeout_seconds, status):
+            chunks.append(chunk)
             yield chunk
 
+        response = "".join(chunks)
+        if status.get("finish_reason"):
+            status["truncated"] = status["finish_reason"] == "length"
+        else:
+            # 服务端没有返回 finish_reason 时按响应长度估算
+            status["truncated"] = is_truncated(response, max_tokens)
+
+        # 仅缓存完整读取、非空且未被截断的响应
+        if cache is not None and chunks:
+            if status["truncated"]:
+                logger.info(f"LLM响应被截断，不写入缓存: model={model}, 响应长度={len(response)}")
+            else:
+                await asyncio.to_thread(cache.set, cache_key, model, response)
+
+    async def invalidate_cache(
+        self,
+        prompt: str,
+        model: str = None,
+        max_tokens: int = 4000,
+        temperature: float = 0.3
+    ) -> None:
+        """删除某个prompt的缓存响应（响应无法解析、需要重新生成时调用）"""
+        cache = get_llm_cache()
+        if cache is not None:
+            key = LLMResponseCache.make_key(model or self.primary_model, temperature, max_tokens, prompt)
+            await asyncio.to_thread(cache.delete, key)
+
     async def _collect_stream_response(self, stream_generator):
         """收集流式响应为完整字符串的辅助方法"""
         response = ""
@@ -208,8 +282,11 @@ class OpenAIClient:
         async for chunk in self._stream_chat(prompt, model, max_tokens, temperature, timeout_seconds):
             yield chunk
 
-    async def _stream_chat(self, prompt: str, model: str, max_tokens: int, temperature: float, timeout_seconds: float):
-        """流式调用 LLM"""
+    async def _stream_chat(
+        self, prompt: str, model: str, max_tokens: int, temperature: float, timeout_seconds: float,
+        status: Optional[Dict] = None
+    ):
+        """流式调用 LLM（status 不为空时写入服务端返回的 finish_reason）"""
         # 为流式响应配置超时：连接超时30s，读取超时使用传入的timeout_seconds
         timeout_config = httpx.Timeout(
             connect=30.0,  # 连接超时
@@ -217,46 +294,53 @@ class OpenAIClient:
             write=30.0,  # 写入超时
             pool=30.0   # 连接池超时
         )
-        client = httpx.AsyncClient(timeout=timeout_config)
+        client = get_http_client()
         try:
-            async with client.stream(
-                "POST",
-                f"{self.base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "max_tokens": max_tokens,
-                    "temperature": temperature,
-                    "stream": True
-                }
-            ) as response:
-                response.raise_for_status()
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data_str = line[6:]  # 移除 "data: " 前缀
-                        if data_str == "[DONE]":
-                            break
-                        try:
-                            data = json.loads(data_str)
-                            if "choices" in data and len(data["choices"]) > 0:
-                                delta = data["choices"][0].get("delta", {})
-                                content = delta.get("content", "")
-                                if content:
-                                    yield content
-                        except json.JSONDecodeError:
-                            continue
+            async with llm_call(model) as call:
+                async with client.stream(
+                    "POST",
+                    f"{self.base_url}/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json"
+                    },
+                    json={
+                        "model": model,
+                        "messages": [{"role": "user", "content": prompt}],
+                        "max_tokens": max_tokens,
+                        "temperature": temperature,
+                        "stream": True
+                    },
+                    timeout=timeout_config
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: "):
+                            data_str = line[6:]  # 移除 "data: " 前缀
+                            if data_str == "[DONE]":
+                                # 读完剩余响应体，连接才能归还连接池复用
+                                continue
+                            try:
+                                data = json.loads(data_str)
+                                if data.get("usage"):
+                                    call.on_usage(data["usage"])
+                                if "choices" in data and len(data["choices"]) > 0:
+                                    finish_reason = data["choices"][0].get("finish_reason")
+                                    if finish_reason and status is not None:
+                                        status["finish_reason"] = finish_reason
+                                    delta = data["choices"][0].get("delta", {})
+                                    content = delta.get("content", "")
+                                    if content:
+                                        call.on_chunk(content)
+                                        yield content
+                            except json.JSONDecodeError:
+                                continue
         except httpx.ReadError as e:
             logger.error(f"LLM流式读取错误: {e}", exc_info=True)
             raise Exception(f"LLM API读取超时或网络中断，请重试")
         except httpx.TimeoutException as e:
             logger.error(f"LLM调用超时: {e}", exc_info=True)
             raise Exception(f"LLM API调用超时（{timeout_seconds}秒），请重试")
-        finally:
-            await client.aclose()
 
     async def generate_app_tags_batch(self, apps: List[Dict]) -> Dict[str, List[str]]:
         """批量为APP生成标签
@@ -299,7 +383,7 @@ APP列表:
 
         try:
             # 使用流式调用
-            stream_generator = self.chat_completion(prompt, max_tokens=4000)
+            stream_generator = self.chat_completion(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
             response = await self._collect_stream_response(stream_generator)
             original_response = response
             logger.debug(f"批量APP打标原始响应: [{original_response[:500]}...]")
@@ -333,13 +417,17 @@ APP列表:
                         logger.warning(f"✗ APP [{app_name}] 未在响应中找到")
 
                 logger.info(f"✓ 批量打标完成: 成功 {len([v for v in result.values() if v])}/{len(apps)}")
+                if not any(result.values()):
+                    await self.invalidate_cache(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
                 return result
             else:
                 logger.error(f"✗ 批量APP打标未找到JSON对象, 原始响应=[{original_response}], 处理后=[{response}]")
+                await self.invalidate_cache(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
                 return {app['app_id']: [] for app in apps}
 
         except json.JSONDecodeError as e:
             logger.error(f"✗ 批量APP打标JSON解析失败: {e}, 响应=[{response[:500]}...]", exc_info=True)
+            await self.invalidate_cache(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
             return {app['app_id']: [] for app in apps}
         except Exception as e:
             logger.error(f"✗ 批量APP打标异常: {type(e).__name__}: {str(e)}", exc_info=True)
@@ -386,7 +474,7 @@ APP列表:
 
         try:
             # 使用流式调用
-            stream_generator = self.chat_completion(prompt, max_tokens=4000)
+            stream_generator = self.chat_completion(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
             response = await self._collect_stream_response(stream_generator)
             original_response = response
             logger.debug(f"批量媒体打标原始响应: [{original_response[:500]}...]")
@@ -420,13 +508,17 @@ APP列表:
                         logger.warning(f"✗ 媒体 [{media_name}] 未在响应中找到")
 
                 logger.info(f"✓ 批量打标完成: 成功 {len([v for v in result.values() if v])}/{len(media_list)}")
+                if not any(result.values()):
+                    await self.invalidate_cache(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
                 return result
             else:
                 logger.error(f"✗ 批量媒体打标未找到JSON对象, 原始响应=[{original_response}], 处理后=[{response}]")
+                await self.invalidate_cache(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
                 return {media['media_id']: [] for media in media_list}
 
         except json.JSONDecodeError as e:
             logger.error(f"✗ 批量媒体打标JSON解析失败: {e}, 响应=[{response[:500]}...]", exc_info=True)
+            await self.invalidate_cache(prompt, max_tokens=TAG_BATCH_MAX_TOKENS)
             return {media['media_id']: [] for media in media_list}
         except Exception as e:
             logger.error(f"✗ 批量媒体打标异常: {type(e).__name__}: {str(e)}", exc_info=True)
@@ -526,14 +618,16 @@ APP名称: {app_name}
         self,
         user_behaviors: Dict[str, List[Dict]],
         user_profiles: Dict[str, Dict] = None,
-        batch_size: int = 20  # 每批处理的行为数量
+        batch_size: int = None,  # 每批处理的行为数量，为空时按token预算切分
+        concurrency: int = None
     ) -> Dict[str, List[Dict]]:
-        """批量抽象用户行为为事件（支持单用户行为分批）
+        """批量抽象用户行为为事件（支持单用户行为分批，所有子批次并发处理）
 
         Args:
             user_behaviors: 用户行为数据(已丰富,包含实体详细信息)
             user_profiles: 用户画像数据(可选)
-            batch_size: 每批处理的行为数量（默认20条）
+            batch_size: 每批处理的行为数量（默认按token预算切分）
+            concurrency: 同时进行的LLM调用数（默认 max_llm_workers）
 
         Returns:
             {
@@ -550,42 +644,18 @@ APP名称: {app_name}
                 "llm_response": "..."
             }
         """
-        logger.info(f"开始批量抽象 {len(user_behaviors)} 个用户的行为为事件（每批{batch_size}条）")
-
-        # 最终结果
-        final_result = {}
+        final_result = {user_id: [] for user_id in user_behaviors}
+        batch_results: Dict[str, Dict[int, List[Dict]]] = {user_id: {} for user_id in user_behaviors}
         all_llm_responses = []
 
-        # 对每个用户的行为进行分批处理
-        for user_id, behaviors in user_behaviors.items():
-            final_result[user_id] = []
-
-            # 如果行为数量超过batch_size，分批处理
-            if len(behaviors) > batch_size:
-                logger.info(f"用户 [{user_id}] 有 {len(behaviors)} 条行为，分为 {(len(behaviors) + batch_size - 1) // batch_size} 批处理")
-
-                for batch_idx in range(0, len(behaviors), batch_size):
-                    batch_behaviors = behaviors[batch_idx:batch_idx + batch_size]
-                    logger.info(f"处理用户 [{user_id}] 第 {batch_idx // batch_size + 1} 批（{len(batch_behaviors)} 条行为）")
-
-                    # 调用LLM处理这一批
-                    batch_result = await self._abstract_events_single_batch(
-                        {user_id: batch_behaviors},
-                        user_profiles
-                    )
-
-                    # 合并结果
-                    if user_id in batch_result.get("events", {}):
-                        final_result[user_id].extend(batch_result["events"][user_id])
-                    all_llm_responses.append(batch_result.get("llm_response", ""))
-            else:
-                # 行为数量不多，直接处理
-                batch_result = await self._abstract_events_single_batch(
-                    {user_id: behaviors},
-                    user_profiles
-                )
-                final_result[user_id] = batch_result.get("events", {}).get(user_id, [])
-                all_llm_responses.append(batch_result.get("llm_response", ""))
+        async for item in self.iter_abstract_events(user_behaviors, user_profiles, batch_size, concurrency):
+            batch_results[item["user_id"]][item["batch_index"]] = item["events"]
+            all_llm_responses.append(item["llm_response"])
+
+        # 按子批次顺序合并，保持每个用户的事件顺序与行为顺序一致
+        for user_id, batches in batch_results.items():
+            for batch_index in sorted(batches):
+                final_result[user_id].extend(batches[batch_index])
 
         logger.info(f"✓ 批量事件抽象完成: 成功 {len([v for v in final_result.values() if v])}/{len(user_behaviors)}")
 
@@ -594,25 +664,98 @@ APP名称: {app_name}
             "llm_response": "\n\n---\n\n".join(all_llm_responses)
         }
 
-    async def _abstract_events_single_batch(
+    async def iter_abstract_events(
         self,
         user_behaviors: Dict[str, List[Dict]],
-        user_profiles: Dict[str, Dict] = None
-    ) -> Dict:
-        """处理单批用户行为（内部方法）
+        user_profiles: Dict[str, Dict] = None,
+        batch_size: int = None,
+        concurrency: int = None
+    ):
+        """并发抽象所有用户的所有子批次，按完成顺序逐个产出结果
 
-        Args:
-            user_behaviors: 单批用户行为数据
-            user_profiles: 用户画像数据
+        每个用户的行为切分为子批次：指定 batch_size 时按条数，否则由 BatchPlanner 按输入token和
+        预期输出token切分。全部子批次共享一个信号量（默认 max_llm_workers）；输出被截断的子批次
+        拆小后重新抽象。没有行为的用户不产出结果。
 
-        Returns:
-            {
-                "events": {"user_id": [...]},
-                "llm_response": "..."
-            }
+        Yields:
+            {"user_id", "batch_index", "batch_count", "events", "llm_response"}
         """
+        concurrency = concurrency or settings.max_llm_workers
+        semaphore = asyncio.Semaphore(concurrency)
+        planner = BatchPlanner(
+            output_tokens_per_item=EVENT_OUTPUT_TOKENS_PER_BEHAVIOR,
+            base_tokens=estimate_tokens(self._build_abstract_events_prompt({"user_id": []})) + PROFILE_TOKENS,
+            max_output_tokens=settings.llm_max_output_tokens
+        )
 
-        # 构建批量请求的prompt
+        def split(behaviors: List[Dict]) -> List[List[Dict]]:
+            if batch_size:
+                return [behaviors[i:i + batch_size] for i in range(0, len(behaviors), batch_size)]
+            return planner.plan(behaviors, self._format_event_behavior)
+
+        jobs = []
+        for user_id, behaviors in user_behaviors.items():
+            batches = split(behaviors)  # 没有行为的用户不调用LLM
+            if len(batches) > 1:
+                logger.info(f"用户 [{user_id}] 有 {len(behaviors)} 条行为，分为 {len(batches)} 批处理")
+            for batch_index, batch_behaviors in enumerate(batches):
+                jobs.append((user_id, batch_index, len(batches), batch_behaviors))
+
+        logger.info(
+            f"开始批量抽象 {len(user_behaviors)} 个用户的行为为事件（"
+            f"{f'每批{batch_size}条' if batch_size else '按token预算分批'}, 共{len(jobs)}批, 并发{concurrency}）"
+        )
+
+        async def run_batch(user_id, batch_behaviors):
+            async with semaphore:
+                batch_result = await self._abstract_events_single_batch({user_id: batch_behaviors}, user_profiles)
+            truncated = batch_result.get("truncated", False)
+            planner.record(truncated)
+            if truncated and len(batch_behaviors) > 1:
+                parts = planner.plan(batch_behaviors, self._format_event_behavior)
+                if len(parts) < 2:
+                    middle = len(batch_behaviors) // 2
+                    parts = [batch_behaviors[:middle], batch_behaviors[middle:]]
+                logger.warning(f"用户 [{user_id}] {len(batch_behaviors)} 条行为的输出被截断，拆为 {len(parts)} 批重新抽象")
+                sub_results = await asyncio.gather(*(run_batch(user_id, part) for part in parts))
+                return (
+                    [event for events, _ in sub_results for event in events],
+                    "\n\n---\n\n".join(response for _, response in sub_results)
+                )
+            return batch_result.get("events", {}).get(user_id, []), batch_result.get("llm_response", "")
+
+        async def run(user_id, batch_index, batch_count, batch_behaviors):
+            events, llm_response = await run_batch(user_id, batch_behaviors)
+            return {
+                "user_id": user_id,
+                "batch_index": batch_index,
+                "batch_count": batch_count,
+                "events": events,
+                "llm_response": llm_response
+            }
+
+        tasks = [asyncio.create_task(run(*job)) for job in jobs]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _format_event_behavior(self, behavior: Dict) -> str:
+        """事件抽象prompt中的单条行为描述"""
+        # 优先使用 behavior_text（非结构化格式），在前面加上时间戳
+        if "behavior_text" in behavior:
+            return f"{behavior.get('timestamp', '')} {behavior.get('behavior_text', '')}"
+        # 兼容结构化格式（使用丰富后的数据）
+        return self._format_enriched_behavior(behavior)
+
+    def _build_abstract_events_prompt(
+        self,
+        user_behaviors: Dict[str, List[Dict]],
+        user_profiles: Dict[str, Dict] = None
+    ) -> str:
+        """构建批量事件抽象prompt"""
         user_behaviors_str = ""
         for user_id, behaviors in user_behaviors.items():
             user_behaviors_str += f"\n用户 {user_id}"
@@ -638,16 +781,7 @@ APP名称: {app_name}
 
             # 格式化行为描述
             for behavior in behaviors:
-                # 优先使用 behavior_text（非结构化格式）
-                if "behavior_text" in behavior:
-                    timestamp = behavior.get("timestamp", "")
-                    behavior_text = behavior.get("behavior_text", "")
-                    # 在behavior_text前面加上时间戳
-                    user_behaviors_str += f"  - {timestamp} {behavior_text}\n"
-                else:
-                    # 兼容结构化格式（使用丰富后的数据）
-                    formatted = self._format_enriched_behavior(behavior)
-                    user_behaviors_str += f"  - {formatted}\n"
+                user_behaviors_str += f"  - {self._format_event_behavior(behavior)}\n"
 
         prompt = f"""你是用户行为分析专家。请将用户的原始行为抽象为高层次事件。
 
@@ -683,22 +817,43 @@ APP名称: {app_name}
 每行一个事件，格式：用户ID|事件类型|时间戳|上下文信息|事件分类
 
 请直接输出，不要有任何解释："""
+        return prompt
+
+    async def _abstract_events_single_batch(
+        self,
+        user_behaviors: Dict[str, List[Dict]],
+        user_profiles: Dict[str, Dict] = None
+    ) -> Dict:
+        """处理单批用户行为（内部方法）
+
+        Args:
+            user_behaviors: 单批用户行为数据
+            user_profiles: 用户画像数据
+
+        Returns:
+            {
+                "events": {"user_id": [...]},
+                "llm_response": "...",
+                "truncated": 输出是否因达到max_tokens被截断（finish_reason == "length"）
+            }
+        """
+        prompt = self._build_abstract_events_prompt(user_behaviors, user_profiles)
+        max_tokens = settings.llm_max_output_tokens
 
         try:
             # 使用流式调用
-            logger.info(f"开始批量抽象 {len(user_behaviors)} 个用户的行为为事件")
-            stream_generator = self.chat_completion(prompt, max_tokens=8000)
+            logger.debug(f"开始批量抽象 {len(user_behaviors)} 个用户的行为为事件")
+            status = {}
+            stream_generator = self.chat_completion(prompt, max_tokens=max_tokens, status=status)
             response = await self._collect_stream_response(stream_generator)
             original_response = response
             logger.info(f"批量事件抽象LLM响应长度: {len(response)}")
-            logger.info(f"批量事件抽象原始响应前2000字符: [{original_response[:2000]}...]")
-            logger.info(f"批量事件抽象原始响应后500字符: [...{original_response[-500:]}]")
-            logger.debug(f"批量事件抽象原始响应: [{original_response[:500]}...]")
+            _log_payload_sample("批量事件抽象原始响应", original_response)
 
             # 移除MiniMax的<think>标签
             if '<think>' in response:
                 response = response.split('</think>')[-1].strip()
-                logger.info(f"移除<think>后长度: {len(response)}, 前500字符: [{response[:500]}...]")
+                logger.debug(f"移除<think>后长度: {len(response)}, 前500字符: [{response[:500]}...]")
 
             # 移除 markdown 代码块标记
             if '```' in response:
@@ -719,8 +874,7 @@ APP名称: {app_name}
                 result[user_id] = []
 
             lines = response.strip().split('\n')
-            logger.info(f"开始解析文本格式，共 {len(lines)} 行")
-            logger.info(f"前10行内容: {lines[:10]}")
+            logger.debug(f"开始解析文本格式，共 {len(lines)} 行")
 
             for line_num, line in enumerate(lines, 1):
                 line = line.strip()
@@ -764,13 +918,15 @@ APP名称: {app_name}
                     logger.warning(f"✗ 用户 [{user_id}] 未找到事件")
 
             logger.info(f"✓ 批量事件抽象完成: 成功 {len([v for v in result.values() if v])}/{len(user_behaviors)}")
+            if original_response.strip() and not any(result.values()):
+                await self.invalidate_cache(prompt, max_tokens=max_tokens)
 
             # 返回结果和原始响应
             return_data = {
                 "events": result,
-                "llm_response": original_response[:5000]  # 限制长度，避免响应过大
+                "llm_response": original_response[:5000],  # 限制长度，避免响应过大
+                "truncated": status.get("truncated", False)
             }
-            logger.info(f"返回数据结构: keys={list(return_data.keys())}, llm_response长度={len(return_data['llm_response'])}")
             return return_data
 
         except json.JSONDecodeError as e:
@@ -804,81 +960,11 @@ APP名称: {app_name}
         """
         logger.info(f"开始流式批量抽象 {len(user_behaviors)} 个用户的行为为事件")
 
-        # 构建批量请求的prompt（与非流式版本相同）
-        user_behaviors_str = ""
-        for user_id, behaviors in user_behaviors.items():
-            user_behaviors_str += f"\n用户 {user_id}"
-
-            # 添加用户画像信息
-            if user_profiles and user_id in user_profiles:
-                profile = user_profiles[user_id]
-                profile_parts = []
-                if profile.get("age"):
-                    profile_parts.append(f"年龄{profile['age']}岁")
-                if profile.get("gender"):
-                    profile_parts.append(f"{profile['gender']}")
-                if profile.get("income_level"):
-                    profile_parts.append(f"收入{profile['income_level']}")
-                if profile.get("interests"):
-                    interests_str = ",".join(profile['interests'][:3])
-                    profile_parts.append(f"兴趣:{interests_str}")
-
-                if profile_parts:
-                    user_behaviors_str += f" ({', '.join(profile_parts)})"
-
-            user_behaviors_str += ":\n"
-
-            # 格式化行为描述
-            for behavior in behaviors:
-                # 优先使用 behavior_text（非结构化格式）
-                if "behavior_text" in behavior:
-                    timestamp = behavior.get("timestamp", "")
-                    behavior_text = behavior.get("behavior_text", "")
-                    # 在behavior_text前面加上时间戳
-                    user_behaviors_str += f"  - {timestamp} {behavior_text}\n"
-                else:
-                    # 兼容结构化格式（使用丰富后的数据）
-                    formatted = self._format_enriched_behavior(behavior)
-                    user_behaviors_str += f"  - {formatted}\n"
-
-        prompt = f"""你是用户行为分析专家。请将用户的原始行为抽象为高层次事件。
-
-## 【关键】转化行为识别规则（必须严格遵守）
-
-原始数据中的 [action=xxx] 标签表示行为类型，**必须按以下规则处理**：
-
-1. **[action=purchase]**
-   → 必须输出：事件类型="购买"，事件分类="conversion"
-   → 示例：user_001|购买|2026-01-01 10:00|长城_WEY VV7,长城4S店|conversion
-
-2. **[action=add_cart]**
-   → 必须输出：事件类型="加购"，事件分类="conversion"
-   → 示例：user_001|加购|2025-12-25 22:00|长城_哈弗H6,汽车之家|conversion
-
-3. **[action=visit_poi] 且包含"4S店"或"经销商"**
-   → 必须输出：事件类型="到店"，事件分类="conversion"
-   → 示例：user_001|到店|2025-12-26 14:00|长城4S店,停留1小时|conversion
-
-4. **其他 [action=xxx]**（如 browse, use_app, search 等）
-   → 根据行为内容抽象事件类型，事件分类="engagement"
-   → 示例：user_001|浏览车型|2025-11-26 09:00|长城_哈弗H6,汽车之家|engagement
-
-**重要提醒**：
-- 看到 [action=purchase] 就必须输出"购买|conversion"，不要抽象成其他事件
-- 看到 [action=add_cart] 就必须输出"加购|conversion"，不要抽象成其他事件
-- 不要将转化行为误判为"使用APP"、"浏览车型"等互动事件
-
-## 用户行为数据
-{user_behaviors_str}
-
-## 输出格式
-每行一个事件，格式：用户ID|事件类型|时间戳|上下文信息|事件分类
-
-请直接输出，不要有任何解释："""
+        prompt = self._build_abstract_events_prompt(user_behaviors, user_profiles)
 
         try:
             # 使用流式调用
-            stream_generator = self.chat_completion(prompt, max_tokens=8000)
+            stream_generator = self.chat_completion(prompt, max_tokens=settings.llm_max_output_tokens)
 
             # 实时yield每个chunk
             full_response = ""
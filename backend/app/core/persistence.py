@@ -1,13 +1,15 @@
 """
 数据持久化层 - 基于SQLite的图数据库持久化
 """
-import sqlite3
 import json
 import pickle
-from typing import Dict, List, Optional
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
 import logging
 
+from app.core.db_pool import get_pool
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,7 +23,7 @@ class GraphPersistence:
 
     def _init_database(self):
         """初始化数据库表结构"""
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).write() as conn:
             cursor = conn.cursor()
 
             # 实体表
@@ -277,6 +279,14 @@ class GraphPersistence:
                 )
             """)
 
+            # 图谱元信息（知识图谱版本，实体/关系每次写入后更新，用于判断内存快照是否可复用）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS graph_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+
             # 创建索引
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_entities_type ON entities(type)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_relations_from ON relations(from_id)")
@@ -290,22 +300,76 @@ class GraphPersistence:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_sequences_user ON event_sequences(user_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_logical_behaviors_user ON logical_behaviors(user_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_logical_behaviors_time ON logical_behaviors(start_time, end_time)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_logical_behaviors_user_time ON logical_behaviors(user_id, start_time)")
 
-            conn.commit()
             logger.info(f"数据库初始化完成: {self.db_path}")
 
     # ========== 知识图谱持久化 ==========
 
+    def _touch_graph_version(self, cursor) -> None:
+        """实体/关系写入后更新知识图谱版本（与写入在同一事务中）"""
+        cursor.execute(
+            "INSERT OR REPLACE INTO graph_meta (key, value) VALUES ('kg_version', ?)",
+            (uuid.uuid4().hex,)
+        )
+
+    def get_graph_version(self) -> Optional[str]:
+        """当前知识图谱版本，没有写入过实体/关系时为None"""
+        with get_pool(self.db_path).read() as conn:
+            row = conn.execute("SELECT value FROM graph_meta WHERE key = 'kg_version'").fetchone()
+        return row[0] if row else None
+
+    def _ensure_graph_version(self) -> None:
+        """旧数据库（或从未写入过实体/关系）没有版本时补写一个，使加载结果可以写入快照"""
+        if self.get_graph_version() is not None:
+            return
+        with get_pool(self.db_path).write() as conn:
+            # 并发写入已经更新了版本时保留该版本
+            conn.execute(
+                "INSERT OR IGNORE INTO graph_meta (key, value) VALUES ('kg_version', ?)",
+                (uuid.uuid4().hex,)
+            )
+
+    def iter_knowledge_graph(self, chunk_size: int = 10000) -> Iterator[Tuple[str, object]]:
+        """
+        在一个读事务中分块读取完整的知识图谱（一致的快照，没有条数上限）
+
+        没有版本时先补写一个；读事务内读到的版本与读到的实体和关系一致（之后的写入都会更新版本）。
+
+        依次产出:
+            ("version", 知识图谱版本)
+            ("entities", [(id, type, properties_json), ...])  每块最多 chunk_size 条
+            ("relations", [(from_id, to_id, type, properties_json), ...])
+        """
+        self._ensure_graph_version()
+        with get_pool(self.db_path).read() as conn:
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute("SELECT value FROM graph_meta WHERE key = 'kg_version'").fetchone()
+                yield "version", row[0] if row else None
+                for kind, sql in (
+                    ("entities", "SELECT id, type, properties FROM entities"),
+                    ("relations", "SELECT from_id, to_id, type, properties FROM relations ORDER BY id"),
+                ):
+                    cursor = conn.execute(sql)
+                    while True:
+                        rows = cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        yield kind, rows
+            finally:
+                conn.rollback()
+
     def save_entity(self, entity_id: str, entity_type: str, properties: Dict) -> bool:
         """保存实体"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "INSERT OR REPLACE INTO entities (id, type, properties) VALUES (?, ?, ?)",
                     (entity_id, entity_type, json.dumps(properties, ensure_ascii=False))
                 )
-                conn.commit()
+                self._touch_graph_version(cursor)
                 return True
         except Exception as e:
             logger.error(f"保存实体失败: {e}")
@@ -314,13 +378,13 @@ class GraphPersistence:
     def save_relation(self, from_id: str, to_id: str, rel_type: str, properties: Dict) -> bool:
         """保存关系"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "INSERT INTO relations (from_id, to_id, type, properties) VALUES (?, ?, ?, ?)",
                     (from_id, to_id, rel_type, json.dumps(properties, ensure_ascii=False))
                 )
-                conn.commit()
+                self._touch_graph_version(cursor)
                 return True
         except Exception as e:
             logger.error(f"保存关系失败: {e}")
@@ -329,7 +393,7 @@ class GraphPersistence:
     def load_entities(self, entity_type: Optional[str] = None, limit: int = 1000) -> List[Dict]:
         """加载实体"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 if entity_type:
                     cursor.execute(
@@ -351,10 +415,27 @@ class GraphPersistence:
             logger.error(f"加载实体失败: {e}")
             return []
 
+    def load_entities_by_ids(self, entity_ids: List[str]) -> List[Dict]:
+        """按ID加载实体（结果顺序与 entity_ids 一致，不存在的ID跳过）"""
+        if not entity_ids:
+            return []
+        try:
+            with get_pool(self.db_path).read() as conn:
+                placeholders = ",".join("?" * len(entity_ids))
+                rows = conn.execute(
+                    f"SELECT id, type, properties FROM entities WHERE id IN ({placeholders})",
+                    list(entity_ids)
+                ).fetchall()
+            found = {row[0]: {"id": row[0], "type": row[1], "properties": json.loads(row[2])} for row in rows}
+            return [found[entity_id] for entity_id in entity_ids if entity_id in found]
+        except Exception as e:
+            logger.error(f"加载实体失败: {e}")
+            return []
+
     def load_relations(self, rel_type: Optional[str] = None, limit: int = 1000) -> List[Dict]:
         """加载关系"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 if rel_type:
                     cursor.execute(
@@ -381,11 +462,11 @@ class GraphPersistence:
     def clear_knowledge_graph(self) -> bool:
         """清空知识图谱"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM relations")
                 cursor.execute("DELETE FROM entities")
-                conn.commit()
+                self._touch_graph_version(cursor)
                 logger.info("知识图谱已清空")
                 return True
         except Exception as e:
@@ -395,7 +476,7 @@ class GraphPersistence:
     def get_stats(self) -> Dict:
         """获取统计信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
 
                 cursor.execute("SELECT COUNT(*) FROM entities")
@@ -430,13 +511,12 @@ class GraphPersistence:
     def save_event_node(self, node_id: str, node_type: str, properties: Dict) -> bool:
         """保存事理节点"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "INSERT OR REPLACE INTO event_nodes (id, type, properties) VALUES (?, ?, ?)",
                     (node_id, node_type, json.dumps(properties, ensure_ascii=False))
                 )
-                conn.commit()
                 return True
         except Exception as e:
             logger.error(f"保存事理节点失败: {e}")
@@ -446,7 +526,7 @@ class GraphPersistence:
                        confidence: float, relation: str) -> bool:
         """保存事理边"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """INSERT INTO event_edges
@@ -454,7 +534,6 @@ class GraphPersistence:
                        VALUES (?, ?, ?, ?, ?)""",
                     (from_id, to_id, probability, confidence, relation)
                 )
-                conn.commit()
                 return True
         except Exception as e:
             logger.error(f"保存事理边失败: {e}")
@@ -463,11 +542,10 @@ class GraphPersistence:
     def clear_event_graph(self) -> bool:
         """清空事理图谱"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM event_edges")
                 cursor.execute("DELETE FROM event_nodes")
-                conn.commit()
                 logger.info("事理图谱已清空")
                 return True
         except Exception as e:
@@ -483,7 +561,7 @@ class GraphPersistence:
 
         saved_count = 0
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
 
                 # 准备批量数据
@@ -502,7 +580,7 @@ class GraphPersistence:
                     data
                 )
                 saved_count = len(data)
-                conn.commit()
+                self._touch_graph_version(cursor)
 
         except Exception as e:
             logger.error(f"批量保存实体失败: {e}")
@@ -516,7 +594,7 @@ class GraphPersistence:
 
         saved_count = 0
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
 
                 # 准备批量数据
@@ -536,7 +614,7 @@ class GraphPersistence:
                     data
                 )
                 saved_count = len(data)
-                conn.commit()
+                self._touch_graph_version(cursor)
 
         except Exception as e:
             logger.error(f"批量保存关系失败: {e}")
@@ -548,7 +626,7 @@ class GraphPersistence:
                          total_users: int, total_patterns: int, graph_data: Dict, insights: List[str]) -> int:
         """保存事理图谱"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """INSERT INTO causal_graphs
@@ -559,7 +637,6 @@ class GraphPersistence:
                      json.dumps(insights, ensure_ascii=False))
                 )
                 graph_id = cursor.lastrowid
-                conn.commit()
                 logger.info(f"事理图谱已保存: {graph_id}")
                 return graph_id
         except Exception as e:
@@ -573,7 +650,7 @@ class GraphPersistence:
 
         saved_count = 0
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
 
                 # 准备批量数据
@@ -597,7 +674,6 @@ class GraphPersistence:
                     data
                 )
                 saved_count = len(data)
-                conn.commit()
 
         except Exception as e:
             logger.error(f"批量保存节点失败: {e}")
@@ -611,7 +687,7 @@ class GraphPersistence:
 
         saved_count = 0
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
 
                 # 准备批量数据
@@ -640,7 +716,6 @@ class GraphPersistence:
                     data
                 )
                 saved_count = len(data)
-                conn.commit()
 
         except Exception as e:
             logger.error(f"批量保存边失败: {e}")
@@ -650,7 +725,7 @@ class GraphPersistence:
     def get_causal_graph(self, graph_id: int) -> Optional[Dict]:
         """获取事理图谱"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """SELECT id, graph_name, analysis_focus, source_pattern_ids, total_users,
@@ -681,7 +756,7 @@ class GraphPersistence:
     def list_causal_graphs(self, limit: int = 20, offset: int = 0) -> List[Dict]:
         """获取事理图谱列表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """SELECT id, graph_name, analysis_focus, total_users, total_patterns,
@@ -710,10 +785,9 @@ class GraphPersistence:
     def delete_causal_graph(self, graph_id: int) -> bool:
         """删除事理图谱"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM causal_graphs WHERE id = ?", (graph_id,))
-                conn.commit()
                 logger.info(f"事理图谱已删除: {graph_id}")
                 return True
         except Exception as e:
@@ -0,0 +1,108 @@
+"""
+Token预算 - 本地token估算与按token预算切分LLM批次
+
+- estimate_tokens: 不依赖分词器的粗略估算（中文约1字1token，其他字符约4字符1token）
+- BatchPlanner: 按估算的输入token和预期输出token把条目切分为批次；
+  响应被截断时提高每条的预期输出token，后续批次自动变小
+"""
+import re
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+# 输出token达到 max_tokens 的该比例时视为被截断
+TRUNCATION_RATIO = 0.95
+
+# 截断后每条预期输出token的放大倍数，以及放大的上限
+TRUNCATION_GROWTH = 1.5
+MAX_OUTPUT_SCALE = 8.0
+
+# 未截断时放大倍数逐步回落的系数
+OUTPUT_SCALE_DECAY = 0.9
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约1字1token，其他字符约4字符1token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def is_truncated(response: str, max_tokens: int) -> bool:
+    """响应的估算token数接近 max_tokens 时视为输出被截断"""
+    return estimate_tokens(response) >= max_tokens * TRUNCATION_RATIO
+
+
+class BatchPlanner:
+    """按token预算切分批次
+
+    每批满足：base_tokens + 各条目输入token <= max_input_tokens，
+    且 各条目预期输出token（output_tokens_per_item × 截断放大倍数）<= max_output_tokens。
+    """
+
+    def __init__(
+        self,
+        output_tokens_per_item: int,
+        base_tokens: int = 0,
+        max_input_tokens: Optional[int] = None,
+        max_output_tokens: Optional[int] = None,
+        max_items: Optional[int] = None
+    ):
+        """
+        Args:
+            output_tokens_per_item: 每个条目的预期输出token数
+            base_tokens: 固定部分（说明、示例等）的token数
+            max_input_tokens: 输入token上限（默认 max_tokens_per_request）
+            max_output_tokens: 输出token上限，即调用时的 max_tokens（默认 llm_max_output_tokens）
+            max_items: 每批条目数上限
+        """
+        self.output_tokens_per_item = output_tokens_per_item
+        self.base_tokens = base_tokens
+        self.max_input_tokens = max_input_tokens or settings.max_tokens_per_request
+        self.max_output_tokens = max_output_tokens or settings.llm_max_output_tokens
+        self.max_items = max_items
+        self.output_scale = 1.0
+
+    @property
+    def expected_output_per_item(self) -> float:
+        return self.output_tokens_per_item * self.output_scale
+
+    def fit(
+        self, items: Iterable[T], render: Callable[[T], str], limit: Optional[int] = None
+    ) -> int:
+        """从头开始能放进一批的条目数（至少为1，单个超限的条目单独成批）"""
+        limit = min(filter(None, (limit, self.max_items)), default=None)
+        input_tokens = self.base_tokens
+        output_tokens = 0.0
+        count = 0
+        for item in items:
+            if limit is not None and count >= limit:
+                break
+            input_tokens += estimate_tokens(render(item))
+            output_tokens += self.expected_output_per_item
+            if count and (
+                input_tokens > self.max_input_tokens or output_tokens > self.max_output_tokens
+            ):
+                break
+            count += 1
+        return count
+
+    def plan(self, items: List[T], render: Callable[[T], str]) -> List[List[T]]:
+        """把条目按顺序切分为批次"""
+        batches = []
+        start = 0
+        while start < len(items):
+            count = self.fit((items[i] for i in range(start, len(items))), render)
+            batches.append(items[start:start + count])
+            start += count
+        return batches
+
+    def record(self, truncated: bool) -> None:
+        """记录一次调用是否被截断：截断时放大预期输出，否则逐步回落"""
+        if truncated:
+            self.output_scale = min(self.output_scale * TRUNCATION_GROWTH, MAX_OUTPUT_SCALE)
+        else:
+            self.output_scale = max(1.0, self.output_scale * OUTPUT_SCALE_DECAY)
@@ -0,0 +1,305 @@
+"""
+流式上传管道 - multipart请求体按块直接送入增量CSV解析和批量写库，不落临时文件
+
+- UploadStream: 有界队列支撑的只读字节流，事件循环一侧写入，工作线程一侧按需读取
+- stream_upload: 解析 multipart 请求体，将指定文件字段的数据写入 UploadStream
+- run_streaming_import: 在工作线程中消费上传流，请求体接收与解析/写库并行进行
+- ImportJobRegistry: 按任务ID记录导入进度
+
+Starlette 的 UploadFile 会将大于1MB的上传写入临时文件，这里直接解析 request.stream()，
+内存占用只与队列长度和CSV分块大小有关。
+
+导入按分块提交，不是全有或全无：中途失败（格式错误的行、校验失败、上传中断）时，
+此前已提交的分块保留在数据库中，不会回滚。失败时任务记录的 committed_rows 为已写入的行数，
+接口的失败响应中也会给出该行数，重新导入前可按需清理。
+"""
+import asyncio
+import io
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.logger import app_logger
+
+# 队列中最多缓存的数据块数（每块约为一次网络读取的大小）
+MAX_QUEUED_CHUNKS = 16
+
+# 内存中保留的导入任务数
+MAX_TRACKED_JOBS = 200
+
+_EOF = object()
+
+
+class UploadStream(io.RawIOBase):
+    """上传数据流：事件循环写入数据块，工作线程阻塞读取
+
+    队列有界，写入方在解析跟不上时等待，从而对网络读取形成背压。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_chunks: int = MAX_QUEUED_CHUNKS):
+        super().__init__()
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_chunks)
+        self._buffer = b""
+        self._eof = False
+        self._error: Optional[BaseException] = None
+        self.bytes_received = 0
+
+    # ---- 事件循环一侧 ----
+
+    async def put(self, data: bytes) -> None:
+        if data:
+            self.bytes_received += len(data)
+            await self._queue.put(bytes(data))
+
+    async def finish(self) -> None:
+        """标记数据正常结束"""
+        await self._queue.put(_EOF)
+
+    def abort(self, error: BaseException) -> None:
+        """丢弃未读数据并结束流，读取方将抛出该异常"""
+        self._error = error
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_EOF)
+
+    # ---- 工作线程一侧 ----
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._buffer and not self._eof:
+            item = asyncio.run_coroutine_threadsafe(self._queue.get(), self._loop).result()
+            if item is _EOF:
+                self._eof = True
+                if self._error is not None:
+                    raise IOError(f"上传中断: {self._error}") from self._error
+            else:
+                self._buffer = item
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+async def stream_upload(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    stream: UploadStream,
+    field_name: str = "file",
+    suffix: Optional[str] = None
+) -> Optional[str]:
+    """解析 multipart/form-data 请求体，将 field_name 字段的文件内容写入 stream
+
+    Args:
+        chunks: 请求体数据块（如 request.stream()）
+        content_type: 请求的 Content-Type 头
+        stream: 目标上传流（结束或出错时由本函数关闭）
+        field_name: 文件字段名
+        suffix: 要求的文件扩展名（如 ".csv"），不符时在写入任何数据前报错
+
+    Returns:
+        上传文件名（未找到该字段时为 None）
+    """
+    try:
+        content_type, options = parse_options_header(content_type or "")
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise ValueError("请求格式错误，请使用 multipart/form-data 上传文件")
+
+        state: Dict[str, Any] = {"header": b"", "value": b"", "name": None, "filename": None}
+        pending = []
+
+        def on_part_begin():
+            state["name"] = None
+
+        def on_header_field(data, start, end):
+            state["header"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            state["value"] += data[start:end]
+
+        def on_header_end():
+            if state["header"].lower() == b"content-disposition":
+                _, params = parse_options_header(state["value"])
+                state["name"] = params.get(b"name", b"").decode("utf-8", "replace")
+                if state["name"] == field_name:
+                    state["filename"] = params.get(b"filename", b"").decode("utf-8", "replace")
+            state["header"] = state["value"] = b""
+
+        def on_part_data(data, start, end):
+            if state["name"] == field_name:
+                pending.append(data[start:end])
+
+        parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_part_data": on_part_data,
+        })
+
+        async for chunk in chunks:
+            parser.write(chunk)
+            if suffix and state["filename"] is not None and not state["filename"].endswith(suffix):
+                raise ValueError(f"文件格式错误，请上传{suffix.lstrip('.').upper()}文件")
+            for data in pending:
+                await stream.put(data)
+            pending.clear()
+        parser.finalize()
+
+        if state["filename"] is None:
+            raise ValueError(f"请求中缺少文件字段: {field_name}")
+    except BaseException as e:
+        stream.abort(e)
+        raise
+
+    await stream.finish()
+    return state["filename"]
+
+
+async def run_streaming_import(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    consume: Callable[[io.BufferedReader], Dict[str, Any]],
+    job: Optional["ImportJob"] = None,
+    field_name: str = "file",
+    suffix: Optional[str] = None
+) -> Dict[str, Any]:
+    """接收上传的同时在工作线程中执行 consume(二进制文件对象)
+
+    Args:
+        chunks: 请求体数据块
+        content_type: 请求的 Content-Type 头
+        consume: 同步导入函数，在工作线程中运行（如 FlexibleCSVImporter.import_behavior_data）
+        job: 进度记录，完成或失败时更新状态
+        field_name: 文件字段名
+        suffix: 要求的文件扩展名
+
+    Returns:
+        consume 的返回值
+    """
+    stream = UploadStream(asyncio.get_running_loop())
+    if job is not None:
+        job.stream = stream
+
+    def worker() -> Dict[str, Any]:
+        with io.BufferedReader(stream) as reader:
+            result = consume(reader)
+            # 读取方提前结束时排空剩余数据，避免接收方因队列满而阻塞
+            while reader.read(1 << 16):
+                pass
+            return result
+
+    consumer = asyncio.ensure_future(asyncio.to_thread(worker))
+    producer = asyncio.ensure_future(stream_upload(chunks, content_type, stream, field_name, suffix))
+
+    try:
+        await asyncio.wait({consumer, producer}, return_when=asyncio.FIRST_EXCEPTION)
+        # 请求体解析失败时以其异常为准（工作线程随后会因流中断而结束）
+        if producer.done() and producer.exception() is not None:
+            await producer
+        if consumer.done() and consumer.exception() is not None:
+            producer.cancel()
+            await consumer
+        filename = await producer
+        result = await consumer
+    except BaseException as e:
+        consumer.add_done_callback(lambda future: future.cancelled() or future.exception())
+        producer.cancel()
+        # 接收方尚未启动即被取消时由这里结束流，避免工作线程一直等待数据
+        stream.abort(e)
+        if job is not None:
+            job.fail(e)
+        raise
+
+    if job is not None:
+        job.complete(result, filename)
+    return result
+
+
+class ImportJob:
+    """单个上传导入任务的进度"""
+
+    def __init__(self, job_id: str, kind: str):
+        self.job_id = job_id
+        self.kind = kind
+        self.status = "running"
+        self.filename: Optional[str] = None
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.stream: Optional[UploadStream] = None
+
+    def update(self, progress: Dict[str, Any]) -> None:
+        """导入器每写完一个分块后回调（工作线程中调用）"""
+        self.progress = dict(progress)
+
+    @property
+    def committed_rows(self) -> int:
+        """已提交到数据库的行数（失败时不会回滚）"""
+        return self.progress.get("success", 0)
+
+    def complete(self, result: Dict[str, Any], filename: Optional[str]) -> None:
+        self.status = "completed"
+        self.result = result
+        self.filename = filename
+        self.finished_at = time.time()
+
+    def fail(self, error: BaseException) -> None:
+        self.status = "failed"
+        self.error = str(error) or type(error).__name__
+        self.finished_at = time.time()
+        app_logger.error(f"导入任务 {self.job_id} 失败: {self.error}, 失败前已写入 {self.committed_rows} 行")
+
+    def failure_message(self) -> str:
+        """失败说明，含失败前已写入的行数"""
+        return f"{self.error}（任务 {self.job_id} 失败前已写入 {self.committed_rows} 行，已写入的分块不会回滚）"
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "filename": self.filename,
+            "bytes_received": self.stream.bytes_received if self.stream else 0,
+            "progress": self.progress,
+            "committed_rows": self.committed_rows,
+            "result": self.result,
+            "error": self.error,
+            "elapsed_seconds": round(end - self.started_at, 3)
+        }
+
+
+class ImportJobRegistry:
+    """内存中的导入任务表，超出容量时淘汰最早的任务"""
+
+    def __init__(self, max_jobs: int = MAX_TRACKED_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, job_id: Optional[str] = None) -> ImportJob:
+        job = ImportJob(job_id or uuid.uuid4().hex, kind)
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+# 全局任务表
+import_jobs = ImportJobRegistry()
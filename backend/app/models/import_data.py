@@ -104,44 +104,20 @@ class ImportedUser(Base):
 
     def to_dict(self):
         """转换为字典"""
-        if self.raw_data:
-            return self.raw_data
+        return self.dict_from_row({field: getattr(self, field) for field in ("raw_data", *USER_FIELDS)})
+
+    @staticmethod
+    def dict_from_row(row) -> dict:
+        """从查询结果行（列名 -> 值的映射）构建用户字典，优先使用 raw_data"""
+        if row.get("raw_data"):
+            return row["raw_data"]
 
         # 如果没有raw_data，从字段构建
-        return {
-            "user_id": self.user_id,
-            "age": self.age,
-            "gender": self.gender,
-            "education": self.education,
-            "income_level": self.income_level,
-            "city_tier": self.city_tier,
-            "occupation": self.occupation,
-            "has_house": self.has_house,
-            "has_car": self.has_car,
-            "phone_price": self.phone_price,
-            "marital_status": self.marital_status,
-            "has_children": self.has_children,
-            "commute_distance": self.commute_distance,
-            "interests": self.interests,
-            "behaviors": self.behaviors,
-            "primary_brand": self.primary_brand,
-            "primary_model": self.primary_model,
-            "brand_score": self.brand_score,
-            "purchase_intent": self.purchase_intent,
-            "intent_score": self.intent_score,
-            "lifecycle_stage": self.lifecycle_stage,
-            "app_open_count": self.app_open_count,
-            "app_usage_duration": self.app_usage_duration,
-            "miniprogram_open_count": self.miniprogram_open_count,
-            "car_search_count": self.car_search_count,
-            "car_browse_count": self.car_browse_count,
-            "car_compare_count": self.car_compare_count,
-            "car_app_payment": self.car_app_payment,
-            "push_exposure": self.push_exposure,
-            "push_click": self.push_click,
-            "ad_exposure": self.ad_exposure,
-            "ad_click": self.ad_click,
-            "near_4s_store": self.near_4s_store,
-            "weather_info": self.weather_info,
-            "consumption_frequency": self.consumption_frequency,
-        }
+        return {field: row.get(field) for field in USER_FIELDS}
+
+
+# 用户记录的业务字段（与 ImportedUser 列一一对应，不含 id/batch_id/raw_data/created_at）
+USER_FIELDS = [
+    column.name for column in ImportedUser.__table__.columns
+    if column.name not in ("id", "batch_id", "raw_data", "created_at")
+]
@@ -1,14 +1,64 @@
 """
 基础建模服务层
 """
-import sqlite3
 import json
 import asyncio
-from typing import Dict, List, Optional
+import time
+from itertools import repeat
+from typing import Dict, List, Optional, Union
 from pathlib import Path
+
+import pandas as pd
+
+from app.core.config import settings
 from app.core.logger import app_logger
 from app.core.persistence import persistence
-from app.core.openai_client import OpenAIClient
+from app.core.db_pool import get_pool
+from app.core.openai_client import OpenAIClient, TAG_BATCH_MAX_TOKENS
+from app.core.token_budget import BatchPlanner
+from app.services.flexible_csv_importer import pack_json_columns
+from app.services.sequence_mining import SequenceMiningService
+from app.services.tagging_engine import AdaptiveBatchSizer, ConcurrentTagger, TaggingProgress
+from app.utils.profile_formatter import format_profile_texts
+
+# 批量写入时每次 executemany 的行数
+BULK_INSERT_CHUNK_SIZE = 50000
+
+# 批量打标：每个条目预估的输出token数（名称 + 3-5个标签）
+TAG_OUTPUT_TOKENS_PER_ITEM = 30
+
+# 批量打标：prompt固定部分（说明和示例）的token数
+TAG_PROMPT_BASE_TOKENS = 400
+
+# 画像中存入 properties JSON 的字段
+PROFILE_PROPERTY_KEYS = ["income", "interests", "budget", "has_car", "purchase_intent"]
+
+
+def _to_frame(records: Union[List[Dict], pd.DataFrame]) -> pd.DataFrame:
+    return records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+
+
+def _column_values(df: pd.DataFrame, name: str) -> List:
+    """取整列的值，缺失值（含列不存在）为 None"""
+    if name not in df.columns:
+        return [None] * len(df)
+    series = df[name].astype(object)
+    return series.where(series.notna(), None).tolist()
+
+
+def _column_truthy(df: pd.DataFrame, name: str) -> pd.Series:
+    """整列取值是否非空"""
+    if name not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df[name].astype(object).map(bool, na_action="ignore").eq(True)
+
+
+def _ingest_metrics(rows: int, start: float) -> Dict:
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else 0.0
+    }
 
 
 class BaseModelingService:
@@ -17,33 +67,47 @@ class BaseModelingService:
     def __init__(self):
         self.db_path = Path("data/graph.db")
         self.llm_client = OpenAIClient()
+        self.tagging_progress = {"app": TaggingProgress("app"), "media": TaggingProgress("media")}
+        self._tagging_tasks: Dict[str, asyncio.Task] = {}
+        self._tagging_rescan = set()
 
     # ========== 行为数据管理 ==========
 
-    def import_behavior_data(self, behaviors: List[Dict]) -> Dict:
-        """导入行为数据（非结构化格式）"""
+    def import_behavior_data(self, behaviors: Union[List[Dict], pd.DataFrame]) -> Dict:
+        """导入行为数据（非结构化格式）
+
+        按列转换为参数元组后分块 executemany 写入，整批在一个事务中提交。
+
+        Args:
+            behaviors: 行为记录列表或 DataFrame（列: user_id, timestamp, behavior_text）
+        """
         try:
+            start = time.perf_counter()
+            df = _to_frame(behaviors)
             saved_count = 0
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
-                for behavior in behaviors:
-                    cursor.execute("""
+                for chunk_start in range(0, len(df), BULK_INSERT_CHUNK_SIZE):
+                    chunk = df.iloc[chunk_start:chunk_start + BULK_INSERT_CHUNK_SIZE]
+                    rows = list(zip(
+                        _column_values(chunk, "user_id"),
+                        _column_values(chunk, "timestamp"),
+                        _column_values(chunk, "behavior_text"),
+                        repeat("unstructured")
+                    ))
+                    cursor.executemany("""
                         INSERT INTO behavior_data
                         (user_id, timestamp, behavior_text, action)
                         VALUES (?, ?, ?, ?)
-                    """, (
-                        behavior.get("user_id"),
-                        behavior.get("timestamp"),
-                        behavior.get("behavior_text"),
-                        "unstructured"
-                    ))
-                    saved_count += 1
-                conn.commit()
+                    """, rows)
+                    saved_count += len(rows)
 
-            app_logger.info(f"成功导入 {saved_count} 条行为数据")
+            metrics = _ingest_metrics(saved_count, start)
+            app_logger.info(f"成功导入 {saved_count} 条行为数据, {metrics['rows_per_sec']:.0f} 行/秒")
             return {
                 "success": True,
-                "saved_count": saved_count
+                "saved_count": saved_count,
+                **metrics
             }
         except Exception as e:
             app_logger.error(f"导入行为数据失败: {e}", exc_info=True)
@@ -55,7 +119,7 @@ class BaseModelingService:
     def query_behavior_data(self, user_id: Optional[str] = None, limit: int = 100, offset: int = 0) -> Dict:
         """查询行为数据（非结构化格式）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
 
                 # 先查询总数
@@ -121,7 +185,7 @@ class BaseModelingService:
         """导入APP列表并自动生成标签"""
         try:
             saved_count = 0
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 for app in apps:
                     cursor.execute("""
@@ -136,14 +200,11 @@ class BaseModelingService:
                         0  # 初始未打标
                     ))
                     saved_count += 1
-                conn.commit()
 
             app_logger.info(f"成功导入 {saved_count} 个APP，开始LLM打标...")
 
-            # 异步调用LLM为所有APP生成标签
-            import asyncio
-            loop = asyncio.get_event_loop()
-            loop.create_task(self._generate_app_tags_async())
+            # 后台并发调用LLM为所有APP生成标签
+            self._start_tagging("app")
 
             return {
                 "success": True,
@@ -158,80 +219,16 @@ class BaseModelingService:
             }
 
     async def _generate_app_tags_async(self):
-        """异步为所有APP生成标签"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, app_id, app_name, category FROM app_tags WHERE llm_generated = 0")
-                apps = cursor.fetchall()
-
-            if not apps:
-                app_logger.info("没有需要打标的APP")
-                return
-
-            app_logger.info(f"========== 开始批量生成APP标签: 共 {len(apps)} 个APP ==========")
-
-            # 转换为字典列表
-            app_list = [
-                {
-                    "app_id": row[1],
-                    "app_name": row[2],
-                    "category": row[3]
-                }
-                for row in apps
-            ]
-
-            # 分批处理，每批100个
-            batch_size = 100
-            total_success = 0
-            total_fail = 0
-
-            for i in range(0, len(app_list), batch_size):
-                batch = app_list[i:i + batch_size]
-                batch_num = i // batch_size + 1
-                total_batches = (len(app_list) + batch_size - 1) // batch_size
-
-                app_logger.info(f"处理第 {batch_num}/{total_batches} 批，共 {len(batch)} 个APP")
-
-                try:
-                    # 批量调用LLM
-                    tags_dict = await self.llm_client.generate_app_tags_batch(batch)
-
-                    # 批量更新数据库
-                    with sqlite3.connect(self.db_path) as conn:
-                        cursor = conn.cursor()
-                        for app in batch:
-                            app_id = app['app_id']
-                            tags = tags_dict.get(app_id, [])
-
-                            cursor.execute("""
-                                UPDATE app_tags
-                                SET tags = ?, llm_generated = 1
-                                WHERE app_id = ?
-                            """, (json.dumps(tags, ensure_ascii=False), app_id))
-
-                            if tags:
-                                total_success += 1
-                            else:
-                                total_fail += 1
-
-                        conn.commit()
-
-                    app_logger.info(f"✓ 第 {batch_num} 批完成: 成功 {len([t for t in tags_dict.values() if t])}/{len(batch)}")
-
-                except Exception as e:
-                    total_fail += len(batch)
-                    app_logger.error(f"✗ 第 {batch_num} 批处理失败: {type(e).__name__}: {str(e)}", exc_info=True)
-
-            app_logger.info(f"========== APP标签生成完成: 成功 {total_success}/{len(app_list)}, 失败 {total_fail}/{len(app_list)} ==========")
-
-        except Exception as e:
-            app_logger.error(f"批量生成APP标签失败: {type(e).__name__}: {str(e)}", exc_info=True)
+        """异步为所有未打标的APP生成标签"""
+        await self._run_tagging(
+            "app", "app_tags", "app_id", ("app_id", "app_name", "category"),
+            self.llm_client.generate_app_tags_batch
+        )
 
     def query_app_tags(self, limit: int = 100, offset: int = 0) -> Dict:
         """查询APP标签"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
 
                 # 先查询总数
@@ -272,13 +269,65 @@ class BaseModelingService:
                 "offset": offset
             }
 
+    # ========== 并发打标 ==========
+
+    def _start_tagging(self, kind: str) -> None:
+        """启动后台打标；同类打标正在运行时，本轮结束后再扫描一次新导入的条目"""
+        task = self._tagging_tasks.get(kind)
+        if task is not None and not task.done():
+            self._tagging_rescan.add(kind)
+            return
+        generate = self._generate_app_tags_async if kind == "app" else self._generate_media_tags_async
+        self._tagging_tasks[kind] = asyncio.create_task(generate())
+
+    async def _run_tagging(self, kind: str, table: str, id_column: str, columns: tuple, tag_batch) -> None:
+        label = "APP" if kind == "app" else "媒体"
+        progress = self.tagging_progress[kind]
+        while True:
+            self._tagging_rescan.discard(kind)
+            try:
+                with get_pool(self.db_path).read() as conn:
+                    rows = conn.execute(
+                        f"SELECT {', '.join(columns)} FROM {table} WHERE llm_generated = 0"
+                    ).fetchall()
+
+                if not rows:
+                    app_logger.info(f"没有需要打标的{label}")
+                else:
+                    app_logger.info(f"========== 开始批量生成{label}标签: 共 {len(rows)} 个{label} ==========")
+                    tagger = ConcurrentTagger(
+                        self.db_path, table, id_column, tag_batch,
+                        concurrency=settings.tagging_concurrency,
+                        sizer=AdaptiveBatchSizer(initial=settings.tagging_batch_size),
+                        planner=BatchPlanner(
+                            output_tokens_per_item=TAG_OUTPUT_TOKENS_PER_ITEM,
+                            base_tokens=TAG_PROMPT_BASE_TOKENS,
+                            max_output_tokens=TAG_BATCH_MAX_TOKENS
+                        )
+                    )
+                    status = await tagger.run([dict(zip(columns, row)) for row in rows], progress)
+                    app_logger.info(
+                        f"========== {label}标签生成完成: 成功 {status['tagged']}/{status['total']}, "
+                        f"无结果 {status['empty']}, 失败 {status['failed']}, {status['items_per_sec']} 条/秒 =========="
+                    )
+            except Exception as e:
+                progress.finish(str(e))
+                app_logger.error(f"批量生成{label}标签失败: {type(e).__name__}: {str(e)}", exc_info=True)
+
+            if kind not in self._tagging_rescan:
+                return
+
+    def get_tagging_status(self, kind: str) -> Dict:
+        """打标进度（kind: app / media）"""
+        return self.tagging_progress[kind].to_dict()
+
     # ========== 媒体标签管理 ==========
 
     async def import_media_list(self, media_list: List[Dict]) -> Dict:
         """导入媒体列表并自动生成标签"""
         try:
             saved_count = 0
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 for media in media_list:
                     cursor.execute("""
@@ -293,12 +342,11 @@ class BaseModelingService:
                         0  # 初始未打标
                     ))
                     saved_count += 1
-                conn.commit()
 
             app_logger.info(f"成功导入 {saved_count} 个媒体，开始LLM打标...")
 
-            # 异步调用LLM为所有媒体生成标签
-            asyncio.create_task(self._generate_media_tags_async())
+            # 后台并发调用LLM为所有媒体生成标签
+            self._start_tagging("media")
 
             return {
                 "success": True,
@@ -313,80 +361,16 @@ class BaseModelingService:
             }
 
     async def _generate_media_tags_async(self):
-        """异步为所有媒体生成标签"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, media_id, media_name, media_type FROM media_tags WHERE llm_generated = 0")
-                media_list = cursor.fetchall()
-
-            if not media_list:
-                app_logger.info("没有需要打标的媒体")
-                return
-
-            app_logger.info(f"========== 开始批量生成媒体标签: 共 {len(media_list)} 个媒体 ==========")
-
-            # 转换为字典列表
-            media_dict_list = [
-                {
-                    "media_id": row[1],
-                    "media_name": row[2],
-                    "media_type": row[3]
-                }
-                for row in media_list
-            ]
-
-            # 分批处理，每批100个
-            batch_size = 100
-            total_success = 0
-            total_fail = 0
-
-            for i in range(0, len(media_dict_list), batch_size):
-                batch = media_dict_list[i:i + batch_size]
-                batch_num = i // batch_size + 1
-                total_batches = (len(media_dict_list) + batch_size - 1) // batch_size
-
-                app_logger.info(f"处理第 {batch_num}/{total_batches} 批，共 {len(batch)} 个媒体")
-
-                try:
-                    # 批量调用LLM
-                    tags_dict = await self.llm_client.generate_media_tags_batch(batch)
-
-                    # 批量更新数据库
-                    with sqlite3.connect(self.db_path) as conn:
-                        cursor = conn.cursor()
-                        for media in batch:
-                            media_id = media['media_id']
-                            tags = tags_dict.get(media_id, [])
-
-                            cursor.execute("""
-                                UPDATE media_tags
-                                SET tags = ?, llm_generated = 1
-                                WHERE media_id = ?
-                            """, (json.dumps(tags, ensure_ascii=False), media_id))
-
-                            if tags:
-                                total_success += 1
-                            else:
-                                total_fail += 1
-
-                        conn.commit()
-
-                    app_logger.info(f"✓ 第 {batch_num} 批完成: 成功 {len([t for t in tags_dict.values() if t])}/{len(batch)}")
-
-                except Exception as e:
-                    total_fail += len(batch)
-                    app_logger.error(f"✗ 第 {batch_num} 批处理失败: {type(e).__name__}: {str(e)}", exc_info=True)
-
-            app_logger.info(f"========== 媒体标签生成完成: 成功 {total_success}/{len(media_dict_list)}, 失败 {total_fail}/{len(media_dict_list)} ==========")
-
-        except Exception as e:
-            app_logger.error(f"批量生成媒体标签失败: {type(e).__name__}: {str(e)}", exc_info=True)
+        """异步为所有未打标的媒体生成标签"""
+        await self._run_tagging(
+            "media", "media_tags", "media_id", ("media_id", "media_name", "media_type"),
+            self.llm_client.generate_media_tags_batch
+        )
 
     def query_media_tags(self, limit: int = 100, offset: int = 0) -> Dict:
         """查询媒体标签"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
 
                 # 先查询总数
@@ -429,7 +413,7 @@ class BaseModelingService:
 
     # ========== 用户画像管理 ==========
 
-    def import_user_profiles(self, profiles: List[Dict]) -> Dict:
+    def import_user_profiles(self, profiles: Union[List[Dict], pd.DataFrame]) -> Dict:
         """导入用户画像（支持结构化和非结构化格式）
 
         支持两种格式:
@@ -438,68 +422,59 @@ class BaseModelingService:
 
         系统会自动检测格式并处理:
         - 如果有 profile_text 字段，直接使用
-        - 如果有结构化字段（age, gender等），自动生成 profile_text
+        - 如果有结构化字段（age, gender等），按列批量生成 profile_text
+
+        按列构建参数元组后分块 executemany 写入，整批在一个事务中提交。
+        画像中的 purchase_intent 是序列挖掘的标签，提交后增量更新这些用户在n-gram索引中的计数。
         """
         try:
-            from app.utils.profile_formatter import format_profile_text
-            import json
+            start = time.perf_counter()
+            df = _to_frame(profiles)
+            if "user_id" not in df.columns:
+                df = df.iloc[0:0]
+            # 跳过没有 user_id 的行
+            df = df[_column_truthy(df, "user_id")]
 
             saved_count = 0
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
-
-                for profile in profiles:
-                    user_id = profile.get("user_id")
-                    if not user_id:
-                        continue
-
-                    # 检测格式：是否有 profile_text 字段
-                    has_profile_text = "profile_text" in profile and profile["profile_text"]
-
-                    # 提取结构化字段
-                    age = profile.get("age")
-                    gender = profile.get("gender")
-                    city = profile.get("city")
-                    occupation = profile.get("occupation")
-
-                    # 构建 properties JSON（存储额外字段）
-                    properties = {}
-                    for key in ["income", "interests", "budget", "has_car", "purchase_intent"]:
-                        if key in profile and profile[key] is not None:
-                            properties[key] = profile[key]
-
-                    properties_json = json.dumps(properties, ensure_ascii=False) if properties else None
-
-                    # 生成或使用 profile_text
-                    if has_profile_text:
-                        # 使用提供的 profile_text
-                        profile_text = profile["profile_text"]
-                    else:
-                        # 从结构化数据生成 profile_text
-                        profile_text = format_profile_text(profile)
-
-                    # 插入数据（支持所有字段）
-                    cursor.execute("""
+                for chunk_start in range(0, len(df), BULK_INSERT_CHUNK_SIZE):
+                    chunk = df.iloc[chunk_start:chunk_start + BULK_INSERT_CHUNK_SIZE]
+
+                    # properties JSON（存储额外字段）
+                    property_columns = [key for key in PROFILE_PROPERTY_KEYS if key in chunk.columns]
+                    properties = pack_json_columns(chunk, property_columns)
+                    properties = properties.where(properties != "{}", None)
+
+                    # 使用提供的 profile_text，缺失时从结构化数据生成
+                    profile_texts = pd.Series(_column_values(chunk, "profile_text"), index=chunk.index, dtype=object)
+                    missing_text = ~_column_truthy(chunk, "profile_text")
+                    if missing_text.any():
+                        profile_texts[missing_text] = format_profile_texts(chunk[missing_text])
+
+                    rows = list(zip(
+                        _column_values(chunk, "user_id"),
+                        _column_values(chunk, "age"),
+                        _column_values(chunk, "gender"),
+                        _column_values(chunk, "city"),
+                        _column_values(chunk, "occupation"),
+                        properties.tolist(),
+                        profile_texts.tolist()
+                    ))
+                    cursor.executemany("""
                         INSERT OR REPLACE INTO user_profiles
                         (user_id, age, gender, city, occupation, properties, profile_text)
                         VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        user_id,
-                        age,
-                        gender,
-                        city,
-                        occupation,
-                        properties_json,
-                        profile_text
-                    ))
-                    saved_count += 1
+                    """, rows)
+                    saved_count += len(rows)
 
-                conn.commit()
-
-            app_logger.info(f"成功导入 {saved_count} 个用户画像")
+            self._refresh_mining_index(_column_values(df, "user_id"))
+            metrics = _ingest_metrics(saved_count, start)
+            app_logger.info(f"成功导入 {saved_count} 个用户画像, {metrics['rows_per_sec']:.0f} 行/秒")
             return {
                 "success": True,
-                "saved_count": saved_count
+                "saved_count": saved_count,
+                **metrics
             }
         except Exception as e:
             app_logger.error(f"导入用户画像失败: {e}", exc_info=True)
@@ -508,6 +483,13 @@ class BaseModelingService:
                 "error": str(e)
             }
 
+    def _refresh_mining_index(self, user_ids: List) -> None:
+        """增量更新这些用户在n-gram挖掘索引中的标签和计数（失败不影响导入结果）"""
+        try:
+            SequenceMiningService(str(self.db_path)).refresh_ngram_index(user_ids)
+        except Exception as e:
+            app_logger.error(f"更新n-gram索引失败: {e}", exc_info=True)
+
     def query_user_profiles(self, user_id: Optional[str] = None, limit: int = 100, offset: int = 0) -> Dict:
         """查询用户画像（支持结构化和非结构化格式）
 
@@ -532,7 +514,7 @@ class BaseModelingService:
             from app.utils.profile_formatter import format_profile_text
             import json
 
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
 
                 if user_id:
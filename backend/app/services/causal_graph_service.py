@@ -4,15 +4,21 @@
 import json
 import logging
 import re
-import sqlite3
 from typing import Dict, List, Optional
 from pathlib import Path
 
 from app.core.openai_client import OpenAIClient
+from app.core.db_pool import get_pool
 from app.core.persistence import persistence
+from app.services.posting_index import EventPostingIndex
+from app.services.transition_stats import compute_pattern_statistics
 
 logger = logging.getLogger(__name__)
 
+# 用户示例数量上限（及每个模式最多提取的示例数）
+MAX_USER_EXAMPLES = 100
+MAX_EXAMPLES_PER_PATTERN = 10
+
 
 class CausalGraphService:
     """事理图谱服务"""
@@ -20,6 +26,7 @@ class CausalGraphService:
     def __init__(self, llm_client: OpenAIClient):
         self.llm = llm_client
         self.db_path = Path("data/graph.db")
+        self.posting_index = EventPostingIndex(str(self.db_path))
 
     async def generate_from_patterns(
         self,
@@ -97,7 +104,7 @@ class CausalGraphService:
     def _load_patterns(self, pattern_ids: Optional[List[int]]) -> List[Dict]:
         """加载高频模式数据"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 if pattern_ids:
                     placeholders = ','.join('?' * len(pattern_ids))
@@ -134,24 +141,57 @@ class CausalGraphService:
             return []
 
     def _extract_user_examples(self, patterns: List[Dict]) -> List[Dict]:
-        """从模式中提取用户示例"""
-        # 简化实现：从logical_behavior_sequences表中提取用户序列
+        """从模式中提取用户示例
+
+        事件倒排索引已构建时，每个模式取包含它的前若干个用户；否则取前100个成功用户的序列。
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
+
+                if self.posting_index.is_built():
+                    user_ids = []
+                    for pattern in patterns[:10]:
+                        for user_id in self.posting_index.find_users(
+                            json.loads(pattern["pattern_sequence"]), limit=MAX_EXAMPLES_PER_PATTERN
+                        ):
+                            if user_id not in user_ids:
+                                user_ids.append(user_id)
+                    user_ids = user_ids[:MAX_USER_EXAMPLES]
+                else:
+                    cursor.execute(
+                        """SELECT user_id FROM logical_behavior_sequences
+                           WHERE status = 'success'
+                           LIMIT ?""",
+                        (MAX_USER_EXAMPLES,)
+                    )
+                    user_ids = [row[0] for row in cursor.fetchall()]
+
+                if not user_ids:
+                    return []
+
+                placeholders = ','.join('?' * len(user_ids))
                 cursor.execute(
-                    """SELECT user_id, sequence, start_time, end_time
-                       FROM logical_behavior_sequences
-                       LIMIT 100"""
+                    f"""SELECT user_id, action, start_time, end_time
+                       FROM logical_behaviors
+                       WHERE user_id IN ({placeholders})
+                       ORDER BY user_id, start_time""",
+                    user_ids
                 )
+                behaviors: Dict[str, List] = {}
+                for user_id, action, start_time, end_time in cursor.fetchall():
+                    behaviors.setdefault(user_id, []).append((action, start_time, end_time))
 
                 examples = []
-                for row in cursor.fetchall():
+                for user_id in user_ids:
+                    rows = behaviors.get(user_id)
+                    if not rows:
+                        continue
                     examples.append({
-                        "user_id": row[0],
-                        "sequence": row[1],
-                        "start_time": row[2],
-                        "end_time": row[3]
+                        "user_id": user_id,
+                        "sequence": " → ".join(action for action, _, _ in rows),
+                        "start_time": rows[0][1],
+                        "end_time": rows[-1][2]
                     })
                 return examples
         except Exception as e:
@@ -165,7 +205,7 @@ class CausalGraphService:
 
         try:
             user_ids = [ex["user_id"] for ex in user_examples]
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 placeholders = ','.join('?' * len(user_ids))
                 cursor.execute(
@@ -201,7 +241,7 @@ class CausalGraphService:
             包含各种统计指标的字典
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
 
                 # 1. 总用户数
@@ -217,90 +257,16 @@ class CausalGraphService:
                 converted_users = cursor.fetchone()[0]
                 conversion_rate = (converted_users / total_users * 100) if total_users > 0 else 0
 
-                # 3. 为每个高频模式计算用户画像分布
-                pattern_profile_stats = {}
-                for pattern in patterns[:10]:  # 只统计前10个模式
-                    pattern_sequence = json.loads(pattern['pattern_sequence'])
-
-                    # 找出包含该模式的用户
-                    cursor.execute("SELECT user_id, sequence FROM logical_behavior_sequences WHERE status = 'success'")
-
-                    matching_users = []
-                    for row in cursor.fetchall():
-                        user_id = row[0]
-                        event_ids = json.loads(row[1])
-
-                        # 获取行为类型序列（使用action字段）
-                        if event_ids:
-                            placeholders = ','.join('?' * len(event_ids))
-                            cursor.execute(
-                                f"""SELECT action FROM logical_behaviors
-                                   WHERE behavior_id IN ({placeholders})
-                                   ORDER BY timestamp""",
-                                event_ids
-                            )
-                            event_types = [r[0] for r in cursor.fetchall()]
-
-                            # 检查是否包含该模式
-                            if self._contains_pattern(event_types, pattern_sequence):
-                                matching_users.append(user_id)
-
-                    # 统计这些用户的画像分布
-                    if matching_users:
-                        profile_dist = self._compute_profile_distribution(cursor, matching_users)
-                        pattern_profile_stats[' → '.join(pattern_sequence)] = {
-                            'user_count': len(matching_users),
-                            'profile_distribution': profile_dist
-                        }
-
-                # 4. 事件转移概率矩阵
-                cursor.execute("""
-                    SELECT es.user_id, es.sequence
-                    FROM logical_behavior_sequences es
-                    WHERE es.status = 'success'
-                """)
-
-                transition_counts = {}  # {(event_a, event_b): count}
-                event_counts = {}  # {event: count}
-
-                for row in cursor.fetchall():
-                    user_id = row[0]
-                    event_ids = json.loads(row[1])
-
-                    # 获取该用户的行为类型序列（使用action字段）
-                    if not event_ids:
-                        continue
-
-                    placeholders = ','.join('?' * len(event_ids))
-                    cursor.execute(
-                        f"""SELECT behavior_id, action
-                           FROM logical_behaviors
-                           WHERE behavior_id IN ({placeholders})
-                           ORDER BY timestamp""",
-                        event_ids
-                    )
-
-                    event_type_map = {row[0]: row[1] for row in cursor.fetchall()}
-                    event_types = [event_type_map.get(eid) for eid in event_ids if eid in event_type_map]
-
-                    # 计算转移
-                    for i in range(len(event_types) - 1):
-                        event_a = event_types[i]
-                        event_b = event_types[i + 1]
-
-                        if event_a and event_b:
-                            transition_counts[(event_a, event_b)] = transition_counts.get((event_a, event_b), 0) + 1
-                            event_counts[event_a] = event_counts.get(event_a, 0) + 1
-
-                # 计算转移概率
-                transition_probs = {}
-                for (event_a, event_b), count in transition_counts.items():
-                    prob = count / event_counts[event_a] if event_counts.get(event_a, 0) > 0 else 0
-                    transition_probs[(event_a, event_b)] = {
-                        "probability": round(prob, 3),
-                        "count": count,
-                        "total": event_counts[event_a]
-                    }
+                # 3-4. 一次有序扫描加载全部行为序列，向量化计算模式画像分布和事件转移概率
+                pattern_sequences = [
+                    json.loads(pattern['pattern_sequence'])
+                    for pattern in patterns[:10]  # 只统计前10个模式
+                ]
+                pattern_profile_stats, transition_probs = compute_pattern_statistics(
+                    cursor,
+                    pattern_sequences,
+                    find_users=self.posting_index.find_users if self.posting_index.is_built() else None
+                )
 
                 # 5. 按性别分组统计（全局）
                 gender_stats = {}
@@ -396,77 +362,6 @@ class CausalGraphService:
             logger.error(f"计算统计数据失败: {e}", exc_info=True)
             return {}
 
-    def _contains_pattern(self, sequence: List[str], pattern: List[str]) -> bool:
-        """检查序列是否包含指定模式（子序列）"""
-        if not pattern or not sequence:
-            return False
-
-        pattern_len = len(pattern)
-        for i in range(len(sequence) - pattern_len + 1):
-            if sequence[i:i+pattern_len] == pattern:
-                return True
-        return False
-
-    def _compute_profile_distribution(self, cursor, user_ids: List[str]) -> Dict:
-        """计算用户列表的画像分布
-
-        Args:
-            cursor: 数据库游标
-            user_ids: 用户ID列表
-
-        Returns:
-            画像分布统计
-        """
-        if not user_ids:
-            return {}
-
-        placeholders = ','.join('?' * len(user_ids))
-
-        # 性别分布
-        cursor.execute(
-            f"""SELECT gender, COUNT(*) as count
-               FROM user_profiles
-               WHERE user_id IN ({placeholders}) AND gender IS NOT NULL
-               GROUP BY gender""",
-            user_ids
-        )
-        gender_dist = {row[0]: row[1] for row in cursor.fetchall()}
-
-        # 年龄段分布
-        cursor.execute(
-            f"""SELECT
-                   CASE
-                       WHEN age >= 25 AND age < 35 THEN '25-35岁'
-                       WHEN age >= 35 AND age < 45 THEN '35-45岁'
-                       WHEN age >= 45 THEN '45岁以上'
-                       ELSE '其他'
-                   END as age_group,
-                   COUNT(*) as count
-               FROM user_profiles
-               WHERE user_id IN ({placeholders}) AND age IS NOT NULL
-               GROUP BY age_group""",
-            user_ids
-        )
-        age_dist = {row[0]: row[1] for row in cursor.fetchall()}
-
-        # 职业分布（只显示人数>=2的）
-        cursor.execute(
-            f"""SELECT occupation, COUNT(*) as count
-               FROM user_profiles
-               WHERE user_id IN ({placeholders}) AND occupation IS NOT NULL
-               GROUP BY occupation
-               HAVING count >= 2
-               ORDER BY count DESC""",
-            user_ids
-        )
-        occupation_dist = {row[0]: row[1] for row in cursor.fetchall()}
-
-        return {
-            "gender": gender_dist,
-            "age": age_dist,
-            "occupation": occupation_dist
-        }
-
     def _find_significant_features(self, pattern_profile_stats: Dict, global_stats: Dict) -> List[Dict]:
         """找出显著的用户画像特征
 
@@ -7,27 +7,175 @@
 - 支持多种数据格式
 """
 
-import pandas as pd
 import json
+import time
 from datetime import datetime
-from typing import List, Dict, Any
-from pathlib import Path
+from json.encoder import encode_basestring
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
 
 from app.core.flexible_persistence import FlexiblePersistence
-from app.core.data_parser import DataParser
 from app.core.logger import app_logger
+from app.core.memory_monitor import memory_monitor
+
+# 时间列候选名称（按优先级）
+TIME_COLUMNS = ["event_time", "timestamp", "time", "datetime"]
+
+# 超过该值的整数浮点数保持浮点表示（超出双精度可精确表示的整数范围）
+MAX_EXACT_FLOAT_INT = 2 ** 53
+
+
+def _parse_time_value(value: Any) -> Optional[datetime]:
+    """逐个解析时间值（向量化解析失败时的回退路径）"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    text = str(value)
+    try:
+        return datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            parsed = pd.to_datetime(text)
+        except (ValueError, TypeError):
+            return None
+        return None if pd.isna(parsed) else parsed.to_pydatetime()
+
+
+def _parse_event_times(series: pd.Series) -> pd.Series:
+    """按列解析事件时间
+
+    Returns:
+        datetime 对象（object dtype），无法解析的值为 None
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        parsed = series
+    else:
+        text = series.astype(str).where(series.notna())
+        normalized = text.str.replace("Z", "+00:00", regex=False)
+        try:
+            # 快速路径：整列都是ISO 8601格式
+            parsed = pd.to_datetime(normalized, format="ISO8601")
+        except ValueError:
+            try:
+                parsed = pd.to_datetime(normalized, errors="coerce", format="mixed")
+            except ValueError:
+                # 混合时区等情况无法按列统一解析，逐个解析
+                return text.map(_parse_time_value).astype(object).where(text.notna(), None)
+
+    result = pd.Series(np.full(len(parsed), None, dtype=object), index=series.index)
+    valid = parsed.notna().to_numpy()
+    if valid.any():
+        result[valid] = list(parsed[valid].dt.to_pydatetime())
+    return result
+
+
+def _encode_json_values(series: pd.Series) -> pd.Series:
+    """按列把取值编码为JSON字面量（与 json.dumps(ensure_ascii=False) 一致），缺失值为 NaN"""
+    values = series.dropna()
+    if pd.api.types.is_bool_dtype(values):
+        encoded = values.map({True: "true", False: "false"})
+    elif pd.api.types.is_integer_dtype(values):
+        encoded = values.astype(str)
+    elif pd.api.types.is_float_dtype(values):
+        # 整数值统一按整数编码，结果不受分块内是否出现缺失值（列被推断为float）影响
+        array = values.to_numpy(dtype=float)
+        integral = np.isfinite(array) & (np.floor(array) == array) & (np.abs(array) < MAX_EXACT_FLOAT_INT)
+        encoded = pd.Series(
+            np.where(integral, array.astype(np.int64, copy=False).astype(str), None),
+            index=values.index,
+            dtype=object
+        )
+        if not integral.all():
+            encoded[~integral] = values[~integral].map(json.dumps)
+    else:
+        encoded = values.map(
+            lambda v: encode_basestring(v) if isinstance(v, str)
+            else json.dumps(v.item() if hasattr(v, "item") else v, ensure_ascii=False, default=str)
+        )
+    return encoded.reindex(series.index)
+
+
+def pack_json_columns(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """把多列按行打包为JSON对象字符串（跳过缺失值），按列向量化拼接"""
+    body = pd.Series("", index=df.index, dtype=object)
+    for col in columns:
+        encoded = _encode_json_values(df[col])
+        present = encoded.notna()
+        if not present.any():
+            continue
+        fragment = encode_basestring(str(col)) + ": " + encoded[present]
+        separator = np.where(body[present].to_numpy() != "", ", ", "")
+        body[present] = body[present] + separator + fragment
+    return "{" + body + "}"
 
 
 class FlexibleCSVImporter:
-    """灵活的CSV导入器"""
+    """灵活的CSV导入器
+
+    CSV按 batch_size 分块流式读取，每块按列向量化构建JSON后一次批量写入，
+    内存占用只与分块大小有关，与文件大小无关。
+    """
 
     def __init__(self, db_path: str = "data/graph.db"):
         self.persistence = FlexiblePersistence(db_path)
 
+    def _import_chunks(
+        self,
+        csv_file: Any,
+        batch_size: int,
+        process_chunk: Callable[[pd.DataFrame], Dict[str, int]],
+        label: str,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None
+    ) -> Dict[str, Any]:
+        """分块读取CSV并逐块处理，统计吞吐和内存峰值
+
+        Args:
+            csv_file: CSV文件路径或文件对象
+            batch_size: 每块行数
+            process_chunk: 处理单个分块，返回 {"success": n, "error": m}
+            label: 日志中的数据类型名称
+            progress: 每块写入后回调，参数为累计的 total/success/error/chunks
+        """
+        start = time.perf_counter()
+        total = success_count = error_count = chunks = 0
+        peak_rss_mb = memory_monitor.get_memory_usage()["rss_mb"]
+
+        reader = pd.read_csv(csv_file, chunksize=batch_size)
+        with reader:
+            for chunk in reader:
+                result = process_chunk(chunk)
+                total += len(chunk)
+                success_count += result["success"]
+                error_count += result["error"]
+                chunks += 1
+                peak_rss_mb = max(peak_rss_mb, memory_monitor.get_memory_usage()["rss_mb"])
+                app_logger.info(f"已导入 {success_count}/{total} 条{label}记录")
+                if progress is not None:
+                    progress({"total": total, "success": success_count, "error": error_count, "chunks": chunks})
+
+        elapsed = time.perf_counter() - start
+        rows_per_sec = total / elapsed if elapsed > 0 else 0.0
+        app_logger.info(
+            f"{label}导入完成: 成功 {success_count}, 失败 {error_count}, "
+            f"{rows_per_sec:.0f} 行/秒, 内存峰值 {peak_rss_mb:.1f}MB"
+        )
+
+        return {
+            "total": total,
+            "success": success_count,
+            "error": error_count,
+            "chunks": chunks,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_sec": round(rows_per_sec, 1),
+            "peak_rss_mb": round(peak_rss_mb, 1)
+        }
+
     def import_behavior_data(
         self,
-        csv_file: str,
-        batch_size: int = 10000
+        csv_file: Any,
+        batch_size: int = 10000,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None
     ) -> Dict[str, Any]:
         """导入行为数据CSV
 
@@ -39,98 +187,55 @@ class FlexibleCSVImporter:
         - 全部打包为event_data（非结构化文本）
 
         Args:
-            csv_file: CSV文件路径
-            batch_size: 批量插入大小
+            csv_file: CSV文件路径或文件对象
+            batch_size: 每块读取和批量插入的行数
+            progress: 每块写入后的进度回调
 
         Returns:
-            导入结果统计
+            导入结果统计（含 rows_per_sec、peak_rss_mb）
         """
         app_logger.info(f"开始导入行为数据: {csv_file}")
 
-        # 读取CSV
-        df = pd.read_csv(csv_file)
-        total_rows = len(df)
-
-        # 验证必需列
-        if "user_id" not in df.columns:
-            raise ValueError("缺少必需列: user_id")
-
-        # 时间列（支持多种命名）
-        time_col = None
-        for col in ["event_time", "timestamp", "time", "datetime"]:
-            if col in df.columns:
-                time_col = col
-                break
-
-        if not time_col:
-            raise ValueError("缺少时间列: event_time, timestamp, time 或 datetime")
-
-        # 准备批量插入数据
-        batch_data = []
-        success_count = 0
-        error_count = 0
-
-        for idx, row in df.iterrows():
-            try:
-                # 提取结构化字段（只有user_id和event_time）
-                user_id = str(row["user_id"])
-                event_time = row[time_col]
-
-                # 转换时间格式
-                if isinstance(event_time, str):
-                    try:
-                        event_time = datetime.fromisoformat(event_time.replace('Z', '+00:00'))
-                    except:
-                        event_time = pd.to_datetime(event_time)
-
-                # 所有其他列（包括event_type/action）都打包为event_data
-                excluded_cols = {"user_id", time_col}
-
-                other_data = {}
-                for col in df.columns:
-                    if col not in excluded_cols and pd.notna(row[col]):
-                        other_data[col] = row[col]
-
-                        # 转换numpy类型为Python原生类型
-                        if hasattr(other_data[col], 'item'):
-                            other_data[col] = other_data[col].item()
-
-                event_data = json.dumps(other_data, ensure_ascii=False)
-
-                batch_data.append({
-                    "user_id": user_id,
-                    "event_time": event_time,
-                    "event_data": event_data
-                })
-
-                # 批量插入
-                if len(batch_data) >= batch_size:
-                    inserted = self.persistence.batch_insert_behavior_events(batch_data)
-                    success_count += inserted
-                    batch_data = []
-                    app_logger.info(f"已导入 {success_count}/{total_rows} 条记录")
-
-            except Exception as e:
-                app_logger.error(f"导入第 {idx+1} 行失败: {e}")
-                error_count += 1
-
-        # 插入剩余数据
-        if batch_data:
+        def process_chunk(df: pd.DataFrame) -> Dict[str, int]:
+            # 验证必需列
+            if "user_id" not in df.columns:
+                raise ValueError("缺少必需列: user_id")
+
+            # 时间列（支持多种命名）
+            time_col = next((col for col in TIME_COLUMNS if col in df.columns), None)
+            if not time_col:
+                raise ValueError("缺少时间列: event_time, timestamp, time 或 datetime")
+
+            event_times = _parse_event_times(df[time_col])
+            valid = event_times.notna().to_numpy()
+            error_count = int((~valid).sum())
+            if error_count:
+                app_logger.error(f"{error_count} 行时间无法解析，已跳过")
+
+            df = df[valid]
+            if df.empty:
+                return {"success": 0, "error": error_count}
+
+            # 所有其他列（包括event_type/action）都打包为event_data
+            other_cols = [col for col in df.columns if col not in {"user_id", time_col}]
+            batch_data = [
+                {"user_id": user_id, "event_time": event_time, "event_data": event_data}
+                for user_id, event_time, event_data in zip(
+                    df["user_id"].astype(str).tolist(),
+                    event_times[valid].tolist(),
+                    pack_json_columns(df, other_cols).tolist()
+                )
+            ]
             inserted = self.persistence.batch_insert_behavior_events(batch_data)
-            success_count += inserted
+            return {"success": inserted, "error": error_count}
 
-        app_logger.info(f"行为数据导入完成: 成功 {success_count}, 失败 {error_count}")
-
-        return {
-            "total": total_rows,
-            "success": success_count,
-            "error": error_count
-        }
+        return self._import_chunks(csv_file, batch_size, process_chunk, "行为数据", progress)
 
     def import_user_profiles(
         self,
-        csv_file: str,
-        batch_size: int = 10000
+        csv_file: Any,
+        batch_size: int = 10000,
+        progress: Optional[Callable[[Dict[str, int]], None]] = None
     ) -> Dict[str, Any]:
         """导入用户画像CSV
 
@@ -141,73 +246,32 @@ class FlexibleCSVImporter:
         - 其他任意列: 自动打包为profile_data
 
         Args:
-            csv_file: CSV文件路径
-            batch_size: 批量插入大小
+            csv_file: CSV文件路径或文件对象
+            batch_size: 每块读取和批量插入的行数
+            progress: 每块写入后的进度回调
 
         Returns:
-            导入结果统计
+            导入结果统计（含 rows_per_sec、peak_rss_mb）
         """
         app_logger.info(f"开始导入用户画像: {csv_file}")
 
-        # 读取CSV
-        df = pd.read_csv(csv_file)
-        total_rows = len(df)
-
-        # 验证必需列
-        if "user_id" not in df.columns:
-            raise ValueError("缺少必需列: user_id")
-
-        # 准备批量插入数据
-        batch_data = []
-        success_count = 0
-        error_count = 0
-
-        for idx, row in df.iterrows():
-            try:
-                # 提取user_id
-                user_id = str(row["user_id"])
-
-                # 其他列打包为profile_data
-                profile_dict = {}
-                for col in df.columns:
-                    if col != "user_id" and pd.notna(row[col]):
-                        profile_dict[col] = row[col]
-
-                        # 转换numpy类型为Python原生类型
-                        if hasattr(profile_dict[col], 'item'):
-                            profile_dict[col] = profile_dict[col].item()
-
-                profile_data = json.dumps(profile_dict, ensure_ascii=False)
-
-                batch_data.append({
-                    "user_id": user_id,
-                    "profile_data": profile_data,
-                    "profile_version": 1
-                })
-
-                # 批量插入
-                if len(batch_data) >= batch_size:
-                    inserted = self.persistence.batch_upsert_user_profiles(batch_data)
-                    success_count += inserted
-                    batch_data = []
-                    app_logger.info(f"已导入 {success_count}/{total_rows} 条记录")
-
-            except Exception as e:
-                app_logger.error(f"导入第 {idx+1} 行失败: {e}")
-                error_count += 1
-
-        # 插入剩余数据
-        if batch_data:
+        def process_chunk(df: pd.DataFrame) -> Dict[str, int]:
+            # 验证必需列
+            if "user_id" not in df.columns:
+                raise ValueError("缺少必需列: user_id")
+
+            other_cols = [col for col in df.columns if col != "user_id"]
+            batch_data = [
+                {"user_id": user_id, "profile_data": profile_data, "profile_version": 1}
+                for user_id, profile_data in zip(
+                    df["user_id"].astype(str).tolist(),
+                    pack_json_columns(df, other_cols).tolist()
+                )
+            ]
             inserted = self.persistence.batch_upsert_user_profiles(batch_data)
-            success_count += inserted
+            return {"success": inserted, "error": 0}
 
-        app_logger.info(f"用户画像导入完成: 成功 {success_count}, 失败 {error_count}")
-
-        return {
-            "total": total_rows,
-            "success": success_count,
-            "error": error_count
-        }
+        return self._import_chunks(csv_file, batch_size, process_chunk, "用户画像", progress)
 
     def export_behavior_data(
         self,
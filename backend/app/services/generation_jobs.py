@@ -0,0 +1,479 @@
+"""
+逻辑行为生成任务队列 - 持久化、可恢复的后台批量生成
+
+- generation_jobs: 任务（job_id、状态、并发数、时间）
+- generation_tasks: 每个用户一条子任务（状态、尝试次数、租约到期时间、下次重试时间、错误信息）
+
+后台运行器按批租用子任务（租约期间定期续租），交给 LogicalBehaviorGenerator.generate_batch 流水线处理，
+完成后逐个用户回写结果：失败的用户按指数退避重试，超过最大尝试次数后标记为失败。
+重试的用户prompt与上次相同，处理时跳过LLM响应缓存，否则只会回放同样的失败响应。
+进程重启后 resume() 继续所有运行中的任务；已成功的用户不会重做，租约过期的用户重新租用。
+"""
+import asyncio
+import time
+import uuid
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.db_pool import get_pool
+from app.core.logger import app_logger
+
+if TYPE_CHECKING:
+    from app.services.logical_behavior import LogicalBehaviorGenerator
+
+# 近期吞吐统计窗口（秒）
+THROUGHPUT_WINDOW_SECONDS = 300
+
+# 没有可租用子任务时的最长等待（秒）
+IDLE_POLL_SECONDS = 5.0
+
+# 重试退避上限（秒）
+MAX_RETRY_BACKOFF_SECONDS = 3600
+
+
+class GenerationJobQueue:
+    """基于SQLite的生成任务表"""
+
+    def __init__(
+        self,
+        db_path: str,
+        max_attempts: int = 3,
+        lease_seconds: float = 120.0,
+        retry_backoff_seconds: float = 30.0
+    ):
+        """
+        Args:
+            db_path: 数据库路径（与逻辑行为同库）
+            max_attempts: 每个用户的最大尝试次数
+            lease_seconds: 租约时长，运行器崩溃后租约到期的用户会被重新租用
+            retry_backoff_seconds: 首次重试的等待时间，之后每次翻倍
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._tables_ready = False
+
+    def _init_tables(self) -> None:
+        if self._tables_ready:
+            return
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS generation_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    max_workers INTEGER NOT NULL,
+                    total_tasks INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS generation_tasks (
+                    job_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    error_message TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (job_id, user_id)
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_generation_tasks_status
+                ON generation_tasks(job_id, status, next_attempt_at)
+            """)
+        self._tables_ready = True
+
+    # ---- 任务 ----
+
+    def create_job(self, user_ids: List[str], max_workers: int) -> str:
+        """创建任务，每个用户一条待处理子任务"""
+        self._init_tables()
+        user_ids = list(dict.fromkeys(user_ids))
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with get_pool(self.db_path).write() as conn:
+            conn.execute(
+                """INSERT INTO generation_jobs
+                   (job_id, status, max_workers, total_tasks, created_at, started_at, updated_at)
+                   VALUES (?, 'running', ?, ?, ?, ?, ?)""",
+                (job_id, max_workers, len(user_ids), now, now, now)
+            )
+            conn.executemany(
+                "INSERT INTO generation_tasks (job_id, user_id, updated_at) VALUES (?, ?, ?)",
+                [(job_id, user_id, now) for user_id in user_ids]
+            )
+        app_logger.info(f"创建逻辑行为生成任务 {job_id}: {len(user_ids)} 个用户, {max_workers} 并发")
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            row = conn.execute(
+                """SELECT job_id, status, max_workers, total_tasks,
+                          created_at, started_at, finished_at, updated_at
+                   FROM generation_jobs WHERE job_id = ?""",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "status", "max_workers", "total_tasks", "created_at", "started_at",
+                "finished_at", "updated_at")
+        return dict(zip(keys, row))
+
+    def running_job_ids(self) -> List[str]:
+        """状态为运行中的任务（进程重启后需要恢复）"""
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            rows = conn.execute(
+                "SELECT job_id FROM generation_jobs WHERE status = 'running' ORDER BY created_at"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def list_jobs(self, limit: int = 20, offset: int = 0) -> List[Dict]:
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            rows = conn.execute(
+                "SELECT job_id FROM generation_jobs ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [self.job_status(row[0]) for row in rows]
+
+    def set_job_status(self, job_id: str, status: str) -> None:
+        """更新任务状态（completed/cancelled/running）"""
+        self._init_tables()
+        now = time.time()
+        finished_at = now if status in ("completed", "cancelled") else None
+        with get_pool(self.db_path).write() as conn:
+            conn.execute(
+                "UPDATE generation_jobs SET status = ?, finished_at = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (status, finished_at, now, job_id)
+            )
+
+    # ---- 子任务 ----
+
+    def lease(self, job_id: str, limit: int) -> List[str]:
+        """租用最多 limit 个可处理的用户（待处理且到达重试时间，或租约已过期）"""
+        self._init_tables()
+        now = time.time()
+        with get_pool(self.db_path).write() as conn:
+            rows = conn.execute(
+                """SELECT user_id FROM generation_tasks
+                   WHERE job_id = ?
+                     AND ((status = 'pending' AND next_attempt_at <= ?)
+                          OR (status = 'leased' AND lease_until < ?))
+                   ORDER BY next_attempt_at, user_id
+                   LIMIT ?""",
+                (job_id, now, now, limit)
+            ).fetchall()
+            user_ids = [row[0] for row in rows]
+            conn.executemany(
+                """UPDATE generation_tasks SET status = 'leased', lease_until = ?, updated_at = ?
+                   WHERE job_id = ? AND user_id = ?""",
+                [(now + self.lease_seconds, now, job_id, user_id) for user_id in user_ids]
+            )
+        return user_ids
+
+    def attempts(self, job_id: str, user_ids: List[str]) -> Dict[str, int]:
+        """这些用户已经尝试过的次数"""
+        self._init_tables()
+        placeholders = ",".join("?" * len(user_ids))
+        with get_pool(self.db_path).read() as conn:
+            rows = conn.execute(
+                f"SELECT user_id, attempts FROM generation_tasks "
+                f"WHERE job_id = ? AND user_id IN ({placeholders})",
+                [job_id, *user_ids]
+            ).fetchall()
+        return dict(rows)
+
+    def renew(self, job_id: str, user_ids: List[str]) -> None:
+        """续租（处理时间超过租约时由运行器定期调用）"""
+        self._init_tables()
+        lease_until = time.time() + self.lease_seconds
+        with get_pool(self.db_path).write() as conn:
+            conn.executemany(
+                """UPDATE generation_tasks SET lease_until = ?
+                   WHERE job_id = ? AND user_id = ? AND status = 'leased'""",
+                [(lease_until, job_id, user_id) for user_id in user_ids]
+            )
+
+    def release(self, job_id: str, user_ids: List[str]) -> None:
+        """归还租约（不计入尝试次数），用于运行器被取消"""
+        self._init_tables()
+        now = time.time()
+        with get_pool(self.db_path).write() as conn:
+            conn.executemany(
+                """UPDATE generation_tasks
+                   SET status = 'pending', lease_until = NULL, updated_at = ?
+                   WHERE job_id = ? AND user_id = ? AND status = 'leased'""",
+                [(now, job_id, user_id) for user_id in user_ids]
+            )
+
+    def complete(self, job_id: str, results: List[Dict]) -> None:
+        """回写一批用户的处理结果
+
+        Args:
+            results: [{"user_id", "status": "success"/"failed", "error"}]
+        """
+        self._init_tables()
+        now = time.time()
+        with get_pool(self.db_path).write() as conn:
+            for result in results:
+                user_id = result["user_id"]
+                row = conn.execute(
+                    "SELECT attempts FROM generation_tasks "
+                    "WHERE job_id = ? AND user_id = ? AND status = 'leased'",
+                    (job_id, user_id)
+                ).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+
+                if result["status"] == "success":
+                    status, next_attempt_at, error = "success", 0, None
+                else:
+                    error = result.get("error") or "未知错误"
+                    if attempts >= self.max_attempts:
+                        status, next_attempt_at = "failed", 0
+                    else:
+                        backoff = min(
+                            self.retry_backoff_seconds * 2 ** (attempts - 1),
+                            MAX_RETRY_BACKOFF_SECONDS
+                        )
+                        status, next_attempt_at = "pending", now + backoff
+
+                conn.execute(
+                    """UPDATE generation_tasks
+                       SET status = ?, attempts = ?, next_attempt_at = ?, lease_until = NULL,
+                           error_message = ?, updated_at = ?
+                       WHERE job_id = ? AND user_id = ?""",
+                    (status, attempts, next_attempt_at, error, now, job_id, user_id)
+                )
+            conn.execute(
+                "UPDATE generation_jobs SET updated_at = ? WHERE job_id = ?", (now, job_id)
+            )
+
+    def next_wakeup(self, job_id: str) -> Optional[float]:
+        """距离下一个用户可租用的秒数；没有未完成的用户时返回 None"""
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            row = conn.execute(
+                """SELECT MIN(CASE status WHEN 'pending' THEN next_attempt_at ELSE lease_until END)
+                   FROM generation_tasks
+                   WHERE job_id = ? AND status IN ('pending', 'leased')""",
+                (job_id,)
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def job_status(self, job_id: str) -> Optional[Dict]:
+        """任务进度与吞吐"""
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+
+        now = time.time()
+        with get_pool(self.db_path).read() as conn:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM generation_tasks WHERE job_id = ? GROUP BY status",
+                (job_id,)
+            ).fetchall())
+            recent = conn.execute(
+                """SELECT COUNT(*) FROM generation_tasks
+                   WHERE job_id = ? AND status IN ('success', 'failed') AND updated_at >= ?""",
+                (job_id, now - THROUGHPUT_WINDOW_SECONDS)
+            ).fetchone()[0]
+            retrying = conn.execute(
+                "SELECT COUNT(*) FROM generation_tasks "
+                "WHERE job_id = ? AND status = 'pending' AND attempts > 0",
+                (job_id,)
+            ).fetchone()[0]
+
+        done = counts.get("success", 0) + counts.get("failed", 0)
+        remaining = job["total_tasks"] - done
+        elapsed = (job["finished_at"] or now) - job["started_at"]
+        window = min(THROUGHPUT_WINDOW_SECONDS, max(now - job["started_at"], 1e-9))
+        recent_rate = recent / window * 60
+        return {
+            **job,
+            "success_count": counts.get("success", 0),
+            "failed_count": counts.get("failed", 0),
+            "pending_count": counts.get("pending", 0),
+            "leased_count": counts.get("leased", 0),
+            "retrying_count": retrying,
+            "elapsed_seconds": round(elapsed, 1),
+            "users_per_minute": round(done / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            "recent_users_per_minute": round(recent_rate, 2),
+            "eta_seconds": (
+                round(remaining / recent_rate * 60, 1) if recent_rate > 0 and remaining else None
+            )
+        }
+
+    def failed_tasks(self, job_id: str, limit: int = 100) -> List[Dict]:
+        """最终失败的用户及错误信息"""
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            rows = conn.execute(
+                """SELECT user_id, attempts, error_message FROM generation_tasks
+                   WHERE job_id = ? AND status = 'failed' ORDER BY user_id LIMIT ?""",
+                (job_id, limit)
+            ).fetchall()
+        return [{"user_id": row[0], "attempts": row[1], "error": row[2]} for row in rows]
+
+
+class GenerationJobManager:
+    """在事件循环中后台运行生成任务，每个任务一个运行器"""
+
+    def __init__(
+        self,
+        db_path: str = "data/graph.db",
+        generator_factory: Optional[Callable[[], "LogicalBehaviorGenerator"]] = None,
+        queue: Optional[GenerationJobQueue] = None
+    ):
+        """
+        Args:
+            db_path: 数据库路径
+            generator_factory: 创建 LogicalBehaviorGenerator 的函数（默认按配置创建LLM客户端）
+            queue: 任务表（默认按配置创建）
+        """
+        self.db_path = db_path
+        self.generator_factory = generator_factory or self._default_generator
+        self.queue = queue or GenerationJobQueue(
+            db_path,
+            max_attempts=settings.generation_max_attempts,
+            lease_seconds=settings.generation_lease_seconds,
+            retry_backoff_seconds=settings.generation_retry_backoff_seconds
+        )
+        self._runners: Dict[str, asyncio.Task] = {}
+
+    def _default_generator(self):
+        from app.core.openai_client import OpenAIClient
+        from app.services.logical_behavior import LogicalBehaviorGenerator
+
+        llm_client = OpenAIClient() if settings.openai_api_key else None
+        return LogicalBehaviorGenerator(llm_client=llm_client, db_path=self.db_path)
+
+    async def submit(self, user_ids: List[str], max_workers: Optional[int] = None) -> str:
+        """创建任务并在后台开始处理"""
+        workers = max_workers or settings.generation_workers
+        job_id = await asyncio.to_thread(self.queue.create_job, user_ids, workers)
+        self.start(job_id)
+        return job_id
+
+    def start(self, job_id: str) -> None:
+        runner = self._runners.get(job_id)
+        if runner is None or runner.done():
+            self._runners[job_id] = asyncio.create_task(self._run(job_id))
+
+    def is_running(self, job_id: str) -> bool:
+        runner = self._runners.get(job_id)
+        return runner is not None and not runner.done()
+
+    async def resume(self) -> List[str]:
+        """恢复所有运行中的任务（应用启动时调用）"""
+        job_ids = await asyncio.to_thread(self.queue.running_job_ids)
+        for job_id in job_ids:
+            self.start(job_id)
+        if job_ids:
+            app_logger.info(f"恢复 {len(job_ids)} 个逻辑行为生成任务")
+        return job_ids
+
+    async def cancel(self, job_id: str) -> bool:
+        job = await asyncio.to_thread(self.queue.get_job, job_id)
+        if job is None:
+            return False
+        if job["status"] == "running":
+            await asyncio.to_thread(self.queue.set_job_status, job_id, "cancelled")
+        runner = self._runners.get(job_id)
+        if runner is not None and not runner.done():
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+        return True
+
+    async def wait(self, job_id: str) -> None:
+        runner = self._runners.get(job_id)
+        if runner is not None:
+            await runner
+
+    async def shutdown(self) -> None:
+        """停止所有运行器，已租用的用户归还到队列（任务保持运行中状态，重启后恢复）"""
+        runners = [runner for runner in self._runners.values() if not runner.done()]
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+
+    async def _heartbeat(self, job_id: str, user_ids: List[str]) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            await asyncio.to_thread(self.queue.renew, job_id, user_ids)
+
+    async def _run(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.queue.get_job, job_id)
+        if job is None:
+            return
+        workers = job["max_workers"]
+        batch_size = max(workers * 4, 16)
+        generator = self.generator_factory()
+
+        while True:
+            job = await asyncio.to_thread(self.queue.get_job, job_id)
+            if job is None or job["status"] != "running":
+                return
+
+            user_ids = await asyncio.to_thread(self.queue.lease, job_id, batch_size)
+            if not user_ids:
+                wait = await asyncio.to_thread(self.queue.next_wakeup, job_id)
+                if wait is None:
+                    await asyncio.to_thread(self.queue.set_job_status, job_id, "completed")
+                    status = await asyncio.to_thread(self.queue.job_status, job_id)
+                    app_logger.info(
+                        f"逻辑行为生成任务 {job_id} 完成: 成功 {status['success_count']}, "
+                        f"失败 {status['failed_count']}, {status['users_per_minute']} 用户/分钟"
+                    )
+                    return
+                await asyncio.sleep(min(wait, IDLE_POLL_SECONDS))
+                continue
+
+            heartbeat = asyncio.create_task(self._heartbeat(job_id, user_ids))
+            try:
+                results = await self._generate(generator, job_id, user_ids, workers)
+            except asyncio.CancelledError:
+                await asyncio.to_thread(self.queue.release, job_id, user_ids)
+                raise
+            except Exception as e:
+                app_logger.error(f"任务 {job_id} 批次处理失败: {e}", exc_info=True)
+                results = [
+                    {"user_id": user_id, "status": "failed", "error": str(e)}
+                    for user_id in user_ids
+                ]
+            finally:
+                heartbeat.cancel()
+
+            await asyncio.to_thread(self.queue.complete, job_id, results)
+
+    async def _generate(
+        self, generator, job_id: str, user_ids: List[str], workers: int
+    ) -> List[Dict]:
+        """首次处理的用户正常生成；重试的用户跳过LLM响应缓存，重新调用LLM"""
+        attempts = await asyncio.to_thread(self.queue.attempts, job_id, user_ids)
+        first = [user_id for user_id in user_ids if not attempts.get(user_id)]
+        retried = [user_id for user_id in user_ids if attempts.get(user_id)]
+
+        results = []
+        if first:
+            results.extend((await generator.generate_batch(first, workers))["results"])
+        if retried:
+            retry_result = await generator.generate_batch(retried, workers, use_cache=False)
+            results.extend(retry_result["results"])
+        return results
+
+
+# 全局任务管理器
+generation_job_manager = GenerationJobManager()
@@ -1,12 +1,29 @@
 """
 导入批次管理服务
 """
-from typing import List, Dict, Optional
+import time
+from typing import List, Dict, Iterable, Iterator, Optional
 from datetime import datetime
-from app.models.import_data import ImportBatch, ImportedUser
+from itertools import islice
+
+from sqlalchemy import select
+
+from app.models.import_data import ImportBatch, ImportedUser, USER_FIELDS
 from app.core.database import get_db
 from app.core.logger import app_logger
 
+# 批量模式下每次写入并提交的用户数
+BULK_INSERT_CHUNK_SIZE = 5000
+
+
+def _user_mapping(batch_id: int, user_data: Dict, store_raw_data: bool) -> Dict:
+    """用户数据 -> imported_users 列值"""
+    mapping = {field: user_data.get(field) for field in USER_FIELDS}
+    mapping["batch_id"] = batch_id
+    mapping["user_id"] = user_data.get("user_id", "")
+    mapping["raw_data"] = user_data if store_raw_data else None  # 保存完整数据
+    return mapping
+
 
 class ImportBatchService:
     """导入批次管理服务"""
@@ -19,10 +36,89 @@ class ImportBatchService:
         unique_record_count: int,
         file_info: List[Dict],
         field_mapping: Dict,
-        users_data: List[Dict],
-        description: str = ""
+        users_data: Iterable[Dict],
+        description: str = "",
+        bulk: bool = True,
+        store_raw_data: bool = True,
+        chunk_size: int = BULK_INSERT_CHUNK_SIZE
     ) -> ImportBatch:
-        """创建新的导入批次"""
+        """创建新的导入批次
+
+        Args:
+            users_data: 用户数据（可为生成器，批量模式下按块消费）
+            bulk: 批量模式，按 chunk_size 分块用 Core insert 写入并逐块提交，
+                不构造ORM对象；为 False 时逐条 db.add（原路径）
+            store_raw_data: 是否在 raw_data 中重复保存完整数据；
+                为 False 时 to_dict/get_batch_users 从字段列重建
+            chunk_size: 批量模式下每次提交的用户数
+        """
+        if not bulk:
+            return ImportBatchService._create_batch_orm(
+                batch_name, file_count, record_count, unique_record_count,
+                file_info, field_mapping, users_data, description, store_raw_data
+            )
+
+        start = time.perf_counter()
+        with get_db() as db:
+            # 先提交批次记录，用户数据写完前状态为 importing
+            batch = ImportBatch(
+                batch_name=batch_name,
+                batch_time=datetime.now(),
+                file_count=file_count,
+                record_count=record_count,
+                unique_record_count=unique_record_count,
+                file_info=file_info,
+                field_mapping=field_mapping,
+                status="importing",
+                description=description
+            )
+            db.add(batch)
+            db.commit()
+
+            user_table = ImportedUser.__table__
+            saved_count = 0
+            try:
+                users = iter(users_data)
+                while True:
+                    chunk = list(islice(users, chunk_size))
+                    if not chunk:
+                        break
+                    db.execute(user_table.insert(), [
+                        _user_mapping(batch.id, user_data, store_raw_data) for user_data in chunk
+                    ])
+                    db.commit()
+                    saved_count += len(chunk)
+            except Exception:
+                db.rollback()
+                batch.status = "failed"
+                db.commit()
+                raise
+
+            batch.status = "completed"
+            db.commit()
+            db.refresh(batch)
+            db.expunge(batch)  # 会话关闭后仍可访问已加载的属性
+
+            elapsed = time.perf_counter() - start
+            app_logger.info(
+                f"创建导入批次成功: {batch.batch_name}, ID: {batch.id}, {saved_count} 个用户, "
+                f"{saved_count / elapsed if elapsed > 0 else 0:.0f} 行/秒"
+            )
+            return batch
+
+    @staticmethod
+    def _create_batch_orm(
+        batch_name: str,
+        file_count: int,
+        record_count: int,
+        unique_record_count: int,
+        file_info: List[Dict],
+        field_mapping: Dict,
+        users_data: Iterable[Dict],
+        description: str,
+        store_raw_data: bool
+    ) -> ImportBatch:
+        """逐条构造 ImportedUser 并在一个事务中提交"""
         with get_db() as db:
             # 创建批次记录
             batch = ImportBatch(
@@ -41,49 +137,11 @@ class ImportBatchService:
 
             # 批量创建用户记录
             for user_data in users_data:
-                user = ImportedUser(
-                    batch_id=batch.id,
-                    user_id=user_data.get("user_id", ""),
-                    age=user_data.get("age"),
-                    gender=user_data.get("gender"),
-                    education=user_data.get("education"),
-                    income_level=user_data.get("income_level"),
-                    city_tier=user_data.get("city_tier"),
-                    occupation=user_data.get("occupation"),
-                    has_house=user_data.get("has_house"),
-                    has_car=user_data.get("has_car"),
-                    phone_price=user_data.get("phone_price"),
-                    marital_status=user_data.get("marital_status"),
-                    has_children=user_data.get("has_children"),
-                    commute_distance=user_data.get("commute_distance"),
-                    interests=user_data.get("interests"),
-                    behaviors=user_data.get("behaviors"),
-                    primary_brand=user_data.get("primary_brand"),
-                    primary_model=user_data.get("primary_model"),
-                    brand_score=user_data.get("brand_score"),
-                    purchase_intent=user_data.get("purchase_intent"),
-                    intent_score=user_data.get("intent_score"),
-                    lifecycle_stage=user_data.get("lifecycle_stage"),
-                    app_open_count=user_data.get("app_open_count"),
-                    app_usage_duration=user_data.get("app_usage_duration"),
-                    miniprogram_open_count=user_data.get("miniprogram_open_count"),
-                    car_search_count=user_data.get("car_search_count"),
-                    car_browse_count=user_data.get("car_browse_count"),
-                    car_compare_count=user_data.get("car_compare_count"),
-                    car_app_payment=user_data.get("car_app_payment"),
-                    push_exposure=user_data.get("push_exposure"),
-                    push_click=user_data.get("push_click"),
-                    ad_exposure=user_data.get("ad_exposure"),
-                    ad_click=user_data.get("ad_click"),
-                    near_4s_store=user_data.get("near_4s_store"),
-                    weather_info=user_data.get("weather_info"),
-                    consumption_frequency=user_data.get("consumption_frequency"),
-                    raw_data=user_data  # 保存完整数据
-                )
-                db.add(user)
+                db.add(ImportedUser(**_user_mapping(batch.id, user_data, store_raw_data)))
 
             db.commit()
             db.refresh(batch)
+            db.expunge(batch)  # 会话关闭后仍可访问已加载的属性
             app_logger.info(f"创建导入批次成功: {batch.batch_name}, ID: {batch.id}")
             return batch
 
@@ -107,10 +165,30 @@ class ImportBatchService:
     def get_batch_users(batch_id: int, limit: int = 1000, offset: int = 0) -> List[Dict]:
         """获取批次的用户数据"""
         with get_db() as db:
-            users = db.query(ImportedUser).filter(
-                ImportedUser.batch_id == batch_id
-            ).limit(limit).offset(offset).all()
-            return [user.to_dict() for user in users]
+            rows = db.execute(
+                select(ImportedUser.__table__)
+                .where(ImportedUser.batch_id == batch_id)
+                .order_by(ImportedUser.id)
+                .limit(limit)
+                .offset(offset)
+            ).mappings()
+            return [ImportedUser.dict_from_row(row) for row in rows]
+
+    @staticmethod
+    def iter_batch_users(batch_id: int, chunk_size: int = BULK_INSERT_CHUNK_SIZE) -> Iterator[Dict]:
+        """流式遍历批次的全部用户数据
+
+        服务端游标按 chunk_size 行分批取回，内存占用与批次大小无关。
+        """
+        with get_db() as db:
+            rows = db.execute(
+                select(ImportedUser.__table__)
+                .where(ImportedUser.batch_id == batch_id)
+                .order_by(ImportedUser.id)
+                .execution_options(yield_per=chunk_size)
+            ).mappings()
+            for row in rows:
+                yield ImportedUser.dict_from_row(row)
 
     @staticmethod
     def delete_batch(batch_id: int) -> bool:
@@ -758,26 +758,22 @@ class GraphQueryEngine:
         pass
     
     def query_by_entity(self, entity_name: str, depth: int = 2) -> Dict:
-        entities = graph_db.query_entities()
-        matching = [e for e in entities if entity_name in e.get("properties", {}).get("name", "")]
-        if not matching:
-            matching = [e for e in entities if entity_name.lower() in e["id"].lower()]
-        
+        # 全文索引查找匹配实体，前5个一起做一次多起点扩展（共享已访问集合，枢纽节点有扇出上限）
+        matching = graph_db.search_entities(entity_name, limit=20)["entities"]
         results = {"entities": matching, "relations": []}
-        if matching:
-            for entity in matching[:5]:
-                related = graph_db.find_related(entity["id"], depth)
-                results["relations"].extend([
-                    {"from": entity["id"], "to": r["id"], "type": "RELATED", "weight": 0.5}
-                    for r in related
-                ])
+        sources = [entity["id"] for entity in matching[:5]]
+        if sources:
+            expanded = graph_db.expand(sources, depth=depth, limit=50 * len(sources))
+            results["relations"] = [
+                {"from": node["source"], "to": node["id"], "type": "RELATED", "weight": 0.5}
+                for node in expanded["nodes"]
+            ]
         return results
     
     def search_entities(self, keyword: str = None, entity_type: str = None, limit: int = 20) -> Dict:
         """搜索实体"""
-        entities = graph_db.query_entities(entity_type, limit=limit * 2)
-        
         if not keyword:
+            entities = graph_db.query_entities(entity_type, limit=limit * 2)
             return {
                 "entities": entities[:limit],
                 "total": len(entities),
@@ -785,63 +781,26 @@ class GraphQueryEngine:
                 "entity_type": entity_type
             }
         
-        # 关键词搜索
-        keyword_lower = keyword.lower()
-        matching = []
-        
-        for entity in entities:
-            # 在ID中搜索
-            if keyword_lower in entity["id"].lower():
-                matching.append(entity)
-                continue
-            
-            # 在属性值中搜索
-            props = entity.get("properties", {})
-            for key, value in props.items():
-                if isinstance(value, str) and keyword_lower in value.lower():
-                    matching.append(entity)
-                    break
-                elif isinstance(value, (int, float)) and keyword_lower in str(value).lower():
-                    matching.append(entity)
-                    break
-        
-        # 去重并限制数量
-        seen = set()
-        unique_results = []
-        for e in matching:
-            if e["id"] not in seen:
-                seen.add(e["id"])
-                unique_results.append(e)
-        
+        # 关键词搜索：全文索引按相关度排序，不受拉取窗口限制
+        result = graph_db.search_entities(keyword, entity_type, limit)
         return {
-            "entities": unique_results[:limit],
-            "total": len(unique_results),
+            "entities": result["entities"],
+            "total": result["total"],
             "keyword": keyword,
             "entity_type": entity_type
         }
-    
+
     def query_brand_interest_correlation(self, brand: str) -> Dict:
         brand_entity = f"brand:{brand}"
         correlations = []
-        relations = graph_db.query_relations()
-        for rel in relations:
-            if rel["from"] == brand_entity:
-                interest_id = rel["to"]
-                interest_entity = graph_db.query_entities()
-                for ie in interest_entity:
-                    if ie["id"] == interest_id:
-                        correlations.append({
-                            "interest": ie["properties"].get("name", interest_id),
-                            "weight": rel.get("weight", 0)
-                        })
+        for edge in graph_db.neighbors(brand_entity):
+            target = graph_db.knowledge_graph.nodes[edge["id"]]
+            correlations.append({
+                "interest": target.get("name", edge["id"]),
+                "weight": edge["weight"]
+            })
         correlations.sort(key=lambda x: x["weight"], reverse=True)
         return {"brand": brand, "correlations": correlations[:10]}
     
     def query_user_segment(self, criteria: Dict) -> List[Dict]:
-        users = graph_db.query_entities("User")
-        matching = []
-        for user in users:
-            props = user.get("properties", {})
-            if all(props.get(k) == v for k, v in criteria.items()):
-                matching.append(user)
-        return matching
+        return graph_db.find_entities("User", criteria)
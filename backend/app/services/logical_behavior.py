@@ -3,14 +3,166 @@
 """
 import asyncio
 import json
-import sqlite3
 from datetime import datetime
 from typing import Dict, List, Optional
 from pathlib import Path
 
+from app.core.config import settings
+from app.core.token_budget import estimate_tokens
 from app.core.logger import app_logger
 from app.core.openai_client import OpenAIClient
 from app.core.exceptions import LLMServiceError, DatabaseError
+from app.core.db_pool import get_pool
+from app.services.sequence_mining import SequenceMiningService
+
+# 流水线预取阶段每次批量加载的用户数
+PREFETCH_CHUNK_SIZE = 64
+
+# 流水线写入阶段每个事务最多写入的用户数
+WRITE_BATCH_SIZE = 64
+
+# IN 查询每次的参数个数（受SQLite参数个数限制）
+IN_QUERY_CHUNK_SIZE = 500
+
+# 打包模式：每个原始行为预估的输出token数（逻辑行为约为原始行为的30-50%，每行约60 token）
+PACK_OUTPUT_TOKENS_PER_BEHAVIOR = 30
+
+# 打包模式：单个请求最多包含的用户数
+PACK_MAX_USERS = 16
+
+# 逻辑行为生成说明（单用户与多用户打包prompt共用）
+PROMPT_INSTRUCTIONS = """## 核心任务：泛化与合并
+你的任务是将碎片化的原始行为**抽象为更高层次的逻辑行为**，而不是简单复制。关键要求：
+
+### 1. 智能合并策略（必须执行）
+
+**紧密合并**（5分钟内）：
+- 相邻5分钟内的相似行为必须合并
+- 示例：[12:00] 浏览宝马X5 → [12:03] 浏览奔驰GLE → [12:05] 浏览奥迪Q7
+- 合并为：对比豪华SUV车型
+
+**主题合并**（同一时段内）：
+- 同一时段（如上午、下午、晚上）的相同主题行为应该聚合
+- 即使时间跨度较大（1-2小时），只要主题一致就合并
+- 示例：
+  - [10:00] 浏览吉利帝豪 → [11:00] 浏览吉利博越 → [13:00] 浏览吉利星越
+  - 合并为：研究吉利品牌车型（上午到下午，主题一致）
+
+**跨时段合并**（同一天内）：
+- 同一天内多次出现的相同主题行为可以合并
+- 示例：
+  - [09:00] 浏览汽车之家 → [14:00] 浏览汽车之家 → [19:00] 浏览汽车之家
+  - 合并为：全天持续关注汽车资讯
+
+**判断标准**：
+- 相同品牌/品类 → 必须合并
+- 相同平台/APP → 可以合并
+- 相同行为类型（如都是浏览、都是使用APP） → 可以合并
+- 不同主题 → 不合并（如浏览汽车+浏览美妆）
+
+### 2. 主题维度聚合（必须执行）
+- 相同品类/主题的多次行为应该聚合
+- 示例：
+  - 原始：浏览本田CR-V → 浏览丰田RAV4 → 浏览日产奇骏
+  - 逻辑：对比日系合资SUV（而不是分别记录3次）
+
+### 3. 意图抽象（核心）
+从具体行为推断用户的真实意图：
+- "浏览宝马7系+奔驰S级+奥迪A8" → "对比豪华轿车"（购车意图）
+- "深夜多次浏览美妆+点击广告" → "种草美妆产品"（消费意图）
+- "工作日午间短时浏览" → "碎片时间信息获取"（浏览意图）
+- "周末长时间停留4S店" → "深度看车体验"（转化意图）
+
+### 4. 对象泛化（必须执行）
+将具体对象抽象为品类/类型：
+- "本田CR-V" → "日系合资SUV"
+- "宝马7系+奔驰S级" → "豪华行政轿车"
+- "抖音+快手" → "短视频平台"
+- "汽车之家+懂车帝" → "汽车资讯平台"
+- "星巴克+瑞幸" → "连锁咖啡品牌"
+- "LV+Gucci" → "奢侈品牌"
+
+## 输出4个维度
+
+1. **本体(Agent)**: 基于用户画像的简洁标签
+   - 结合年龄段+性别+职业/身份
+   - 示例：Z世代年轻女性学生、中年高收入男性白领、退休老年男性
+
+2. **环境(Scene)**: 时间+场景特征
+   - 时间段：深夜(22:00-02:00)、午休(12:00-14:00)、周末、工作日
+   - 场景：休闲娱乐、碎片时间、深度研究、商务活动
+   - 示例：深夜宿舍休闲娱乐场景、工作日午休碎片时间、周末深度购车研究
+
+3. **行动(Action)**: 泛化的行为意图
+   - 不要简单说"浏览"、"使用"，要说明目的
+   - 示例：对比豪华SUV车型、种草美妆产品、研究购车方案、碎片时间娱乐
+
+4. **对象(Object)**: 泛化的目标品类
+   - 不要具体品牌/型号，要品类/类型
+   - 示例：日系合资SUV、豪华行政轿车、平价美妆产品、短视频娱乐平台
+
+## 泛化示例对比
+
+❌ 错误（没有泛化）：
+中年女性教师|工作日上午|浏览汽车资讯|本田CR-V|...|user_0136_b0|0.9
+中年女性教师|工作日上午|浏览汽车资讯|丰田RAV4|...|user_0136_b1|0.9
+中年女性教师|工作日上午|浏览汽车资讯|日产奇骏|...|user_0136_b2|0.9
+
+✓ 正确（已泛化合并）：
+中年女性教师|工作日上午碎片时间|对比日系合资SUV车型|20-30万家用SUV|...|user_0136_b0,user_0136_b1,user_0136_b2|0.95
+
+❌ 错误（没有泛化）：
+Z世代女性学生|深夜|浏览|抖音短视频|...|b5|0.8
+Z世代女性学生|深夜|浏览|小红书|...|b6|0.8
+
+✓ 正确（已泛化合并）：
+Z世代女性学生|深夜宿舍休闲娱乐|种草美妆内容|短视频+社区平台|...|b5,b6|0.9
+
+## 输出格式（严格遵守）
+
+**必须使用管道符分隔的纯文本格式，不要使用JSON！**
+
+每行一个逻辑行为，格式如下：
+```
+agent|scene|action|object|start_time|end_time|raw_behavior_ids|confidence
+```
+
+**示例输出**：
+```
+50岁上海男性互联网从业者|工作日全天持续关注|研究豪华SUV车型|30-50万豪华SUV|2025-11-26 09:00:00|2025-11-26 18:00:00|user_0035_b0,user_0035_b2,user_0035_b3,user_0035_b4,user_0035_b5|0.92
+50岁上海男性互联网从业者|晚间商务社交|高端商务会所活动|商务社交场所|2025-11-27 19:00:00|2025-11-29 21:00:00|user_0035_b6,user_0035_b12,user_0035_b13|0.97
+```
+
+**严格要求**：
+1. ❌ 不要输出JSON格式（不要用花括号、方括号、引号等）
+2. ❌ 不要输出原始行为的详细列表
+3. ❌ 不要输出多个版本（详细版、简化版等）
+4. ✅ 只输出最终的泛化合并后的逻辑行为
+5. ✅ 每行一个逻辑行为，使用管道符|分隔
+6. ✅ 直接输出结果，不要任何前缀、标题、说明
+
+**字段说明**：
+- raw_behavior_ids: 逗号分隔的行为ID列表（如：user_0035_b0,user_0035_b2,user_0035_b3）
+- confidence: 0-1之间的数字（如：0.92）
+- 时间格式: YYYY-MM-DD HH:MM:SS
+
+## 关键提醒
+- 必须合并相邻的相似行为，不要一对一映射
+- 必须泛化对象，不要保留具体品牌/型号
+- 必须抽象意图，不要简单复制动作
+- 逻辑行为数量应该远少于原始行为数量（建议压缩到30-50%）
+"""
+
+# 多用户打包prompt追加的输出要求
+PACKED_OUTPUT_INSTRUCTIONS = """
+## 多用户输出要求（覆盖上面的输出格式）
+- 本次请求包含多个用户，每行最前面必须增加该逻辑行为所属的用户ID字段，共9个字段：
+```
+user_id|agent|scene|action|object|start_time|end_time|raw_behavior_ids|confidence
+```
+- 用户ID必须与「用户画像」中的用户ID完全一致
+- 每个用户都必须输出逻辑行为，按用户依次输出，不要输出用户标题或分隔行
+"""
 
 
 class LogicalBehaviorGenerator:
@@ -19,6 +171,7 @@ class LogicalBehaviorGenerator:
     def __init__(self, llm_client: OpenAIClient, db_path: str = "data/graph.db"):
         self.llm_client = llm_client
         self.db_path = Path(db_path)
+        self.mining_service = SequenceMiningService(db_path)  # 维护挖掘用的n-gram索引和事件倒排索引
         self.progress = {
             "total_users": 0,
             "processed_users": 0,
@@ -28,23 +181,24 @@ class LogicalBehaviorGenerator:
         }
 
     async def generate_for_user(self, user_id: str) -> Dict:
-        """为单个用户生成逻辑行为序列"""
+        """为单个用户生成逻辑行为序列（数据库读写在线程池中执行，不阻塞事件循环）"""
         app_logger.info(f"开始为用户 {user_id} 生成逻辑行为")
 
         try:
             # 更新状态为processing
-            self._update_sequence_status(user_id, "processing")
+            await asyncio.to_thread(self._update_sequence_status, user_id, "processing")
 
             # 1. 获取用户画像
-            user_profile = self._get_user_profile(user_id)
+            user_profile = await asyncio.to_thread(self._get_user_profile, user_id)
             if not user_profile:
                 raise DatabaseError(f"用户 {user_id} 画像不存在")
 
             # 2. 获取原始行为数据
-            raw_behaviors = self._get_raw_behaviors(user_id)
+            raw_behaviors = await asyncio.to_thread(self._get_raw_behaviors, user_id)
             if not raw_behaviors:
                 app_logger.warning(f"用户 {user_id} 没有行为数据")
-                self._update_sequence_status(user_id, "success", 0)
+                await asyncio.to_thread(self._update_sequence_status, user_id, "success", 0)
+                await asyncio.to_thread(self._refresh_mining_index, user_id)
                 return {
                     "user_id": user_id,
                     "logical_behaviors": [],
@@ -53,7 +207,9 @@ class LogicalBehaviorGenerator:
                 }
 
             # 3. 丰富行为数据（关联app_tags和media_tags）
-            enriched_behaviors = self._enrich_behaviors_with_tags(raw_behaviors)
+            enriched_behaviors = await asyncio.to_thread(
+                self._enrich_behaviors_with_tags, raw_behaviors
+            )
 
             # 4. 调用LLM生成逻辑行为
             logical_behaviors = await self._generate_logical_behaviors(
@@ -61,10 +217,13 @@ class LogicalBehaviorGenerator:
             )
 
             # 5. 保存到数据库
-            saved_count = self._save_logical_behaviors(user_id, logical_behaviors)
+            saved_count = await asyncio.to_thread(
+                self._save_logical_behaviors, user_id, logical_behaviors
+            )
 
             # 6. 更新状态为success
-            self._update_sequence_status(user_id, "success", saved_count)
+            await asyncio.to_thread(self._update_sequence_status, user_id, "success", saved_count)
+            await asyncio.to_thread(self._refresh_mining_index, user_id)
 
             app_logger.info(
                 f"用户 {user_id} 逻辑行为生成完成: "
@@ -81,12 +240,32 @@ class LogicalBehaviorGenerator:
         except Exception as e:
             error_msg = str(e)
             app_logger.error(f"用户 {user_id} 逻辑行为生成失败: {error_msg}", exc_info=True)
-            self._update_sequence_status(user_id, "failed", 0, error_msg)
+            await asyncio.to_thread(self._update_sequence_status, user_id, "failed", 0, error_msg)
             raise
 
-    async def generate_batch(self, user_ids: List[str], max_workers: int = 4) -> Dict:
-        """批量生成逻辑行为序列（并行处理）"""
-        app_logger.info(f"开始批量生成逻辑行为: {len(user_ids)} 个用户, {max_workers} 并发")
+    async def generate_batch(
+        self,
+        user_ids: List[str],
+        max_workers: int = 4,
+        pack: Optional[bool] = None,
+        use_cache: bool = True
+    ) -> Dict:
+        """批量生成逻辑行为序列（流水线处理）
+
+        三个阶段并行推进：
+        1. 预取：每 PREFETCH_CHUNK_SIZE 个用户一次批量加载画像、行为和标签（线程池中执行）
+        2. LLM：max_workers 个协程并发调用LLM，是唯一的吞吐瓶颈
+        3. 写入：单个写入协程把已完成的用户攒批，在一个事务中写入逻辑行为和状态
+
+        pack 为 True 时（默认取 LLM_PACK_USERS 配置），预取分块内的小用户按token预算打包到同一个LLM请求，
+        共用说明部分；打包结果中缺失的用户单独重试。
+
+        use_cache 为 False 时不读取LLM响应缓存（重试的用户prompt不变，读缓存只会得到同样的失败结果）。
+        """
+        pack = settings.llm_pack_users if pack is None else pack
+        app_logger.info(
+            f"开始批量生成逻辑行为: {len(user_ids)} 个用户, {max_workers} 并发{', 多用户打包' if pack else ''}"
+        )
 
         # 初始化进度
         self.progress = {
@@ -97,42 +276,79 @@ class LogicalBehaviorGenerator:
             "current_user": None
         }
 
-        success_count = 0
-        failed_count = 0
-        results = []
-
-        async def process_with_progress(user_id: str):
-            nonlocal success_count, failed_count
+        results: List[Optional[Dict]] = [None] * len(user_ids)
+        # 预取最多领先LLM阶段一个分块，内存占用与批次大小无关
+        llm_queue: asyncio.Queue = asyncio.Queue(maxsize=max(PREFETCH_CHUNK_SIZE, max_workers))
+        write_queue: asyncio.Queue = asyncio.Queue()
+
+        async def prefetch():
+            for start in range(0, len(user_ids), PREFETCH_CHUNK_SIZE):
+                chunk = user_ids[start:start + PREFETCH_CHUNK_SIZE]
+                try:
+                    loaded = await asyncio.to_thread(self._prefetch_users, chunk)
+                except Exception as e:
+                    app_logger.error(f"预取用户数据失败: {e}", exc_info=True)
+                    loaded = {user_id: e for user_id in chunk}
+                items = [
+                    (start + offset, user_id, loaded.get(user_id))
+                    for offset, user_id in enumerate(chunk)
+                ]
+                for group in (self._pack_users(items) if pack else [[item] for item in items]):
+                    await llm_queue.put(group)
+            for _ in range(max_workers):
+                await llm_queue.put(None)
+
+        async def llm_worker():
+            while True:
+                item = await llm_queue.get()
+                if item is None:
+                    return
+                if len(item) > 1:
+                    self.progress["current_user"] = item[0][1]
+                    for outcome in await self._run_packed_llm_stage(item, use_cache):
+                        await write_queue.put(outcome)
+                    continue
+                index, user_id, loaded = item[0]
+                self.progress["current_user"] = user_id
+                outcome = await self._run_llm_stage(user_id, loaded, use_cache)
+                await write_queue.put((index, outcome))
+
+        async def writer():
+            success = failed = 0  # 按每批写入结果累加，不重新扫描全部结果
+            finished = False
+            while not finished:
+                batch = [await write_queue.get()]
+                while not write_queue.empty() and len(batch) < WRITE_BATCH_SIZE:
+                    batch.append(write_queue.get_nowait())
+                finished = batch[-1] is None
+                batch = [item for item in batch if item is not None]
+                if not batch:
+                    continue
 
-            try:
-                result = await self.generate_for_user(user_id)
-                success_count += 1
-                self._update_progress(
-                    processed_users=success_count + failed_count,
-                    success_count=success_count,
-                    failed_count=failed_count
+                written = await asyncio.to_thread(
+                    self._write_outcomes, [outcome for _, outcome in batch]
                 )
-                return {"user_id": user_id, "status": "success", "result": result}
-            except Exception as e:
-                failed_count += 1
+                for (index, _), result in zip(batch, written):
+                    results[index] = result
+                    if result["status"] == "success":
+                        success += 1
+                    else:
+                        failed += 1
                 self._update_progress(
-                    processed_users=success_count + failed_count,
-                    success_count=success_count,
-                    failed_count=failed_count
+                    processed_users=success + failed,
+                    success_count=success,
+                    failed_count=failed
                 )
-                return {"user_id": user_id, "status": "failed", "error": str(e)}
-
-        # 使用信号量控制并发
-        semaphore = asyncio.Semaphore(max_workers)
-
-        async def process_with_semaphore(user_id: str):
-            async with semaphore:
-                return await process_with_progress(user_id)
 
-        # 并行处理
-        tasks = [process_with_semaphore(user_id) for user_id in user_ids]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        writer_task = asyncio.create_task(writer())
+        try:
+            await asyncio.gather(prefetch(), *(llm_worker() for _ in range(max_workers)))
+        finally:
+            await write_queue.put(None)
+            await writer_task
 
+        success_count = self.progress["success_count"]
+        failed_count = self.progress["failed_count"]
         app_logger.info(
             f"批量生成完成: 成功 {success_count}, 失败 {failed_count}"
         )
@@ -144,6 +360,107 @@ class LogicalBehaviorGenerator:
             "results": results
         }
 
+    async def _run_llm_stage(self, user_id: str, loaded, use_cache: bool = True) -> Dict:
+        """流水线LLM阶段：根据预取的数据调用LLM，返回待写入的结果（不访问数据库）"""
+        outcome = {
+            "user_id": user_id, "logical_behaviors": [], "raw_behavior_count": 0, "error": None
+        }
+        try:
+            if isinstance(loaded, Exception):
+                raise loaded
+            if not loaded or not loaded["profile"]:
+                raise DatabaseError(f"用户 {user_id} 画像不存在")
+
+            behaviors = loaded["behaviors"]
+            outcome["raw_behavior_count"] = len(behaviors)
+            if not behaviors:
+                app_logger.warning(f"用户 {user_id} 没有行为数据")
+                return outcome
+
+            outcome["logical_behaviors"] = await self._generate_logical_behaviors(
+                user_id, loaded["profile"], behaviors, use_cache=use_cache
+            )
+        except Exception as e:
+            app_logger.error(f"用户 {user_id} 逻辑行为生成失败: {e}", exc_info=True)
+            outcome["error"] = str(e)
+        return outcome
+
+    def _pack_users(self, items: List[tuple]) -> List[List[tuple]]:
+        """把预取分块中的用户按token预算分组（每组一个LLM请求）
+
+        估算的prompt token不超过 max_tokens_per_request，预估输出不超过 llm_max_output_tokens；
+        无数据或单独就占用一半以上预算的用户单独成组。
+        """
+        budget = settings.max_tokens_per_request
+        max_output_tokens = settings.llm_max_output_tokens
+        base_tokens = estimate_tokens(self._build_packed_prompt([]))
+        groups, current = [], []
+        used_tokens = output_tokens = 0
+
+        for item in items:
+            loaded = item[2]
+            if (isinstance(loaded, Exception) or not loaded
+                    or not loaded["profile"] or not loaded["behaviors"]):
+                groups.append([item])
+                continue
+
+            section = self._format_user_section(
+                loaded["profile"], self._format_raw_behaviors(loaded["behaviors"])
+            )
+            loaded["prompt_section"] = section
+            cost = estimate_tokens(section)
+            output = len(loaded["behaviors"]) * PACK_OUTPUT_TOKENS_PER_BEHAVIOR
+            if base_tokens + 2 * cost > budget or 2 * output > max_output_tokens:
+                groups.append([item])
+                continue
+
+            if current and (
+                base_tokens + used_tokens + cost > budget
+                or output_tokens + output > max_output_tokens
+                or len(current) >= PACK_MAX_USERS
+            ):
+                groups.append(current)
+                current, used_tokens, output_tokens = [], 0, 0
+            current.append(item)
+            used_tokens += cost
+            output_tokens += output
+
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _run_packed_llm_stage(
+        self, group: List[tuple], use_cache: bool = True
+    ) -> List[tuple]:
+        """流水线LLM阶段（打包）：一个请求处理一组用户，返回 [(index, outcome)]
+
+        请求失败或输出中缺少某个用户时，这些用户在当前worker中逐个单独重试一次，
+        同时进行的LLM请求数仍不超过 max_workers。
+        """
+        try:
+            by_user = await self._generate_packed_logical_behaviors(group, use_cache)
+        except Exception as e:
+            app_logger.warning(f"打包请求失败（{len(group)} 个用户），改为逐个生成: {e}")
+            by_user = {}
+
+        outcomes, retry = [], []
+        for index, user_id, loaded in group:
+            if by_user.get(user_id):
+                outcomes.append((index, {
+                    "user_id": user_id,
+                    "logical_behaviors": by_user[user_id],
+                    "raw_behavior_count": len(loaded["behaviors"]),
+                    "error": None
+                }))
+            else:
+                retry.append((index, user_id, loaded))
+
+        if retry:
+            app_logger.info(f"打包请求中 {len(retry)}/{len(group)} 个用户没有结果，单独重试")
+            for index, user_id, loaded in retry:
+                outcomes.append((index, await self._run_llm_stage(user_id, loaded, use_cache)))
+        return outcomes
+
     def get_progress(self) -> Dict:
         """获取生成进度"""
         return self.progress.copy()
@@ -151,7 +468,7 @@ class LogicalBehaviorGenerator:
     def query_logical_behaviors(self, user_id: str) -> List[Dict]:
         """查询用户的逻辑行为序列"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """SELECT id, user_id, agent, scene, action, object,
@@ -185,10 +502,53 @@ class LogicalBehaviorGenerator:
 
     # ========== 私有方法 ==========
 
+    @staticmethod
+    def _profile_from_row(row) -> Dict:
+        properties = json.loads(row[5]) if row[5] else {}
+
+        return {
+            "user_id": row[0],
+            "age": row[1],
+            "gender": row[2],
+            "city": row[3],
+            "occupation": row[4],
+            "age_bucket": properties.get("age_bucket", ""),
+            "education": properties.get("education", ""),
+            "income_level": properties.get("income_level", ""),
+            "interests": properties.get("interests", []),
+            "behaviors": properties.get("behaviors", [])
+        }
+
+    @staticmethod
+    def _behavior_from_row(row) -> Dict:
+        properties = json.loads(row[9]) if row[9] else {}
+        return {
+            "id": row[0],
+            "user_id": row[1],
+            "action": row[2],
+            "timestamp": row[3],
+            "item_id": row[4],
+            "app_id": row[5],
+            "media_id": row[6],
+            "poi_id": row[7],
+            "duration": row[8],
+            "properties": properties
+        }
+
+    @staticmethod
+    def _select_in(cursor, sql: str, ids: List) -> List:
+        """按 IN 列表分块查询（受SQLite参数个数限制），sql 中用 {placeholders} 占位"""
+        rows = []
+        for i in range(0, len(ids), IN_QUERY_CHUNK_SIZE):
+            chunk = ids[i:i + IN_QUERY_CHUNK_SIZE]
+            cursor.execute(sql.format(placeholders=",".join("?" * len(chunk))), chunk)
+            rows.extend(cursor.fetchall())
+        return rows
+
     def _get_user_profile(self, user_id: str) -> Optional[Dict]:
         """获取用户画像"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """SELECT user_id, age, gender, city, occupation, properties
@@ -200,20 +560,7 @@ class LogicalBehaviorGenerator:
                 if not row:
                     return None
 
-                properties = json.loads(row[5]) if row[5] else {}
-
-                return {
-                    "user_id": row[0],
-                    "age": row[1],
-                    "gender": row[2],
-                    "city": row[3],
-                    "occupation": row[4],
-                    "age_bucket": properties.get("age_bucket", ""),
-                    "education": properties.get("education", ""),
-                    "income_level": properties.get("income_level", ""),
-                    "interests": properties.get("interests", []),
-                    "behaviors": properties.get("behaviors", [])
-                }
+                return self._profile_from_row(row)
 
         except Exception as e:
             app_logger.error(f"获取用户画像失败: {e}", exc_info=True)
@@ -222,7 +569,7 @@ class LogicalBehaviorGenerator:
     def _get_raw_behaviors(self, user_id: str) -> List[Dict]:
         """获取原始行为数据"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """SELECT id, user_id, action, timestamp, item_id, app_id,
@@ -233,97 +580,132 @@ class LogicalBehaviorGenerator:
                     (user_id,)
                 )
 
-                behaviors = []
-                for row in cursor.fetchall():
-                    properties = json.loads(row[9]) if row[9] else {}
-                    behaviors.append({
-                        "id": row[0],
-                        "user_id": row[1],
-                        "action": row[2],
-                        "timestamp": row[3],
-                        "item_id": row[4],
-                        "app_id": row[5],
-                        "media_id": row[6],
-                        "poi_id": row[7],
-                        "duration": row[8],
-                        "properties": properties
-                    })
-
-                return behaviors
+                return [self._behavior_from_row(row) for row in cursor.fetchall()]
 
         except Exception as e:
             app_logger.error(f"获取原始行为失败: {e}", exc_info=True)
             return []
 
+    def _prefetch_users(self, user_ids: List[str]) -> Dict[str, Dict]:
+        """流水线预取阶段：批量加载一组用户的画像和（已关联标签的）原始行为
+
+        画像、行为、app标签、媒体标签各一次查询；同时把这些用户标记为processing。
+
+        Returns:
+            user_id -> {"profile": 画像或None, "behaviors": 丰富后的行为列表}
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        with get_pool(self.db_path).write() as conn:
+            now = datetime.now()
+            conn.executemany(
+                """INSERT OR REPLACE INTO logical_behavior_sequences
+                   (user_id, status, behavior_count, error_message, updated_at)
+                   VALUES (?, 'processing', 0, NULL, ?)""",
+                [(user_id, now) for user_id in user_ids]
+            )
+
+        loaded = {user_id: {"profile": None, "behaviors": []} for user_id in user_ids}
+        with get_pool(self.db_path).read() as conn:
+            cursor = conn.cursor()
+            for row in self._select_in(
+                cursor,
+                """SELECT user_id, age, gender, city, occupation, properties
+                   FROM user_profiles
+                   WHERE user_id IN ({placeholders})""",
+                user_ids
+            ):
+                loaded[row[0]]["profile"] = self._profile_from_row(row)
+
+            for row in self._select_in(
+                cursor,
+                """SELECT id, user_id, action, timestamp, item_id, app_id,
+                          media_id, poi_id, duration, properties
+                   FROM behavior_data
+                   WHERE user_id IN ({placeholders})
+                   ORDER BY user_id, timestamp ASC""",
+                user_ids
+            ):
+                loaded[row[1]]["behaviors"].append(self._behavior_from_row(row))
+
+            all_behaviors = [b for entry in loaded.values() for b in entry["behaviors"]]
+            app_tags_map, media_tags_map = self._load_tag_maps(cursor, all_behaviors)
+
+        for entry in loaded.values():
+            entry["behaviors"] = self._apply_tags(entry["behaviors"], app_tags_map, media_tags_map)
+        return loaded
+
+    def _load_tag_maps(self, cursor, behaviors: List[Dict]):
+        """批量查询行为涉及的app_tags和media_tags"""
+        # 提取所有app_id和media_id
+        app_ids = list(set(b["app_id"] for b in behaviors if b.get("app_id")))
+        media_ids = list(set(b["media_id"] for b in behaviors if b.get("media_id")))
+
+        # 批量查询app_tags
+        app_tags_map = {}
+        for row in self._select_in(
+            cursor,
+            """SELECT app_id, app_name, category, tags
+               FROM app_tags
+               WHERE app_id IN ({placeholders})""",
+            app_ids
+        ):
+            app_tags_map[row[0]] = {
+                "app_name": row[1],
+                "category": row[2],
+                "tags": row[3]
+            }
+
+        # 批量查询media_tags
+        media_tags_map = {}
+        for row in self._select_in(
+            cursor,
+            """SELECT media_id, media_name, media_type, tags
+               FROM media_tags
+               WHERE media_id IN ({placeholders})""",
+            media_ids
+        ):
+            media_tags_map[row[0]] = {
+                "media_name": row[1],
+                "media_type": row[2],
+                "tags": row[3]
+            }
+
+        return app_tags_map, media_tags_map
+
+    @staticmethod
+    def _apply_tags(behaviors: List[Dict], app_tags_map: Dict, media_tags_map: Dict) -> List[Dict]:
+        """把标签信息合并到行为数据中"""
+        enriched = []
+        for behavior in behaviors:
+            enriched_behavior = behavior.copy()
+
+            # 添加app信息
+            if behavior.get("app_id") and behavior["app_id"] in app_tags_map:
+                app_info = app_tags_map[behavior["app_id"]]
+                enriched_behavior["app_name"] = app_info["app_name"]
+                enriched_behavior["app_category"] = app_info["category"]
+                enriched_behavior["app_tags"] = app_info["tags"]
+
+            # 添加media信息
+            if behavior.get("media_id") and behavior["media_id"] in media_tags_map:
+                media_info = media_tags_map[behavior["media_id"]]
+                enriched_behavior["media_name"] = media_info["media_name"]
+                enriched_behavior["media_type"] = media_info["media_type"]
+                enriched_behavior["media_tags"] = media_info["tags"]
+
+            enriched.append(enriched_behavior)
+
+        return enriched
+
     def _enrich_behaviors_with_tags(self, behaviors: List[Dict]) -> List[Dict]:
         """丰富行为数据（关联app_tags和media_tags）"""
         if not behaviors:
             return behaviors
 
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
-                # 提取所有app_id和media_id
-                app_ids = list(set(b["app_id"] for b in behaviors if b.get("app_id")))
-                media_ids = list(set(b["media_id"] for b in behaviors if b.get("media_id")))
-
-                # 批量查询app_tags
-                app_tags_map = {}
-                if app_ids:
-                    placeholders = ",".join("?" * len(app_ids))
-                    cursor.execute(
-                        f"""SELECT app_id, app_name, category, tags
-                           FROM app_tags
-                           WHERE app_id IN ({placeholders})""",
-                        app_ids
-                    )
-                    for row in cursor.fetchall():
-                        app_tags_map[row[0]] = {
-                            "app_name": row[1],
-                            "category": row[2],
-                            "tags": row[3]
-                        }
-
-                # 批量查询media_tags
-                media_tags_map = {}
-                if media_ids:
-                    placeholders = ",".join("?" * len(media_ids))
-                    cursor.execute(
-                        f"""SELECT media_id, media_name, media_type, tags
-                           FROM media_tags
-                           WHERE media_id IN ({placeholders})""",
-                        media_ids
-                    )
-                    for row in cursor.fetchall():
-                        media_tags_map[row[0]] = {
-                            "media_name": row[1],
-                            "media_type": row[2],
-                            "tags": row[3]
-                        }
-
-                # 丰富行为数据
-                enriched = []
-                for behavior in behaviors:
-                    enriched_behavior = behavior.copy()
-
-                    # 添加app信息
-                    if behavior.get("app_id") and behavior["app_id"] in app_tags_map:
-                        app_info = app_tags_map[behavior["app_id"]]
-                        enriched_behavior["app_name"] = app_info["app_name"]
-                        enriched_behavior["app_category"] = app_info["category"]
-                        enriched_behavior["app_tags"] = app_info["tags"]
-
-                    # 添加media信息
-                    if behavior.get("media_id") and behavior["media_id"] in media_tags_map:
-                        media_info = media_tags_map[behavior["media_id"]]
-                        enriched_behavior["media_name"] = media_info["media_name"]
-                        enriched_behavior["media_type"] = media_info["media_type"]
-                        enriched_behavior["media_tags"] = media_info["tags"]
-
-                    enriched.append(enriched_behavior)
-
-                return enriched
+            with get_pool(self.db_path).read() as conn:
+                app_tags_map, media_tags_map = self._load_tag_maps(conn.cursor(), behaviors)
+            return self._apply_tags(behaviors, app_tags_map, media_tags_map)
 
         except Exception as e:
             app_logger.error(f"丰富行为数据失败: {e}", exc_info=True)
@@ -370,8 +752,8 @@ class LogicalBehaviorGenerator:
 
         return "\n".join(lines)
 
-    def _build_prompt(self, user_profile: Dict, formatted_behaviors: str) -> str:
-        """构建LLM prompt"""
+    def _format_user_section(self, user_profile: Dict, formatted_behaviors: str) -> str:
+        """单个用户的画像与原始行为段落"""
         # 提取用户画像字段
         age = user_profile.get("age", "未知")
         age_bucket = user_profile.get("age_bucket", "")
@@ -383,9 +765,7 @@ class LogicalBehaviorGenerator:
         interests = ", ".join(user_profile.get("interests", []))
         behaviors = ", ".join(user_profile.get("behaviors", []))
 
-        prompt = f"""你是一个用户行为分析专家，需要将用户的原始行为序列抽象为逻辑行为序列。
-
-## 用户画像
+        return f"""## 用户画像
 - 用户ID: {user_profile['user_id']}
 - 年龄: {age}岁 ({age_bucket})
 - 性别: {gender}
@@ -399,145 +779,49 @@ class LogicalBehaviorGenerator:
 ## 原始行为序列
 {formatted_behaviors}
 
-## 核心任务：泛化与合并
-你的任务是将碎片化的原始行为**抽象为更高层次的逻辑行为**，而不是简单复制。关键要求：
-
-### 1. 智能合并策略（必须执行）
-
-**紧密合并**（5分钟内）：
-- 相邻5分钟内的相似行为必须合并
-- 示例：[12:00] 浏览宝马X5 → [12:03] 浏览奔驰GLE → [12:05] 浏览奥迪Q7
-- 合并为：对比豪华SUV车型
-
-**主题合并**（同一时段内）：
-- 同一时段（如上午、下午、晚上）的相同主题行为应该聚合
-- 即使时间跨度较大（1-2小时），只要主题一致就合并
-- 示例：
-  - [10:00] 浏览吉利帝豪 → [11:00] 浏览吉利博越 → [13:00] 浏览吉利星越
-  - 合并为：研究吉利品牌车型（上午到下午，主题一致）
-
-**跨时段合并**（同一天内）：
-- 同一天内多次出现的相同主题行为可以合并
-- 示例：
-  - [09:00] 浏览汽车之家 → [14:00] 浏览汽车之家 → [19:00] 浏览汽车之家
-  - 合并为：全天持续关注汽车资讯
-
-**判断标准**：
-- 相同品牌/品类 → 必须合并
-- 相同平台/APP → 可以合并
-- 相同行为类型（如都是浏览、都是使用APP） → 可以合并
-- 不同主题 → 不合并（如浏览汽车+浏览美妆）
-
-### 2. 主题维度聚合（必须执行）
-- 相同品类/主题的多次行为应该聚合
-- 示例：
-  - 原始：浏览本田CR-V → 浏览丰田RAV4 → 浏览日产奇骏
-  - 逻辑：对比日系合资SUV（而不是分别记录3次）
-
-### 3. 意图抽象（核心）
-从具体行为推断用户的真实意图：
-- "浏览宝马7系+奔驰S级+奥迪A8" → "对比豪华轿车"（购车意图）
-- "深夜多次浏览美妆+点击广告" → "种草美妆产品"（消费意图）
-- "工作日午间短时浏览" → "碎片时间信息获取"（浏览意图）
-- "周末长时间停留4S店" → "深度看车体验"（转化意图）
-
-### 4. 对象泛化（必须执行）
-将具体对象抽象为品类/类型：
-- "本田CR-V" → "日系合资SUV"
-- "宝马7系+奔驰S级" → "豪华行政轿车"
-- "抖音+快手" → "短视频平台"
-- "汽车之家+懂车帝" → "汽车资讯平台"
-- "星巴克+瑞幸" → "连锁咖啡品牌"
-- "LV+Gucci" → "奢侈品牌"
-
-## 输出4个维度
-
-1. **本体(Agent)**: 基于用户画像的简洁标签
-   - 结合年龄段+性别+职业/身份
-   - 示例：Z世代年轻女性学生、中年高收入男性白领、退休老年男性
-
-2. **环境(Scene)**: 时间+场景特征
-   - 时间段：深夜(22:00-02:00)、午休(12:00-14:00)、周末、工作日
-   - 场景：休闲娱乐、碎片时间、深度研究、商务活动
-   - 示例：深夜宿舍休闲娱乐场景、工作日午休碎片时间、周末深度购车研究
-
-3. **行动(Action)**: 泛化的行为意图
-   - 不要简单说"浏览"、"使用"，要说明目的
-   - 示例：对比豪华SUV车型、种草美妆产品、研究购车方案、碎片时间娱乐
-
-4. **对象(Object)**: 泛化的目标品类
-   - 不要具体品牌/型号，要品类/类型
-   - 示例：日系合资SUV、豪华行政轿车、平价美妆产品、短视频娱乐平台
-
-## 泛化示例对比
-
-❌ 错误（没有泛化）：
-中年女性教师|工作日上午|浏览汽车资讯|本田CR-V|...|user_0136_b0|0.9
-中年女性教师|工作日上午|浏览汽车资讯|丰田RAV4|...|user_0136_b1|0.9
-中年女性教师|工作日上午|浏览汽车资讯|日产奇骏|...|user_0136_b2|0.9
-
-✓ 正确（已泛化合并）：
-中年女性教师|工作日上午碎片时间|对比日系合资SUV车型|20-30万家用SUV|...|user_0136_b0,user_0136_b1,user_0136_b2|0.95
-
-❌ 错误（没有泛化）：
-Z世代女性学生|深夜|浏览|抖音短视频|...|b5|0.8
-Z世代女性学生|深夜|浏览|小红书|...|b6|0.8
-
-✓ 正确（已泛化合并）：
-Z世代女性学生|深夜宿舍休闲娱乐|种草美妆内容|短视频+社区平台|...|b5,b6|0.9
-
-## 输出格式（严格遵守）
-
-**必须使用管道符分隔的纯文本格式，不要使用JSON！**
-
-每行一个逻辑行为，格式如下：
-```
-agent|scene|action|object|start_time|end_time|raw_behavior_ids|confidence
-```
-
-**示例输出**：
-```
-50岁上海男性互联网从业者|工作日全天持续关注|研究豪华SUV车型|30-50万豪华SUV|2025-11-26 09:00:00|2025-11-26 18:00:00|user_0035_b0,user_0035_b2,user_0035_b3,user_0035_b4,user_0035_b5|0.92
-50岁上海男性互联网从业者|晚间商务社交|高端商务会所活动|商务社交场所|2025-11-27 19:00:00|2025-11-29 21:00:00|user_0035_b6,user_0035_b12,user_0035_b13|0.97
-```
-
-**严格要求**：
-1. ❌ 不要输出JSON格式（不要用花括号、方括号、引号等）
-2. ❌ 不要输出原始行为的详细列表
-3. ❌ 不要输出多个版本（详细版、简化版等）
-4. ✅ 只输出最终的泛化合并后的逻辑行为
-5. ✅ 每行一个逻辑行为，使用管道符|分隔
-6. ✅ 直接输出结果，不要任何前缀、标题、说明
+"""
 
-**字段说明**：
-- raw_behavior_ids: 逗号分隔的行为ID列表（如：user_0035_b0,user_0035_b2,user_0035_b3）
-- confidence: 0-1之间的数字（如：0.92）
-- 时间格式: YYYY-MM-DD HH:MM:SS
+    def _build_prompt(self, user_profile: Dict, formatted_behaviors: str) -> str:
+        """构建LLM prompt"""
+        return (
+            "你是一个用户行为分析专家，需要将用户的原始行为序列抽象为逻辑行为序列。\n\n"
+            + self._format_user_section(user_profile, formatted_behaviors)
+            + PROMPT_INSTRUCTIONS
+        )
 
-## 关键提醒
-- 必须合并相邻的相似行为，不要一对一映射
-- 必须泛化对象，不要保留具体品牌/型号
-- 必须抽象意图，不要简单复制动作
-- 逻辑行为数量应该远少于原始行为数量（建议压缩到30-50%）
-"""
-        return prompt
+    def _build_packed_prompt(self, sections: List[str]) -> str:
+        """构建多用户打包prompt：说明部分只出现一次，输出行首增加用户ID字段"""
+        users = "".join(f"# 用户 {index + 1}\n\n{section}" for index, section in enumerate(sections))
+        return (
+            f"你是一个用户行为分析专家，需要将下面 {len(sections)} 个用户的原始行为序列分别抽象为逻辑行为序列。"
+            "每个用户独立分析，不要跨用户合并行为。\n\n"
+            + users
+            + PROMPT_INSTRUCTIONS
+            + PACKED_OUTPUT_INSTRUCTIONS
+        )
 
     async def _generate_logical_behaviors(
-        self, user_id: str, user_profile: Dict, enriched_behaviors: List[Dict]
+        self,
+        user_id: str,
+        user_profile: Dict,
+        enriched_behaviors: List[Dict],
+        use_cache: bool = True
     ) -> List[Dict]:
-        """调用LLM生成逻辑行为"""
+        """调用LLM生成逻辑行为（响应中解析不出逻辑行为时视为失败）"""
         try:
             # 格式化行为数据
             formatted_behaviors = self._format_raw_behaviors(enriched_behaviors)
 
             # 构建prompt
             prompt = self._build_prompt(user_profile, formatted_behaviors)
+            max_tokens = settings.llm_max_output_tokens
 
             # 调用LLM（流式）
             stream_generator = self.llm_client.chat_completion(
                 prompt=prompt,
-                max_tokens=8000,
-                temperature=0.3
+                max_tokens=max_tokens,
+                temperature=0.3,
+                use_cache=use_cache
             )
 
             # 收集完整响应
@@ -550,6 +834,12 @@ agent|scene|action|object|start_time|end_time|raw_behavior_ids|confidence
 
             # 解析响应
             logical_behaviors = self._parse_llm_response(user_id, full_response, enriched_behaviors)
+            if not logical_behaviors:
+                # 无法解析的响应不保留在缓存中，重试时重新调用LLM
+                await self.llm_client.invalidate_cache(
+                    prompt, max_tokens=max_tokens, temperature=0.3
+                )
+                raise LLMServiceError("LLM响应中没有可解析的逻辑行为")
 
             return logical_behaviors
 
@@ -557,6 +847,54 @@ agent|scene|action|object|start_time|end_time|raw_behavior_ids|confidence
             app_logger.error(f"LLM生成逻辑行为失败: {e}", exc_info=True)
             raise LLMServiceError(f"LLM生成失败: {e}")
 
+    async def _generate_packed_logical_behaviors(
+        self, group: List[tuple], use_cache: bool = True
+    ) -> Dict[str, List[Dict]]:
+        """一次LLM调用为一组用户生成逻辑行为，按行首用户ID拆分回各用户"""
+        prompt = self._build_packed_prompt([loaded["prompt_section"] for _, _, loaded in group])
+        max_tokens = settings.llm_max_output_tokens
+        stream_generator = self.llm_client.chat_completion(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=0.3,
+            use_cache=use_cache
+        )
+        full_response = await self.llm_client._collect_stream_response(stream_generator)
+        if not full_response:
+            raise LLMServiceError("LLM返回空结果")
+
+        app_logger.info(f"打包LLM响应长度: {len(full_response)} 字符, {len(group)} 个用户")
+        by_user = self._parse_packed_response(
+            full_response, {user_id: loaded["behaviors"] for _, user_id, loaded in group}
+        )
+        if any(not by_user.get(user_id) for _, user_id, _ in group):
+            # 缺少部分用户的响应不保留在缓存中，下次运行时重新请求整组
+            await self.llm_client.invalidate_cache(prompt, max_tokens=max_tokens, temperature=0.3)
+        return by_user
+
+    def _parse_packed_response(
+        self, response: str, behaviors_by_user: Dict[str, List[Dict]]
+    ) -> Dict[str, List[Dict]]:
+        """解析多用户响应：每行第一个字段是用户ID，其余字段与单用户格式相同"""
+        lines_by_user: Dict[str, List[str]] = {user_id: [] for user_id in behaviors_by_user}
+
+        response = response.replace("```text", "").replace("```", "")
+        for line in response.split("\n"):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            user_id, sep, rest = line.partition("|")
+            if sep and user_id.strip() in lines_by_user:
+                lines_by_user[user_id.strip()].append(rest)
+            else:
+                app_logger.warning(f"跳过没有有效用户ID的行: {line}")
+
+        return {
+            user_id: self._parse_llm_response(user_id, "\n".join(lines), behaviors_by_user[user_id])
+            for user_id, lines in lines_by_user.items()
+            if lines
+        }
+
     def _parse_llm_response(
         self, user_id: str, response: str, enriched_behaviors: List[Dict]
     ) -> List[Dict]:
@@ -614,46 +952,63 @@ agent|scene|action|object|start_time|end_time|raw_behavior_ids|confidence
         app_logger.info(f"解析出 {len(logical_behaviors)} 个逻辑行为")
         return logical_behaviors
 
+    @staticmethod
+    def _insert_logical_behaviors(cursor, user_id: str, logical_behaviors: List[Dict]) -> int:
+        """替换用户的逻辑行为（调用方负责事务）"""
+        # 先删除该用户的旧数据
+        cursor.execute("DELETE FROM logical_behaviors WHERE user_id = ?", (user_id,))
+
+        # 批量插入
+        data = [
+            (
+                lb["id"],
+                lb["user_id"],
+                lb["agent"],
+                lb["scene"],
+                lb["action"],
+                lb["object"],
+                lb["start_time"],
+                lb["end_time"],
+                lb["raw_behavior_ids"],
+                lb["confidence"]
+            )
+            for lb in logical_behaviors
+        ]
+
+        cursor.executemany(
+            """INSERT INTO logical_behaviors
+               (id, user_id, agent, scene, action, object, start_time, end_time,
+                raw_behavior_ids, confidence)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            data
+        )
+        return len(data)
+
+    @staticmethod
+    def _write_status(
+        cursor, user_id: str, status: str, behavior_count: int = 0, error_message: str = None
+    ):
+        cursor.execute(
+            """INSERT OR REPLACE INTO logical_behavior_sequences
+               (user_id, status, behavior_count, error_message, updated_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (user_id, status, behavior_count, error_message, datetime.now())
+        )
+
     def _save_logical_behaviors(self, user_id: str, logical_behaviors: List[Dict]) -> int:
         """保存逻辑行为到数据库"""
         if not logical_behaviors:
             return 0
 
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            with get_pool(self.db_path).write() as conn:
+                count = self._insert_logical_behaviors(conn.cursor(), user_id, logical_behaviors)
 
-                # 先删除该用户的旧数据
-                cursor.execute("DELETE FROM logical_behaviors WHERE user_id = ?", (user_id,))
-
-                # 批量插入
-                data = [
-                    (
-                        lb["id"],
-                        lb["user_id"],
-                        lb["agent"],
-                        lb["scene"],
-                        lb["action"],
-                        lb["object"],
-                        lb["start_time"],
-                        lb["end_time"],
-                        lb["raw_behavior_ids"],
-                        lb["confidence"]
-                    )
-                    for lb in logical_behaviors
-                ]
-
-                cursor.executemany(
-                    """INSERT INTO logical_behaviors
-                       (id, user_id, agent, scene, action, object, start_time, end_time,
-                        raw_behavior_ids, confidence)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    data
-                )
+                # 同一事务内更新事件倒排索引
+                self.mining_service.posting_index.refresh_users([user_id])
 
-                conn.commit()
-                app_logger.info(f"保存了 {len(data)} 个逻辑行为")
-                return len(data)
+                app_logger.info(f"保存了 {count} 个逻辑行为")
+                return count
 
         except Exception as e:
             app_logger.error(f"保存逻辑行为失败: {e}", exc_info=True)
@@ -664,18 +1019,76 @@ agent|scene|action|object|start_time|end_time|raw_behavior_ids|confidence
     ):
         """更新逻辑行为序列状态"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
+                self._write_status(conn.cursor(), user_id, status, behavior_count, error_message)
+
+        except Exception as e:
+            app_logger.error(f"更新序列状态失败: {e}", exc_info=True)
+
+    def _write_outcomes(self, outcomes: List[Dict]) -> List[Dict]:
+        """流水线写入阶段：一个事务写入一批用户的逻辑行为和状态
+
+        整批写入失败时逐个用户重试，单个用户的问题不影响同批其他用户。
+
+        Returns:
+            与 outcomes 一一对应的 {"user_id", "status", "result"/"error"}
+        """
+        try:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    """INSERT OR REPLACE INTO logical_behavior_sequences
-                       (user_id, status, behavior_count, error_message, updated_at)
-                       VALUES (?, ?, ?, ?, ?)""",
-                    (user_id, status, behavior_count, error_message, datetime.now())
+                saved = [self._write_outcome(cursor, outcome) for outcome in outcomes]
+                # 同一事务内更新事件倒排索引
+                self.mining_service.posting_index.refresh_users(
+                    [outcome["user_id"] for outcome in outcomes if not outcome["error"]]
                 )
-                conn.commit()
+        except Exception as e:
+            if len(outcomes) == 1:
+                app_logger.error(f"保存逻辑行为失败: {e}", exc_info=True)
+                outcome = dict(outcomes[0], error=f"保存逻辑行为失败: {e}")
+                self._update_sequence_status(outcome["user_id"], "failed", 0, outcome["error"])
+                return [
+                    {"user_id": outcome["user_id"], "status": "failed", "error": outcome["error"]}
+                ]
+            app_logger.warning(f"批量写入 {len(outcomes)} 个用户失败，逐个重试: {e}")
+            return [result for outcome in outcomes for result in self._write_outcomes([outcome])]
+
+        succeeded = [outcome["user_id"] for outcome in outcomes if not outcome["error"]]
+        if succeeded:
+            self._refresh_mining_index(*succeeded)
+            app_logger.info(f"批量保存 {len(succeeded)} 个用户的逻辑行为, 共 {sum(saved)} 条")
 
+        results = []
+        for outcome, count in zip(outcomes, saved):
+            if outcome["error"]:
+                results.append(
+                    {"user_id": outcome["user_id"], "status": "failed", "error": outcome["error"]}
+                )
+            else:
+                results.append({"user_id": outcome["user_id"], "status": "success", "result": {
+                    "user_id": outcome["user_id"],
+                    "logical_behaviors": outcome["logical_behaviors"],
+                    "raw_behavior_count": outcome["raw_behavior_count"],
+                    "logical_behavior_count": count
+                }})
+        return results
+
+    def _write_outcome(self, cursor, outcome: Dict) -> int:
+        user_id = outcome["user_id"]
+        if outcome["error"]:
+            self._write_status(cursor, user_id, "failed", 0, outcome["error"])
+            return 0
+        count = 0
+        if outcome["logical_behaviors"]:
+            count = self._insert_logical_behaviors(cursor, user_id, outcome["logical_behaviors"])
+        self._write_status(cursor, user_id, "success", count)
+        return count
+
+    def _refresh_mining_index(self, *user_ids: str):
+        """增量更新这些用户在n-gram挖掘索引中的模式计数（失败不影响生成结果）"""
+        try:
+            self.mining_service.refresh_ngram_index(list(user_ids))
         except Exception as e:
-            app_logger.error(f"更新序列状态失败: {e}", exc_info=True)
+            app_logger.error(f"更新n-gram索引失败: {e}", exc_info=True)
 
     def _update_progress(self, processed_users: int, success_count: int, failed_count: int):
         """更新进度"""
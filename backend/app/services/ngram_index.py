@@ -0,0 +1,328 @@
+"""
+增量n-gram支持度索引 - 持久化的 (模式, 标签) 连续子序列支持度
+
+- ngram_support: 每个 (模式, 标签) 的支持度（包含该连续子序列的用户数）
+- ngram_index_users: 每个已索引用户的标签和标准化后的行为序列，用于增量更新时扣减旧贡献
+- ngram_index_meta: 索引元信息（最大模式长度、构建时间）
+
+全量构建一次后，只需对逻辑行为发生变化的用户调用 refresh_users：
+扣减旧序列的模式计数、加上新序列的模式计数，n-gram 挖掘请求可直接查索引返回。
+"""
+import json
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.db_pool import get_pool
+from app.core.logger import app_logger
+
+# 索引的最大模式长度（与挖掘API的 max_length 上限一致）
+NGRAM_INDEX_MAX_LENGTH = 5
+
+# 增量更新时每条查询的用户数（受SQLite参数个数限制）
+REFRESH_CHUNK_SIZE = 500
+
+# 序列加载与索引共用：标签取 properties.purchase_intent，缺失、为null或无法解析时为 unknown
+LABEL_SQL = """
+    CASE
+        WHEN json_valid(up.properties) AND json_type(up.properties) = 'object' THEN
+            COALESCE(json_extract(up.properties, '$.purchase_intent'), 'unknown')
+        ELSE 'unknown'
+    END
+"""
+
+
+class NgramSupportIndex:
+    """持久化的n-gram支持度索引
+
+    没有画像的用户记为 unknown 且 profiled=0：不指定标签时参与统计，
+    指定标签时与序列加载（INNER JOIN user_profiles）一致地被排除。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        normalize: Optional[Callable[[str], str]] = None,
+        max_length: int = NGRAM_INDEX_MAX_LENGTH
+    ):
+        """
+        Args:
+            db_path: 数据库路径（与 logical_behaviors 同库）
+            normalize: 事件类型标准化函数，需与挖掘时加载序列使用的一致
+            max_length: 索引的最大模式长度
+        """
+        self.db_path = db_path
+        self.normalize = normalize or (lambda event: event)
+        self.max_length = max_length
+        self._tables_ready = False
+
+    def _init_tables(self) -> None:
+        if self._tables_ready:
+            return
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ngram_support (
+                    pattern TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    profiled INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    support INTEGER NOT NULL,
+                    PRIMARY KEY (pattern, label, profiled)
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_ngram_support_label_length "
+                "ON ngram_support(label, length)"
+            )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ngram_index_users (
+                    user_id TEXT PRIMARY KEY,
+                    label TEXT NOT NULL,
+                    profiled INTEGER NOT NULL,
+                    event_count INTEGER NOT NULL,
+                    sequence TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ngram_index_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+        self._tables_ready = True
+
+    # ---- 状态 ----
+
+    def built_max_length(self) -> int:
+        """已构建索引的最大模式长度，未构建时返回0"""
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            row = conn.execute("SELECT value FROM ngram_index_meta WHERE key = 'max_length'").fetchone()
+        return int(row[0]) if row else 0
+
+    def covers(self, max_length: int) -> bool:
+        """索引是否已构建且能回答该长度的查询"""
+        return self.built_max_length() >= max_length
+
+    # ---- 构建与增量更新 ----
+
+    def rebuild(self) -> Dict:
+        """全量重建索引"""
+        start = time.perf_counter()
+        self._init_tables()
+
+        deltas: Counter = Counter()
+        user_rows = []
+        # 扫描与写入在同一写事务内，避免与并发的增量更新交错
+        with get_pool(self.db_path).write() as conn:
+            for user_id, label, profiled, sequence in self._iter_sequences(conn.cursor()):
+                self._add_patterns(deltas, sequence, label, profiled, 1)
+                user_rows.append(self._user_row(user_id, label, profiled, sequence))
+
+            conn.execute("DELETE FROM ngram_support")
+            conn.execute("DELETE FROM ngram_index_users")
+            conn.executemany(
+                "INSERT INTO ngram_support (pattern, label, profiled, length, support) VALUES (?, ?, ?, ?, ?)",
+                [(*key, support) for key, support in deltas.items()]
+            )
+            conn.executemany(
+                "INSERT INTO ngram_index_users (user_id, label, profiled, event_count, sequence) "
+                "VALUES (?, ?, ?, ?, ?)",
+                user_rows
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO ngram_index_meta (key, value) VALUES (?, ?)",
+                [("max_length", str(self.max_length)), ("built_at", str(time.time()))]
+            )
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        app_logger.info(
+            f"n-gram索引重建完成: {len(user_rows)}个用户, {len(deltas)}个(模式,标签)计数, 耗时{elapsed_ms:.1f}ms"
+        )
+        return {
+            "indexed_users": len(user_rows),
+            "support_entries": len(deltas),
+            "max_length": self.max_length,
+            "elapsed_ms": round(elapsed_ms, 1)
+        }
+
+    def refresh_users(self, user_ids: Iterable[str]) -> int:
+        """增量更新指定用户的模式计数（逻辑行为或状态变化后调用）
+
+        索引尚未构建时不做任何事，首次全量构建会覆盖这些用户。
+
+        Returns:
+            发生变化的用户数
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids or not self.covers(self.max_length):
+            return 0
+
+        changed = 0
+        for i in range(0, len(user_ids), REFRESH_CHUNK_SIZE):
+            changed += self._refresh_chunk(user_ids[i:i + REFRESH_CHUNK_SIZE])
+        app_logger.info(f"n-gram索引增量更新: {len(user_ids)}个用户, {changed}个有变化")
+        return changed
+
+    def _refresh_chunk(self, user_ids: List[str]) -> int:
+        placeholders = ",".join("?" * len(user_ids))
+        with get_pool(self.db_path).write() as conn:
+            cursor = conn.cursor()
+            old = {
+                user_id: (label, profiled, json.loads(sequence))
+                for user_id, label, profiled, sequence in cursor.execute(
+                    f"SELECT user_id, label, profiled, sequence FROM ngram_index_users "
+                    f"WHERE user_id IN ({placeholders})",
+                    user_ids
+                ).fetchall()
+            }
+            new = {
+                user_id: (label, profiled, sequence)
+                for user_id, label, profiled, sequence in self._iter_sequences(cursor, user_ids)
+            }
+
+            deltas: Counter = Counter()
+            changed = 0
+            for user_id in user_ids:
+                before, after = old.get(user_id), new.get(user_id)
+                if before == after:
+                    continue
+                changed += 1
+                if before is not None:
+                    self._add_patterns(deltas, before[2], before[0], before[1], -1)
+                if after is not None:
+                    self._add_patterns(deltas, after[2], after[0], after[1], 1)
+
+            cursor.executemany(
+                """INSERT INTO ngram_support (pattern, label, profiled, length, support)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(pattern, label, profiled) DO UPDATE SET support = support + excluded.support""",
+                [(*key, delta) for key, delta in deltas.items() if delta]
+            )
+            cursor.executemany(
+                "DELETE FROM ngram_support WHERE pattern = ? AND label = ? AND profiled = ? AND support <= 0",
+                [key[:3] for key, delta in deltas.items() if delta < 0]
+            )
+            cursor.execute(f"DELETE FROM ngram_index_users WHERE user_id IN ({placeholders})", user_ids)
+            cursor.executemany(
+                "INSERT INTO ngram_index_users (user_id, label, profiled, event_count, sequence) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [self._user_row(user_id, *state) for user_id, state in new.items()]
+            )
+        return changed
+
+    def _iter_sequences(
+        self,
+        cursor,
+        user_ids: Optional[Sequence[str]] = None
+    ) -> Iterator[Tuple[str, str, int, List[str]]]:
+        """按 (user_id, start_time) 有序扫描，逐用户产出标准化后的行为序列
+
+        只包含序列加载会读取的用户（status='success' 且 behavior_count > 0）。
+
+        Yields:
+            (user_id, label, profiled, [action, ...])
+        """
+        user_filter = f"AND lbs.user_id IN ({','.join('?' * len(user_ids))})" if user_ids else ""
+        cursor.execute(f"""
+            SELECT lbs.user_id, {LABEL_SQL} AS label, up.user_id IS NOT NULL AS profiled, lb.action
+            FROM logical_behavior_sequences lbs
+            LEFT JOIN user_profiles up ON lbs.user_id = up.user_id
+            LEFT JOIN logical_behaviors lb ON lb.user_id = lbs.user_id
+            WHERE lbs.status = 'success' AND lbs.behavior_count > 0 {user_filter}
+            ORDER BY lbs.user_id, lb.start_time
+        """, list(user_ids or []))
+
+        current = None
+        actions: List[str] = []
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for user_id, label, profiled, action in rows:
+                if current is None or user_id != current[0]:
+                    if current is not None:
+                        yield (*current, actions)
+                    current, actions = (user_id, label, int(profiled)), []
+                if action is not None:
+                    actions.append(self.normalize(action))
+
+        if current is not None:
+            yield (*current, actions)
+
+    def _add_patterns(self, deltas: Counter, sequence: List[str], label: str, profiled: int, sign: int) -> None:
+        """把一条序列包含的连续子序列（每个模式只计一次）计入 deltas"""
+        seen = set()
+        for length in range(1, min(len(sequence), self.max_length) + 1):
+            for i in range(len(sequence) - length + 1):
+                seen.add(tuple(sequence[i:i + length]))
+        for pattern in seen:
+            deltas[(json.dumps(list(pattern), ensure_ascii=False), label, profiled, len(pattern))] += sign
+
+    @staticmethod
+    def _user_row(user_id: str, label: str, profiled: int, sequence: List[str]) -> Tuple:
+        return user_id, label, profiled, len(sequence), json.dumps(sequence, ensure_ascii=False)
+
+    # ---- 查询 ----
+
+    def _label_filter(self, target_label: Optional[str]) -> Tuple[str, List[Any]]:
+        if target_label is None:
+            return "", []
+        return "AND label = ? AND profiled = 1", [target_label]
+
+    def query(
+        self,
+        min_support: int,
+        min_length: int,
+        max_length: int,
+        target_label: Optional[str] = None
+    ) -> List[Tuple[int, List[str]]]:
+        """查询支持度 >= min_support 的连续子序列
+
+        Returns:
+            [(support, pattern), ...]，按支持度降序
+        """
+        self._init_tables()
+        where, params = self._label_filter(target_label)
+        with get_pool(self.db_path).read() as conn:
+            rows = conn.execute(f"""
+                SELECT pattern, SUM(support) AS total
+                FROM ngram_support
+                WHERE length BETWEEN ? AND ? {where}
+                GROUP BY pattern
+                HAVING total >= ?
+            """, [min_length, max_length, *params, min_support]).fetchall()
+
+        patterns = [(total, json.loads(pattern)) for pattern, total in rows]
+        patterns.sort(key=lambda x: (-x[0], len(x[1]), x[1]))
+        return patterns
+
+    def summary(self, target_label: Optional[str] = None) -> Dict:
+        """已索引序列的统计信息（与序列加载的统计口径一致）"""
+        self._init_tables()
+        where, params = self._label_filter(target_label)
+        with get_pool(self.db_path).read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT COUNT(*), COALESCE(SUM(event_count), 0)
+                FROM ngram_index_users
+                WHERE event_count > 0 {where}
+            """, params)
+            total_sequences, total_events = cursor.fetchone()
+
+            cursor.execute(f"""
+                SELECT COUNT(DISTINCT pattern) FROM ngram_support WHERE length = 1 {where}
+            """, params)
+            unique_event_types = cursor.fetchone()[0]
+
+            # 标签分布覆盖所有候选用户（含无行为记录的用户）
+            profiled_only = "WHERE profiled = 1" if target_label is not None else ""
+            cursor.execute(f"SELECT label, COUNT(*) FROM ngram_index_users {profiled_only} GROUP BY label")
+            label_distribution = dict(cursor.fetchall())
+
+        return {
+            "total_sequences": total_sequences,
+            "total_events": total_events,
+            "unique_event_types": unique_event_types,
+            "label_distribution": label_distribution
+        }
@@ -0,0 +1,218 @@
+"""
+多进程分片序列挖掘 - 按序列分片到进程池，局部精确计数后归并
+
+- 单遍模式：每个分片返回全部模式的局部支持度（按打包键），归并求和后按 min_support 过滤
+- 两遍模式（SON）：第一遍每个分片只返回局部支持度 >= ceil(min_support * 分片占比) 的候选，
+  全局频繁的模式必然在至少一个分片中达到该阈值；第二遍各分片只统计候选的精确支持度
+两种模式结果都是精确的，两遍模式在模式空间很大时传输和归并的数据量更小。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.logger import app_logger
+from app.services.sequence_store import EncodedSequences
+
+# 事件总数低于该值时进程启动开销大于收益，使用单进程
+PARALLEL_MIN_EVENTS = 200_000
+
+KeyCounts = Tuple[np.ndarray, np.ndarray]
+
+
+def shard_sequences(store: EncodedSequences, num_shards: int) -> List[EncodedSequences]:
+    """按事件数均衡切分为连续的序列分片"""
+    num_shards = max(1, min(num_shards, len(store)))
+    targets = np.linspace(0, store.total_events, num_shards + 1)[1:-1]
+    cuts = np.searchsorted(store.offsets, targets)
+    bounds = [0, *sorted(set(int(c) for c in cuts) - {0, len(store)}), len(store)]
+    return [store.subset(range(lo, hi)) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+
+def merge_key_counts(parts: Sequence[KeyCounts]) -> KeyCounts:
+    """归并多个分片的 (keys, counts)，相同键的计数求和"""
+    parts = [(keys, counts) for keys, counts in parts if len(keys)]
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    keys = np.concatenate([k for k, _ in parts])
+    counts = np.concatenate([c for _, c in parts])
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=counts, minlength=len(unique_keys)).astype(np.int64)
+
+
+def _restrict(key_counts: KeyCounts, candidates: Optional[np.ndarray], min_count: int = 0) -> KeyCounts:
+    keys, counts = key_counts
+    mask = counts >= min_count
+    if candidates is not None:
+        mask &= np.isin(keys, candidates, assume_unique=True)
+    return keys[mask], counts[mask]
+
+
+# ---- 进程池任务（需为模块级函数以便序列化） ----
+
+def _support_task(
+    shard: EncodedSequences,
+    max_length: int,
+    min_counts: Optional[List[int]],
+    candidates: Optional[List[np.ndarray]]
+) -> List[KeyCounts]:
+    """分片内各长度连续子序列的支持度（按序列去重）"""
+    results = []
+    for i, length in enumerate(range(1, max_length + 1)):
+        key_counts = shard.support_key_counts(length)
+        results.append(_restrict(
+            key_counts,
+            candidates[i] if candidates is not None else None,
+            min_counts[i] if min_counts is not None else 0
+        ))
+    return results
+
+
+def _cooccurrence_task(shard: EncodedSequences, window: int) -> KeyCounts:
+    return shard.cooccurrence_key_counts(window)
+
+
+def _attention_task(
+    shard: EncodedSequences,
+    max_length: int,
+    cooc: KeyCounts,
+    min_weight: int,
+    min_counts: Optional[List[int]],
+    candidates: Optional[List[np.ndarray]]
+) -> List[KeyCounts]:
+    """分片内注意力权重达标的窗口出现次数"""
+    results = []
+    for i, length in enumerate(range(2, max_length + 1)):
+        key_counts = shard.weighted_window_key_counts(length, cooc[0], cooc[1], min_weight)
+        results.append(_restrict(
+            key_counts,
+            candidates[i] if candidates is not None else None,
+            min_counts[i] if min_counts is not None else 0
+        ))
+    return results
+
+
+def _run_sharded(
+    shards: List[EncodedSequences],
+    workers: int,
+    task: Callable,
+    *args
+) -> list:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(task, shard, *args) for shard in shards]
+        return [future.result() for future in futures]
+
+
+def _reduce_levels(
+    store: EncodedSequences,
+    lengths: range,
+    shard_results: List[List[KeyCounts]],
+    min_support: int
+) -> List[Tuple[int, Tuple[int, ...]]]:
+    """按长度归并分片结果并过滤"""
+    patterns = []
+    for i, length in enumerate(lengths):
+        keys, counts = merge_key_counts([result[i] for result in shard_results])
+        mask = counts >= min_support
+        patterns.extend(
+            (count, store.unpack(key, length))
+            for key, count in zip(keys[mask].tolist(), counts[mask].tolist())
+        )
+    return patterns
+
+
+def _local_thresholds(weights: Sequence[int], total: int, min_support: int, levels: int) -> List[List[int]]:
+    """两遍模式第一遍的分片局部阈值：ceil(min_support * 分片权重 / 总权重)
+
+    各分片局部计数之和等于全局计数，且各分片阈值之和不小于 min_support，
+    因此全局频繁的模式必然至少在一个分片中达到局部阈值。
+    """
+    return [[max(1, (min_support * weight + total - 1) // total)] * levels for weight in weights]
+
+
+def _two_pass(
+    store: EncodedSequences,
+    shards: List[EncodedSequences],
+    workers: int,
+    lengths: range,
+    task: Callable,
+    task_args: tuple,
+    local_thresholds: List[List[int]],
+    min_support: int
+) -> List[Tuple[int, Tuple[int, ...]]]:
+    """第一遍收集局部频繁候选，第二遍统计候选的精确全局计数"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(task, shard, *task_args, thresholds, None)
+            for shard, thresholds in zip(shards, local_thresholds)
+        ]
+        first_results = [future.result() for future in futures]
+        candidates = [
+            np.unique(np.concatenate([result[i][0] for result in first_results]))
+            for i in range(len(lengths))
+        ]
+        app_logger.info(f"两遍模式候选数: {sum(len(c) for c in candidates)}")
+
+        futures = [pool.submit(task, shard, *task_args, None, candidates) for shard in shards]
+        second_results = [future.result() for future in futures]
+
+    return _reduce_levels(store, lengths, second_results, min_support)
+
+
+def parallel_support_mining(
+    store: EncodedSequences,
+    min_support: int,
+    max_length: int,
+    workers: int,
+    two_pass: bool = False
+) -> List[Tuple[int, Tuple[int, ...]]]:
+    """多进程统计连续子序列支持度（每条序列最多计数一次）
+
+    Returns:
+        [(support, codes), ...]
+    """
+    shards = shard_sequences(store, workers)
+    lengths = range(1, max_length + 1)
+    app_logger.info(f"分片挖掘: {len(shards)}个分片, {workers}个进程, 两遍模式={two_pass}")
+
+    if two_pass:
+        thresholds = _local_thresholds([len(shard) for shard in shards], len(store), min_support, len(lengths))
+        return _two_pass(store, shards, workers, lengths, _support_task, (max_length,), thresholds, min_support)
+
+    results = _run_sharded(shards, workers, _support_task, max_length, None, None)
+    return _reduce_levels(store, lengths, results, min_support)
+
+
+def parallel_attention_mining(
+    store: EncodedSequences,
+    min_support: int,
+    max_length: int,
+    workers: int,
+    two_pass: bool = False
+) -> List[Tuple[int, Tuple[int, ...]]]:
+    """多进程 Attention 权重挖掘
+
+    共现频率在各分片上可加，先归并得到全局共现表，再分发给各分片统计达标窗口的出现次数。
+
+    Returns:
+        [(count, codes), ...]
+    """
+    shards = shard_sequences(store, workers)
+    lengths = range(2, max_length + 1)
+    app_logger.info(f"分片Attention挖掘: {len(shards)}个分片, {workers}个进程, 两遍模式={two_pass}")
+
+    cooc = merge_key_counts(_run_sharded(shards, workers, _cooccurrence_task, max_length))
+    app_logger.info(f"共现矩阵计算完成: {len(cooc[0])} 个事件对")
+
+    if two_pass:
+        # 出现次数按分片事件数占比分摊阈值
+        thresholds = _local_thresholds(
+            [shard.total_events for shard in shards], store.total_events, min_support, len(lengths)
+        )
+        return _two_pass(
+            store, shards, workers, lengths, _attention_task,
+            (max_length, cooc, min_support), thresholds, min_support
+        )
+
+    results = _run_sharded(shards, workers, _attention_task, max_length, cooc, min_support, None, None)
+    return _reduce_levels(store, lengths, results, min_support)
@@ -0,0 +1,184 @@
+"""
+事件倒排索引 - 事件ID -> (用户, 位置) 倒排列表，与 logical_behaviors 存放在同一数据库
+
+- posting_events: 行为名称 -> 事件ID
+- event_postings: (event_id, user_id, position) 聚簇主键（WITHOUT ROWID），同一事件的倒排列表按用户、位置有序存放
+- posting_index_meta: 索引元信息（构建时间）
+
+连续模式查询变为倒排列表求交：以第一个事件的倒排列表为驱动，
+后续事件按 (event_id, user_id, position + k) 主键点查校验位置，不再逐用户扫描行为序列。
+position 为行为在用户序列（按 start_time 排序）中的下标。
+"""
+import time
+from typing import Dict, Iterable, List, Optional
+
+from app.core.db_pool import get_pool
+from app.core.logger import app_logger
+
+# 增量更新时每条语句的用户数（受SQLite参数个数限制）
+REFRESH_CHUNK_SIZE = 500
+
+
+class EventPostingIndex:
+    """持久化的事件倒排索引"""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: 数据库路径（与 logical_behaviors 同库）
+        """
+        self.db_path = db_path
+        self._tables_ready = False
+
+    def _init_tables(self) -> None:
+        if self._tables_ready:
+            return
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS posting_events (
+                    event_id INTEGER PRIMARY KEY,
+                    action TEXT UNIQUE NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS event_postings (
+                    event_id INTEGER NOT NULL,
+                    user_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (event_id, user_id, position)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_event_postings_user ON event_postings(user_id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS posting_index_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+        self._tables_ready = True
+
+    def is_built(self) -> bool:
+        """索引是否已全量构建"""
+        self._init_tables()
+        with get_pool(self.db_path).read() as conn:
+            row = conn.execute("SELECT 1 FROM posting_index_meta WHERE key = 'built_at'").fetchone()
+        return row is not None
+
+    # ---- 构建与增量更新 ----
+
+    def _index_users(self, conn, user_filter: str = "", params: Iterable = ()) -> None:
+        """为满足条件的用户写入倒排列表（调用方负责先删除旧记录）"""
+        params = list(params)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO posting_events (action)
+            SELECT DISTINCT action FROM logical_behaviors
+            WHERE action IS NOT NULL AND action != '' {user_filter}
+        """, params)
+        conn.execute(f"""
+            INSERT INTO event_postings (event_id, user_id, position)
+            SELECT pe.event_id, lb.user_id, lb.position
+            FROM (
+                SELECT user_id, action,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY start_time) - 1 AS position
+                FROM logical_behaviors
+                WHERE 1 = 1 {user_filter}
+            ) lb
+            JOIN posting_events pe ON pe.action = lb.action
+        """, params)
+
+    def rebuild(self) -> Dict:
+        """全量重建倒排索引"""
+        start = time.perf_counter()
+        self._init_tables()
+        with get_pool(self.db_path).write() as conn:
+            conn.execute("DELETE FROM event_postings")
+            self._index_users(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO posting_index_meta (key, value) VALUES ('built_at', ?)",
+                (str(time.time()),)
+            )
+            postings = conn.execute("SELECT COUNT(*) FROM event_postings").fetchone()[0]
+            events = conn.execute("SELECT COUNT(*) FROM posting_events").fetchone()[0]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        app_logger.info(f"事件倒排索引重建完成: {events}个事件, {postings}条倒排记录, 耗时{elapsed_ms:.1f}ms")
+        return {
+            "events": events,
+            "postings": postings,
+            "elapsed_ms": round(elapsed_ms, 1)
+        }
+
+    def refresh_users(self, user_ids: Iterable[str]) -> None:
+        """重建指定用户的倒排记录（逻辑行为写入后调用）
+
+        在调用方的写事务内执行时与逻辑行为的写入一起提交。索引尚未构建时不做任何事。
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return
+
+        self._init_tables()
+        with get_pool(self.db_path).write() as conn:
+            # 在写连接上检查，调用方事务中未提交的建表对只读连接不可见
+            if conn.execute("SELECT 1 FROM posting_index_meta WHERE key = 'built_at'").fetchone() is None:
+                return
+            for i in range(0, len(user_ids), REFRESH_CHUNK_SIZE):
+                chunk = user_ids[i:i + REFRESH_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                conn.execute(f"DELETE FROM event_postings WHERE user_id IN ({placeholders})", chunk)
+                self._index_users(conn, f"AND user_id IN ({placeholders})", chunk)
+
+    # ---- 查询 ----
+
+    def find_users(
+        self,
+        pattern: List[str],
+        limit: Optional[int] = None,
+        require_behaviors: bool = False
+    ) -> List[str]:
+        """查找序列中包含连续模式的成功用户
+
+        Args:
+            pattern: 行为名称序列
+            limit: 最多返回的用户数，None表示不限制
+            require_behaviors: 是否只返回 behavior_count > 0 的用户
+
+        Returns:
+            用户ID列表（按user_id升序）
+        """
+        if not pattern:
+            return []
+        self._init_tables()
+
+        with get_pool(self.db_path).read() as conn:
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(set(pattern)))
+            cursor.execute(
+                f"SELECT action, event_id FROM posting_events WHERE action IN ({placeholders})",
+                list(set(pattern))
+            )
+            event_ids = dict(cursor.fetchall())
+            if len(event_ids) < len(set(pattern)):
+                return []
+
+            joins = "".join(
+                f" JOIN event_postings p{k} ON p{k}.event_id = ? AND p{k}.user_id = p0.user_id"
+                f" AND p{k}.position = p0.position + {k}"
+                for k in range(1, len(pattern))
+            )
+            behavior_filter = "AND lbs.behavior_count > 0" if require_behaviors else ""
+            limit_clause = "LIMIT ?" if limit is not None else ""
+            params = [event_ids[action] for action in pattern[1:]]
+            params.append(event_ids[pattern[0]])
+            if limit is not None:
+                params.append(limit)
+
+            cursor.execute(f"""
+                SELECT DISTINCT p0.user_id
+                FROM event_postings p0 {joins}
+                JOIN logical_behavior_sequences lbs ON lbs.user_id = p0.user_id
+                WHERE p0.event_id = ? AND lbs.status = 'success' {behavior_filter}
+                ORDER BY p0.user_id
+                {limit_clause}
+            """, params)
+            return [row[0] for row in cursor.fetchall()]
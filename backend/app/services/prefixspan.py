@@ -0,0 +1,151 @@
+"""
+PrefixSpan 序列模式挖掘 - 基于伪投影的内置实现
+
+在整数编码序列（EncodedSequences）上挖掘频繁子序列（允许间隔）：
+- 伪投影：投影数据库只保存 (序列下标, 后缀起点) 指针数组，不复制序列；后缀扫描向量化
+- 搜索过程中按 min_support 和 max_length 剪枝
+- top-k 模式：维护大小为k的最小堆，支持度阈值随堆填满逐步抬高
+"""
+import heapq
+from itertools import count
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.sequence_store import EncodedSequences
+
+# (序列下标数组, 后缀在扁平数组中的起点数组)
+Projection = Tuple[np.ndarray, np.ndarray]
+Pattern = Tuple[int, ...]
+
+
+class PrefixSpanMiner:
+    """PrefixSpan 挖掘器
+
+    支持度 = 包含该模式（作为可间隔子序列）的序列数。
+    """
+
+    def __init__(self, sequences: EncodedSequences):
+        self.sequences = sequences
+        self._data = sequences.data
+        self._ends = sequences.offsets[1:]
+        self._vocab_size = max(sequences.vocab_size, 1)
+
+    def _initial_projection(self) -> Projection:
+        starts = self.sequences.offsets[:-1]
+        sids = np.flatnonzero(starts < self._ends)
+        return sids, starts[sids]
+
+    def _extend(self, projection: Projection, min_support: int) -> List[Tuple[int, Projection]]:
+        """扫描投影后缀，得到每个频繁后续事件的新投影（取每条序列中的首次出现）
+
+        Returns:
+            [(item, projection), ...]，按支持度降序
+        """
+        sids, positions = projection
+        lengths = self._ends[sids] - positions
+        total = int(lengths.sum())
+        if total == 0:
+            return []
+
+        # 展开所有后缀：owner 为投影条目下标，idx 为事件在扁平数组中的位置
+        owner = np.repeat(np.arange(len(sids), dtype=np.int64), lengths)
+        suffix_start = np.zeros(len(sids), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=suffix_start[1:])
+        idx = np.arange(total, dtype=np.int64) + np.repeat(positions - suffix_start, lengths)
+
+        # 每个投影条目中每个事件只保留首次出现
+        keys = owner * self._vocab_size + self._data[idx]
+        unique_keys, first = np.unique(keys, return_index=True)
+        items = unique_keys % self._vocab_size
+        support = np.bincount(items, minlength=self._vocab_size)
+
+        frequent_items = np.flatnonzero(support >= min_support)
+        if len(frequent_items) == 0:
+            return []
+        order = np.argsort(items, kind="stable")
+        bounds = np.zeros(self._vocab_size + 1, dtype=np.int64)
+        np.cumsum(support, out=bounds[1:])
+        new_owner = (unique_keys // self._vocab_size)[order]
+        new_positions = idx[first][order] + 1
+
+        extensions = []
+        for item in frequent_items[np.argsort(-support[frequent_items], kind="stable")].tolist():
+            lo, hi = bounds[item], bounds[item + 1]
+            extensions.append((item, (sids[new_owner[lo:hi]], new_positions[lo:hi])))
+        return extensions
+
+    def frequent(
+        self,
+        min_support: int,
+        max_length: Optional[int] = None
+    ) -> List[Tuple[int, Pattern]]:
+        """挖掘所有支持度 >= min_support 且长度 <= max_length 的模式
+
+        Returns:
+            [(support, codes), ...]
+        """
+        min_support = max(1, min_support)
+        results: List[Tuple[int, Pattern]] = []
+
+        def mine(prefix: Pattern, projection: Projection) -> None:
+            if max_length is not None and len(prefix) >= max_length:
+                return
+            for item, child in self._extend(projection, min_support):
+                pattern = prefix + (item,)
+                results.append((len(child[0]), pattern))
+                mine(pattern, child)
+
+        mine((), self._initial_projection())
+        return results
+
+    def topk(
+        self,
+        k: int,
+        min_support: int = 1,
+        max_length: Optional[int] = None,
+        accept: Optional[Callable[[Pattern], bool]] = None
+    ) -> List[Tuple[int, Pattern]]:
+        """挖掘支持度最高的k个模式
+
+        当已收集k个模式后，阈值抬高到堆中最小支持度+1。支持度随前缀扩展单调不增，
+        低于阈值的分支可以整体剪掉。
+
+        Args:
+            k: 返回模式数
+            min_support: 最小支持度（初始阈值）
+            max_length: 最大模式长度
+            accept: 模式过滤条件，只有通过的模式计入top-k（不影响搜索剪枝的正确性）
+
+        Returns:
+            [(support, codes), ...]，按支持度降序
+        """
+        if k <= 0:
+            return []
+        min_support = max(1, min_support)
+        heap: List[Tuple[int, int, Pattern]] = []
+        tie_breaker = count()
+
+        def threshold() -> int:
+            # 堆满后，支持度不高于堆顶的分支（含其所有扩展）都无法进入top-k
+            return max(min_support, heap[0][0] + 1) if len(heap) >= k else min_support
+
+        def mine(prefix: Pattern, projection: Projection) -> None:
+            if max_length is not None and len(prefix) >= max_length:
+                return
+            # 先扩展支持度高的分支，让阈值尽快抬高
+            for item, child in self._extend(projection, threshold()):
+                support = len(child[0])
+                if support < threshold():
+                    break
+                pattern = prefix + (item,)
+                if accept is None or accept(pattern):
+                    entry = (support, -next(tie_breaker), pattern)
+                    if len(heap) < k:
+                        heapq.heappush(heap, entry)
+                    else:
+                        heapq.heapreplace(heap, entry)
+                mine(pattern, child)
+
+        mine((), self._initial_projection())
+        return [(support, pattern) for support, _, pattern in sorted(heap, reverse=True)]
@@ -1,23 +1,66 @@
 """
 高频子序列挖掘服务
 """
-import sqlite3
 import json
-import gc
-from typing import List, Dict, Tuple, Optional, Iterator
+from typing import Any, Callable, List, Dict, Tuple, Optional, Iterator, Union
 from pathlib import Path
-from collections import Counter
+from app.core.config import settings
 from app.core.logger import app_logger
 from app.core.cache_service import SequenceCacheService
+from app.core.db_pool import get_pool
 from app.core.memory_monitor import memory_monitor
+from app.services.ngram_index import LABEL_SQL, NgramSupportIndex
+from app.services.posting_index import EventPostingIndex
+from app.services.parallel_mining import (
+    PARALLEL_MIN_EVENTS,
+    parallel_attention_mining,
+    parallel_support_mining
+)
+from app.services.prefixspan import PrefixSpanMiner
+from app.services.sequence_store import EncodedSequences, SequenceStoreBuilder
 
 
 class SequenceMiningService:
     """高频子序列挖掘服务 - 基于事件序列数据"""
 
-    def __init__(self):
-        self.db_path = Path("data/graph.db")
+    def __init__(self, db_path: str = "data/graph.db"):
+        self.db_path = Path(db_path)
         self.cache = SequenceCacheService()  # 添加缓存服务
+        self.workers = settings.mining_workers  # >1 时启用多进程分片挖掘
+        self.two_pass = settings.mining_two_pass  # 分片挖掘使用两遍精确模式
+        self._ngram_index: Optional[NgramSupportIndex] = None
+        self._posting_index: Optional[EventPostingIndex] = None
+
+    @property
+    def ngram_index(self) -> NgramSupportIndex:
+        """当前数据库对应的n-gram支持度索引"""
+        if self._ngram_index is None or self._ngram_index.db_path != str(self.db_path):
+            self._ngram_index = NgramSupportIndex(str(self.db_path), normalize=self._normalize_event_type)
+        return self._ngram_index
+
+    @property
+    def posting_index(self) -> EventPostingIndex:
+        """当前数据库对应的事件倒排索引"""
+        if self._posting_index is None or self._posting_index.db_path != str(self.db_path):
+            self._posting_index = EventPostingIndex(str(self.db_path))
+        return self._posting_index
+
+    def rebuild_posting_index(self) -> Dict:
+        """全量重建事件倒排索引"""
+        return self.posting_index.rebuild()
+
+    def rebuild_ngram_index(self) -> Dict:
+        """全量重建n-gram支持度索引"""
+        result = self.ngram_index.rebuild()
+        self.cache.invalidate_patterns()
+        return result
+
+    def refresh_ngram_index(self, user_ids: List[str]) -> int:
+        """逻辑行为变化后增量更新索引，并使序列和模式缓存失效"""
+        changed = self.ngram_index.refresh_users(user_ids)
+        self.cache.invalidate_sequences()
+        self.cache.invalidate_patterns()
+        return changed
 
     def mine_frequent_subsequences(
         self,
@@ -33,7 +76,7 @@ class SequenceMiningService:
         """挖掘高频事件子序列
 
         Args:
-            algorithm: 算法类型 ("prefixspan" 或 "attention")
+            algorithm: 算法类型 ("prefixspan"、"attention" 或 "ngram"（连续子序列）)
             min_support: 最小支持度(出现次数)
             min_length: 最小序列长度
             max_length: 最大序列长度
@@ -50,6 +93,10 @@ class SequenceMiningService:
             }
         """
         try:
+            # 连续子序列挖掘优先由增量维护的n-gram索引回答
+            if algorithm == "ngram" and not target_events and self.ngram_index.covers(max_length):
+                return self._mine_from_ngram_index(min_support, min_length, max_length, top_k, target_label)
+
             # 尝试从缓存获取
             if use_cache:
                 # 将target_events转为字符串用于缓存键
@@ -59,7 +106,10 @@ class SequenceMiningService:
                     max_length,
                     target_label,
                     target_events_str,
-                    None  # 不再使用 target_category
+                    None,  # 不再使用 target_category
+                    algorithm=algorithm,
+                    min_length=min_length,
+                    top_k=top_k
                 )
                 if cached_result:
                     app_logger.info(f"从缓存获取模式: min_support={min_support}, max_length={max_length}, target_label={target_label}, target_events={target_events}")
@@ -98,9 +148,19 @@ class SequenceMiningService:
 
             # 2. 根据算法类型选择挖掘方法
             if algorithm == "prefixspan":
-                frequent_patterns = self._mine_with_prefixspan(sequences, min_support, max_length)
+                # 与下方结果过滤条件一致，只有满足条件的模式计入top-k
+                def accept(pattern: List[str]) -> bool:
+                    return len(pattern) >= max(2, min_length) and (
+                        not target_events or pattern[-1] in target_events
+                    )
+
+                frequent_patterns = self._mine_with_prefixspan(
+                    sequences, min_support, max_length, top_k=top_k, accept=accept
+                )
             elif algorithm == "attention":
                 frequent_patterns = self._mine_with_attention(sequences, min_support, max_length)
+            elif algorithm == "ngram":
+                frequent_patterns = self._simple_frequent_mining(sequences, min_support, max_length)
             else:
                 raise ValueError(f"不支持的算法类型: {algorithm}")
 
@@ -123,14 +183,11 @@ class SequenceMiningService:
             formatted_patterns = formatted_patterns[:top_k]
 
             # 4. 计算统计信息
-            all_events = [event for seq in sequences for event in seq]
-            unique_events = set(all_events)
-
             statistics = {
                 "total_users": len(sequences),
                 "total_sequences": len(sequences),
-                "unique_event_types": len(unique_events),
-                "avg_sequence_length": round(sum(len(seq) for seq in sequences) / len(sequences), 2) if sequences else 0,
+                "unique_event_types": sequences.unique_event_count(),
+                "avg_sequence_length": round(sequences.avg_length, 2),
                 "min_support": min_support,
                 "min_length": min_length,
                 "max_length": max_length,
@@ -156,7 +213,10 @@ class SequenceMiningService:
                     target_label,
                     target_events_str,
                     None,  # 不再使用 target_category
-                    ttl=600
+                    ttl=600,
+                    algorithm=algorithm,
+                    min_length=min_length,
+                    top_k=top_k
                 )
 
             app_logger.info(f"✓ 高频子序列挖掘完成: 找到 {len(formatted_patterns)} 个模式")
@@ -167,119 +227,130 @@ class SequenceMiningService:
             app_logger.error(f"高频子序列挖掘失败: {type(e).__name__}: {str(e)}", exc_info=True)
             raise
 
+    def _mine_from_ngram_index(
+        self,
+        min_support: int,
+        min_length: int,
+        max_length: int,
+        top_k: int,
+        target_label: Optional[str]
+    ) -> Dict:
+        """从n-gram支持度索引直接返回连续子序列挖掘结果
+
+        结果与加载序列后 _simple_frequent_mining 的结果一致（索引覆盖全部用户，不受加载数量限制）。
+        """
+        index = self.ngram_index
+        summary = index.summary(target_label)
+        frequent_patterns = index.query(min_support, max(2, min_length), max_length, target_label)
+
+        formatted_patterns = self._format_patterns(frequent_patterns, summary["total_sequences"])[:top_k]
+        total_sequences = summary["total_sequences"]
+        statistics = {
+            "total_users": total_sequences,
+            "total_sequences": total_sequences,
+            "unique_event_types": summary["unique_event_types"],
+            "avg_sequence_length": round(summary["total_events"] / total_sequences, 2) if total_sequences else 0.0,
+            "min_support": min_support,
+            "min_length": min_length,
+            "max_length": max_length,
+            "patterns_found": len(formatted_patterns),
+            "target_label": target_label,
+            "target_events": None,
+            "label_distribution": summary["label_distribution"],
+            "target_users": 0,
+            "source": "ngram_index"
+        }
+
+        app_logger.info(f"✓ 从n-gram索引获取 {len(formatted_patterns)} 个模式")
+        return {
+            "algorithm": "ngram",
+            "frequent_patterns": formatted_patterns,
+            "statistics": statistics
+        }
+
     def _mine_with_prefixspan(
         self,
-        sequences: List[List[str]],
+        sequences: Union[EncodedSequences, List[List[str]]],
         min_support: int,
-        max_length: int
+        max_length: int,
+        top_k: Optional[int] = None,
+        accept: Optional[Callable[[List[str]], bool]] = None
     ) -> List[Tuple[int, List[str]]]:
-        """使用 PrefixSpan 算法挖掘频繁模式"""
-        try:
-            from prefixspan import PrefixSpan
-            ps = PrefixSpan(sequences)
-            # PrefixSpan库不支持maxlen参数,需要手动过滤
-            frequent_patterns = ps.frequent(minsup=min_support)
-            # 过滤掉超过最大长度的模式
-            filtered_patterns = [
-                (support, pattern)
-                for support, pattern in frequent_patterns
-                if len(pattern) <= max_length
-            ]
-            app_logger.info(f"PrefixSpan 挖掘完成: 找到 {len(filtered_patterns)} 个频繁模式")
-            return filtered_patterns
-        except ImportError:
-            app_logger.warning("PrefixSpan 库未安装,使用简单频繁项集挖掘")
-            return self._simple_frequent_mining(sequences, min_support, max_length)
+        """使用 PrefixSpan 算法挖掘频繁模式（允许间隔的子序列）
+
+        Args:
+            sequences: 序列集合
+            min_support: 最小支持度
+            max_length: 最大模式长度（搜索时剪枝）
+            top_k: 只返回支持度最高的K个模式，搜索时随结果填满抬高支持度阈值
+            accept: 计入top-k的模式条件（如最小长度、目标事件结尾）
+        """
+        store = EncodedSequences.coerce(sequences)
+        miner = PrefixSpanMiner(store)
+
+        if top_k:
+            accept_codes = (lambda codes: accept(store.decode(codes))) if accept else None
+            patterns = miner.topk(top_k, min_support, max_length, accept_codes)
+        else:
+            patterns = miner.frequent(min_support, max_length)
+
+        frequent = [(support, store.decode(codes)) for support, codes in patterns]
+        app_logger.info(f"PrefixSpan 挖掘完成: 找到 {len(frequent)} 个频繁模式")
+        return frequent
 
     def _mine_with_attention(
         self,
-        sequences: List[List[str]],
+        sequences: Union[EncodedSequences, List[List[str]]],
         min_support: int,
         max_length: int
     ) -> List[Tuple[int, List[str]]]:
-        """使用 Attention 权重挖掘频繁模式 - 流式处理版本
+        """使用 Attention 权重挖掘频繁模式
 
         注: 这是一个简化实现,真正的 Attention 需要训练 Transformer 模型
         这里使用共现频率作为 Attention 权重的近似
         """
         app_logger.info("使用 Attention 权重方法挖掘频繁模式")
-
-        batch_size = 2000
-        total_batches = (len(sequences) + batch_size - 1) // batch_size
-
-        # 第一阶段: 分批计算事件对的共现频率
-        cooccurrence = Counter()
-        for batch_idx in range(total_batches):
-            start_idx = batch_idx * batch_size
-            end_idx = min(start_idx + batch_size, len(sequences))
-            batch = sequences[start_idx:end_idx]
-
-            for seq in batch:
-                for i in range(len(seq)):
-                    for j in range(i + 1, min(i + max_length, len(seq))):
-                        cooccurrence[(seq[i], seq[j])] += 1
-
-            # 定期检查内存
-            if (batch_idx + 1) % 5 == 0:
-                memory_monitor.check_memory()
-                if memory_monitor.is_memory_critical():
-                    app_logger.error("内存使用达到严重阈值,提前终止共现计算")
-                    break
-
-        app_logger.info(f"共现矩阵计算完成: {len(cooccurrence)} 个事件对")
-
-        # 第二阶段: 分批构建频繁模式
-        pattern_counts = Counter()
-        for batch_idx in range(total_batches):
-            start_idx = batch_idx * batch_size
-            end_idx = min(start_idx + batch_size, len(sequences))
-            batch = sequences[start_idx:end_idx]
-
-            for seq in batch:
-                # 生成所有可能的子序列
-                for length in range(2, min(len(seq) + 1, max_length + 1)):
-                    for i in range(len(seq) - length + 1):
-                        subseq = tuple(seq[i:i + length])
-
-                        # 计算子序列的 Attention 权重(基于共现频率)
-                        attention_weight = 0
-                        for k in range(len(subseq) - 1):
-                            attention_weight += cooccurrence.get((subseq[k], subseq[k + 1]), 0)
-
-                        # 只保留高权重的子序列
-                        if attention_weight >= min_support:
-                            pattern_counts[subseq] += 1
-
-            # 每处理5批后,过滤低频模式
-            if (batch_idx + 1) % 5 == 0:
-                before_count = len(pattern_counts)
-                pattern_counts = Counter({
-                    pattern: count
-                    for pattern, count in pattern_counts.items()
-                    if count >= min_support or count >= (batch_idx + 1) * batch_size * 0.001
-                })
-                after_count = len(pattern_counts)
-                app_logger.info(f"批次 {batch_idx + 1}/{total_batches}: 过滤模式 {before_count} -> {after_count}")
-
-                gc.collect()
+        store = EncodedSequences.coerce(sequences)
+        if store.total_events == 0:
+            return []
+
+        if self._use_parallel(store, max_length):
+            frequent = [
+                (count, store.decode(codes))
+                for count, codes in parallel_attention_mining(
+                    store, min_support, max_length, self.workers, two_pass=self.two_pass
+                )
+            ]
+        else:
+            # 第一阶段: 计算窗口内事件对的共现频率
+            cooc_keys, cooc_counts = store.cooccurrence_key_counts(max_length)
+            app_logger.info(f"共现矩阵计算完成: {len(cooc_keys)} 个事件对")
+
+            # 第二阶段: 统计注意力权重达标的连续子序列出现次数
+            frequent = []
+            for length in range(2, max_length + 1):
+                keys, counts = store.weighted_window_key_counts(length, cooc_keys, cooc_counts, min_support)
+                mask = counts >= min_support
+                frequent.extend(
+                    (count, store.decode(store.unpack(key, length)))
+                    for key, count in zip(keys[mask].tolist(), counts[mask].tolist())
+                )
                 memory_monitor.check_memory()
-                if memory_monitor.is_memory_critical():
-                    app_logger.error("内存使用达到严重阈值,提前终止模式挖掘")
-                    break
-
-        # 过滤出频繁模式
-        frequent = [
-            (count, list(pattern))
-            for pattern, count in pattern_counts.items()
-            if count >= min_support
-        ]
 
         # 按支持度降序排序
-        frequent.sort(reverse=True, key=lambda x: x[0])
+        frequent.sort(key=lambda x: (-x[0], len(x[1]), x[1]))
 
         app_logger.info(f"Attention 方法挖掘完成: 找到 {len(frequent)} 个频繁模式")
         return frequent
 
+    def _use_parallel(self, store: EncodedSequences, max_length: int) -> bool:
+        """数据量足够大且模式键可打包时使用多进程分片挖掘"""
+        return (
+            self.workers > 1
+            and store.total_events >= PARALLEL_MIN_EVENTS
+            and max_length <= store.max_packable_length()
+        )
+
     def _normalize_event_type(self, event_type: str) -> str:
         """标准化事件类型名称
 
@@ -304,6 +375,62 @@ class SequenceMiningService:
 
         return synonyms.get(normalized, normalized)
 
+    def _iter_user_sequences(
+        self,
+        cursor,
+        limit: Optional[int],
+        offset: int,
+        target_label: Optional[str]
+    ) -> Iterator[Tuple[str, Any, List[str]]]:
+        """一次有序扫描逐用户产出行为序列
+
+        用户列表、标签（properties.purchase_intent）和逻辑行为在同一条查询中关联，
+        结果按 (user_id, start_time) 排序后流式分组，由 idx_logical_behaviors_user_time 索引支撑。
+        指定目标标签时，非目标用户只参与标签统计，不读取其行为。
+
+        Yields:
+            (user_id, label, [action, ...])
+        """
+        # 没有画像的用户：指定目标标签时不参与统计（INNER JOIN），否则记为unknown
+        profile_join = "JOIN" if target_label else "LEFT JOIN"
+        behavior_filter = "AND u.label = ?" if target_label else ""
+        params: List[Any] = [limit if limit else -1, offset]
+        if target_label:
+            params.append(target_label)
+
+        cursor.execute(f"""
+            WITH users AS (
+                SELECT lbs.user_id, {LABEL_SQL} AS label
+                FROM logical_behavior_sequences lbs
+                {profile_join} user_profiles up ON lbs.user_id = up.user_id
+                WHERE lbs.status = 'success' AND lbs.behavior_count > 0
+                ORDER BY lbs.user_id
+                LIMIT ? OFFSET ?
+            )
+            SELECT u.user_id, u.label, lb.action
+            FROM users u
+            LEFT JOIN logical_behaviors lb ON lb.user_id = u.user_id {behavior_filter}
+            ORDER BY u.user_id, lb.start_time
+        """, params)
+
+        current_user = None
+        current_label = None
+        actions: List[str] = []
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for user_id, label, action in rows:
+                if user_id != current_user:
+                    if current_user is not None:
+                        yield current_user, current_label, actions
+                    current_user, current_label, actions = user_id, label, []
+                if action is not None:
+                    actions.append(action)
+
+        if current_user is not None:
+            yield current_user, current_label, actions
+
     def _load_event_sequences(
         self,
         limit: Optional[int] = None,
@@ -311,7 +438,7 @@ class SequenceMiningService:
         target_label: Optional[str] = None,  # 目标结果标签
         target_events: Optional[List[str]] = None,  # 目标事件列表（action）
         use_cache: bool = True
-    ) -> Tuple[List[List[str]], Dict]:
+    ) -> Tuple[EncodedSequences, Dict]:
         """从logical_behaviors表加载所有用户的逻辑行为序列
 
         Args:
@@ -323,200 +450,107 @@ class SequenceMiningService:
 
         Returns:
             (sequences, statistics)
-            - sequences: [[action1, action2, ...], ...]
+            - sequences: 整数编码的序列集合，可迭代得到 [action1, action2, ...]
             - statistics: {
                 "label_distribution": {"首购": 10, "换车": 5, ...},
                 "target_users": 50  # 包含目标事件的用户数
               }
         """
-        # 尝试从缓存获取
-        if use_cache and limit and offset == 0:
-            cached_sequences = self.cache.get_sequences(limit)
-            if cached_sequences:
+        # 尝试从缓存获取（缓存键只区分limit，仅用于不带过滤条件的加载）
+        cacheable = use_cache and limit and offset == 0 and target_label is None and target_events is None
+        if cacheable:
+            cached = self.cache.get_sequences(limit)
+            if cached:
                 app_logger.info(f"从缓存获取序列: limit={limit}")
-                return cached_sequences
+                return cached
 
-        sequences = []
+        sequences = SequenceStoreBuilder()
         label_distribution = {}
         target_users = 0
 
-        with sqlite3.connect(self.db_path) as conn:
+        total_users = 0
+        with get_pool(self.db_path).read() as conn:
             cursor = conn.cursor()
 
-            # 构建查询 - 从logical_behavior_sequences获取成功状态的用户
-            if target_label:
-                # 过滤特定标签的用户
-                query = """
-                    SELECT lbs.user_id, up.properties
-                    FROM logical_behavior_sequences lbs
-                    JOIN user_profiles up ON lbs.user_id = up.user_id
-                    WHERE lbs.status = 'success' AND lbs.behavior_count > 0
-                    ORDER BY lbs.user_id
-                """
-            else:
-                # 加载所有用户，但仍然获取标签信息用于统计
-                query = """
-                    SELECT lbs.user_id, up.properties
-                    FROM logical_behavior_sequences lbs
-                    LEFT JOIN user_profiles up ON lbs.user_id = up.user_id
-                    WHERE lbs.status = 'success' AND lbs.behavior_count > 0
-                    ORDER BY lbs.user_id
-                """
-
-            if limit:
-                query += f" LIMIT {limit}"
-            if offset:
-                query += f" OFFSET {offset}"
-
-            cursor.execute(query)
-            all_rows = cursor.fetchall()
-
-            # 第一遍：过滤用户并统计标签分布
-            filtered_user_ids = []
-            for row in all_rows:
-                user_id = row[0]
-                properties_json = row[1]
-
-                # 解析用户标签
-                user_label = None
-                if properties_json:
-                    try:
-                        properties = json.loads(properties_json)
-                        user_label = properties.get('purchase_intent', 'unknown')
-                    except:
-                        user_label = 'unknown'
-                else:
-                    user_label = 'unknown'
-
+            for user_id, user_label, actions in self._iter_user_sequences(
+                cursor, limit, offset, target_label
+            ):
+                total_users += 1
                 # 统计标签分布
                 label_distribution[user_label] = label_distribution.get(user_label, 0) + 1
 
                 # 如果指定了目标标签，只保留匹配的用户
-                if target_label is None or user_label == target_label:
-                    filtered_user_ids.append(user_id)
-
-            app_logger.info(f"标签过滤: 总用户数={len(all_rows)}, 目标标签={target_label}, 过滤后={len(filtered_user_ids)}")
-            app_logger.info(f"标签分布: {label_distribution}")
-
-            # 第二遍：加载每个用户的逻辑行为序列
-            for user_id in filtered_user_ids:
-                cursor.execute("""
-                    SELECT action, start_time
-                    FROM logical_behaviors
-                    WHERE user_id = ?
-                    ORDER BY start_time ASC
-                """, (user_id,))
-
-                behaviors = cursor.fetchall()
-                if not behaviors:
+                if target_label is not None and user_label != target_label:
+                    continue
+                if not actions:
                     continue
 
                 # 构建行为序列（使用action作为事件类型）
-                full_sequence = []
-                target_index = -1
-
-                for idx, (action, start_time) in enumerate(behaviors):
-                    # 事件标准化
-                    action = self._normalize_event_type(action)
-                    full_sequence.append(action)
-
-                    # 检查是否匹配目标事件列表
-                    if target_events and action in target_events and target_index == -1:
-                        target_index = idx
+                full_sequence = [self._normalize_event_type(action) for action in actions]
 
                 # 过滤和截取
                 if target_events:
+                    target_index = next(
+                        (idx for idx, action in enumerate(full_sequence) if action in target_events),
+                        -1
+                    )
                     if target_index >= 0:
                         # 截取到目标事件（包含目标）
-                        truncated_sequence = full_sequence[:target_index + 1]
-                        sequences.append(truncated_sequence)
+                        sequences.append(full_sequence[:target_index + 1])
                         target_users += 1
                 else:
-                    if full_sequence:
-                        sequences.append(full_sequence)
+                    sequences.append(full_sequence)
 
-        # 缓存结果
-        if use_cache and limit and offset == 0 and target_label is None and target_events is None:
-            self.cache.set_sequences(sequences, limit, ttl=300)
+        sequences = sequences.build()
+        app_logger.info(
+            f"标签过滤: 总用户数={total_users}, 目标标签={target_label}, 序列数={len(sequences)}, "
+            f"事件数={sequences.total_events}, 编码后{sequences.nbytes / 1024:.1f}KB"
+        )
+        app_logger.info(f"标签分布: {label_distribution}")
 
         statistics = {
             "label_distribution": label_distribution,
             "target_users": target_users
         }
 
+        # 缓存结果
+        if cacheable:
+            self.cache.set_sequences((sequences, statistics), limit, ttl=300)
+
         return sequences, statistics
 
     def _simple_frequent_mining(
         self,
-        sequences: List[List[str]],
+        sequences: Union[EncodedSequences, List[List[str]]],
         min_support: int,
         max_length: int
     ) -> List[Tuple[int, List[str]]]:
-        """简单的频繁子序列挖掘(当 PrefixSpan 不可用时) - 流式处理版本
+        """简单的频繁连续子序列挖掘(当 PrefixSpan 不可用时)
 
-        使用批处理和增量过滤来控制内存使用
+        在整数编码序列上按长度逐层统计，子序列打包为 int64 键后向量化去重计数。
 
         注意：支持度 = 包含该模式的用户数（每个用户最多计数一次）
 
         Returns:
             [(support, pattern), ...]
         """
-        pattern_counts = Counter()
-        batch_size = 2000  # 每批处理2000个序列
-        total_batches = (len(sequences) + batch_size - 1) // batch_size
-
-        app_logger.info(f"开始流式挖掘: {len(sequences)}个序列, 分{total_batches}批处理")
-
-        # 分批处理序列
-        for batch_idx in range(total_batches):
-            start_idx = batch_idx * batch_size
-            end_idx = min(start_idx + batch_size, len(sequences))
-            batch = sequences[start_idx:end_idx]
-
-            # 处理当前批次
-            for seq in batch:
-                # 对于每个序列，记录其包含的所有唯一子序列
-                seen_patterns = set()
-
-                # 生成长度为 1 到 max_length 的所有子序列
-                for length in range(1, min(len(seq) + 1, max_length + 1)):
-                    for i in range(len(seq) - length + 1):
-                        subseq = tuple(seq[i:i + length])
-                        seen_patterns.add(subseq)
-
-                # 对该用户包含的每个模式计数一次
-                for pattern in seen_patterns:
-                    pattern_counts[pattern] += 1
-
-            # 每处理5批后,过滤掉低频模式以释放内存
-            if (batch_idx + 1) % 5 == 0:
-                before_count = len(pattern_counts)
-                pattern_counts = Counter({
-                    pattern: count
-                    for pattern, count in pattern_counts.items()
-                    if count >= min_support or count >= (batch_idx + 1) * batch_size * 0.001  # 保留有潜力的模式
-                })
-                after_count = len(pattern_counts)
-                app_logger.info(f"批次 {batch_idx + 1}/{total_batches}: 过滤模式 {before_count} -> {after_count}")
-
-                # 触发垃圾回收
-                gc.collect()
-
-                # 检查内存
-                memory_monitor.check_memory()
-                if memory_monitor.is_memory_critical():
-                    app_logger.error("内存使用达到严重阈值,提前终止挖掘")
-                    break
-
-        # 最终过滤出频繁模式
-        frequent = [
-            (count, list(pattern))
-            for pattern, count in pattern_counts.items()
-            if count >= min_support
-        ]
+        store = EncodedSequences.coerce(sequences)
+        app_logger.info(
+            f"开始挖掘: {len(store)}个序列, {store.total_events}个事件, "
+            f"词表{store.vocab_size}, 编码后{store.nbytes / 1024:.1f}KB"
+        )
+
+        if self._use_parallel(store, max_length):
+            patterns = parallel_support_mining(
+                store, min_support, max_length, self.workers, two_pass=self.two_pass
+            )
+        else:
+            patterns = store.count_contiguous_support(max_length, min_support)
+        frequent = [(support, store.decode(codes)) for support, codes in patterns]
+        memory_monitor.check_memory()
 
         # 按支持度降序排序
-        frequent.sort(reverse=True, key=lambda x: x[0])
+        frequent.sort(key=lambda x: (-x[0], len(x[1]), x[1]))
 
         app_logger.info(f"挖掘完成: 找到 {len(frequent)} 个频繁模式")
         return frequent
@@ -591,7 +625,7 @@ class SequenceMiningService:
             保存结果
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
 
                 # 表由 persistence.py 统一管理，这里不再重复创建
@@ -627,8 +661,6 @@ class SequenceMiningService:
                     ))
                     saved_count += 1
 
-                conn.commit()
-
             app_logger.info(f"✓ 成功保存 {saved_count} 个高频模式")
 
             return {
@@ -651,7 +683,7 @@ class SequenceMiningService:
             模式列表和统计信息
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
 
                 # 查询总数
@@ -700,10 +732,9 @@ class SequenceMiningService:
             pattern_id: 模式ID
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).write() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM frequent_patterns WHERE id = ?", (pattern_id,))
-                conn.commit()
 
             app_logger.info(f"✓ 删除模式 {pattern_id}")
 
@@ -723,7 +754,7 @@ class SequenceMiningService:
             ]
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with get_pool(self.db_path).read() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT action, COUNT(*) as count
@@ -754,21 +785,33 @@ class SequenceMiningService:
     ) -> List[Dict]:
         """获取某个模式的具体用户示例
 
+        事件倒排索引已构建时直接求交得到包含模式的用户（覆盖全部用户，按user_id排序），
+        否则逐用户扫描前 max_scan 个序列。
+
         Args:
             pattern: 事件类型序列
             limit: 返回示例数量
-            max_scan: 最大扫描序列数（默认1000，最大10000）
+            max_scan: 最大扫描序列数（默认1000，最大10000，仅在未构建倒排索引时生效）
 
         Returns:
             用户示例列表
         """
+        if self.posting_index.is_built():
+            user_ids = self.posting_index.find_users(pattern, limit=limit, require_behaviors=True)
+            with get_pool(self.db_path).read() as conn:
+                cursor = conn.cursor()
+                return [
+                    example for example in (self._build_example(cursor, user_id) for user_id in user_ids)
+                    if example is not None
+                ]
+
         # 限制最大扫描数，防止性能问题
         if max_scan > 10000:
             max_scan = 10000
 
         examples = []
 
-        with sqlite3.connect(self.db_path) as conn:
+        with get_pool(self.db_path).read() as conn:
             cursor = conn.cursor()
 
             # 查询逻辑行为序列（使用可配置的限制）
@@ -786,42 +829,46 @@ class SequenceMiningService:
                 if len(examples) >= limit:
                     break
 
-                # 查询该用户的逻辑行为序列
-                cursor.execute("""
-                    SELECT action, start_time, agent, scene, object
-                    FROM logical_behaviors
-                    WHERE user_id = ?
-                    ORDER BY start_time ASC
-                """, (user_id,))
-
-                behaviors = cursor.fetchall()
-                if not behaviors:
-                    continue
-
-                # 构建事件类型序列和详细信息
-                event_types = [b[0] for b in behaviors]  # action
-                event_details = []
-                for action, start_time, agent, scene, obj in behaviors:
-                    event_details.append({
-                        "event_type": action,
-                        "timestamp": start_time,
-                        "context": {
-                            "agent": agent,
-                            "scene": scene,
-                            "object": obj
-                        }
-                    })
-
+                example = self._build_example(cursor, user_id)
                 # 检查是否包含目标模式
-                if self._contains_pattern(event_types, pattern):
-                    examples.append({
-                        "user_id": user_id,
-                        "sequence": event_types,  # 添加完整的事件类型序列
-                        "events": event_details   # 保留详细信息
-                    })
+                if example is not None and self._contains_pattern(example["sequence"], pattern):
+                    examples.append(example)
 
         return examples
 
+    def _build_example(self, cursor, user_id: str) -> Optional[Dict]:
+        """查询用户的逻辑行为序列并构建示例，没有行为时返回None"""
+        cursor.execute("""
+            SELECT action, start_time, agent, scene, object
+            FROM logical_behaviors
+            WHERE user_id = ?
+            ORDER BY start_time ASC
+        """, (user_id,))
+
+        behaviors = cursor.fetchall()
+        if not behaviors:
+            return None
+
+        # 构建事件类型序列和详细信息
+        event_types = [b[0] for b in behaviors]  # action
+        event_details = []
+        for action, start_time, agent, scene, obj in behaviors:
+            event_details.append({
+                "event_type": action,
+                "timestamp": start_time,
+                "context": {
+                    "agent": agent,
+                    "scene": scene,
+                    "object": obj
+                }
+            })
+
+        return {
+            "user_id": user_id,
+            "sequence": event_types,  # 添加完整的事件类型序列
+            "events": event_details   # 保留详细信息
+        }
+
     def _contains_pattern(self, sequence: List[str], pattern: List[str]) -> bool:
         """检查序列是否包含指定模式(子序列)
 
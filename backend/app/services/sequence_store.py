@@ -0,0 +1,291 @@
+"""
+紧凑序列存储 - 整数编码的CSR布局行为序列
+
+所有序列的事件ID拼接在一个 int32 数组中，offsets[i]:offsets[i+1] 为第i条序列。
+相比 List[List[str]]，内存占用下降一个数量级，n-gram计数可直接在打包的 int64 键上向量化完成。
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+class SequenceStoreBuilder:
+    """增量构建 EncodedSequences（加载数据时逐条追加）"""
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self._data = array("i")
+        self._offsets = array("q", [0])
+
+    def encode(self, event: str) -> int:
+        code = self.vocab.get(event)
+        if code is None:
+            code = len(self.vocab)
+            self.vocab[event] = code
+        return code
+
+    def append(self, sequence: Iterable[str]) -> None:
+        """追加一条序列"""
+        self._data.extend(self.encode(event) for event in sequence)
+        self._offsets.append(len(self._data))
+
+    def build(self) -> "EncodedSequences":
+        return EncodedSequences(
+            vocab=self.vocab,
+            data=np.frombuffer(self._data, dtype=np.int32).copy() if self._data else np.empty(0, dtype=np.int32),
+            offsets=np.frombuffer(self._offsets, dtype=np.int64).copy()
+        )
+
+
+class EncodedSequences:
+    """整数编码的序列集合（CSR布局）
+
+    - vocab: 事件名称 -> 事件ID
+    - events: 事件ID -> 事件名称
+    - data: 所有序列拼接后的事件ID（int32）
+    - offsets: 每条序列在 data 中的起止位置（int64，长度为序列数+1）
+    """
+
+    def __init__(self, vocab: Dict[str, int], data: np.ndarray, offsets: np.ndarray):
+        self.vocab = vocab
+        self.events = [None] * len(vocab)
+        for event, code in vocab.items():
+            self.events[code] = event
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_sequences(cls, sequences: Iterable[Sequence[str]]) -> "EncodedSequences":
+        builder = SequenceStoreBuilder()
+        for sequence in sequences:
+            builder.append(sequence)
+        return builder.build()
+
+    @classmethod
+    def coerce(cls, sequences: Union["EncodedSequences", Iterable[Sequence[str]]]) -> "EncodedSequences":
+        """兼容旧接口：List[List[str]] 转为 EncodedSequences"""
+        if isinstance(sequences, cls):
+            return sequences
+        return cls.from_sequences(sequences)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for i in range(len(self)):
+            yield self.decode(self.codes(i))
+
+    def __getitem__(self, i: int) -> List[str]:
+        return self.decode(self.codes(i))
+
+    def codes(self, i: int) -> np.ndarray:
+        """第i条序列的事件ID"""
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def decode(self, codes: Iterable[int]) -> List[str]:
+        return [self.events[code] for code in codes]
+
+    def encode(self, events: Iterable[str]) -> Optional[List[int]]:
+        """事件名称转为ID，包含未知事件时返回None"""
+        codes = []
+        for event in events:
+            code = self.vocab.get(event)
+            if code is None:
+                return None
+            codes.append(code)
+        return codes
+
+    def to_lists(self) -> List[List[str]]:
+        return list(self)
+
+    def code_lists(self) -> List[List[int]]:
+        """每条序列的事件ID列表（供需要Python序列的第三方算法使用）"""
+        data = self.data.tolist()
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def total_events(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def vocab_size(self) -> int:
+        return len(self.vocab)
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_events / len(self) if len(self) else 0.0
+
+    def unique_event_count(self) -> int:
+        """实际出现过的事件类型数"""
+        return int(np.unique(self.data).size)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + self.offsets.nbytes)
+
+    def sequence_index(self) -> np.ndarray:
+        """每个事件所属序列的下标"""
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.lengths)
+
+    def subset(self, indices: Sequence[int]) -> "EncodedSequences":
+        """按下标抽取子集（共享词表）"""
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if offsets[-1]:
+            positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+            data = self.data[positions]
+        else:
+            data = np.empty(0, dtype=np.int32)
+        return EncodedSequences(self.vocab, data, offsets)
+
+    # ---- n-gram 计数 ----
+
+    def max_packable_length(self) -> int:
+        """打包为int64键时允许的最大n-gram长度"""
+        base = max(self.vocab_size, 2)
+        length = 0
+        while base ** (length + 1) < 2 ** 62:
+            length += 1
+        return length
+
+    def ngram_windows(self, length: int) -> np.ndarray:
+        """不跨越序列边界的长度为length的窗口起点"""
+        if length <= 0 or self.total_events < length:
+            return np.empty(0, dtype=np.int64)
+        starts = np.arange(self.total_events - length + 1, dtype=np.int64)
+        seq_end = np.repeat(self.offsets[1:], self.lengths)[:len(starts)]
+        return starts[starts + length <= seq_end]
+
+    def pack(self, starts: np.ndarray, length: int) -> np.ndarray:
+        """把从starts开始的length个事件ID打包为int64键"""
+        base = max(self.vocab_size, 2)
+        keys = np.zeros(len(starts), dtype=np.int64)
+        for k in range(length):
+            keys = keys * base + self.data[starts + k]
+        return keys
+
+    def unpack(self, key: int, length: int) -> Tuple[int, ...]:
+        base = max(self.vocab_size, 2)
+        codes = []
+        for _ in range(length):
+            key, code = divmod(key, base)
+            codes.append(code)
+        return tuple(reversed(codes))
+
+    def count_contiguous_support(
+        self,
+        max_length: int,
+        min_support: int,
+        min_length: int = 1
+    ) -> List[Tuple[int, Tuple[int, ...]]]:
+        """统计连续子序列的支持度（包含该子序列的序列数，每条序列最多计数一次）
+
+        Returns:
+            [(support, codes), ...]，codes 为事件ID元组
+        """
+        if max_length > self.max_packable_length():
+            return self._count_contiguous_support_tuples(max_length, min_support, min_length)
+
+        results = []
+        for length in range(max(1, min_length), max_length + 1):
+            unique_keys, counts = self.support_key_counts(length)
+            if len(unique_keys) == 0:
+                break
+            frequent = counts >= min_support
+            for key, count in zip(unique_keys[frequent].tolist(), counts[frequent].tolist()):
+                results.append((count, self.unpack(key, length)))
+        return results
+
+    def support_key_counts(self, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        """长度为length的连续子序列的支持度（按打包键，不做阈值过滤）
+
+        Returns:
+            (unique_keys, counts)，unique_keys 升序
+        """
+        starts = self.ngram_windows(length)
+        if len(starts) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        keys = self.pack(starts, length)
+        owners = self.sequence_index()[starts]
+        # 同一序列内重复出现的模式只计一次
+        order = np.lexsort((keys, owners))
+        keys, owners = keys[order], owners[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (owners[1:] != owners[:-1])
+        return np.unique(keys[first], return_counts=True)
+
+    def cooccurrence_key_counts(self, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """窗口内（间隔1..window-1）有序事件对的出现次数，键为 a*V+b
+
+        Returns:
+            (unique_keys, counts)，unique_keys 升序
+        """
+        base = max(self.vocab_size, 2)
+        pair_keys = []
+        for gap in range(1, window):
+            starts = self.ngram_windows(gap + 1)
+            if len(starts) == 0:
+                break
+            pair_keys.append(self.data[starts].astype(np.int64) * base + self.data[starts + gap])
+        if not pair_keys:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(pair_keys), return_counts=True)
+
+    def weighted_window_key_counts(
+        self,
+        length: int,
+        cooc_keys: np.ndarray,
+        cooc_counts: np.ndarray,
+        min_weight: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """统计相邻事件对共现频率之和 >= min_weight 的连续窗口出现次数（按打包键）
+
+        Returns:
+            (unique_keys, counts)，unique_keys 升序
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        starts = self.ngram_windows(length)
+        if len(starts) == 0 or len(cooc_keys) == 0:
+            return empty
+
+        base = max(self.vocab_size, 2)
+        pair_starts = self.ngram_windows(2)
+        pair_keys = self.data[pair_starts].astype(np.int64) * base + self.data[pair_starts + 1]
+        idx = np.minimum(np.searchsorted(cooc_keys, pair_keys), len(cooc_keys) - 1)
+        pair_weight = np.where(cooc_keys[idx] == pair_keys, cooc_counts[idx], 0)
+        weights_by_start = np.zeros(self.total_events, dtype=np.int64)
+        weights_by_start[pair_starts] = pair_weight
+
+        weight = np.zeros(len(starts), dtype=np.int64)
+        for k in range(length - 1):
+            weight += weights_by_start[starts + k]
+        starts = starts[weight >= min_weight]
+        if len(starts) == 0:
+            return empty
+        return np.unique(self.pack(starts, length), return_counts=True)
+
+    def _count_contiguous_support_tuples(
+        self,
+        max_length: int,
+        min_support: int,
+        min_length: int
+    ) -> List[Tuple[int, Tuple[int, ...]]]:
+        """键无法打包进int64时按整数元组计数"""
+        counts: Dict[Tuple[int, ...], int] = {}
+        for seq in self.code_lists():
+            seen = set()
+            for length in range(max(1, min_length), min(len(seq), max_length) + 1):
+                for i in range(len(seq) - length + 1):
+                    seen.add(tuple(seq[i:i + length]))
+            for pattern in seen:
+                counts[pattern] = counts.get(pattern, 0) + 1
+        return [(count, pattern) for pattern, count in counts.items() if count >= min_support]
@@ -0,0 +1,231 @@
+"""
+并发批量打标引擎 - APP/媒体标签的LLM批量生成
+
+多个批次同时调用LLM（同时进行的批次数受 concurrency 限制），批大小根据上一批的响应延迟和
+缺失率（响应被截断时大量条目没有结果）自适应调整，并且不超过 BatchPlanner 的token预算；
+每批结果用一次 executemany 写回。
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.db_pool import get_pool
+from app.core.logger import app_logger
+from app.core.token_budget import BatchPlanner
+
+
+class AdaptiveBatchSizer:
+    """根据每批的延迟和缺失率调整下一批的大小
+
+    - 缺失率超过 truncation_threshold（输出被截断或JSON不完整）：减半
+    - 延迟超过 target_latency：缩小1/4
+    - 延迟低于目标一半且没有缺失：增大1/4
+    """
+
+    def __init__(
+        self,
+        initial: int = 100,
+        minimum: int = 10,
+        maximum: int = 200,
+        target_latency: float = 60.0,
+        truncation_threshold: float = 0.2
+    ):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.truncation_threshold = truncation_threshold
+
+    def record(self, batch_size: int, latency: float, missing: int) -> int:
+        """记录一批的结果，返回调整后的批大小"""
+        if batch_size and missing / batch_size > self.truncation_threshold:
+            size = self.size // 2
+        elif latency > self.target_latency:
+            size = self.size * 3 // 4
+        elif latency < self.target_latency / 2 and missing == 0 and batch_size >= self.size:
+            size = self.size * 5 // 4
+        else:
+            size = self.size
+        self.size = max(self.minimum, min(self.maximum, size))
+        return self.size
+
+
+class TaggingProgress:
+    """一类标签（app/media）的打标进度"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._reset()
+
+    def _reset(self) -> None:
+        self.status = "idle"
+        self.total = 0
+        self.tagged = 0
+        self.empty = 0
+        self.failed = 0
+        self.batches = 0
+        self.retried = 0
+        self.batch_size = 0
+        self.latency_total = 0.0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def start(self, total: int, batch_size: int) -> None:
+        self._reset()
+        self.status = "running"
+        self.total = total
+        self.batch_size = batch_size
+        self.started_at = time.time()
+
+    def record_batch(self, tagged: int, empty: int, latency: float, batch_size: int) -> None:
+        self.tagged += tagged
+        self.empty += empty
+        self.batches += 1
+        self.latency_total += latency
+        self.batch_size = batch_size
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self.status = "failed" if error else "completed"
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        processed = self.tagged + self.empty + self.failed
+        return {
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "processed": processed,
+            "tagged": self.tagged,
+            "empty": self.empty,
+            "failed": self.failed,
+            "batches": self.batches,
+            "retried": self.retried,
+            "batch_size": self.batch_size,
+            "avg_batch_latency": round(self.latency_total / self.batches, 2) if self.batches else 0.0,
+            "elapsed_seconds": round(elapsed, 1),
+            "items_per_sec": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "error": self.error
+        }
+
+
+class ConcurrentTagger:
+    """并发批量打标：条目按自适应批大小分批，最多 concurrency 个批次同时调用LLM"""
+
+    def __init__(
+        self,
+        db_path,
+        table: str,
+        id_column: str,
+        tag_batch: Callable[[List[Dict]], Awaitable[Dict[str, List[str]]]],
+        concurrency: int = 4,
+        sizer: Optional[AdaptiveBatchSizer] = None,
+        max_attempts: int = 2,
+        planner: Optional[BatchPlanner] = None,
+        render: Optional[Callable[[Dict], str]] = None
+    ):
+        """
+        Args:
+            db_path: 数据库路径
+            table: 标签表（app_tags / media_tags）
+            id_column: 主键列（app_id / media_id）
+            tag_batch: 批量打标函数，返回 {id: 标签列表}，没有结果的条目为空列表
+            concurrency: 同时进行的LLM批次数
+            sizer: 批大小调整器
+            max_attempts: 没有结果（或批次异常）的条目最多尝试次数
+            planner: token预算（可选），每批条目数同时受其限制
+            render: 条目在prompt中的文本，用于估算输入token
+        """
+        self.db_path = db_path
+        self.table = table
+        self.id_column = id_column
+        self.tag_batch = tag_batch
+        self.concurrency = max(1, concurrency)
+        self.sizer = sizer or AdaptiveBatchSizer()
+        self.max_attempts = max_attempts
+        self.planner = planner
+        self.render = render or (lambda item: " ".join(str(value) for value in item.values()))
+
+    async def run(self, items: List[Dict], progress: TaggingProgress) -> Dict:
+        """为所有条目打标，返回进度快照"""
+        progress.start(len(items), self.sizer.size)
+        pending = deque(items)
+        attempts: Dict[str, int] = {}
+        in_flight = set()
+
+        while pending or in_flight:
+            while pending and len(in_flight) < self.concurrency:
+                if self.planner is not None:
+                    count = self.planner.fit(pending, self.render, self.sizer.size)
+                else:
+                    count = min(self.sizer.size, len(pending))
+                batch = [pending.popleft() for _ in range(count)]
+                in_flight.add(asyncio.create_task(self._process_batch(batch, attempts, progress)))
+
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                retry = task.result()
+                progress.retried += len(retry)
+                pending.extend(retry)
+
+        progress.finish()
+        return progress.to_dict()
+
+    async def _process_batch(self, batch: List[Dict], attempts: Dict[str, int], progress: TaggingProgress) -> List[Dict]:
+        """处理一批，返回需要重试的条目"""
+        start = time.perf_counter()
+        try:
+            tags_dict = await self.tag_batch(batch)
+        except Exception as e:
+            app_logger.error(f"✗ {self.table} 批次打标失败({len(batch)} 条): {type(e).__name__}: {e}", exc_info=True)
+            tags_dict = None
+        latency = time.perf_counter() - start
+
+        results, retry = [], []
+        for item in batch:
+            item_id = item[self.id_column]
+            tags = tags_dict.get(item_id) if tags_dict is not None else None
+            if tags:
+                results.append((json.dumps(tags, ensure_ascii=False), item_id))
+                continue
+            attempts[item_id] = attempts.get(item_id, 0) + 1
+            if attempts[item_id] < self.max_attempts:
+                retry.append(item)
+            elif tags_dict is None:
+                progress.failed += 1  # 保持未打标状态，下次导入时重新处理
+            else:
+                results.append(("[]", item_id))
+
+        tagged = sum(1 for tags, _ in results if tags != "[]")
+        batch_size = self.sizer.record(len(batch), latency, len(batch) - tagged)
+        if self.planner is not None:
+            self.planner.record((len(batch) - tagged) / len(batch) > self.sizer.truncation_threshold)
+        written = len(results)
+        if results:
+            try:
+                await asyncio.to_thread(self._apply, results)
+            except Exception as e:
+                # 写回失败的条目保持未打标状态（计为失败），其余批次继续
+                app_logger.error(
+                    f"✗ {self.table} 批次写回失败({len(results)} 条): {type(e).__name__}: {e}", exc_info=True
+                )
+                progress.failed += len(results)
+                tagged = written = 0
+        progress.record_batch(tagged, written - tagged, latency, batch_size)
+        app_logger.info(
+            f"✓ {self.table} 批次完成: 成功 {tagged}/{len(batch)}, 耗时 {latency:.1f}s, "
+            f"重试 {len(retry)}, 下一批大小 {batch_size}"
+        )
+        return retry
+
+    def _apply(self, results: List[tuple]) -> None:
+        """一次 executemany 写回一批标签"""
+        with get_pool(self.db_path).write() as conn:
+            conn.executemany(
+                f"UPDATE {self.table} SET tags = ?, llm_generated = 1 WHERE {self.id_column} = ?",
+                results
+            )
@@ -0,0 +1,281 @@
+"""
+行为序列统计引擎 - 一次有序扫描加载全部行为序列，向量化计算转移矩阵和模式画像分布
+"""
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# 与原 SQL CASE 表达式保持一致的年龄段划分
+AGE_GROUP_LABELS = ["25-35岁", "35-45岁", "45岁以上", "其他"]
+
+
+def _age_group_code(age) -> int:
+    """年龄映射为年龄段编码，None返回-1"""
+    if age is None:
+        return -1
+    if 25 <= age < 35:
+        return 0
+    if 35 <= age < 45:
+        return 1
+    if age >= 45:
+        return 2
+    return 3
+
+
+class ActionSequenceMatrix:
+    """整数编码的用户行为序列矩阵
+
+    所有成功用户的行为序列按 (user_id, start_time) 顺序拼接到一个 int32 数组中：
+    - codes: 每个事件的行为编码（空行为编码为-1）
+    - user_index: 每个事件所属用户在 user_ids 中的下标
+    - actions: 编码 -> 行为名称
+    """
+
+    def __init__(
+        self,
+        user_ids: List[str],
+        actions: List[str],
+        codes: np.ndarray,
+        user_index: np.ndarray
+    ):
+        self.user_ids = user_ids
+        self.actions = actions
+        self.vocab = {action: i for i, action in enumerate(actions)}
+        self.codes = codes
+        self.user_index = user_index
+
+    @classmethod
+    def load(cls, cursor: sqlite3.Cursor) -> "ActionSequenceMatrix":
+        """一次有序扫描加载所有成功用户的行为序列"""
+        cursor.execute("""
+            SELECT lb.user_id, lb.action
+            FROM logical_behaviors lb
+            JOIN logical_behavior_sequences lbs ON lb.user_id = lbs.user_id
+            WHERE lbs.status = 'success'
+            ORDER BY lb.user_id, lb.start_time
+        """)
+
+        user_ids: List[str] = []
+        vocab: Dict[str, int] = {}
+        codes: List[int] = []
+        user_index: List[int] = []
+        current_user = None
+
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for user_id, action in rows:
+                if user_id != current_user:
+                    current_user = user_id
+                    user_ids.append(user_id)
+                if action:
+                    code = vocab.get(action)
+                    if code is None:
+                        code = len(vocab)
+                        vocab[action] = code
+                else:
+                    code = -1
+                codes.append(code)
+                user_index.append(len(user_ids) - 1)
+
+        return cls(
+            user_ids=user_ids,
+            actions=list(vocab),
+            codes=np.asarray(codes, dtype=np.int32),
+            user_index=np.asarray(user_index, dtype=np.int32)
+        )
+
+    @property
+    def num_users(self) -> int:
+        return len(self.user_ids)
+
+    def transition_counts(self) -> Tuple[Dict[Tuple[str, str], int], Dict[str, int]]:
+        """计算相邻事件转移次数
+
+        Returns:
+            (transition_counts, event_counts)
+            - transition_counts: {(event_a, event_b): count}
+            - event_counts: {event_a: 作为转移起点的次数}
+        """
+        if len(self.codes) < 2:
+            return {}, {}
+
+        src = self.codes[:-1]
+        dst = self.codes[1:]
+        mask = (self.user_index[:-1] == self.user_index[1:]) & (src >= 0) & (dst >= 0)
+        src = src[mask].astype(np.int64)
+        dst = dst[mask].astype(np.int64)
+
+        vocab_size = len(self.actions)
+        keys, counts = np.unique(src * vocab_size + dst, return_counts=True)
+        source_counts = np.bincount(src, minlength=vocab_size)
+
+        transitions = {
+            (self.actions[key // vocab_size], self.actions[key % vocab_size]): int(count)
+            for key, count in zip(keys.tolist(), counts.tolist())
+        }
+        event_counts = {
+            self.actions[code]: int(count)
+            for code, count in enumerate(source_counts.tolist())
+            if count > 0
+        }
+        return transitions, event_counts
+
+    def user_indices(self, user_ids: List[str]) -> np.ndarray:
+        """用户ID转为用户下标（升序去重，忽略不在矩阵中的用户）"""
+        positions = {user_id: idx for idx, user_id in enumerate(self.user_ids)}
+        return np.unique(np.asarray(
+            [positions[user_id] for user_id in user_ids if user_id in positions], dtype=np.int32
+        ))
+
+    def matching_users(self, pattern: List[str]) -> np.ndarray:
+        """返回包含连续模式的用户下标（升序去重）"""
+        if not pattern or len(pattern) > len(self.codes):
+            return np.empty(0, dtype=np.int32)
+
+        pattern_codes = [self.vocab.get(action) for action in pattern]
+        if any(code is None for code in pattern_codes):
+            return np.empty(0, dtype=np.int32)
+
+        length = len(pattern_codes)
+        window = len(self.codes) - length + 1
+        mask = self.codes[:window] == pattern_codes[0]
+        for offset in range(1, length):
+            mask &= self.codes[offset:offset + window] == pattern_codes[offset]
+        # 模式不能跨越用户边界
+        mask &= self.user_index[:window] == self.user_index[length - 1:length - 1 + window]
+
+        return np.unique(self.user_index[:window][mask])
+
+
+class ProfileColumns:
+    """与 ActionSequenceMatrix 用户下标对齐的列式画像数据"""
+
+    def __init__(self, user_ids: List[str], profiles: Dict[str, Tuple]):
+        """
+        Args:
+            user_ids: 用户ID列表（下标与序列矩阵一致）
+            profiles: {user_id: (age, gender, occupation)}
+        """
+        self.genders: List[str] = []
+        self.occupations: List[str] = []
+        gender_vocab: Dict[str, int] = {}
+        occupation_vocab: Dict[str, int] = {}
+
+        has_profile = np.zeros(len(user_ids), dtype=bool)
+        gender_codes = np.full(len(user_ids), -1, dtype=np.int32)
+        age_codes = np.full(len(user_ids), -1, dtype=np.int32)
+        occupation_codes = np.full(len(user_ids), -1, dtype=np.int32)
+
+        for idx, user_id in enumerate(user_ids):
+            profile = profiles.get(user_id)
+            if profile is None:
+                continue
+            age, gender, occupation = profile
+            has_profile[idx] = True
+            age_codes[idx] = _age_group_code(age)
+            if gender is not None:
+                gender_codes[idx] = gender_vocab.setdefault(gender, len(gender_vocab))
+            if occupation is not None:
+                occupation_codes[idx] = occupation_vocab.setdefault(occupation, len(occupation_vocab))
+
+        self.genders = list(gender_vocab)
+        self.occupations = list(occupation_vocab)
+        self.has_profile = has_profile
+        self.gender_codes = gender_codes
+        self.age_codes = age_codes
+        self.occupation_codes = occupation_codes
+
+    @classmethod
+    def load(cls, cursor: sqlite3.Cursor, user_ids: List[str]) -> "ProfileColumns":
+        """一次查询加载所有成功用户的画像字段"""
+        cursor.execute("""
+            SELECT up.user_id, up.age, up.gender, up.occupation
+            FROM user_profiles up
+            JOIN logical_behavior_sequences lbs ON up.user_id = lbs.user_id
+            WHERE lbs.status = 'success'
+        """)
+        profiles = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+        return cls(user_ids, profiles)
+
+    @staticmethod
+    def _count(codes: np.ndarray, labels: List[str]) -> Dict[str, int]:
+        codes = codes[codes >= 0]
+        counts = np.bincount(codes, minlength=len(labels))
+        return {labels[i]: int(c) for i, c in enumerate(counts.tolist()) if c > 0}
+
+    def distribution(self, user_indices: np.ndarray) -> Dict:
+        """计算一组用户的画像分布（与原SQL分组统计结果一致）"""
+        if len(user_indices) == 0:
+            return {}
+
+        selected = user_indices[self.has_profile[user_indices]]
+
+        gender_dist = self._count(self.gender_codes[selected], self.genders)
+        age_dist = self._count(self.age_codes[selected], AGE_GROUP_LABELS)
+        occupation_dist = self._count(self.occupation_codes[selected], self.occupations)
+
+        # SQL GROUP BY 按分组键排序；职业只保留人数>=2的，按人数降序
+        gender_dist = dict(sorted(gender_dist.items()))
+        age_dist = dict(sorted(age_dist.items()))
+        occupation_dist = dict(sorted(
+            ((k, v) for k, v in occupation_dist.items() if v >= 2),
+            key=lambda item: item[1],
+            reverse=True
+        ))
+
+        return {
+            "gender": gender_dist,
+            "age": age_dist,
+            "occupation": occupation_dist
+        }
+
+
+def compute_pattern_statistics(
+    cursor: sqlite3.Cursor,
+    pattern_sequences: List[List[str]],
+    matrix: Optional[ActionSequenceMatrix] = None,
+    find_users: Optional[Callable[[List[str]], List[str]]] = None
+) -> Tuple[Dict, Dict]:
+    """计算模式画像分布和转移概率
+
+    Args:
+        cursor: 数据库游标
+        pattern_sequences: 模式列表（每个模式为行为名称列表）
+        matrix: 已加载的序列矩阵，None时从数据库加载
+        find_users: 查找包含连续模式的用户ID（如事件倒排索引），None时在序列矩阵上匹配
+
+    Returns:
+        (pattern_profile_stats, transition_probs)
+    """
+    if matrix is None:
+        matrix = ActionSequenceMatrix.load(cursor)
+    profiles = ProfileColumns.load(cursor, matrix.user_ids)
+
+    pattern_profile_stats = {}
+    for pattern_sequence in pattern_sequences:
+        if find_users is not None:
+            matching = matrix.user_indices(find_users(pattern_sequence))
+        else:
+            matching = matrix.matching_users(pattern_sequence)
+        if len(matching) == 0:
+            continue
+        pattern_profile_stats[' → '.join(pattern_sequence)] = {
+            'user_count': int(len(matching)),
+            'profile_distribution': profiles.distribution(matching)
+        }
+
+    transition_counts, event_counts = matrix.transition_counts()
+    transition_probs = {}
+    for (event_a, event_b), count in transition_counts.items():
+        total = event_counts[event_a]
+        transition_probs[(event_a, event_b)] = {
+            "probability": round(count / total, 3) if total > 0 else 0,
+            "count": count,
+            "total": total
+        }
+
+    return pattern_profile_stats, transition_probs
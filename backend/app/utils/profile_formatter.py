@@ -3,7 +3,10 @@
 将结构化数据转换为自然语言文本
 """
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
 
 
 def format_profile_text(profile: Dict[str, Any]) -> str:
@@ -123,3 +126,103 @@ def format_profile_text(profile: Dict[str, Any]) -> str:
         return f"{user_id}用户"
 
     return "，".join(parts)
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and value != value)
+
+
+def _truthy(series: pd.Series) -> pd.Series:
+    """按列计算取值的真值（缺失值为 False）"""
+    return series.map(lambda v: not _is_missing(v) and bool(v)).astype(bool)
+
+
+def _value_text(value: Any) -> str:
+    if isinstance(value, list):
+        return ", ".join(map(str, value))
+    if isinstance(value, float) and value.is_integer():
+        # 列中含缺失值时整数被推断为浮点，按整数输出
+        return str(int(value))
+    return str(value)
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """按列格式化取值，缺失值为空字符串（由调用方的掩码过滤）"""
+    return series.map(_value_text, na_action="ignore").astype(object).fillna("")
+
+
+def format_profile_texts(df: pd.DataFrame) -> pd.Series:
+    """按列批量生成用户画像文本，等价于对每行（去掉缺失值、整数值浮点还原为整数后）调用 format_profile_text
+
+    每个字段在整列上一次性判断和格式化，再按列拼接，避免逐行构造字典和函数调用。
+    含 properties 列时（嵌套属性）退回逐行处理。
+
+    Returns:
+        与 df 同索引的画像文本
+    """
+    if "properties" in df.columns:
+        return pd.Series([
+            format_profile_text({
+                key: int(value) if isinstance(value, float) and value.is_integer() else value
+                for key, value in record.items() if not _is_missing(value)
+            })
+            for record in df.to_dict("records")
+        ], index=df.index, dtype=object)
+
+    def column(name: str) -> Optional[pd.Series]:
+        return df[name] if name in df.columns else None
+
+    parts = []
+    for name, template in (("age", "{}岁"), ("gender", "{}"), ("city", "{}"), ("occupation", "{}")):
+        series = column(name)
+        if series is not None:
+            prefix, suffix = template.split("{}")
+            parts.append((_truthy(series), prefix + _text(series) + suffix))
+
+    income = column("income")
+    if income is not None:
+        numeric = pd.to_numeric(income, errors="coerce")
+        large = (numeric >= 10000).to_numpy()
+        parts.append((
+            numeric.notna() & (numeric != 0),
+            pd.Series(np.where(
+                large, "年收入" + _text(numeric // 10000) + "万", "年收入" + _text(numeric) + "元"
+            ), index=df.index, dtype=object)
+        ))
+
+    interests = column("interests")
+    if interests is not None:
+        parts.append((_truthy(interests), "喜欢" + _text(interests)))
+
+    budget = column("budget")
+    if budget is not None:
+        parts.append((_truthy(budget), "购车预算" + _text(budget) + "万"))
+
+    has_car = column("has_car")
+    if has_car is not None:
+        parts.append((
+            has_car.map(lambda v: not _is_missing(v)).astype(bool),
+            pd.Series(np.where(_truthy(has_car), "已有车", "无车"), index=df.index, dtype=object)
+        ))
+
+    intent = column("purchase_intent")
+    if intent is not None:
+        parts.append((_truthy(intent) & (intent.astype(object) != "无"), "购车意向: " + _text(intent)))
+
+    text = pd.Series("", index=df.index, dtype=object)
+    for mask, part in parts:
+        mask = mask.to_numpy()
+        if not mask.any():
+            continue
+        separator = np.where(text[mask].to_numpy() != "", "，", "")
+        text[mask] = text[mask] + separator + part[mask]
+
+    # 没有任何信息时使用用户ID
+    empty = (text == "").to_numpy()
+    if empty.any():
+        user_ids = column("user_id")
+        fallback = np.full(len(df), "未知", dtype=object)
+        if user_ids is not None:
+            fallback = np.where(user_ids.notna().to_numpy(), _text(user_ids).to_numpy(), fallback)
+        text[empty] = fallback[empty] + "用户"
+    return text
@@ -1,6 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import qa_routes, base_modeling_routes, sequence_mining_routes, causal_graph_routes, logical_behavior_routes
+from app.api import (
+    qa_routes, base_modeling_routes, sequence_mining_routes, causal_graph_routes, logical_behavior_routes,
+    flexible_import_routes
+)
 from app.core.config import settings
 from app.core.exceptions import (
     BusinessException,
@@ -10,6 +13,10 @@ from app.core.exceptions import (
 )
 from app.core.logger import app_logger
 from app.core.database import init_db
+from app.core.db_pool import get_pool_metrics
+from app.core.llm_transport import close_http_clients, llm_metrics
+from app.core.llm_cache import get_llm_cache
+from app.services.generation_jobs import generation_job_manager
 from fastapi import HTTPException
 
 app = FastAPI(
@@ -25,6 +32,13 @@ async def startup_event():
     app_logger.info("初始化数据库...")
     init_db()
     app_logger.info("数据库初始化完成")
+    await generation_job_manager.resume()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台生成任务并释放LLM HTTP连接"""
+    await generation_job_manager.shutdown()
+    await close_http_clients()
 
 # 注册异常处理器
 app.add_exception_handler(BusinessException, business_exception_handler)
@@ -44,12 +58,28 @@ app.include_router(base_modeling_routes.router, prefix="/api/v1")
 app.include_router(sequence_mining_routes.router, prefix="/api/v1")
 app.include_router(causal_graph_routes.router, prefix="/api/v1")
 app.include_router(logical_behavior_routes.router, prefix="/api/v1")
+app.include_router(flexible_import_routes.router)
 
 @app.get("/health")
 async def health():
     app_logger.info("健康检查请求")
     return {"status": "ok", "message": "广告知识图谱系统运行中"}
 
+@app.get("/health/db")
+async def health_db():
+    """SQLite连接池指标"""
+    return {"status": "ok", "pools": get_pool_metrics()}
+
+@app.get("/health/llm")
+async def health_llm():
+    """LLM调用指标（TTFT、tokens/s、并发数）和响应缓存统计"""
+    cache = get_llm_cache()
+    return {
+        "status": "ok",
+        "metrics": llm_metrics.snapshot(),
+        "cache": cache.get_stats() if cache is not None else None
+    }
+
 @app.get("/")
 async def root():
     return {
@@ -0,0 +1,122 @@
+"""
+导入批次写入基准测试
+
+对比 ImportBatchService.create_batch 的三种写入方式（临时数据库）:
+- 批量模式且不重复保存 raw_data
+- 批量模式：Core insert 分块写入
+- 逐条构造 ImportedUser 并 db.add（原路径）
+
+用法:
+    python scripts/benchmark_import_batch.py --users 100000 --chunk-size 5000
+"""
+import argparse
+import random
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.import_data import Base
+from app.services import import_batch_service
+from app.services.import_batch_service import ImportBatchService
+
+
+def generate_users(count: int, seed: int):
+    """生成带35个字段的模拟用户"""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "user_id": f"user_{i:07d}",
+            "age": rng.randint(18, 60),
+            "gender": rng.choice(["男", "女"]),
+            "education": rng.choice(["本科", "硕士", "大专"]),
+            "income_level": rng.choice(["高", "中", "低"]),
+            "city_tier": rng.choice(["一线", "二线", "三线"]),
+            "occupation": rng.choice(["白领", "教师", "工程师"]),
+            "has_house": rng.random() < 0.5,
+            "has_car": rng.random() < 0.5,
+            "phone_price": rng.choice(["3000以下", "3000-6000", "6000以上"]),
+            "marital_status": rng.choice(["已婚", "未婚"]),
+            "has_children": rng.random() < 0.5,
+            "commute_distance": rng.randint(1, 50),
+            "interests": rng.sample(["高尔夫", "旅游", "科技", "美食", "健身"], 2),
+            "behaviors": rng.sample(["浏览", "搜索", "比价", "到店"], 2),
+            "primary_brand": rng.choice(["宝马", "奔驰", "奥迪"]),
+            "primary_model": rng.choice(["5系", "E级", "A6L"]),
+            "brand_score": rng.randint(0, 100),
+            "purchase_intent": rng.choice(["首购", "换车", "增购"]),
+            "intent_score": rng.randint(0, 100),
+            "lifecycle_stage": rng.choice(["认知", "兴趣", "决策"]),
+            "app_open_count": rng.randint(0, 500),
+            "app_usage_duration": rng.randint(0, 10000),
+            "miniprogram_open_count": rng.randint(0, 100),
+            "car_search_count": rng.randint(0, 50),
+            "car_browse_count": rng.randint(0, 200),
+            "car_compare_count": rng.randint(0, 20),
+            "car_app_payment": rng.random() < 0.1,
+            "push_exposure": rng.randint(0, 100),
+            "push_click": rng.randint(0, 10),
+            "ad_exposure": rng.randint(0, 100),
+            "ad_click": rng.randint(0, 10),
+            "near_4s_store": rng.random() < 0.2,
+            "weather_info": rng.choice(["晴", "雨"]),
+            "consumption_frequency": rng.randint(0, 30),
+        }
+
+
+def measure(name: str, users: int, func):
+    # tracemalloc 会显著拖慢 JSON 序列化，这里用进程 RSS 峰值（单调）观察内存
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{name:<28} {elapsed:>8.2f}s  {users / elapsed:>10.0f} 行/秒  进程RSS峰值 {peak_mb:>8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入批次写入基准测试")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=import_batch_service.BULK_INSERT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'import_data.db'}")
+        Base.metadata.create_all(bind=engine)
+        factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        @contextmanager
+        def get_db():
+            db = factory()
+            try:
+                yield db
+                db.commit()
+            finally:
+                db.close()
+
+        import_batch_service.get_db = get_db
+        print(f"用户数={args.users}, chunk_size={args.chunk_size}\n")
+
+        def run(**kwargs):
+            ImportBatchService.create_batch(
+                "benchmark", 1, args.users, args.users, [], {},
+                generate_users(args.users, args.seed), **kwargs
+            )
+
+        # RSS峰值单调不减，逐条ORM路径（在会话中持有全部对象）放在最后
+        measure("批量 Core insert, 无raw_data", args.users,
+                lambda: run(chunk_size=args.chunk_size, store_raw_data=False))
+        measure("批量 Core insert", args.users, lambda: run(chunk_size=args.chunk_size))
+        measure("逐条 ORM db.add（原路径）", args.users, lambda: run(bulk=False))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
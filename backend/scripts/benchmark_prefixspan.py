@@ -0,0 +1,84 @@
+"""
+PrefixSpan 基准测试
+
+对比内置伪投影 PrefixSpan（frequent / top-k）与原有路径：
+- prefixspan 第三方库：先挖掘全部模式再按 max_length 过滤（已安装时）
+- 库缺失时的连续子序列暴力挖掘
+
+用法:
+    python scripts/benchmark_prefixspan.py --users 5000 --events 60 --max-length 4 --min-support 250
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.prefixspan import PrefixSpanMiner
+from app.services.sequence_mining import SequenceMiningService
+from app.services.sequence_store import EncodedSequences
+
+
+def generate_sequences(users: int, vocab: int, avg_length: int, seed: int):
+    """生成带有偏斜分布的随机行为序列"""
+    rng = random.Random(seed)
+    events = [f"事件{i}" for i in range(vocab)]
+    weights = [1.0 / (i + 1) for i in range(vocab)]
+    return [
+        rng.choices(events, weights=weights, k=max(1, int(rng.gauss(avg_length, avg_length / 3))))
+        for _ in range(users)
+    ]
+
+
+def measure(name: str, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<36} {elapsed:>8.2f}s  峰值内存 {peak / 1024 / 1024:>8.1f}MB  模式数 {len(result)}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PrefixSpan 基准测试")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--vocab", type=int, default=50)
+    parser.add_argument("--events", type=int, default=60, help="平均序列长度")
+    parser.add_argument("--min-support", type=int, default=250)
+    parser.add_argument("--max-length", type=int, default=4)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sequences = generate_sequences(args.users, args.vocab, args.events, args.seed)
+    store = EncodedSequences.from_sequences(sequences)
+    print(f"用户数={len(store)}, 事件数={store.total_events}, 词表={store.vocab_size}, "
+          f"min_support={args.min_support}, max_length={args.max_length}\n")
+
+    miner = PrefixSpanMiner(store)
+    measure("内置 PrefixSpan frequent", lambda: miner.frequent(args.min_support, args.max_length))
+    measure(f"内置 PrefixSpan top-{args.top_k}", lambda: miner.topk(
+        args.top_k, args.min_support, args.max_length, accept=lambda p: len(p) >= 2
+    ))
+
+    try:
+        from prefixspan import PrefixSpan
+        measure("prefixspan库 frequent + 长度过滤", lambda: [
+            (s, p) for s, p in PrefixSpan(sequences).frequent(args.min_support)
+            if len(p) <= args.max_length
+        ])
+    except ImportError:
+        print("prefixspan库未安装，原路径回退到连续子序列暴力挖掘")
+        service = SequenceMiningService()
+        measure("连续子序列挖掘（原回退路径）", lambda: service._simple_frequent_mining(
+            store, args.min_support, args.max_length
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+测试共用fixture
+"""
+import pytest
+
+from app.core.persistence import GraphPersistence
+
+
+@pytest.fixture
+def graph_db_path(tmp_path):
+    """按正式表结构（GraphPersistence 初始化）建立的空数据库，返回路径；测试数据由各测试自行写入"""
+    db_path = tmp_path / "graph.db"
+    GraphPersistence(str(db_path))
+    return db_path
@@ -0,0 +1,92 @@
+"""
+批量事件抽象单元测试 - 所有用户的子批次并发执行，合并后保持每个用户的事件顺序
+"""
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.openai_client import OpenAIClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = OpenAIClient()
+    state = {"active": 0, "max_active": 0, "calls": 0}
+
+    async def fake_single_batch(user_behaviors, user_profiles=None):
+        (user_id, behaviors), = user_behaviors.items()
+        state["calls"] += 1
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        # 越靠前的子批次越慢，完成顺序与提交顺序相反
+        await asyncio.sleep(0.02 * (10 - int(behaviors[0]["seq"]) // 3 % 10))
+        state["active"] -= 1
+        events = [{"event_type": b["seq"], "timestamp": "", "context": {}, "category": "engagement"}
+                  for b in behaviors]
+        return {"events": {user_id: events}, "llm_response": f"{user_id}:{behaviors[0]['seq']}"}
+
+    monkeypatch.setattr(client, "_abstract_events_single_batch", fake_single_batch)
+    client.state = state
+    return client
+
+
+def _behaviors(n):
+    return [{"seq": str(i), "behavior_text": f"浏览{i}", "timestamp": ""} for i in range(n)]
+
+
+def test_batches_run_concurrently_and_merge_in_order(client):
+    user_behaviors = {"u1": _behaviors(10), "u2": _behaviors(4), "u3": []}
+    result = asyncio.run(client.abstract_events_batch(user_behaviors, batch_size=3, concurrency=3))
+
+    assert client.state["calls"] == 4 + 2
+    assert client.state["max_active"] == 3
+    assert [e["event_type"] for e in result["events"]["u1"]] == [str(i) for i in range(10)]
+    assert [e["event_type"] for e in result["events"]["u2"]] == ["0", "1", "2", "3"]
+    assert result["events"]["u3"] == []
+    assert result["llm_response"].count("---") == 5
+
+
+def test_iter_yields_as_completed(client):
+    async def collect():
+        return [item async for item in client.iter_abstract_events({"u1": _behaviors(9)}, batch_size=3)]
+
+    items = asyncio.run(collect())
+    assert [item["batch_index"] for item in items] == [2, 1, 0]
+    assert all(item["batch_count"] == 3 for item in items)
+
+
+def test_truncated_batch_is_split(monkeypatch):
+    client = OpenAIClient()
+    sizes = []
+
+    async def fake_single_batch(user_behaviors, user_profiles=None):
+        (user_id, behaviors), = user_behaviors.items()
+        sizes.append(len(behaviors))
+        events = [{"event_type": b["seq"], "timestamp": "", "context": {}, "category": "engagement"}
+                  for b in behaviors]
+        # 超过4条时输出被截断，只返回前一部分事件
+        truncated = len(behaviors) > 4
+        return {"events": {user_id: events[:4]}, "llm_response": "", "truncated": truncated}
+
+    monkeypatch.setattr(client, "_abstract_events_single_batch", fake_single_batch)
+    result = asyncio.run(client.abstract_events_batch({"u1": _behaviors(10)}, batch_size=10))
+
+    assert sizes[:3] == [10, 5, 5] and sorted(sizes[3:]) == [2, 2, 3, 3]
+    assert [e["event_type"] for e in result["events"]["u1"]] == [str(i) for i in range(10)]
+
+
+@pytest.mark.parametrize("finish_reason, truncated", [("length", True), ("stop", False)])
+def test_single_batch_truncation_from_finish_reason(finish_reason, truncated, monkeypatch):
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    client = OpenAIClient()
+
+    async def fake_stream(prompt, model, max_tokens, temperature, timeout_seconds, status=None):
+        yield "u1|浏览车型|2026-01-01 10:00|汽车之家|engagement"
+        status["finish_reason"] = finish_reason
+
+    client._stream_chat = fake_stream
+    result = asyncio.run(client._abstract_events_single_batch({"u1": _behaviors(2)}))
+
+    assert result["truncated"] is truncated
+    assert [e["event_type"] for e in result["events"]["u1"]] == ["浏览车型"]
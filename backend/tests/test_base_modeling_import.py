@@ -0,0 +1,117 @@
+"""
+基础建模批量导入单元测试 - 按列 executemany 写入，画像文本按列生成且与逐行格式化一致
+"""
+import json
+import random
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from app.services import base_modeling
+from app.services.base_modeling import BaseModelingService
+from app.utils.profile_formatter import format_profile_text, format_profile_texts
+
+
+@pytest.fixture
+def service(tmp_path):
+    db_path = tmp_path / "graph.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE behavior_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, action TEXT, timestamp TEXT, behavior_text TEXT)""")
+    conn.execute("""CREATE TABLE user_profiles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT UNIQUE NOT NULL, age INTEGER, gender TEXT,
+        city TEXT, occupation TEXT, properties TEXT, profile_text TEXT)""")
+    conn.commit()
+    conn.close()
+
+    service = BaseModelingService()
+    service.db_path = db_path
+    return service
+
+
+def _rows(service, sql):
+    conn = sqlite3.connect(service.db_path)
+    rows = conn.execute(sql).fetchall()
+    conn.close()
+    return rows
+
+
+def _clean(record):
+    """逐行参考实现的输入：去掉缺失值，整数值浮点还原为整数"""
+    cleaned = {}
+    for key, value in record.items():
+        if value is None or (isinstance(value, float) and value != value):
+            continue
+        cleaned[key] = int(value) if isinstance(value, float) and value.is_integer() else value
+    return cleaned
+
+
+def _random_profiles(n, seed=5):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "user_id": [f"user_{i}" for i in range(n)],
+        "age": [rng.choice([None, 0, 28, 35]) for _ in range(n)],
+        "gender": [rng.choice([None, "", "男", "女"]) for _ in range(n)],
+        "city": [rng.choice([None, "上海", "北京"]) for _ in range(n)],
+        "income": [rng.choice([None, 0, 8000, 25000, 123456]) for _ in range(n)],
+        "interests": [rng.choice([None, "", "高尔夫,旅游"]) for _ in range(n)],
+        "has_car": [rng.choice([None, True, False]) for _ in range(n)],
+        "purchase_intent": [rng.choice([None, "无", "换车"]) for _ in range(n)],
+    })
+
+
+def test_format_profile_texts_matches_row_formatter():
+    df = _random_profiles(400)
+    expected = [format_profile_text(_clean(record)) for record in df.to_dict("records")]
+    assert format_profile_texts(df).tolist() == expected
+
+    df["properties"] = [json.dumps({"budget": 30})] * len(df)
+    expected = [format_profile_text(_clean(record)) for record in df.to_dict("records")]
+    assert format_profile_texts(df).tolist() == expected
+
+
+def test_behavior_import_chunks(service, monkeypatch):
+    monkeypatch.setattr(base_modeling, "BULK_INSERT_CHUNK_SIZE", 7)
+    behaviors = [
+        {"user_id": f"u{i % 3}", "timestamp": f"2026-01-01 00:00:{i:02d}",
+         "behavior_text": None if i % 5 == 0 else f"浏览{i}", "action": "browse"}
+        for i in range(30)
+    ]
+    result = service.import_behavior_data(pd.DataFrame(behaviors))
+    assert result["success"] and result["saved_count"] == 30 and result["rows_per_sec"] > 0
+
+    assert _rows(service, "SELECT user_id, timestamp, behavior_text, action FROM behavior_data ORDER BY id") == [
+        (b["user_id"], b["timestamp"], b["behavior_text"], "unstructured") for b in behaviors
+    ]
+    assert service.import_behavior_data(behaviors)["saved_count"] == 30
+
+
+def test_profile_import(service, monkeypatch):
+    monkeypatch.setattr(base_modeling, "BULK_INSERT_CHUNK_SIZE", 50)
+    df = _random_profiles(120)
+    df.loc[3, "user_id"] = None
+    df["profile_text"] = None
+    df.loc[4, "profile_text"] = "自定义描述"
+    df = pd.concat([df, df.iloc[[10]].assign(city="深圳")], ignore_index=True)
+
+    result = service.import_user_profiles(df)
+    assert result["success"] and result["saved_count"] == 120
+
+    stored = {row[0]: row[1:] for row in _rows(
+        service, "SELECT user_id, age, city, properties, profile_text FROM user_profiles"
+    )}
+    assert len(stored) == 119 and stored["user_10"][1] == "深圳"
+
+    for record in df.drop(index=10).to_dict("records"):
+        if pd.isna(record["user_id"]):
+            continue
+        cleaned = _clean(record)
+        age, city, properties, profile_text = stored[record["user_id"]]
+        assert age == cleaned.get("age") and city == cleaned.get("city")
+        expected_properties = {
+            key: cleaned[key] for key in base_modeling.PROFILE_PROPERTY_KEYS if key in cleaned
+        }
+        assert (json.loads(properties) if properties else {}) == expected_properties
+        assert profile_text == cleaned.get("profile_text") or profile_text == format_profile_text(cleaned)
+    assert stored["user_4"][3] == "自定义描述"
@@ -0,0 +1,107 @@
+"""
+CSR紧凑图存储单元测试 - 与 NetworkX 后端的查询结果一致、增量边与压缩、快照序列化
+"""
+import pickle
+import random
+
+import pytest
+
+import app.core.csr_graph as csr_graph_module
+from app.core.csr_graph import CSRGraph
+from app.core.graph_db import GraphDatabase
+
+
+def _populate(graph, seed=7, users=60, brands=8):
+    rng = random.Random(seed)
+    graph.batch_create_entities(
+        [{"id": f"user:{i}", "type": "User", "properties": {"gender": rng.choice(["男", "女"]), "age": 20 + i % 30}}
+         for i in range(users)]
+        + [{"id": f"brand:{i}", "type": "Brand", "properties": {"name": f"品牌{i}"}} for i in range(brands)]
+    )
+    relations = []
+    for i in range(users):
+        for _ in range(rng.randint(0, 3)):
+            relations.append({"from": f"user:{i}", "to": f"brand:{rng.randrange(brands)}",
+                              "type": "PREFERS", "properties": {"weight": round(rng.random(), 3)}})
+        if rng.random() < 0.5:
+            relations.append({"from": f"user:{i}", "to": f"user:{rng.randrange(users)}",
+                              "type": "KNOWS", "properties": {"weight": 0.5, "since": 2020}})
+    graph.batch_create_relations(relations)
+    return graph
+
+
+@pytest.fixture
+def graphs():
+    return (
+        _populate(GraphDatabase(enable_persistence=False, backend="networkx")),
+        _populate(GraphDatabase(enable_persistence=False, backend="csr")),
+    )
+
+
+def test_queries_match_networkx(graphs):
+    nx_graph, csr_graph = graphs
+    assert csr_graph.knowledge_graph.number_of_nodes() == nx_graph.knowledge_graph.number_of_nodes()
+    assert csr_graph.knowledge_graph.number_of_edges() == nx_graph.knowledge_graph.number_of_edges()
+
+    for node in ["user:0", "user:5", "brand:3"]:
+        assert csr_graph.find_related(node, depth=2) == nx_graph.find_related(node, depth=2)
+        key = lambda edge: (edge["id"], edge["type"], edge["weight"])
+        assert sorted(csr_graph.neighbors(node), key=key) == sorted(nx_graph.neighbors(node), key=key)
+    for source, target in [("user:1", "brand:2"), ("user:3", "user:40"), ("brand:0", "user:0")]:
+        assert len(csr_graph.find_path(source, target)) == len(nx_graph.find_path(source, target))
+
+    # 遍历顺序不同（networkx 按源节点分组），比较全部结果
+    edge_key = lambda rel: (rel["from"], rel["to"], rel["type"], rel["weight"])
+    for rel_type in (None, "KNOWS"):
+        assert (sorted(csr_graph.query_relations(rel_type, limit=500), key=edge_key)
+                == sorted(nx_graph.query_relations(rel_type, limit=500), key=edge_key))
+    assert {rel["type"] for rel in csr_graph.query_relations("KNOWS", limit=5)} == {"KNOWS"}
+    assert csr_graph.find_entities("User", {"gender": "男"}) == nx_graph.find_entities("User", {"gender": "男"})
+    assert csr_graph.knowledge_graph.nodes["user:3"] == nx_graph.knowledge_graph.nodes["user:3"]
+
+
+def test_node_update_and_entity_index(graphs):
+    for graph in graphs:
+        graph.create_entity("user:0", "User", {"age": 99})
+        assert graph.knowledge_graph.nodes["user:0"]["age"] == 99
+        assert "gender" in graph.knowledge_graph.nodes["user:0"]  # 合并属性
+        assert graph.entity_index["User"].count("user:0") == 1
+        assert "type:User" not in graph.entity_index
+
+
+def test_pending_edges_and_compaction(monkeypatch):
+    monkeypatch.setattr(csr_graph_module, "COMPACT_MIN_PENDING", 3)
+    graph = CSRGraph()
+    graph.add_edge("a", "b", type="R", weight=1.0)
+    graph.add_edge("a", "c", type="R")
+    assert [n for n, _ in graph.iter_adjacent("a")] == ["b", "c"]  # 增量表
+
+    for target in ["d", "e", "f"]:
+        graph.add_edge("a", target, type="S", flag=True)
+    assert graph._csr_edges == 0
+    assert graph.has_edge("a", "f")  # 触发压缩
+    assert graph._csr_edges == 5
+
+    graph.add_edge("g", "a", type="R")
+    assert graph.out_edges("a", "S")[0] == ("d", {"type": "S", "flag": True})
+    assert graph.edges_of_type("R").tolist() == [0, 1, 5]
+    assert graph.has_edge("a", "e") and not graph.has_edge("e", "a")
+    assert list(graph.iter_adjacent("a")) == [("b", "R"), ("c", "R"), ("d", "S"), ("e", "S"), ("f", "S")]
+    assert list(graph.iter_adjacent("a", outgoing=False)) == [("g", "R")]
+    assert graph.type_of("a") is None and graph.type_of("missing") is None
+
+
+def test_pickle_roundtrip():
+    graph = CSRGraph()
+    graph.add_nodes_from([("u1", {"type": "User", "city": "北京"}), ("u2", {"type": "User"})])
+    graph.add_edge("u1", "u2", type="KNOWS", weight=0.5)
+    restored = pickle.loads(pickle.dumps(graph))
+    assert restored.nodes["u1"] == {"type": "User", "city": "北京"}
+    assert list(restored.edges(data=True)) == [("u1", "u2", {"type": "KNOWS", "weight": 0.5})]
+    restored.add_edge("u2", "u1")
+    assert list(restored.iter_adjacent("u2")) == [("u1", None)]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        GraphDatabase(enable_persistence=False, backend="neo4j")
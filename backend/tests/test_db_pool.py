@@ -0,0 +1,92 @@
+"""
+SQLite连接池单元测试
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from app.core.db_pool import SQLiteConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLiteConnectionPool(tmp_path / "pool.db")
+    with pool.write() as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    yield pool
+    pool.close()
+
+
+def test_pragmas_configured(pool):
+    """WAL和synchronous=NORMAL在建连时配置"""
+    with pool.write() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    with pool.read() as conn:
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] < 0
+
+
+def test_read_connection_is_per_thread_and_read_only(pool):
+    """每个线程复用自己的只读连接"""
+    with pool.read() as first:
+        pass
+    with pool.read() as second:
+        assert first is second
+        with pytest.raises(sqlite3.OperationalError):
+            second.execute("INSERT INTO items (name) VALUES ('x')")
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(pool._get_read_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+    assert pool.get_metrics()["read_connections"] == 2
+
+
+def test_write_commits_and_rolls_back(pool):
+    """写连接正常退出提交，异常回滚"""
+    with pool.write() as conn:
+        conn.execute("INSERT INTO items (name) VALUES ('a')")
+    with pytest.raises(RuntimeError):
+        with pool.write() as conn:
+            conn.execute("INSERT INTO items (name) VALUES ('b')")
+            raise RuntimeError("boom")
+
+    with pool.read() as conn:
+        names = [row[0] for row in conn.execute("SELECT name FROM items")]
+    assert names == ["a"]
+
+
+def test_concurrent_writers_are_serialized(pool):
+    """多线程写入串行化，记录等待与持有时间"""
+    def worker(n):
+        for i in range(20):
+            with pool.write() as conn:
+                conn.execute("INSERT INTO items (name) VALUES (?)", (f"{n}-{i}",))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with pool.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 80
+
+    metrics = pool.get_metrics()
+    assert metrics["write_checkouts"] == 81
+    assert metrics["write_hold_ms_total"] > 0
+    assert metrics["busy_retries"] == 0
+
+
+def test_in_memory_pool_shares_connection():
+    """内存数据库读写共用同一连接"""
+    pool = SQLiteConnectionPool(":memory:")
+    with pool.write() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.read() as conn:
+        assert conn.execute("SELECT x FROM t").fetchone()[0] == 1
+    pool.close()
@@ -0,0 +1,94 @@
+"""
+实体搜索索引单元测试 - 中文子串/英文前缀匹配、类型过滤、相关度排序、与图数据库同步
+"""
+import json
+import sqlite3
+
+import pytest
+
+from app.core.entity_search import EntitySearchIndex, build_match_query
+from app.core.graph_db import GraphDatabase
+
+
+@pytest.fixture
+def index(tmp_path):
+    return EntitySearchIndex(tmp_path / "graph.db")
+
+
+@pytest.fixture
+def graph(index):
+    graph = GraphDatabase(enable_persistence=False, search_index=index)
+    graph.batch_create_entities([
+        {"id": "brand:宝马", "type": "Brand", "properties": {"name": "宝马", "country": "德国"}},
+        {"id": "brand:BMW_M", "type": "Brand", "properties": {"name": "BMW M系列"}},
+        {"id": "interest:汽车改装", "type": "Interest", "properties": {"name": "汽车改装"}},
+        {"id": "user_001", "type": "User", "properties": {"name": "张三", "interest": "宝马汽车", "age": 35}},
+        {"id": "user_002", "type": "User", "properties": {"name": "李四", "tags": ["宝马"]}},
+    ])
+    return graph
+
+
+def _ids(result):
+    return [entity["id"] for entity in result["entities"]]
+
+
+def test_build_match_query():
+    assert build_match_query("宝马 X5") == '"宝 马 X5"*'
+    assert build_match_query("user_001") == '"user 001"*'
+    assert build_match_query("  !! ") is None
+
+
+def test_search_ranks_and_filters(graph):
+    result = graph.search_entities("宝马")
+    # ID命中的实体排在属性命中之前；非字符串属性（列表）不参与检索
+    assert _ids(result) == ["brand:宝马", "user_001"]
+    assert result["total"] == 2
+    assert result["entities"][1]["properties"]["interest"] == "宝马汽车"
+    assert result["entities"][0]["score"] > result["entities"][1]["score"]
+
+    assert _ids(graph.search_entities("宝马", entity_type="User")) == ["user_001"]
+    assert _ids(graph.search_entities("汽车")) == ["interest:汽车改装", "user_001"]
+    assert _ids(graph.search_entities("bm")) == ["brand:BMW_M"]
+    assert sorted(_ids(graph.search_entities("USER_00", limit=5))) == ["user_001", "user_002"]
+    assert _ids(graph.search_entities("35")) == ["user_001"]
+    assert graph.search_entities("奔驰")["total"] == 0
+
+
+def test_total_counts_beyond_limit(graph):
+    result = graph.search_entities("user", limit=1)
+    assert len(result["entities"]) == 1 and result["total"] == 2
+
+
+def test_upsert_replaces_and_clear(graph, index):
+    graph.create_entity("user_001", "User", {"name": "张三", "interest": "奔驰"})
+    assert _ids(graph.search_entities("宝马")) == ["brand:宝马"]
+    assert _ids(graph.search_entities("奔驰")) == ["user_001"]
+
+    graph.clear_knowledge_graph()
+    assert graph.search_entities("宝马")["total"] == 0
+
+
+def test_rebuild_from_entities_table(tmp_path):
+    db_path = tmp_path / "graph.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE entities (id TEXT PRIMARY KEY, type TEXT NOT NULL, properties TEXT NOT NULL)")
+    conn.executemany("INSERT INTO entities VALUES (?, ?, ?)", [
+        (f"user_{i}", "User", json.dumps({"city": "北京" if i % 2 else "上海"}, ensure_ascii=False))
+        for i in range(100)
+    ])
+    conn.commit()
+    conn.close()
+
+    index = EntitySearchIndex(db_path)
+    assert not index.is_built()
+    assert index.rebuild() == 100
+    assert index.is_built()
+    result = index.search("北京", limit=10)
+    assert len(result["hits"]) == 10 and result["total"] == 50
+
+
+def test_scan_fallback_without_index():
+    graph = GraphDatabase(enable_persistence=False)
+    graph.create_entity("brand:宝马", "Brand", {"name": "宝马"})
+    graph.create_entity("brand:奔驰", "Brand", {"name": "奔驰"})
+    assert _ids(graph.search_entities("宝")) == ["brand:宝马"]
@@ -0,0 +1,82 @@
+"""
+流式CSV导入单元测试 - 分块向量化构建JSON，结果与分块大小无关
+"""
+import io
+import json
+import random
+import sqlite3
+
+import pytest
+
+from app.services.flexible_csv_importer import FlexibleCSVImporter
+
+
+@pytest.fixture
+def behavior_csv():
+    rng = random.Random(3)
+    lines = ["user_id,event_time,action,item,duration,app"]
+    for i in range(500):
+        duration = rng.choice(["", "120", "45"])
+        item = rng.choice(["宝马5系", "奔驰\"E级\"", "", "a\\b"])
+        time = f"2026-02-{rng.randint(1, 28):02d} 10:{i % 60:02d}:00"
+        if i % 97 == 0:
+            time = "not a time"
+        item_field = '"' + item.replace('"', '""') + '"' if item else ""
+        lines.append(f"user_{i % 40},{time},{rng.choice(['browse', 'search'])},{item_field},{duration},汽车之家")
+    return "\n".join(lines) + "\n"
+
+
+def _rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(sql).fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.mark.parametrize("batch_size", [7, 10000])
+def test_behavior_import(tmp_path, behavior_csv, batch_size):
+    db_path = str(tmp_path / "graph.db")
+    result = FlexibleCSVImporter(db_path).import_behavior_data(io.StringIO(behavior_csv), batch_size=batch_size)
+
+    assert result["total"] == 500
+    assert result["error"] == 6
+    assert result["success"] == 494
+    assert result["rows_per_sec"] > 0 and result["peak_rss_mb"] > 0
+
+    rows = _rows(db_path, "SELECT user_id, event_time, event_data FROM behavior_events ORDER BY id")
+    assert len(rows) == 494
+    for line, (user_id, event_time, event_data) in zip(
+        [line for line in behavior_csv.splitlines()[1:] if "not a time" not in line], rows
+    ):
+        assert line.startswith(user_id + "," + event_time + ",")
+        data = json.loads(event_data)
+        assert data["app"] == "汽车之家"
+        # 空值不写入，整数列不因缺失值变为浮点
+        assert "duration" not in data or isinstance(data["duration"], int)
+        assert "item" not in data or data["item"] in {"宝马5系", "奔驰\"E级\"", "a\\b"}
+
+
+def test_behavior_import_is_independent_of_chunking(tmp_path, behavior_csv):
+    outputs = []
+    for batch_size in (3, 10000):
+        db_path = str(tmp_path / f"graph_{batch_size}.db")
+        FlexibleCSVImporter(db_path).import_behavior_data(io.StringIO(behavior_csv), batch_size=batch_size)
+        outputs.append(_rows(db_path, "SELECT user_id, event_time, event_data FROM behavior_events ORDER BY id"))
+    assert outputs[0] == outputs[1]
+
+
+def test_missing_time_column(tmp_path):
+    with pytest.raises(ValueError, match="缺少时间列"):
+        FlexibleCSVImporter(str(tmp_path / "graph.db")).import_behavior_data(io.StringIO("user_id,action\n1,a\n"))
+
+
+def test_user_profiles_import(tmp_path):
+    db_path = str(tmp_path / "graph.db")
+    csv = "user_id,age,city,has_car\nu1,35,上海,是\nu2,,北京,\nu1,40,,否\n"
+    result = FlexibleCSVImporter(db_path).import_user_profiles(io.StringIO(csv), batch_size=2)
+
+    assert result["success"] == 3 and result["chunks"] == 2
+    assert dict(_rows(db_path, "SELECT user_id, profile_data FROM user_profiles_v2")) == {
+        "u1": json.dumps({"age": 40, "has_car": "否"}, ensure_ascii=False),
+        "u2": json.dumps({"city": "北京"}, ensure_ascii=False)
+    }
@@ -0,0 +1,159 @@
+"""
+逻辑行为生成任务队列单元测试 - 租约、失败退避重试、后台运行与重启恢复
+"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.services.generation_jobs import GenerationJobManager, GenerationJobQueue
+
+
+class FakeGenerator:
+    """记录每批处理的用户，fail_once 中的用户第一次失败"""
+
+    def __init__(self, fail_once=(), always_fail=()):
+        self.fail_once = set(fail_once)
+        self.always_fail = set(always_fail)
+        self.calls = []
+        self.uncached = []
+
+    async def generate_batch(self, user_ids, max_workers, use_cache=True):
+        self.calls.append(list(user_ids))
+        if not use_cache:
+            self.uncached.extend(user_ids)
+        results = []
+        for user_id in user_ids:
+            if user_id in self.always_fail or user_id in self.fail_once:
+                self.fail_once.discard(user_id)
+                results.append({"user_id": user_id, "status": "failed", "error": "LLM超时"})
+            else:
+                results.append({"user_id": user_id, "status": "success", "result": {}})
+        return {"results": results}
+
+    def processed(self):
+        return [user_id for batch in self.calls for user_id in batch]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "graph.db")
+
+
+def _users(n):
+    return [f"user_{i}" for i in range(n)]
+
+
+def _skip_backoff(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE generation_tasks SET next_attempt_at = 0 WHERE status = 'pending'")
+    conn.commit()
+    conn.close()
+
+
+def test_retry_backoff_and_final_failure(db_path):
+    queue = GenerationJobQueue(db_path, max_attempts=2, retry_backoff_seconds=60)
+    job_id = queue.create_job(_users(3), max_workers=2)
+
+    assert queue.lease(job_id, 2) == ["user_0", "user_1"]
+    queue.complete(job_id, [
+        {"user_id": "user_0", "status": "success"},
+        {"user_id": "user_1", "status": "failed", "error": "LLM超时"},
+    ])
+    status = queue.job_status(job_id)
+    assert (status["success_count"], status["pending_count"], status["retrying_count"]) == (1, 2, 1)
+
+    # user_1 处于退避期，只能租到 user_2
+    assert queue.lease(job_id, 10) == ["user_2"]
+    queue.complete(job_id, [{"user_id": "user_2", "status": "success"}])
+    assert queue.lease(job_id, 10) == []
+    assert 50 < queue.next_wakeup(job_id) <= 60
+
+    queue.complete(job_id, [{"user_id": "user_1", "status": "failed"}])  # 未租用，忽略
+    _skip_backoff(db_path)
+    assert queue.lease(job_id, 10) == ["user_1"]
+    queue.complete(job_id, [{"user_id": "user_1", "status": "failed", "error": "仍然超时"}])
+
+    assert queue.next_wakeup(job_id) is None
+    assert queue.failed_tasks(job_id) == [{"user_id": "user_1", "attempts": 2, "error": "仍然超时"}]
+
+
+def test_expired_lease_is_reclaimed(db_path):
+    queue = GenerationJobQueue(db_path, lease_seconds=60)
+    job_id = queue.create_job(_users(2), max_workers=1)
+    assert queue.lease(job_id, 2) == ["user_0", "user_1"]
+    assert queue.lease(job_id, 2) == []
+
+    queue.release(job_id, ["user_1"])
+    assert queue.lease(job_id, 2) == ["user_1"]
+
+    expired = GenerationJobQueue(db_path, lease_seconds=0)
+    assert expired.lease(job_id, 2) == []  # 续期中的租约不受影响
+    expired.renew(job_id, ["user_0"])
+    assert expired.lease(job_id, 2) == ["user_0"]
+
+
+def test_manager_runs_job_with_retries(db_path):
+    generator = FakeGenerator(fail_once={"user_3"}, always_fail={"user_5"})
+    queue = GenerationJobQueue(db_path, max_attempts=3, retry_backoff_seconds=0)
+    manager = GenerationJobManager(db_path, generator_factory=lambda: generator, queue=queue)
+
+    async def run():
+        job_id = await manager.submit(_users(8), max_workers=2)
+        await manager.wait(job_id)
+        return job_id
+
+    job_id = asyncio.run(run())
+    status = queue.job_status(job_id)
+    assert status["status"] == "completed"
+    assert (status["success_count"], status["failed_count"], status["pending_count"]) == (7, 1, 0)
+    assert generator.processed().count("user_3") == 2
+    assert generator.processed().count("user_5") == 3
+    # 重试跳过LLM响应缓存，首次处理不跳过
+    assert sorted(generator.uncached) == ["user_3", "user_5", "user_5"]
+    assert status["users_per_minute"] > 0
+
+
+def test_resume_skips_completed_users(db_path):
+    queue = GenerationJobQueue(db_path, lease_seconds=0)
+    job_id = queue.create_job(_users(6), max_workers=2)
+    # 重启前：3个用户已完成，1个用户处理中（租约已过期）
+    done = queue.lease(job_id, 3)
+    queue.complete(job_id, [{"user_id": user_id, "status": "success"} for user_id in done])
+    queue.lease(job_id, 1)
+
+    generator = FakeGenerator()
+    manager = GenerationJobManager(db_path, generator_factory=lambda: generator, queue=queue)
+
+    async def run():
+        assert await manager.resume() == [job_id]
+        await manager.wait(job_id)
+
+    asyncio.run(run())
+    assert sorted(generator.processed()) == ["user_3", "user_4", "user_5"]
+    assert queue.job_status(job_id)["success_count"] == 6
+    assert queue.running_job_ids() == []
+
+
+def test_cancel_releases_leases(db_path):
+    queue = GenerationJobQueue(db_path)
+
+    class SlowGenerator(FakeGenerator):
+        async def generate_batch(self, user_ids, max_workers, use_cache=True):
+            self.calls.append(list(user_ids))
+            await asyncio.sleep(3600)
+
+    generator = SlowGenerator()
+    manager = GenerationJobManager(db_path, generator_factory=lambda: generator, queue=queue)
+
+    async def run():
+        job_id = await manager.submit(_users(4), max_workers=1)
+        while not generator.calls:
+            await asyncio.sleep(0.01)
+        assert await manager.cancel(job_id)
+        return job_id
+
+    job_id = asyncio.run(run())
+    status = queue.job_status(job_id)
+    assert status["status"] == "cancelled"
+    assert (status["pending_count"], status["leased_count"]) == (4, 0)
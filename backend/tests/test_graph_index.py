@@ -0,0 +1,73 @@
+"""
+图数据库索引查询单元测试 - 类型化出边查询、二级属性索引求交与属性更新
+"""
+import pytest
+
+from app.core.graph_db import GraphDatabase
+
+
+@pytest.fixture
+def graph():
+    graph = GraphDatabase(enable_persistence=False)
+    cities = ["一线", "二线", "三线"]
+    graph.batch_create_entities([
+        {"id": f"user:{i}", "type": "User", "properties": {
+            "gender": "男" if i % 2 else "女",
+            "city_tier": cities[i % 3],
+            "income_level": "高" if i < 10 else "中",
+            "has_car": i % 4 == 0
+        }}
+        for i in range(30)
+    ] + [
+        {"id": "brand:宝马", "type": "Brand", "properties": {"name": "宝马"}},
+        {"id": "interest:自驾", "type": "Interest", "properties": {"name": "自驾"}},
+        {"id": "interest:改装", "type": "Interest", "properties": {"name": "改装"}},
+    ])
+    graph.batch_create_relations([
+        {"from": "brand:宝马", "to": "interest:自驾", "type": "CORRELATES", "properties": {"weight": 0.3}},
+        {"from": "brand:宝马", "to": "interest:改装", "type": "CORRELATES", "properties": {"weight": 0.7}},
+        {"from": "brand:宝马", "to": "user:1", "type": "TARGETS", "properties": {"weight": 0.1}},
+        {"from": "user:1", "to": "brand:宝马", "type": "PREFERS", "properties": {"weight": 0.9}},
+    ])
+    return graph
+
+
+def _ids(entities):
+    return sorted(entity["id"] for entity in entities)
+
+
+def _scan(graph, criteria):
+    return sorted(
+        eid for eid, data in graph.knowledge_graph.nodes(data=True)
+        if data.get("type") == "User" and all(data.get(k) == v for k, v in criteria.items())
+    )
+
+
+@pytest.mark.parametrize("criteria", [
+    {"gender": "男"},
+    {"gender": "男", "city_tier": "一线"},
+    {"gender": "女", "city_tier": "二线", "income_level": "高"},
+    {"gender": "男", "has_car": True},
+    {"has_car": True},
+    {"city_tier": "四线"},
+])
+def test_find_entities_matches_scan(graph, criteria):
+    assert _ids(graph.find_entities("User", criteria)) == _scan(graph, criteria)
+
+
+def test_find_entities_tracks_updates(graph):
+    assert "user:3" in _ids(graph.find_entities("User", {"city_tier": "一线"}))
+    graph.create_entity("user:3", "User", {"city_tier": "二线"})
+    assert "user:3" not in _ids(graph.find_entities("User", {"city_tier": "一线"}))
+    # add_node 合并属性：未更新的 gender 仍然有效
+    assert "user:3" in _ids(graph.find_entities("User", {"city_tier": "二线", "gender": "男"}))
+
+    graph.clear_knowledge_graph()
+    assert graph.find_entities("User", {"gender": "男"}) == []
+
+
+def test_neighbors_typed(graph):
+    assert {edge["id"] for edge in graph.neighbors("brand:宝马")} == {"interest:自驾", "interest:改装", "user:1"}
+    edges = graph.neighbors("brand:宝马", "CORRELATES")
+    assert sorted((edge["id"], edge["weight"]) for edge in edges) == [("interest:改装", 0.7), ("interest:自驾", 0.3)]
+    assert graph.neighbors("brand:不存在") == []
@@ -0,0 +1,91 @@
+"""
+知识图谱加载单元测试 - 分块加载无条数上限、快照复用与失效、后台加载
+"""
+import pytest
+
+import app.core.graph_db as graph_db_module
+from app.core.db_pool import get_pool
+from app.core.graph_db import GraphDatabase
+from app.core.persistence import GraphPersistence
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = GraphPersistence(str(tmp_path / "graph.db"))
+    monkeypatch.setattr(graph_db_module, "persistence", store)
+    monkeypatch.setattr(graph_db_module, "LOAD_CHUNK_SIZE", 7)
+    store.batch_save_entities(
+        [{"id": f"user:{i}", "type": "User", "properties": {"gender": "男" if i % 2 else "女"}} for i in range(40)]
+        + [{"id": "brand:宝马", "type": "Brand", "properties": {"name": "宝马"}}]
+    )
+    store.batch_save_relations(
+        [{"from": f"user:{i}", "to": "brand:宝马", "type": "PREFERS", "properties": {"weight": 0.9}} for i in range(40)]
+        + [{"from": "user:0", "to": "brand:不存在", "type": "PREFERS", "properties": {}}]
+    )
+    return store
+
+
+def _load(**kwargs):
+    graph = GraphDatabase(**kwargs)
+    assert graph.wait_until_loaded(timeout=10)
+    return graph
+
+
+def test_chunked_load_and_snapshot_reuse(store, monkeypatch):
+    graph = _load()
+    assert graph.snapshot_path.exists()
+    assert graph.knowledge_graph.number_of_nodes() == 41
+    assert graph.knowledge_graph.number_of_edges() == 40  # 端点不存在的关系被跳过
+    assert len(graph.find_entities("User", {"gender": "男"})) == 20
+    assert graph.neighbors("user:3")[0]["weight"] == 0.9
+
+    # 版本未变化：直接读取快照，不再查询实体和关系
+    def fail(*args, **kwargs):
+        raise AssertionError("不应从数据库加载")
+
+    monkeypatch.setattr(store, "iter_knowledge_graph", fail)
+    cached = _load(background_load=False)
+    assert cached.knowledge_graph.number_of_nodes() == 41
+    assert cached.relation_index["PREFERS"] == graph.relation_index["PREFERS"]
+    assert len(cached.find_entities("User", {"gender": "女"})) == 20
+
+
+def test_snapshot_invalidated_by_writes(store):
+    _load()
+    version = store.get_graph_version()
+    store.save_entity("user:new", "User", {"gender": "男"})
+    assert store.get_graph_version() != version
+
+    graph = _load()
+    assert graph.knowledge_graph.has_node("user:new")
+    assert len(graph.find_entities("User", {"gender": "男"})) == 21
+
+
+def test_corrupt_snapshot_falls_back_to_database(store):
+    graph = _load()
+    graph.snapshot_path.write_bytes(b"not a pickle")
+    assert _load(background_load=False).knowledge_graph.number_of_nodes() == 41
+
+
+def test_writes_wait_for_background_load(store):
+    graph = GraphDatabase()
+    graph.create_entity("user:late", "User", {"gender": "女"})
+    assert graph.knowledge_graph.number_of_nodes() == 42
+
+
+def test_missing_version_is_seeded_and_snapshot_written(store, monkeypatch):
+    # 旧数据库：有实体和关系但没有 kg_version
+    with get_pool(store.db_path).write() as conn:
+        conn.execute("DELETE FROM graph_meta WHERE key = 'kg_version'")
+
+    graph = _load()
+    version = store.get_graph_version()
+    assert version is not None
+    assert graph.snapshot_path.exists()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("不应从数据库加载")
+
+    monkeypatch.setattr(store, "iter_knowledge_graph", fail)
+    assert _load(background_load=False).knowledge_graph.number_of_nodes() == 41
+    assert store.get_graph_version() == version
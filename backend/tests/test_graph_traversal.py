@@ -0,0 +1,122 @@
+"""
+多跳遍历引擎单元测试 - 扇出上限、提前结束、分页、多起点、双向最短路径
+"""
+import random
+
+import networkx as nx
+import pytest
+
+from app.core.graph_db import GraphDatabase
+
+
+def _hub_graph(backend):
+    """hub 有 300 个 FOLLOWS 入边和 20 个 OWNS 出边，每个粉丝再关注 2 个用户"""
+    graph = GraphDatabase(enable_persistence=False, backend=backend)
+    graph.batch_create_entities(
+        [{"id": "hub", "type": "App", "properties": {}}]
+        + [{"id": f"fan:{i}", "type": "User", "properties": {}} for i in range(300)]
+        + [{"id": f"item:{i}", "type": "Item", "properties": {}} for i in range(20)]
+    )
+    relations = [{"from": f"fan:{i}", "to": "hub", "type": "FOLLOWS"} for i in range(300)]
+    relations += [{"from": "hub", "to": f"item:{i}", "type": "OWNS"} for i in range(20)]
+    relations += [{"from": f"fan:{i}", "to": f"fan:{(i + k) % 300}", "type": "KNOWS"}
+                  for i in range(300) for k in (1, 2)]
+    graph.batch_create_relations(relations)
+    return graph
+
+
+def _random_graph(backend, seed=3, nodes=200, edges=500):
+    rng = random.Random(seed)
+    graph = GraphDatabase(enable_persistence=False, backend=backend)
+    graph.batch_create_entities([{"id": f"n{i}", "type": "Node", "properties": {}} for i in range(nodes)])
+    graph.batch_create_relations([
+        {"from": f"n{rng.randrange(nodes)}", "to": f"n{rng.randrange(nodes)}", "type": "LINK"}
+        for _ in range(edges)
+    ])
+    return graph
+
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_fanout_caps_and_truncation(backend):
+    graph = _hub_graph(backend)
+    result = graph.expand(["hub"], depth=1, fanout=10, limit=None)
+    vias = [node["via"] for node in result["nodes"]]
+    assert vias.count("OWNS") == 10 and vias.count("FOLLOWS") == 10
+    assert result["hop_counts"] == {1: 20}
+
+    result = graph.expand(["hub"], depth=1, fanout=10, fanout_per_type={"OWNS": 3}, rel_types=["OWNS"], limit=None)
+    assert [node["via"] for node in result["nodes"]] == ["OWNS"] * 3
+    assert all(node["type"] == "Item" for node in result["nodes"])
+
+    result = graph.expand(["hub"], depth=1, direction="out", fanout=None, limit=None)
+    assert result["total"] == 20 and not result["truncated"]
+
+    # 单节点扫描上限：只读取部分边
+    result = graph.expand(["hub"], depth=1, direction="in", fanout=None, node_scan_limit=50, limit=None)
+    assert result["total"] == 50 and result["truncated"] and result["edges_scanned"] == 50
+
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_early_stop_and_pagination(backend):
+    graph = _hub_graph(backend)
+    result = graph.expand(["hub"], depth=3, fanout=None, max_nodes=100, limit=30, offset=10)
+    assert result["total"] == 100 and result["truncated"]
+    assert len(result["nodes"]) == 30 and sum(result["hop_counts"].values()) == 100
+    distances = [node["distance"] for node in graph.expand(["hub"], depth=3, fanout=None, limit=None)["nodes"]]
+    assert distances == sorted(distances)
+
+    result = graph.expand(["hub"], depth=2, fanout=None, max_edges=40, limit=None)
+    assert result["truncated"] and result["edges_scanned"] == 40
+
+    with pytest.raises(ValueError):
+        graph.expand(["hub"], direction="sideways")
+
+
+def test_multi_source_shares_visited():
+    graph = _hub_graph("networkx")
+    result = graph.expand(["fan:0", "fan:1", "missing"], depth=1, fanout=None, limit=None)
+    ids = [node["id"] for node in result["nodes"]]
+    assert len(ids) == len(set(ids))
+    assert "fan:0" not in ids and "fan:1" not in ids  # 起点不重复出现
+    assert {node["source"] for node in result["nodes"]} == {"fan:0", "fan:1"}
+    assert next(node for node in result["nodes"] if node["id"] == "fan:2")["source"] == "fan:0"
+
+
+def test_find_related_matches_plain_bfs():
+    graph = _random_graph("networkx")
+    nx_graph = graph.knowledge_graph
+    for node in ["n0", "n7", "n42"]:
+        # 参照实现：出边邻居在前，入边邻居在后，按距离由近到远
+        expected, visited, queue = [], {node}, [(node, 0)]
+        while queue and len(expected) < 50:
+            current, distance = queue.pop(0)
+            if distance >= 2:
+                continue
+            for neighbor in list(nx_graph.successors(current)) + list(nx_graph.predecessors(current)):
+                if neighbor not in visited and len(expected) < 50:
+                    visited.add(neighbor)
+                    expected.append({"id": neighbor, "type": "Node", "distance": distance + 1})
+                    queue.append((neighbor, distance + 1))
+        assert graph.find_related(node, depth=2) == expected
+
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_bidirectional_shortest_path(backend):
+    graph = _random_graph(backend)
+    reference = _random_graph("networkx").knowledge_graph
+    rng = random.Random(11)
+    for _ in range(50):
+        source, target = f"n{rng.randrange(200)}", f"n{rng.randrange(200)}"
+        path = graph.find_path(source, target)
+        try:
+            expected = nx.shortest_path(reference, source, target)
+        except nx.NetworkXNoPath:
+            assert path == []
+            continue
+        assert len(path) == len(expected) and path[0] == source and path[-1] == target
+        assert all(reference.has_edge(a, b) for a, b in zip(path, path[1:]))
+        if len(expected) > 2:
+            assert graph.find_path(source, target, max_depth=len(expected) - 2) == []
+
+    assert graph.find_path("n0", "missing") == []
+    assert graph.find_path("n0", "n0") == ["n0"]
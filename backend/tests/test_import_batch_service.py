@@ -0,0 +1,98 @@
+"""
+导入批次服务单元测试 - 批量写入与逐条ORM写入结果一致，流式读取批次用户
+"""
+import random
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.import_data import Base, ImportBatch, ImportedUser, USER_FIELDS
+from app.services import import_batch_service
+from app.services.import_batch_service import ImportBatchService
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'import_data.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    @contextmanager
+    def get_db():
+        db = factory()
+        try:
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    monkeypatch.setattr(import_batch_service, "get_db", get_db)
+    return factory
+
+
+def _users(n, seed=9):
+    rng = random.Random(seed)
+    return [
+        {
+            "user_id": f"user_{i}",
+            "age": rng.choice([None, 25, 40]),
+            "gender": rng.choice(["男", "女"]),
+            "has_car": rng.choice([True, False, None]),
+            "interests": rng.sample(["高尔夫", "旅游", "科技"], 2),
+            "ad_click": rng.randint(0, 9),
+            "extra_field": f"x{i}",
+        }
+        for i in range(n)
+    ]
+
+
+def _create(users, count=None, **kwargs):
+    count = len(users) if count is None else count
+    return ImportBatchService.create_batch(
+        "批次", 1, count, count, [{"name": "a.csv"}], {"user_id": "用户ID"}, users, **kwargs
+    )
+
+
+def _stored(factory, batch_id):
+    with factory() as db:
+        users = db.query(ImportedUser).filter(ImportedUser.batch_id == batch_id).order_by(ImportedUser.id).all()
+        return [(user.to_dict(), {field: getattr(user, field) for field in USER_FIELDS}) for user in users]
+
+
+def test_bulk_matches_orm_path(session_factory):
+    users = _users(23)
+    orm_batch = _create(users, bulk=False)
+    bulk_batch = _create(iter(users), count=len(users), chunk_size=5)
+
+    assert _stored(session_factory, bulk_batch.id) == _stored(session_factory, orm_batch.id)
+    assert ImportBatchService.get_batch_users(bulk_batch.id, limit=5, offset=20) == users[20:]
+    assert list(ImportBatchService.iter_batch_users(bulk_batch.id, chunk_size=4)) == users
+    with session_factory() as db:
+        assert db.get(ImportBatch, bulk_batch.id).status == "completed"
+
+
+def test_skip_raw_data(session_factory):
+    users = _users(7)
+    batch = _create(users, store_raw_data=False)
+
+    with session_factory() as db:
+        assert all(user.raw_data is None for user in db.query(ImportedUser).all())
+    expected = [{field: user.get(field) for field in USER_FIELDS} for user in users]
+    assert list(ImportBatchService.iter_batch_users(batch.id)) == expected
+
+
+def test_failed_chunk_marks_batch(session_factory):
+    users = _users(12)
+    users[8]["user_id"] = None  # 违反 NOT NULL 约束
+
+    with pytest.raises(Exception):
+        _create(users, chunk_size=5)
+    with session_factory() as db:
+        batch = db.query(ImportBatch).one()
+        assert batch.status == "failed"
+        assert db.query(ImportedUser).count() == 5
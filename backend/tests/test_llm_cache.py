@@ -0,0 +1,147 @@
+"""
+LLM响应缓存测试
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import llm_cache
+from app.core.config import settings
+from app.core.llm_cache import LLMResponseCache
+from app.core.openai_client import OpenAIClient
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(str(tmp_path / "llm_cache.db"), ttl_seconds=3600, max_bytes=1024)
+
+
+def test_key_depends_on_all_parameters():
+    base = LLMResponseCache.make_key("m", 0.3, 100, "prompt")
+    assert base == LLMResponseCache.make_key("m", 0.3, 100, "prompt")
+    assert base != LLMResponseCache.make_key("m2", 0.3, 100, "prompt")
+    assert base != LLMResponseCache.make_key("m", 0.5, 100, "prompt")
+    assert base != LLMResponseCache.make_key("m", 0.3, 200, "prompt")
+    assert base != LLMResponseCache.make_key("m", 0.3, 100, "prompt!")
+
+
+def test_get_set_and_ttl(cache, monkeypatch):
+    cache.set("k", "m", "响应")
+    assert cache.get("k") == "响应"
+    assert cache.get("missing") is None
+
+    now = llm_cache.time.time()
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now + 7200)
+    assert cache.get("k") is None
+    assert cache.get_stats()["total_entries"] == 0
+
+
+def test_miss_does_not_take_write_lock(cache, monkeypatch):
+    cache.set("k", "m", "响应")
+    pool = llm_cache.get_pool(cache.db_path)
+
+    def no_write():
+        raise AssertionError("未命中时不应获取写锁")
+
+    monkeypatch.setattr(pool, "write", no_write)
+    assert cache.get("missing") is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_hit_counters_thread_safe(cache):
+    cache.set("k", "m", "响应")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: cache.get("k" if i % 2 else "missing"), range(200)))
+
+    assert results.count("响应") == 100
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (100, 100)
+
+
+def test_lru_eviction_by_size(cache):
+    for key in ("a", "b", "c"):
+        cache.set(key, "m", "x" * 300)
+    # 访问a使其成为最近使用，写入d超出容量时应驱逐最久未使用的b
+    cache.get("a")
+    cache.set("d", "m", "x" * 300)
+
+    stats = cache.get_stats()
+    assert stats["total_bytes"] <= 1024
+    assert cache.get("a") is not None
+    assert cache.get("d") is not None
+    assert cache.get("b") is None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "llm_cache_enabled", True)
+    monkeypatch.setattr(settings, "llm_cache_path", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(llm_cache, "_llm_cache", None)
+
+    client = OpenAIClient()
+    client.calls = 0
+    client.finish_reason = "stop"
+
+    async def fake_stream(prompt, model, max_tokens, temperature, timeout_seconds, status=None):
+        client.calls += 1
+        for part in ("第一段", "第二段"):
+            yield part
+        status["finish_reason"] = client.finish_reason
+
+    client._stream_chat = fake_stream
+    return client
+
+
+@pytest.mark.asyncio
+async def test_chat_completion_replays_cached_stream(client):
+    first = await client._collect_stream_response(client.chat_completion("同一个prompt", max_tokens=100))
+    second_chunks = [c async for c in client.chat_completion("同一个prompt", max_tokens=100)]
+
+    assert first == "第一段第二段"
+    assert "".join(second_chunks) == first
+    assert client.calls == 1
+
+    # 参数不同或显式绕过缓存时重新调用
+    await client._collect_stream_response(client.chat_completion("同一个prompt", max_tokens=200))
+    await client._collect_stream_response(
+        client.chat_completion("同一个prompt", max_tokens=100, use_cache=False)
+    )
+    assert client.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_invalidate_cache(client):
+    await client._collect_stream_response(client.chat_completion("p", max_tokens=100))
+    await client.invalidate_cache("p", max_tokens=100)
+    await client._collect_stream_response(client.chat_completion("p", max_tokens=100))
+    assert client.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_truncated_response_not_cached(client):
+    client.finish_reason = "length"
+    status = {}
+    await client._collect_stream_response(client.chat_completion("p", max_tokens=100, status=status))
+    await client._collect_stream_response(client.chat_completion("p", max_tokens=100))
+    assert status == {"finish_reason": "length", "truncated": True}
+    assert client.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_truncation_follows_finish_reason(client):
+    # 估算长度已达到 max_tokens，但服务端报告正常结束，不视为截断
+    status = {}
+    await client._collect_stream_response(client.chat_completion("p", max_tokens=6, status=status))
+    assert status["truncated"] is False
+
+    cached = {}
+    await client._collect_stream_response(client.chat_completion("p", max_tokens=6, status=cached))
+    assert client.calls == 1 and cached["truncated"] is False
+
+
+@pytest.mark.asyncio
+async def test_unparseable_tag_response_invalidated(client):
+    apps = [{"app_id": "a1", "app_name": "微信", "category": "社交"}]
+    assert await client.generate_app_tags_batch(apps) == {"a1": []}
+    assert await client.generate_app_tags_batch(apps) == {"a1": []}
+    assert client.calls == 2  # 无法解析的响应不会从缓存回放
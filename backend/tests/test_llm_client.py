@@ -0,0 +1,61 @@
+"""
+LLM关系识别单元测试 - 输出被截断的批次拆小后重试
+"""
+import asyncio
+import json
+import re
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm_client import LLMRelationIdentifier
+
+
+@pytest.fixture
+def identifier(monkeypatch):
+    monkeypatch.setattr(settings, "llm_cache_enabled", False)
+    identifier = LLMRelationIdentifier()
+    identifier.sizes = []
+
+    async def fake_stream(prompt, model, max_tokens, temperature, timeout_seconds, status=None):
+        seqs = re.findall(r'"seq": (\d+)', prompt)
+        identifier.sizes.append(len(seqs))
+        relations = [{"from_id": f"user_{s}", "to_id": "item_001", "relation_type": "浏览"} for s in seqs]
+        response = json.dumps({"relations": relations})
+        if len(seqs) > 3:
+            # 超过3条时输出达到 max_tokens，JSON不完整
+            yield response[:len(response) // 2]
+            status["finish_reason"] = "length"
+            return
+        yield response
+        status["finish_reason"] = "stop"
+
+    identifier.llm_client._stream_chat = fake_stream
+    return identifier
+
+
+def test_truncated_batch_is_split_and_retried(identifier):
+    behaviors = [{"seq": i, "action": "浏览"} for i in range(10)]
+    relations = asyncio.run(
+        identifier.identify_relations_batch(behaviors, {"宝马X5": "item_001"}, batch_size=10)
+    )
+
+    assert identifier.sizes[0] == 10 and max(identifier.sizes[1:]) <= 5
+    assert sum(size for size in identifier.sizes if size <= 3) == 10  # 每条行为恰好在一个完整批次中
+    assert [r["from_id"] for r in relations] == [f"user_{i}" for i in range(10)]
+
+
+def test_planner_shrinks_after_truncation(identifier):
+    behaviors = [{"seq": i, "action": "浏览"} for i in range(4)]
+    scales = []
+    original = identifier._identify_batch
+
+    async def spy(batch, item_index, planner):
+        scales.append(planner.output_scale)
+        return await original(batch, item_index, planner)
+
+    identifier._identify_batch = spy
+    relations = asyncio.run(identifier.identify_relations_batch(behaviors, {}, batch_size=4))
+
+    assert len(relations) == 4
+    assert scales[0] == 1.0 and scales[1] > 1.0  # 截断后放大预期输出
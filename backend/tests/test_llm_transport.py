@@ -0,0 +1,166 @@
+"""
+LLM传输层测试 - 使用本地模拟的流式接口验证连接复用、并发限制和指标
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.core import llm_transport
+from app.core.config import settings
+from app.core.openai_client import OpenAIClient
+
+
+class FakeStreamingServer:
+    """最小化的HTTP/1.1 keep-alive SSE服务"""
+
+    def __init__(self, chunks, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in header.decode().split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                await reader.readexactly(length)
+                await self._respond(writer)
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer):
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n"
+            )
+            events = [{"choices": [{"delta": {"content": c}}]} for c in self.chunks]
+            events.append({"choices": [{"delta": {}, "finish_reason": "stop"}]})
+            events.append({"choices": [], "usage": {"completion_tokens": 7}})
+            for event in events:
+                await asyncio.sleep(self.delay)
+                self._write_chunk(writer, f"data: {json.dumps(event)}\n\n")
+                await writer.drain()
+            self._write_chunk(writer, "data: [DONE]\n\n")
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            self.active -= 1
+
+    @staticmethod
+    def _write_chunk(writer, text):
+        data = text.encode()
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+@pytest.fixture
+def client():
+    llm_transport.llm_metrics.reset()
+    client = OpenAIClient()
+    client.api_key = "test-key"
+    return client
+
+
+async def _call(client, prompt="hi", status=None):
+    return await client._collect_stream_response(
+        client._stream_chat(prompt, "test-model", 100, 0.0, 10.0, status)
+    )
+
+
+@pytest.mark.asyncio
+async def test_sequential_calls_reuse_connection(client):
+    """顺序调用复用同一个keep-alive连接"""
+    async with FakeStreamingServer(["你好", "，世界"]) as server:
+        client.base_url = server.base_url
+        results = [await _call(client) for _ in range(5)]
+        await llm_transport.close_http_clients()
+
+    assert results == ["你好，世界"] * 5
+    assert server.requests == 5
+    assert server.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limited_by_semaphore(client, monkeypatch):
+    """同时进行的请求数不超过 max_llm_workers"""
+    monkeypatch.setattr(settings, "max_llm_workers", 2)
+    await llm_transport.close_http_clients()
+
+    async with FakeStreamingServer(["a", "b", "c"], delay=0.01) as server:
+        client.base_url = server.base_url
+        results = await asyncio.gather(*[_call(client) for _ in range(8)])
+        await llm_transport.close_http_clients()
+
+    assert results == ["abc"] * 8
+    assert server.max_active <= 2
+    assert server.connections <= 2
+
+
+@pytest.mark.asyncio
+async def test_queued_calls_not_counted_in_flight(client, monkeypatch):
+    """等待并发槽位的调用计入 queued，不计入 in_flight"""
+    monkeypatch.setattr(settings, "max_llm_workers", 1)
+    await llm_transport.close_http_clients()
+
+    async with FakeStreamingServer(["a", "b"], delay=0.02) as server:
+        client.base_url = server.base_url
+        tasks = [asyncio.create_task(_call(client)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        snapshot = llm_transport.llm_metrics.snapshot()
+        await asyncio.gather(*tasks)
+        await llm_transport.close_http_clients()
+
+    assert snapshot["in_flight"] == 1
+    assert snapshot["queued"] == 2
+    final = llm_transport.llm_metrics.snapshot()
+    assert final["in_flight"] == 0 and final["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_recorded(client):
+    """记录TTFT、usage中的输出token数和吞吐"""
+    status = {}
+    async with FakeStreamingServer(["x"] * 4, delay=0.005) as server:
+        client.base_url = server.base_url
+        await _call(client, status=status)
+        await llm_transport.close_http_clients()
+
+    assert status == {"finish_reason": "stop"}
+
+    snapshot = llm_transport.llm_metrics.snapshot()
+    assert snapshot["total_calls"] == 1
+    assert snapshot["failed_calls"] == 0
+    assert snapshot["in_flight"] == 0
+    assert snapshot["total_output_tokens"] == 7
+    assert snapshot["ttft_p50"] is not None
+    assert snapshot["tokens_per_second_avg"] > 0
+
+
+def test_estimate_tokens():
+    assert llm_transport.estimate_tokens("") == 0
+    assert llm_transport.estimate_tokens("你好世界") == 4
+    assert llm_transport.estimate_tokens("abcdefgh") == 2
@@ -3,9 +3,14 @@
 """
 import pytest
 import asyncio
+import sqlite3
 from unittest.mock import Mock, AsyncMock, patch
+from app.services import logical_behavior
+from app.core import llm_cache
+from app.services.generation_jobs import GenerationJobManager, GenerationJobQueue
 from app.services.logical_behavior import LogicalBehaviorGenerator
 from app.core.openai_client import OpenAIClient
+from app.core.exceptions import LLMServiceError
 
 
 @pytest.fixture
@@ -188,3 +193,218 @@ def test_update_progress(generator):
     assert generator.progress["processed_users"] == 5
     assert generator.progress["success_count"] == 4
     assert generator.progress["failed_count"] == 1
+
+
+# ========== 批量生成流水线 ==========
+
+@pytest.fixture
+def pipeline_db(tmp_path):
+    db_path = tmp_path / "graph.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE user_profiles (user_id TEXT UNIQUE, age INTEGER, gender TEXT, city TEXT,
+            occupation TEXT, properties TEXT);
+        CREATE TABLE behavior_data (id INTEGER PRIMARY KEY, user_id TEXT, action TEXT, timestamp TEXT,
+            item_id TEXT, app_id TEXT, media_id TEXT, poi_id TEXT, duration INTEGER, properties TEXT);
+        CREATE TABLE app_tags (app_id TEXT, app_name TEXT, category TEXT, tags TEXT);
+        CREATE TABLE media_tags (media_id TEXT, media_name TEXT, media_type TEXT, tags TEXT);
+        CREATE TABLE logical_behaviors (id TEXT PRIMARY KEY, user_id TEXT, agent TEXT, scene TEXT,
+            action TEXT, object TEXT, start_time TEXT, end_time TEXT, raw_behavior_ids TEXT, confidence REAL);
+        CREATE TABLE logical_behavior_sequences (user_id TEXT PRIMARY KEY, status TEXT,
+            behavior_count INTEGER, error_message TEXT, updated_at TEXT);
+        INSERT INTO app_tags VALUES ('app_1', '汽车之家', '汽车资讯', '[]');
+        INSERT INTO media_tags VALUES ('m_1', '懂车帝', '短视频', '[]');
+    """)
+    for u in range(10):
+        user_id = f"user_{u}"
+        if u != 7:  # user_7 无画像
+            conn.execute("INSERT INTO user_profiles VALUES (?, 30, '男', '上海', '白领', ?)",
+                         (user_id, '{"interests": ["汽车"]}'))
+        for i in range(u % 4):  # user_0/4/8 无行为
+            conn.execute(
+                "INSERT INTO behavior_data (user_id, action, timestamp, app_id, media_id) VALUES (?, ?, ?, ?, ?)",
+                (user_id, "browse", f"2026-01-01 10:0{3 - i}:00", "app_1", "m_1" if i else None)
+            )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+@pytest.mark.asyncio
+async def test_generate_batch_pipeline(pipeline_db, monkeypatch):
+    monkeypatch.setattr(logical_behavior, "PREFETCH_CHUNK_SIZE", 4)
+    generator = LogicalBehaviorGenerator(llm_client=None, db_path=str(pipeline_db))
+    active = {"now": 0, "max": 0}
+
+    async def fake_llm(user_id, profile, behaviors, use_cache=True):
+        assert profile["interests"] == ["汽车"]
+        assert [b["timestamp"] for b in behaviors] == sorted(b["timestamp"] for b in behaviors)
+        assert all(b["app_name"] == "汽车之家" for b in behaviors)
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        if user_id == "user_5":
+            raise LLMServiceError("LLM生成失败")
+        return [
+            {"id": f"lb_{user_id}_{i}", "user_id": user_id, "agent": "", "scene": "", "action": b["action"],
+             "object": b.get("media_name") or "", "start_time": b["timestamp"], "end_time": b["timestamp"],
+             "raw_behavior_ids": str(b["id"]), "confidence": 0.9}
+            for i, b in enumerate(behaviors)
+        ]
+
+    monkeypatch.setattr(generator, "_generate_logical_behaviors", fake_llm)
+    user_ids = [f"user_{u}" for u in range(10)]
+    result = await generator.generate_batch(user_ids, max_workers=3)
+
+    failed = {"user_5", "user_7"}
+    assert [r["user_id"] for r in result["results"]] == user_ids
+    assert [r["status"] for r in result["results"]] == ["failed" if u in failed else "success" for u in user_ids]
+    assert result["success_count"] == 8 and result["failed_count"] == 2
+    assert generator.get_progress()["processed_users"] == 10
+    assert 1 < active["max"] <= 3
+
+    conn = sqlite3.connect(pipeline_db)
+    statuses = dict(conn.execute("SELECT user_id, status FROM logical_behavior_sequences").fetchall())
+    counts = dict(conn.execute("SELECT user_id, COUNT(*) FROM logical_behaviors GROUP BY user_id").fetchall())
+    conn.close()
+    assert statuses == {u: "failed" if u in failed else "success" for u in user_ids}
+    assert counts == {f"user_{u}": u % 4 for u in range(10) if u % 4 and f"user_{u}" not in failed}
+    assert result["results"][3]["result"]["logical_behavior_count"] == 3
+
+
+class PackingLLMClient:
+    """按prompt中的用户ID逐行回复；drop 中的用户在打包请求里不返回结果"""
+
+    def __init__(self, drop=()):
+        self.drop = set(drop)
+        self.prompts = []
+        self.invalidated = []
+
+    def chat_completion(self, prompt, max_tokens, temperature, use_cache=True):
+        self.prompts.append(prompt)
+        return prompt
+
+    async def _collect_stream_response(self, prompt):
+        user_ids = [line.split(": ", 1)[1] for line in prompt.split("\n") if line.startswith("- 用户ID: ")]
+        packed = "多用户输出要求" in prompt
+        lines = []
+        for user_id in user_ids:
+            if packed and user_id in self.drop:
+                continue
+            fields = f"白领|工作日|研究车型|{user_id}汽车|2026-01-01 10:00:00|2026-01-01 10:03:00|b0|0.9"
+            lines.append(f"{user_id}|{fields}" if packed else fields)
+        return "\n".join(lines)
+
+    async def invalidate_cache(self, prompt, max_tokens, temperature):
+        self.invalidated.append(prompt)
+
+
+@pytest.mark.asyncio
+async def test_generate_batch_packed(pipeline_db, monkeypatch):
+    llm_client = PackingLLMClient(drop={"user_6"})
+    generator = LogicalBehaviorGenerator(llm_client=llm_client, db_path=str(pipeline_db))
+    user_ids = [f"user_{u}" for u in range(10)]
+    result = await generator.generate_batch(user_ids, max_workers=2, pack=True)
+
+    assert [r["status"] for r in result["results"]] == ["failed" if u == "user_7" else "success" for u in user_ids]
+    packed = [p for p in llm_client.prompts if "多用户输出要求" in p]
+    single = [p for p in llm_client.prompts if "多用户输出要求" not in p]
+    # 6个有行为的用户打包到一个请求，user_6 在打包结果中缺失后单独重试
+    assert len(packed) == 1 and packed[0].count("- 用户ID: ") == 6
+    assert len(single) == 1 and "- 用户ID: user_6" in single[0]
+    assert llm_client.invalidated == packed  # 缺少用户的打包响应不保留在缓存中
+
+    conn = sqlite3.connect(pipeline_db)
+    rows = conn.execute("SELECT id, user_id, object FROM logical_behaviors ORDER BY user_id").fetchall()
+    conn.close()
+    assert rows == [
+        (f"lb_user_{u}_0", f"user_{u}", f"user_{u}汽车") for u in (1, 2, 3, 5, 6, 9)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_packed_retries_respect_max_workers(pipeline_db):
+    """打包结果中缺失的用户逐个重试，并发LLM请求数不超过 max_workers"""
+
+    class CountingClient(PackingLLMClient):
+        active = peak = 0
+
+        async def _collect_stream_response(self, prompt):
+            CountingClient.active += 1
+            CountingClient.peak = max(CountingClient.peak, CountingClient.active)
+            await asyncio.sleep(0.01)
+            CountingClient.active -= 1
+            return await super()._collect_stream_response(prompt)
+
+    llm_client = CountingClient(drop={f"user_{u}" for u in range(10)})
+    generator = LogicalBehaviorGenerator(llm_client=llm_client, db_path=str(pipeline_db))
+    result = await generator.generate_batch([f"user_{u}" for u in range(10)], max_workers=1, pack=True)
+
+    assert result["success_count"] == 9  # user_7 没有画像
+    assert CountingClient.peak == 1
+
+
+def test_pack_users_respects_budget(generator, monkeypatch):
+    profile = {"user_id": "u", "interests": [], "behaviors": []}
+    behaviors = [{"timestamp": "2026-01-01 10:00:00", "action": "浏览" * 50}]
+    items = [(i, f"user_{i}", {"profile": dict(profile, user_id=f"user_{i}"), "behaviors": behaviors})
+             for i in range(6)]
+    items.insert(0, (6, "user_6", {"profile": profile, "behaviors": []}))
+
+    base = logical_behavior.estimate_tokens(generator._build_packed_prompt([]))
+    section = logical_behavior.estimate_tokens(
+        generator._format_user_section(items[1][2]["profile"], generator._format_raw_behaviors(behaviors))
+    )
+    monkeypatch.setattr(logical_behavior.settings, "max_tokens_per_request", base + 2 * section + 10)
+
+    groups = generator._pack_users(items)
+    assert [[item[1] for item in group] for group in groups] == [
+        ["user_6"], ["user_0", "user_1"], ["user_2", "user_3"], ["user_4", "user_5"]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_job_retry_bypasses_llm_cache(pipeline_db, tmp_path, monkeypatch):
+    """重试的用户prompt不变，不能从缓存回放上次的失败响应"""
+    monkeypatch.setattr(logical_behavior.settings, "llm_cache_enabled", True)
+    monkeypatch.setattr(logical_behavior.settings, "llm_cache_path", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(llm_cache, "_llm_cache", None)
+
+    responses = ["抱歉，我无法完成这个任务", "白领|工作日|研究车型|汽车|2026-01-01 10:00:00|2026-01-01 10:03:00|b0|0.9"]
+    client = OpenAIClient()
+
+    async def fake_stream(prompt, model, max_tokens, temperature, timeout_seconds, status=None):
+        yield responses.pop(0)
+
+    async def keep_cache(*args, **kwargs):
+        pass  # 只验证重试本身绕过缓存
+
+    client._stream_chat = fake_stream
+    monkeypatch.setattr(client, "invalidate_cache", keep_cache)
+
+    queue = GenerationJobQueue(str(pipeline_db), max_attempts=2, retry_backoff_seconds=0)
+    generator = LogicalBehaviorGenerator(llm_client=client, db_path=str(pipeline_db))
+    manager = GenerationJobManager(str(pipeline_db), generator_factory=lambda: generator, queue=queue)
+    job_id = await manager.submit(["user_1"], max_workers=1)
+    await manager.wait(job_id)
+
+    assert responses == []  # 第二次尝试重新调用了LLM
+    status = queue.job_status(job_id)
+    assert (status["success_count"], status["failed_count"]) == (1, 0)
+    conn = sqlite3.connect(pipeline_db)
+    assert conn.execute("SELECT COUNT(*) FROM logical_behaviors WHERE user_id = 'user_1'").fetchone()[0] == 1
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_unparseable_response_is_failure(pipeline_db):
+    client = Mock(spec=OpenAIClient)
+    client.chat_completion.return_value = None
+    client._collect_stream_response = AsyncMock(return_value="这不是管道分隔格式")
+    generator = LogicalBehaviorGenerator(llm_client=client, db_path=str(pipeline_db))
+
+    result = await generator.generate_batch(["user_1"], max_workers=1)
+    assert result["failed_count"] == 1
+    assert "没有可解析的逻辑行为" in result["results"][0]["error"]
+    client.invalidate_cache.assert_awaited_once()
@@ -0,0 +1,164 @@
+"""
+n-gram支持度索引单元测试 - 索引结果与扫描挖掘一致，增量更新与全量重建一致
+"""
+import json
+import random
+import sqlite3
+
+import pytest
+
+from app.services.base_modeling import BaseModelingService
+from app.services.logical_behavior import LogicalBehaviorGenerator
+from app.services.sequence_mining import SequenceMiningService
+
+
+ACTIONS = ["浏览车型", "使用app", "对比车型", "到店", "购买"]
+LABELS = ["首购", "换车", None]
+
+
+@pytest.fixture
+def db_path(graph_db_path):
+    rng = random.Random(23)
+    db_path = graph_db_path
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+
+    for u in range(60):
+        user_id = f"user_{u:03d}"
+        length = rng.randint(0, 8)
+        status = "failed" if u % 13 == 0 else "success"
+        cur.execute("INSERT INTO logical_behavior_sequences (user_id, status, behavior_count) VALUES (?, ?, ?)",
+                    (user_id, status, length))
+        for i in range(length):
+            start_time = f"2026-01-01 00:{i:02d}:00"
+            cur.execute(
+                "INSERT INTO logical_behaviors (id, user_id, agent, scene, action, object, start_time, end_time, "
+                "raw_behavior_ids) VALUES (?, ?, '', '', ?, '', ?, ?, '[]')",
+                (f"lb_{user_id}_{i}", user_id, rng.choice(ACTIONS), start_time, start_time)
+            )
+        if u % 4 == 0:
+            continue  # 无画像
+        label = rng.choice(LABELS)
+        properties = json.dumps({"purchase_intent": label} if label else {}, ensure_ascii=False)
+        cur.execute("INSERT INTO user_profiles (user_id, properties) VALUES (?, ?)", (user_id, properties))
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _mine(service, **kwargs):
+    params = dict(algorithm="ngram", min_support=2, min_length=2, max_length=4, top_k=100, use_cache=False)
+    params.update(kwargs)
+    return service.mine_frequent_subsequences(**params)
+
+
+def _scan(db_path, **kwargs):
+    """不使用索引，加载序列后扫描挖掘"""
+    service = SequenceMiningService(str(db_path))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(service.ngram_index, "covers", lambda max_length: False)
+        return _mine(service, **kwargs)
+
+
+def _assert_same(indexed, scanned):
+    assert indexed["statistics"]["source"] == "ngram_index"
+    assert indexed["frequent_patterns"] == scanned["frequent_patterns"]
+    for key in ("total_users", "unique_event_types", "avg_sequence_length", "label_distribution"):
+        assert indexed["statistics"][key] == scanned["statistics"][key]
+
+
+@pytest.mark.parametrize("target_label", [None, "首购", "unknown"])
+def test_index_matches_scan(db_path, target_label):
+    service = SequenceMiningService(str(db_path))
+    scanned = _mine(service, target_label=target_label)
+    assert "source" not in scanned["statistics"]
+
+    service.rebuild_ngram_index()
+    _assert_same(_mine(service, target_label=target_label), scanned)
+
+
+def test_target_events_not_served_by_index(db_path):
+    service = SequenceMiningService(str(db_path))
+    service.rebuild_ngram_index()
+    result = _mine(service, target_events=["购买"])
+    assert "source" not in result["statistics"]
+
+
+def test_incremental_refresh_matches_rebuild(db_path):
+    service = SequenceMiningService(str(db_path))
+    service.rebuild_ngram_index()
+
+    generator = LogicalBehaviorGenerator(llm_client=None, db_path=str(db_path))
+    behaviors = [
+        {"id": f"new_{i}", "user_id": "user_001", "agent": "", "scene": "", "action": action, "object": "",
+         "start_time": f"2026-02-01 00:{i:02d}:00", "end_time": f"2026-02-01 00:{i:02d}:00",
+         "raw_behavior_ids": "[]", "confidence": 1.0}
+        for i, action in enumerate(["到店", "对比车型", "购买", "到店", "对比车型"])
+    ]
+    generator._save_logical_behaviors("user_001", behaviors)
+    generator._update_sequence_status("user_001", "success", len(behaviors))
+    generator._refresh_mining_index("user_001")
+
+    # 状态变为失败的用户不再参与统计
+    conn = sqlite3.connect(db_path)
+    failed_user, unchanged_user = [row[0] for row in conn.execute(
+        "SELECT user_id FROM ngram_index_users WHERE event_count > 0 AND user_id != 'user_001' LIMIT 2"
+    )]
+    conn.close()
+    generator._update_sequence_status(failed_user, "failed")
+    assert service.refresh_ngram_index([failed_user, unchanged_user]) == 1
+
+    incremental = _mine(service)
+    _assert_same(incremental, _scan(db_path))
+
+    service.rebuild_ngram_index()
+    assert _mine(service) == incremental
+
+
+def test_refresh_before_build_is_noop(db_path):
+    service = SequenceMiningService(str(db_path))
+    assert service.refresh_ngram_index(["user_001"]) == 0
+    assert not service.ngram_index.covers(2)
+
+
+def test_profile_import_refreshes_labels(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("ALTER TABLE user_profiles ADD COLUMN profile_text TEXT")  # 画像导入写入的列
+    conn.commit()
+    conn.close()
+
+    service = SequenceMiningService(str(db_path))
+    service.rebuild_ngram_index()
+
+    # 重新导入画像改变标签（含原本没有画像的用户）
+    modeling = BaseModelingService()
+    modeling.db_path = db_path
+    profiles = [{"user_id": f"user_{u:03d}", "purchase_intent": "换车"} for u in range(0, 30)]
+    assert modeling.import_user_profiles(profiles)["success"]
+
+    for target_label in ("换车", "首购", None):
+        _assert_same(_mine(service, target_label=target_label), _scan(db_path, target_label=target_label))
+
+
+def test_null_label_indexed_as_unknown(db_path):
+    service = SequenceMiningService(str(db_path))
+    service.rebuild_ngram_index()
+
+    # 画像中 purchase_intent 为 null：增量更新和全量重建都记为 unknown
+    conn = sqlite3.connect(db_path)
+    null_users = [row[0] for row in conn.execute(
+        "SELECT user_id FROM ngram_index_users WHERE profiled = 1 AND label != 'unknown' ORDER BY user_id LIMIT 5"
+    )]
+    conn.executemany(
+        "UPDATE user_profiles SET properties = ? WHERE user_id = ?",
+        [('{"purchase_intent": null}', user_id) for user_id in null_users]
+    )
+    conn.commit()
+    conn.close()
+
+    assert service.refresh_ngram_index(null_users) == len(null_users) > 0
+    incremental = _mine(service, target_label="unknown")
+    _assert_same(incremental, _scan(db_path, target_label="unknown"))
+
+    service.rebuild_ngram_index()
+    assert _mine(service, target_label="unknown") == incremental
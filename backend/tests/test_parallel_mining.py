@@ -0,0 +1,67 @@
+"""
+多进程分片挖掘单元测试 - 结果与单进程精确一致
+"""
+import random
+
+import numpy as np
+import pytest
+
+from app.services import sequence_mining
+from app.services.parallel_mining import (
+    merge_key_counts,
+    parallel_attention_mining,
+    parallel_support_mining,
+    shard_sequences
+)
+from app.services.sequence_mining import SequenceMiningService
+from app.services.sequence_store import EncodedSequences
+
+
+@pytest.fixture(scope="module")
+def store():
+    rng = random.Random(9)
+    events = [f"事件{i}" for i in range(12)]
+    weights = [1.0 / (i + 1) for i in range(12)]
+    sequences = [rng.choices(events, weights=weights, k=rng.randint(0, 15)) for _ in range(600)]
+    return EncodedSequences.from_sequences(sequences)
+
+
+def test_shards_cover_all_sequences(store):
+    shards = shard_sequences(store, 4)
+    assert len(shards) == 4
+    assert sum(len(s) for s in shards) == len(store)
+    assert [seq for shard in shards for seq in shard] == store.to_lists()
+
+
+def test_merge_key_counts():
+    keys, counts = merge_key_counts([
+        (np.array([1, 5, 9]), np.array([2, 1, 1])),
+        (np.array([5, 7]), np.array([3, 4])),
+        (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    ])
+    assert keys.tolist() == [1, 5, 7, 9]
+    assert counts.tolist() == [2, 4, 4, 1]
+
+
+@pytest.mark.parametrize("two_pass", [False, True])
+def test_support_mining_is_exact(store, two_pass):
+    expected = sorted(store.count_contiguous_support(4, 7))
+    assert sorted(parallel_support_mining(store, 7, 4, workers=3, two_pass=two_pass)) == expected
+
+
+@pytest.mark.parametrize("two_pass", [False, True])
+def test_attention_mining_is_exact(store, two_pass):
+    service = SequenceMiningService()
+    service.workers = 1
+    expected = sorted((c, tuple(store.encode(p))) for c, p in service._mine_with_attention(store, 40, 4))
+    assert sorted(parallel_attention_mining(store, 40, 4, workers=3, two_pass=two_pass)) == expected
+
+
+def test_service_switches_to_parallel(store, monkeypatch):
+    monkeypatch.setattr(sequence_mining, "PARALLEL_MIN_EVENTS", 0)
+    serial = SequenceMiningService()
+    serial.workers = 1
+    parallel = SequenceMiningService()
+    parallel.workers = 2
+    assert parallel._use_parallel(store, 4)
+    assert parallel._simple_frequent_mining(store, 10, 3) == serial._simple_frequent_mining(store, 10, 3)
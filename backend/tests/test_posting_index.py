@@ -0,0 +1,109 @@
+"""
+事件倒排索引单元测试 - 倒排列表求交结果与逐用户扫描一致
+"""
+import random
+import sqlite3
+
+import pytest
+
+from app.core.db_pool import get_pool
+from app.services.logical_behavior import LogicalBehaviorGenerator
+from app.services.posting_index import EventPostingIndex
+from app.services.sequence_mining import SequenceMiningService
+from app.services.transition_stats import compute_pattern_statistics
+
+
+ACTIONS = ["浏览车型", "搜索", "对比车型", "到店", "购买"]
+
+
+@pytest.fixture
+def db_path(graph_db_path):
+    rng = random.Random(31)
+    db_path = graph_db_path
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+
+    for u in range(80):
+        user_id = f"user_{u:03d}"
+        length = rng.randint(0, 10)
+        status = "failed" if u % 11 == 0 else "success"
+        cur.execute("INSERT INTO logical_behavior_sequences (user_id, status, behavior_count) VALUES (?, ?, ?)",
+                    (user_id, status, length))
+        # 乱序插入，位置由 start_time 决定
+        for i in rng.sample(range(length), length):
+            start_time = f"2026-01-01 00:{i:02d}:00"
+            cur.execute(
+                "INSERT INTO logical_behaviors (id, user_id, agent, scene, action, object, start_time, end_time, "
+                "raw_behavior_ids) VALUES (?, ?, '', '', ?, '', ?, ?, '[]')",
+                (f"lb_{user_id}_{i}", user_id, rng.choice(ACTIONS), start_time, start_time)
+            )
+        cur.execute("INSERT INTO user_profiles (user_id, age, gender, occupation) VALUES (?, ?, ?, ?)",
+                    (user_id, rng.choice([30, 40, 50]), rng.choice(["男", "女"]), rng.choice(["白领", "教师"])))
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _naive_users(db_path, pattern):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("""
+        SELECT lb.user_id, lb.action FROM logical_behaviors lb
+        JOIN logical_behavior_sequences lbs ON lb.user_id = lbs.user_id
+        WHERE lbs.status = 'success' ORDER BY lb.user_id, lb.start_time
+    """).fetchall()
+    conn.close()
+    sequences = {}
+    for user_id, action in rows:
+        sequences.setdefault(user_id, []).append(action)
+    return [
+        user_id for user_id, seq in sorted(sequences.items())
+        if any(seq[i:i + len(pattern)] == pattern for i in range(len(seq) - len(pattern) + 1))
+    ]
+
+
+PATTERNS = [["浏览车型"], ["搜索", "对比车型"], ["到店", "购买", "到店"], ["购买", "购买"], ["不存在的行为"]]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_find_users_matches_scan(db_path, pattern):
+    index = EventPostingIndex(str(db_path))
+    index.rebuild()
+    assert index.find_users(pattern) == _naive_users(db_path, pattern)
+    assert index.find_users(pattern, limit=3) == _naive_users(db_path, pattern)[:3]
+
+
+def test_pattern_examples_use_index(db_path):
+    service = SequenceMiningService(str(db_path))
+    pattern = ["搜索", "对比车型"]
+    scanned = service.get_pattern_examples(pattern, limit=100, max_scan=10000)
+
+    service.rebuild_posting_index()
+    indexed = service.get_pattern_examples(pattern, limit=100, max_scan=1)
+    assert indexed == sorted(scanned, key=lambda example: example["user_id"])
+    assert [ex["user_id"] for ex in service.get_pattern_examples(pattern, limit=2)] == \
+        [ex["user_id"] for ex in indexed[:2]]
+
+
+def test_saving_behaviors_updates_postings(db_path):
+    index = EventPostingIndex(str(db_path))
+    index.rebuild()
+
+    generator = LogicalBehaviorGenerator(llm_client=None, db_path=str(db_path))
+    behaviors = [
+        {"id": f"new_{i}", "user_id": "user_001", "agent": "", "scene": "", "action": action, "object": "",
+         "start_time": f"2026-02-01 00:{i:02d}:00", "end_time": "", "raw_behavior_ids": "[]", "confidence": 1.0}
+        for i, action in enumerate(["试驾", "到店", "试驾"])
+    ]
+    generator._save_logical_behaviors("user_001", behaviors)
+
+    for pattern in PATTERNS + [["试驾", "到店"]]:
+        assert index.find_users(pattern) == _naive_users(db_path, pattern)
+
+
+def test_pattern_statistics_with_index(db_path):
+    index = EventPostingIndex(str(db_path))
+    index.rebuild()
+    patterns = PATTERNS[:4]
+    with get_pool(db_path).read() as conn:
+        expected = compute_pattern_statistics(conn.cursor(), patterns)
+        assert compute_pattern_statistics(conn.cursor(), patterns, find_users=index.find_users) == expected
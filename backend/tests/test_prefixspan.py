@@ -0,0 +1,64 @@
+"""
+内置 PrefixSpan 单元测试
+"""
+import random
+from itertools import combinations
+
+import pytest
+
+from app.services.prefixspan import PrefixSpanMiner
+from app.services.sequence_mining import SequenceMiningService
+from app.services.sequence_store import EncodedSequences
+
+
+@pytest.fixture
+def store():
+    rng = random.Random(5)
+    events = ["浏览", "搜索", "对比", "到店", "购买"]
+    sequences = [[rng.choice(events) for _ in range(rng.randint(0, 7))] for _ in range(60)]
+    return EncodedSequences.from_sequences(sequences)
+
+
+def _brute_force(store, min_support, max_length):
+    """枚举每条序列的所有子序列（允许间隔）"""
+    support = {}
+    for codes in store.code_lists():
+        seen = set()
+        for length in range(1, min(len(codes), max_length) + 1):
+            for idx in combinations(range(len(codes)), length):
+                seen.add(tuple(codes[i] for i in idx))
+        for pattern in seen:
+            support[pattern] = support.get(pattern, 0) + 1
+    return {p: s for p, s in support.items() if s >= min_support}
+
+
+def test_frequent_matches_brute_force(store):
+    miner = PrefixSpanMiner(store)
+    result = miner.frequent(min_support=4, max_length=4)
+    assert len(result) == len({p for _, p in result})
+    assert {p: s for s, p in result} == _brute_force(store, 4, 4)
+
+
+def test_max_length_pruned_during_search(store):
+    result = PrefixSpanMiner(store).frequent(min_support=1, max_length=2)
+    assert max(len(p) for _, p in result) == 2
+
+
+def test_topk_matches_sorted_frequent(store):
+    miner = PrefixSpanMiner(store)
+    accept = lambda p: len(p) >= 2  # noqa: E731
+    all_supports = sorted((s for s, p in miner.frequent(2, 4) if accept(p)), reverse=True)
+
+    for k in (1, 5, 20, 10000):
+        top = miner.topk(k, min_support=2, max_length=4, accept=accept)
+        assert [s for s, _ in top] == all_supports[:k]
+        assert all(accept(p) for _, p in top)
+
+
+def test_service_uses_top_k(store):
+    service = SequenceMiningService()
+    patterns = service._mine_with_prefixspan(
+        store, 2, 3, top_k=3, accept=lambda p: len(p) >= 2 and p[-1] == "购买"
+    )
+    assert len(patterns) == 3
+    assert all(p[-1] == "购买" and 2 <= len(p) <= 3 for _, p in patterns)
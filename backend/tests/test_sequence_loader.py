@@ -0,0 +1,133 @@
+"""
+序列加载单元测试 - 单次有序扫描与逐用户查询结果一致
+"""
+import json
+import random
+import sqlite3
+
+import pytest
+
+from app.core.db_pool import get_pool
+from app.services.sequence_mining import SequenceMiningService
+
+
+ACTIONS = ["浏览车型", "使用app", "对比车型", "到店", "购买"]
+LABELS = ["首购", "换车", None]
+
+
+@pytest.fixture
+def service(graph_db_path):
+    """构造包含画像标签和逻辑行为的数据库"""
+    rng = random.Random(11)
+    db_path = graph_db_path
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+
+    for u in range(80):
+        user_id = f"user_{u:03d}"
+        length = rng.randint(0, 8)
+        status = "failed" if u % 11 == 0 else "success"
+        # 部分用户 behavior_count>0 但没有行为记录
+        count = length or (1 if u % 5 == 0 else 0)
+        cur.execute(
+            "INSERT INTO logical_behavior_sequences (user_id, status, behavior_count) VALUES (?, ?, ?)",
+            (user_id, status, count)
+        )
+        for i in rng.sample(range(length), length):
+            start_time = f"2026-01-01 00:{i:02d}:00"
+            cur.execute(
+                "INSERT INTO logical_behaviors (id, user_id, agent, scene, action, object, start_time, end_time, "
+                "raw_behavior_ids) VALUES (?, ?, '', '', ?, '', ?, ?, '[]')",
+                (f"lb_{user_id}_{i}", user_id, rng.choice(ACTIONS), start_time, start_time)
+            )
+
+        kind = u % 6
+        if kind == 0:
+            continue  # 无画像
+        elif kind == 1:
+            properties = "not json"
+        elif kind == 2:
+            properties = json.dumps({"other": 1})
+        elif kind == 3:
+            properties = ""
+        else:
+            label = rng.choice(LABELS)
+            properties = json.dumps({"purchase_intent": label} if label else {}, ensure_ascii=False)
+        cur.execute("INSERT INTO user_profiles (user_id, properties) VALUES (?, ?)", (user_id, properties))
+    conn.commit()
+    conn.close()
+
+    svc = SequenceMiningService()
+    svc.db_path = db_path
+    return svc
+
+
+def _naive_load(db_path, service, limit=None, offset=0, target_label=None, target_events=None):
+    """原逐用户查询实现"""
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    join = "JOIN" if target_label else "LEFT JOIN"
+    query = f"""
+        SELECT lbs.user_id, up.properties FROM logical_behavior_sequences lbs
+        {join} user_profiles up ON lbs.user_id = up.user_id
+        WHERE lbs.status = 'success' AND lbs.behavior_count > 0 ORDER BY lbs.user_id
+    """
+    if limit:
+        query += f" LIMIT {limit}"
+    if offset:
+        query += f" OFFSET {offset}"
+
+    label_distribution, user_ids, sequences, target_users = {}, [], [], 0
+    for user_id, properties_json in cur.execute(query).fetchall():
+        try:
+            label = json.loads(properties_json).get("purchase_intent", "unknown") if properties_json else "unknown"
+        except Exception:
+            label = "unknown"
+        label_distribution[label] = label_distribution.get(label, 0) + 1
+        if target_label is None or label == target_label:
+            user_ids.append(user_id)
+
+    for user_id in user_ids:
+        rows = cur.execute(
+            "SELECT action FROM logical_behaviors WHERE user_id = ? ORDER BY start_time ASC", (user_id,)
+        ).fetchall()
+        sequence = [service._normalize_event_type(r[0]) for r in rows]
+        if not sequence:
+            continue
+        if target_events:
+            hits = [i for i, a in enumerate(sequence) if a in target_events]
+            if hits:
+                sequences.append(sequence[:hits[0] + 1])
+                target_users += 1
+        else:
+            sequences.append(sequence)
+    conn.close()
+    return sequences, {"label_distribution": label_distribution, "target_users": target_users}
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"limit": 20},
+    {"limit": 15, "offset": 10},
+    {"target_label": "首购"},
+    {"target_events": ["到店", "购买"]},
+    {"target_label": "换车", "target_events": ["购买"]},
+])
+def test_matches_per_user_queries(service, kwargs):
+    expected = _naive_load(service.db_path, service, **kwargs)
+    sequences, statistics = service._load_event_sequences(use_cache=False, **kwargs)
+    assert (sequences.to_lists(), statistics) == expected
+
+
+def test_single_query(service):
+    """加载过程只执行一条查询"""
+    statements = []
+    with get_pool(service.db_path).read() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        service._load_event_sequences(use_cache=False)
+    finally:
+        with get_pool(service.db_path).read() as conn:
+            conn.set_trace_callback(None)
+
+    assert len([s for s in statements if s.lstrip().upper().startswith(("SELECT", "WITH"))]) == 1
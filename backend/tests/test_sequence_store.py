@@ -0,0 +1,94 @@
+"""
+紧凑序列存储与挖掘算法单元测试
+"""
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app.services.sequence_mining import SequenceMiningService
+from app.services.sequence_store import EncodedSequences
+
+
+EVENTS = ["浏览车型", "搜索", "对比车型", "到店", "试驾", "购买"]
+
+
+@pytest.fixture
+def sequences():
+    rng = random.Random(3)
+    return [[rng.choice(EVENTS) for _ in range(rng.randint(0, 12))] for _ in range(200)]
+
+
+def _naive_support(sequences, max_length):
+    counts = Counter()
+    for seq in sequences:
+        seen = set()
+        for length in range(1, min(len(seq), max_length) + 1):
+            for i in range(len(seq) - length + 1):
+                seen.add(tuple(seq[i:i + length]))
+        counts.update(seen)
+    return counts
+
+
+def _naive_attention(sequences, min_support, max_length):
+    cooccurrence = Counter()
+    for seq in sequences:
+        for i in range(len(seq)):
+            for j in range(i + 1, min(i + max_length, len(seq))):
+                cooccurrence[(seq[i], seq[j])] += 1
+    counts = Counter()
+    for seq in sequences:
+        for length in range(2, min(len(seq) + 1, max_length + 1)):
+            for i in range(len(seq) - length + 1):
+                sub = tuple(seq[i:i + length])
+                weight = sum(cooccurrence.get((sub[k], sub[k + 1]), 0) for k in range(len(sub) - 1))
+                if weight >= min_support:
+                    counts[sub] += 1
+    return {p: c for p, c in counts.items() if c >= min_support}
+
+
+def test_round_trip(sequences):
+    store = EncodedSequences.from_sequences(sequences)
+    assert len(store) == len(sequences)
+    assert store.to_lists() == sequences
+    assert store[5] == sequences[5]
+    assert store.data.dtype == np.int32
+    assert store.total_events == sum(len(s) for s in sequences)
+    assert store.unique_event_count() == len({e for s in sequences for e in s})
+
+
+def test_subset(sequences):
+    store = EncodedSequences.from_sequences(sequences)
+    indices = [3, 0, 199, 42]
+    assert store.subset(indices).to_lists() == [sequences[i] for i in indices]
+
+
+def test_ngram_windows_do_not_cross_boundaries():
+    store = EncodedSequences.from_sequences([["a", "b"], ["c"], ["d", "e", "f"]])
+    assert store.ngram_windows(2).tolist() == [0, 3, 4]
+    assert store.ngram_windows(3).tolist() == [3]
+    assert store.ngram_windows(4).tolist() == []
+
+
+def test_simple_mining_matches_naive(sequences):
+    service = SequenceMiningService()
+    result = service._simple_frequent_mining(EncodedSequences.from_sequences(sequences), 5, 4)
+    expected = {p: c for p, c in _naive_support(sequences, 4).items() if c >= 5}
+    assert {tuple(p): c for c, p in result} == expected
+    # 兼容 List[List[str]] 输入
+    assert service._simple_frequent_mining(sequences, 5, 4) == result
+
+
+def test_tuple_fallback_matches_packed(sequences, monkeypatch):
+    store = EncodedSequences.from_sequences(sequences)
+    packed = sorted(store.count_contiguous_support(4, 3))
+    monkeypatch.setattr(store, "max_packable_length", lambda: 0)
+    assert sorted(store.count_contiguous_support(4, 3)) == packed
+
+
+def test_attention_mining_matches_naive(sequences):
+    service = SequenceMiningService()
+    result = service._mine_with_attention(EncodedSequences.from_sequences(sequences), 20, 4)
+    assert {tuple(p): c for c, p in result} == _naive_attention(sequences, 20, 4)
+    assert [c for c, _ in result] == sorted((c for c, _ in result), reverse=True)
@@ -0,0 +1,154 @@
+"""
+并发打标引擎单元测试 - 并发批次上限、截断后缩小批大小并重试、结果写回与进度
+"""
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from app.services.base_modeling import BaseModelingService
+from app.services.tagging_engine import AdaptiveBatchSizer, ConcurrentTagger, TaggingProgress
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = tmp_path / "graph.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE app_tags (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, app_id TEXT UNIQUE NOT NULL, app_name TEXT NOT NULL,
+        category TEXT, tags TEXT, llm_generated INTEGER DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _insert_apps(db_path, n):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO app_tags (app_id, app_name, category, tags) VALUES (?, ?, '工具', '[]')",
+        [(f"app_{i}", f"应用{i}") for i in range(n)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _stored(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT app_id, tags, llm_generated FROM app_tags").fetchall()
+    conn.close()
+    return {app_id: (json.loads(tags), generated) for app_id, tags, generated in rows}
+
+
+class FakeTagLLM:
+    """每批最多返回 limit 个结果（模拟输出截断），never 中的条目始终没有结果"""
+
+    def __init__(self, limit=1000, never=()):
+        self.limit = limit
+        self.never = set(never)
+        self.sizes = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, batch):
+        self.sizes.append(len(batch))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return {
+            app["app_id"]: ([] if app["app_id"] in self.never or i >= self.limit else [app["app_name"], "工具"])
+            for i, app in enumerate(batch)
+        }
+
+
+def test_sizer_adjusts():
+    sizer = AdaptiveBatchSizer(initial=100, minimum=10, maximum=150, target_latency=10)
+    assert sizer.record(100, 1.0, 0) == 125
+    assert sizer.record(125, 1.0, 0) == 150
+    assert sizer.record(150, 20.0, 0) == 112
+    assert sizer.record(112, 1.0, 60) == 56
+    assert sizer.record(20, 1.0, 0) == 56  # 批次没有用满时不增大
+    for _ in range(5):
+        sizer.record(56, 1.0, 56)
+    assert sizer.size == 10
+
+
+def test_concurrent_tagger_retries_truncated(db_path):
+    _insert_apps(db_path, 200)
+    llm = FakeTagLLM(limit=30, never={"app_7"})
+    tagger = ConcurrentTagger(
+        db_path, "app_tags", "app_id", llm, concurrency=3,
+        sizer=AdaptiveBatchSizer(initial=50, minimum=10, maximum=50)
+    )
+    items = [{"app_id": f"app_{i}", "app_name": f"应用{i}"} for i in range(200)]
+    progress = TaggingProgress("app")
+    status = asyncio.run(tagger.run(items, progress))
+
+    assert llm.max_active == 3
+    assert llm.sizes[0] == 50 and min(llm.sizes) < 50  # 截断后批大小减小
+    assert status["status"] == "completed"
+    assert (status["total"], status["tagged"], status["empty"], status["failed"]) == (200, 199, 1, 0)
+    assert status["retried"] > 0
+
+    stored = _stored(db_path)
+    assert stored["app_3"] == (["应用3", "工具"], 1)
+    assert stored["app_7"] == ([], 1)
+    assert all(generated == 1 for _, generated in stored.values())
+
+
+def test_failed_batches_stay_untagged(db_path):
+    _insert_apps(db_path, 5)
+
+    async def broken(batch):
+        raise TimeoutError("LLM超时")
+
+    tagger = ConcurrentTagger(db_path, "app_tags", "app_id", broken, concurrency=2)
+    items = [{"app_id": f"app_{i}", "app_name": f"应用{i}"} for i in range(5)]
+    status = asyncio.run(tagger.run(items, TaggingProgress("app")))
+
+    assert (status["tagged"], status["failed"], status["processed"]) == (0, 5, 5)
+    assert all(generated == 0 for _, generated in _stored(db_path).values())
+
+
+def test_failed_writes_counted_and_run_continues(db_path):
+    _insert_apps(db_path, 40)
+    tagger = ConcurrentTagger(
+        db_path, "app_tags", "app_id", FakeTagLLM(), concurrency=2,
+        sizer=AdaptiveBatchSizer(initial=10, minimum=10, maximum=10)
+    )
+    apply = tagger._apply
+    calls = []
+
+    def flaky_apply(results):
+        calls.append(len(results))
+        if len(calls) == 2:
+            raise sqlite3.OperationalError("database is locked")
+        apply(results)
+
+    tagger._apply = flaky_apply
+    items = [{"app_id": f"app_{i}", "app_name": f"应用{i}"} for i in range(40)]
+    status = asyncio.run(tagger.run(items, TaggingProgress("app")))
+
+    assert len(calls) == 4  # 一批写回失败后其余批次照常完成
+    assert status["status"] == "completed"
+    assert (status["tagged"], status["failed"], status["processed"]) == (30, 10, 40)
+    assert sum(generated for _, generated in _stored(db_path).values()) == 30
+
+
+def test_service_tagging_status(db_path):
+    service = BaseModelingService()
+    service.db_path = db_path
+    service.llm_client.generate_app_tags_batch = FakeTagLLM()
+
+    async def run():
+        result = await service.import_app_list(
+            [{"app_id": f"app_{i}", "app_name": f"应用{i}", "category": "工具"} for i in range(12)]
+        )
+        assert result["tagging_status"] == "pending"
+        await service._tagging_tasks["app"]
+
+    asyncio.run(run())
+    status = service.get_tagging_status("app")
+    assert status["status"] == "completed" and status["tagged"] == 12
+    assert service.get_tagging_status("media")["status"] == "idle"
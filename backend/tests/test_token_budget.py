@@ -0,0 +1,57 @@
+"""
+Token预算单元测试 - 按输入/输出token切分批次、截断后缩小批次
+"""
+from app.core.token_budget import BatchPlanner, estimate_tokens, is_truncated
+
+
+def _render(item):
+    return item
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("浏览汽车") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_plan_respects_input_budget():
+    planner = BatchPlanner(output_tokens_per_item=1, base_tokens=10, max_input_tokens=30, max_output_tokens=1000)
+    items = ["一二三四五"] * 9  # 每条5 token，每批最多4条
+    batches = planner.plan(items, _render)
+    assert [len(batch) for batch in batches] == [4, 4, 1]
+
+
+def test_plan_respects_output_budget_and_limits():
+    planner = BatchPlanner(output_tokens_per_item=100, max_input_tokens=10000, max_output_tokens=350)
+    assert [len(batch) for batch in planner.plan(["a"] * 7, _render)] == [3, 3, 1]
+    assert planner.fit(["a"] * 7, _render, limit=2) == 2
+
+    limited = BatchPlanner(output_tokens_per_item=1, max_input_tokens=10000, max_output_tokens=1000, max_items=5)
+    assert [len(batch) for batch in limited.plan(["a"] * 12, _render)] == [5, 5, 2]
+
+
+def test_oversized_item_gets_own_batch():
+    planner = BatchPlanner(output_tokens_per_item=1, max_input_tokens=10, max_output_tokens=1000)
+    batches = planner.plan(["a", "长" * 50, "b"], _render)
+    assert [len(batch) for batch in batches] == [1, 1, 1]
+
+
+def test_truncation_shrinks_batches():
+    planner = BatchPlanner(output_tokens_per_item=100, max_input_tokens=10000, max_output_tokens=1000)
+    assert planner.fit(["a"] * 50, _render) == 10
+
+    planner.record(True)  # 输出被截断（finish_reason == "length"）
+    assert planner.fit(["a"] * 50, _render) == 6
+    for _ in range(10):
+        planner.record(True)
+    assert planner.fit(["a"] * 50, _render) == 1
+
+    for _ in range(50):
+        planner.record(False)
+    assert planner.output_scale == 1.0
+    assert planner.fit(["a"] * 50, _render) == 10
+
+
+def test_is_truncated():
+    assert not is_truncated("短响应", 100)
+    assert is_truncated("x" * 390, 100)
@@ -0,0 +1,135 @@
+"""
+行为序列统计引擎单元测试
+"""
+import random
+import sqlite3
+
+import pytest
+
+from app.services.transition_stats import (
+    ActionSequenceMatrix,
+    ProfileColumns,
+    compute_pattern_statistics
+)
+
+
+ACTIONS = ["浏览车型", "搜索", "对比车型", "到店", "加购", "购买"]
+
+
+@pytest.fixture
+def cursor(graph_db_path):
+    """构造包含随机行为序列的数据库"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(graph_db_path)
+    cur = conn.cursor()
+
+    for u in range(60):
+        user_id = f"user_{u:03d}"
+        status = "failed" if u % 13 == 0 else "success"
+        length = rng.randint(0, 12)
+        cur.execute(
+            "INSERT INTO logical_behavior_sequences (user_id, status, behavior_count) VALUES (?, ?, ?)",
+            (user_id, status, length)
+        )
+        for i in range(length):
+            start_time = f"2026-01-01 00:{i:02d}:00"
+            cur.execute(
+                "INSERT INTO logical_behaviors (id, user_id, agent, scene, action, object, start_time, end_time, "
+                "raw_behavior_ids) VALUES (?, ?, '', '', ?, '', ?, ?, '[]')",
+                (f"lb_{user_id}_{i}", user_id, rng.choice(ACTIONS), start_time, start_time)
+            )
+        if u % 7 != 0:
+            cur.execute(
+                "INSERT INTO user_profiles (user_id, age, gender, occupation) VALUES (?, ?, ?, ?)",
+                (user_id, rng.choice([None, 22, 30, 40, 55]), rng.choice([None, "男", "女"]),
+                 rng.choice([None, "白领", "教师", "学生"]))
+            )
+    conn.commit()
+    yield cur
+    conn.close()
+
+
+def _naive_sequences(cur):
+    cur.execute("""
+        SELECT lb.user_id, lb.action FROM logical_behaviors lb
+        JOIN logical_behavior_sequences lbs ON lb.user_id = lbs.user_id
+        WHERE lbs.status = 'success' ORDER BY lb.user_id, lb.start_time
+    """)
+    sequences = {}
+    for user_id, action in cur.fetchall():
+        sequences.setdefault(user_id, []).append(action)
+    return sequences
+
+
+def _contains(sequence, pattern):
+    n = len(pattern)
+    return any(sequence[i:i + n] == pattern for i in range(len(sequence) - n + 1))
+
+
+def test_transition_counts_match_naive(cursor):
+    """转移计数与逐用户循环结果一致"""
+    matrix = ActionSequenceMatrix.load(cursor)
+    transitions, event_counts = matrix.transition_counts()
+
+    expected_transitions, expected_events = {}, {}
+    for sequence in _naive_sequences(cursor).values():
+        for a, b in zip(sequence, sequence[1:]):
+            expected_transitions[(a, b)] = expected_transitions.get((a, b), 0) + 1
+            expected_events[a] = expected_events.get(a, 0) + 1
+
+    assert transitions == expected_transitions
+    assert event_counts == expected_events
+
+
+def test_matching_users_respects_user_boundaries(cursor):
+    """模式匹配不跨越用户边界"""
+    matrix = ActionSequenceMatrix.load(cursor)
+    sequences = _naive_sequences(cursor)
+
+    for pattern in (["浏览车型", "搜索"], ["搜索", "对比车型", "到店"], ["购买"], ["不存在的行为"]):
+        matched = {matrix.user_ids[i] for i in matrix.matching_users(pattern).tolist()}
+        expected = {u for u, seq in sequences.items() if _contains(seq, pattern)}
+        assert matched == expected
+
+
+def test_profile_distribution_matches_sql(cursor):
+    """画像分布与SQL分组统计一致"""
+    matrix = ActionSequenceMatrix.load(cursor)
+    profiles = ProfileColumns.load(cursor, matrix.user_ids)
+    indices = matrix.matching_users(["浏览车型"])
+    user_ids = [matrix.user_ids[i] for i in indices.tolist()]
+    placeholders = ",".join("?" * len(user_ids))
+
+    cursor.execute(
+        f"SELECT gender, COUNT(*) FROM user_profiles WHERE user_id IN ({placeholders}) "
+        f"AND gender IS NOT NULL GROUP BY gender", user_ids)
+    expected_gender = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute(
+        f"""SELECT CASE WHEN age >= 25 AND age < 35 THEN '25-35岁'
+                        WHEN age >= 35 AND age < 45 THEN '35-45岁'
+                        WHEN age >= 45 THEN '45岁以上' ELSE '其他' END AS g, COUNT(*)
+            FROM user_profiles WHERE user_id IN ({placeholders}) AND age IS NOT NULL
+            GROUP BY g""", user_ids)
+    expected_age = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute(
+        f"SELECT occupation, COUNT(*) AS c FROM user_profiles WHERE user_id IN ({placeholders}) "
+        f"AND occupation IS NOT NULL GROUP BY occupation HAVING c >= 2", user_ids)
+    expected_occupation = {row[0]: row[1] for row in cursor.fetchall()}
+
+    dist = profiles.distribution(indices)
+    assert dist["gender"] == expected_gender
+    assert dist["age"] == expected_age
+    assert dist["occupation"] == expected_occupation
+
+
+def test_compute_pattern_statistics_keys(cursor):
+    """结果结构与原统计字典一致"""
+    pattern_stats, transition_probs = compute_pattern_statistics(
+        cursor, [["浏览车型", "搜索"], ["不存在的行为", "购买"]]
+    )
+
+    assert list(pattern_stats) == ["浏览车型 → 搜索"]
+    assert set(pattern_stats["浏览车型 → 搜索"]) == {"user_count", "profile_distribution"}
+    for data in transition_probs.values():
+        assert set(data) == {"probability", "count", "total"}
+        assert 0 < data["probability"] <= 1
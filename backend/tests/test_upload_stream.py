@@ -0,0 +1,130 @@
+"""
+流式上传管道单元测试 - multipart请求体分块送入CSV导入器，结果与整文件导入一致
+"""
+import asyncio
+import io
+import sqlite3
+
+import pytest
+
+from app.core.upload_stream import ImportJobRegistry, run_streaming_import
+from app.services.flexible_csv_importer import FlexibleCSVImporter
+
+BOUNDARY = "----testboundary7MA4YWxk"
+
+
+def _multipart(csv_text, field="file", filename="data.csv"):
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\n'
+        f"ignored\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: text/csv\r\n\r\n"
+        f"{csv_text}\r\n"
+        f"--{BOUNDARY}--"
+    ).encode("utf-8")
+
+
+async def _chunks(body, size):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def _import(body, consume, job=None, size=13, suffix=None):
+    return asyncio.run(run_streaming_import(
+        _chunks(body, size), f"multipart/form-data; boundary={BOUNDARY}", consume, job, suffix=suffix
+    ))
+
+
+@pytest.fixture
+def behavior_csv():
+    lines = ["user_id,event_time,action,item"]
+    for i in range(300):
+        lines.append(f"user_{i % 17},2026-02-{i % 28 + 1:02d} 10:{i % 60:02d}:00,browse,宝马{i}系")
+    return "\n".join(lines) + "\n"
+
+
+def _events(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT user_id, event_time, event_data FROM behavior_events ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def test_streaming_import_matches_file_import(tmp_path, behavior_csv):
+    streamed_db = str(tmp_path / "streamed.db")
+    job = ImportJobRegistry().create("behavior_data", "job-1")
+    importer = FlexibleCSVImporter(streamed_db)
+    result = _import(
+        _multipart(behavior_csv),
+        lambda stream: importer.import_behavior_data(stream, batch_size=50, progress=job.update),
+        job
+    )
+
+    direct_db = str(tmp_path / "direct.db")
+    FlexibleCSVImporter(direct_db).import_behavior_data(io.StringIO(behavior_csv))
+
+    assert result["success"] == 300 and result["chunks"] == 6
+    assert _events(streamed_db) == _events(direct_db)
+
+    status = job.to_dict()
+    assert status["status"] == "completed" and status["filename"] == "data.csv"
+    assert status["progress"] == {"total": 300, "success": 300, "error": 0, "chunks": 6}
+    assert status["bytes_received"] == len(behavior_csv.encode("utf-8"))
+
+
+def test_consumer_error_fails_job(tmp_path):
+    job = ImportJobRegistry().create("behavior_data")
+    importer = FlexibleCSVImporter(str(tmp_path / "graph.db"))
+    body = _multipart("user_id,action\n" + "u1,a\n" * 5000)
+
+    with pytest.raises(ValueError, match="缺少时间列"):
+        _import(body, importer.import_behavior_data, job, size=64)
+    assert job.status == "failed" and "缺少时间列" in job.error
+
+
+def test_partial_import_reports_committed_rows(tmp_path, behavior_csv):
+    """中途失败时已提交的分块保留，任务记录已写入的行数"""
+    db_path = str(tmp_path / "graph.db")
+    job = ImportJobRegistry().create("behavior_data")
+    importer = FlexibleCSVImporter(db_path)
+
+    def progress(state):
+        job.update(state)
+        if state["chunks"] == 2:
+            raise ValueError("第3块校验失败")
+
+    with pytest.raises(ValueError, match="校验失败"):
+        _import(_multipart(behavior_csv),
+                lambda stream: importer.import_behavior_data(stream, batch_size=50, progress=progress), job)
+    assert job.status == "failed"
+    assert job.committed_rows == len(_events(db_path)) == 100
+    assert job.to_dict()["committed_rows"] == 100
+    assert "已写入 100 行" in job.failure_message()
+
+
+def test_rejects_wrong_suffix(tmp_path):
+    job = ImportJobRegistry().create("behavior_data")
+    consumed = []
+    with pytest.raises(ValueError, match="请上传CSV文件"):
+        _import(_multipart("user_id\nu1\n", filename="data.xlsx"), lambda stream: consumed.append(stream.read()),
+                job, suffix=".csv")
+    assert job.status == "failed" and consumed in ([], [b""])
+
+
+def test_missing_file_field(tmp_path):
+    job = ImportJobRegistry().create("user_profiles")
+    importer = FlexibleCSVImporter(str(tmp_path / "graph.db"))
+
+    with pytest.raises(ValueError, match="缺少文件字段"):
+        _import(_multipart("user_id\nu1\n", field="other"), importer.import_user_profiles, job)
+    assert job.status == "failed"
+
+
+def test_registry_evicts_oldest():
+    registry = ImportJobRegistry(max_jobs=2)
+    first = registry.create("a")
+    registry.create("b")
+    registry.create("c")
+    assert registry.get(first.job_id) is None